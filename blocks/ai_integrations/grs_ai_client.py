@@ -14,16 +14,31 @@ GRS AI API Client - универсальный клиент для работы
 Документация: https://grsai.com/dashboard/documents/chat
 """
 
+import contextvars
 import os
 import json
 import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Dict, Optional, Generator, Any
 import requests
 from dataclasses import dataclass
 
+from . import model_router, usage
+from .model_router import default_router
+from .single_flight import default_group as single_flight, fingerprint
+
 
 logger = logging.getLogger(__name__)
 
+# Потоки для хеджированных запросов (основной + дублирующий); проигравший отменяется (см. _hedged_request)
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="grs-hedge")
+
+
+class RequestCancelled(Exception):
+    """Запрос отменён между попытками: параллельный (хеджированный) запрос уже получил ответ"""
+
 
 @dataclass
 class GRSAIConfig:
@@ -47,7 +62,8 @@ class GRSAIClient:
     - Обычный и потоковый режим
     - Автоматическая обработка кодировки (UTF-8)
     - Парсинг различных форматов ответов
-    - Fallback на другие модели при ошибках
+    - Fallback на другие модели при ошибках (порядок — по здоровью моделей, см. model_router)
+    - Одинаковые одновременные запросы выполняются один раз (см. single_flight)
     - Обработка ошибок API
     """
     
@@ -75,7 +91,11 @@ class GRSAIClient:
             self.config = GRSAIConfig(api_key=api_key, base_url=base_url)
         
         self.endpoint = f"{self.config.base_url}/v1/chat/completions"
-        self.session = requests.Session()
+        self.session = self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        """HTTP-сессия с авторизацией и повтором на 502/503/504"""
+        session = requests.Session()
         retry_strategy = requests.adapters.HTTPAdapter(
             max_retries=requests.packages.urllib3.util.retry.Retry(
                 total=3,
@@ -85,12 +105,13 @@ class GRSAIClient:
                 raise_on_status=False,
             ),
         )
-        self.session.mount("https://", retry_strategy)
-        self.session.mount("http://", retry_strategy)
-        self.session.headers.update({
+        session.mount("https://", retry_strategy)
+        session.mount("http://", retry_strategy)
+        session.headers.update({
             "Authorization": f"Bearer {self.config.api_key}",
             "Content-Type": "application/json"
         })
+        return session
     
     def chat(
         self,
@@ -122,30 +143,183 @@ class GRSAIClient:
             raise ValueError("For streaming use chat_stream() method")
         
         model = model or self.config.default_model
+        key = self._chat_fingerprint(messages, model, temperature, max_tokens, use_fallback)
+        return single_flight.do(
+            key, lambda: self._chat(messages, model, temperature, max_tokens, use_fallback)
+        )
+    
+    async def chat_async(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        use_fallback: bool = True
+    ) -> str:
+        """chat() для asyncio: запрос в пуле потоков, одинаковые одновременные запросы — один вызов API"""
+        model = model or self.config.default_model
+        key = self._chat_fingerprint(messages, model, temperature, max_tokens, use_fallback)
+        return await single_flight.do_async(
+            key, lambda: self._chat(messages, model, temperature, max_tokens, use_fallback)
+        )
+    
+    def _chat_fingerprint(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        use_fallback: bool,
+    ) -> str:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "use_fallback": use_fallback,
+        }
+        return fingerprint("chat", self.config.api_key, self.endpoint, payload)
+    
+    def _chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        use_fallback: bool,
+    ) -> str:
+        """Запрос с выбором модели через model_router (вызывается один раз на группу одинаковых запросов)"""
+        candidates = [model]
+        if use_fallback and self.config.fallback_models:
+            # Остальные модели (включая из fallback_models, кроме запрошенной)
+            to_try = [m for m in self.config.fallback_models if m != model]
+            if not to_try:
+                to_try = [m for m in ["gemini-2.5-flash", "gemini-2.5-flash-lite", "gpt-4o-mini"] if m != model]
+            candidates += to_try
+        
+        cls = model_router.classify(messages, max_tokens, self.POWERFUL_MODELS, model)
+        if model_router.ROUTER_ENABLED:
+            peers = next((tier for tier in (self.FAST_MODELS, self.POWERFUL_MODELS) if model in tier), [])
+            order = default_router.order(model, candidates[1:], cls, peers)
+        else:
+            order = candidates
+        
+        last_error: Optional[Exception] = None
+        tried: List[str] = []
+        for i, candidate in enumerate(order):
+            if candidate in tried:
+                continue
+            if model_router.ROUTER_ENABLED and not default_router.allow(candidate):
+                logger.info("Model %s skipped: circuit breaker open", candidate)
+                continue
+            rest = [m for m in order[i + 1:] if m not in tried]
+            # Пока есть запасные модели, не тратим минуты на повторы соединения с деградировавшей
+            attempts = model_router.ATTEMPTS_WITH_FALLBACK if rest else 5
+            backup = rest[0] if rest else None
+            delay = default_router.hedge_delay(candidate, cls) if backup and model_router.ROUTER_ENABLED else None
+            try:
+                if delay is not None:
+                    return self._hedged_request(messages, candidate, backup, delay, cls, tried, temperature, max_tokens, attempts)
+                tried.append(candidate)
+                response_text = self._timed_request(messages, candidate, cls, temperature, max_tokens, attempts)
+                if candidate != model:
+                    logger.info("Success with fallback model: %s", candidate)
+                return response_text
+            except Exception as e:
+                last_error = e
+                logger.error("Error with model %s: %s", candidate, e)
         
+        if not tried:
+            # Все breaker открыты — всё равно пробуем лучшую модель, а не отказываем сразу
+            try:
+                return self._timed_request(messages, order[0], cls, temperature, max_tokens, 5)
+            except Exception as e:
+                last_error = e
+        raise Exception(f"All models failed. Last error: {last_error}")
+    
+    def _timed_request(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        cls: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        max_attempts: int,
+        session: Optional[requests.Session] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> str:
+        """_make_request с записью латентности и результата в model_router"""
+        started = time.monotonic()
+        ok = False
         try:
-            response_text = self._make_request(messages, model, stream=False, temperature=temperature, max_tokens=max_tokens)
+            response_text = self._make_request(
+                messages, model, stream=False, temperature=temperature, max_tokens=max_tokens,
+                max_attempts=max_attempts, session=session, cancel=cancel,
+            )
+            ok = True
             return response_text
-        
-        except Exception as e:
-            logger.error(f"Error with model {model}: {e}")
-            
-            if use_fallback and self.config.fallback_models:
-                # Пробуем остальные модели (включая из fallback_models, кроме той что уже упала)
-                to_try = [m for m in self.config.fallback_models if m != model]
-                if not to_try:
-                    to_try = [m for m in ["gemini-2.5-flash", "gemini-2.5-flash-lite", "gpt-4o-mini"] if m != model]
-                logger.info("Trying fallback models: %s", to_try)
-                for fallback_model in to_try:
-                    try:
-                        response_text = self._make_request(messages, fallback_model, stream=False, temperature=temperature, max_tokens=max_tokens)
-                        logger.info("Success with fallback model: %s", fallback_model)
-                        return response_text
-                    except Exception as fallback_error:
-                        logger.error("Fallback model %s failed: %s", fallback_model, fallback_error)
-                        continue
-            
-            raise Exception(f"All models failed. Last error: {e}")
+        finally:
+            # Отменённый проигравший хеджа — не сбой модели, в статистику router не идёт
+            cancelled = not ok and cancel is not None and cancel.is_set()
+            if model_router.ROUTER_ENABLED and not cancelled:
+                default_router.record(model, cls, time.monotonic() - started, ok)
+            if session is not None:
+                session.close()
+    
+    def _hedged_request(
+        self,
+        messages: List[Dict[str, str]],
+        primary: str,
+        backup: str,
+        delay: float,
+        cls: str,
+        tried: List[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        max_attempts: int,
+    ) -> str:
+        """
+        Запрос к primary; если за delay сек ответа нет — дублирующий запрос к backup
+        (в своей сессии). Возвращает первый успешный ответ, иначе пробрасывает последнюю ошибку.
+        Проигравшему выставляется флаг отмены (новых попыток он не делает, пауза между попытками
+        прерывается) и закрывается его сессия — текущий HTTP-запрос дорабатывает до ответа или таймаута.
+        """
+        tried.append(primary)
+        calls = {}
+
+        def submit(model: str):
+            # Копия контекста — учёт расхода (usage) видит шаг пайплайна и в потоках пула
+            session, cancel = self._build_session(), threading.Event()
+            future = _hedge_pool.submit(
+                contextvars.copy_context().run, self._timed_request,
+                messages, model, cls, temperature, max_tokens, max_attempts, session, cancel,
+            )
+            calls[future] = (model, session, cancel)
+            return future
+
+        first = submit(primary)
+        done, _ = wait([first], timeout=delay)
+        if done or not default_router.allow(backup):
+            return first.result()
+        logger.info("No answer from %s after %.1fs — hedging with %s", primary, delay, backup)
+        tried.append(backup)
+        pending = {first, submit(backup)}
+        last_error: Optional[Exception] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response_text = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                for loser in pending:
+                    model, session, cancel = calls[loser]
+                    logger.info("Hedge won by %s — cancelling %s", calls[future][0], model)
+                    cancel.set()
+                    session.close()
+                return response_text
+        raise last_error
     
     def chat_stream(
         self,
@@ -179,6 +353,11 @@ class GRSAIClient:
         if max_tokens is not None:
             data["max_tokens"] = max_tokens
         
+        started = time.monotonic()
+        request_bytes = len(json.dumps(data).encode("utf-8"))
+        response_bytes = 0
+        tokens: Dict[str, Any] = {}
+        ok = False
         try:
             response = self.session.post(
                 self.endpoint,
@@ -191,6 +370,7 @@ class GRSAIClient:
             
             for line in response.iter_lines():
                 if line:
+                    response_bytes += len(line)
                     if line.startswith(b"data: "):
                         chunk = line[6:].decode("utf-8")
                         if chunk == "[DONE]":
@@ -198,16 +378,27 @@ class GRSAIClient:
                         
                         try:
                             data = json.loads(chunk)
+                            if isinstance(data.get("usage"), dict):
+                                tokens = data["usage"]
                             delta = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
                             if delta:
                                 yield delta
                         except json.JSONDecodeError:
                             continue
+            ok = True
         
         except requests.exceptions.Timeout:
             raise Exception(f"Request timeout after {self.config.timeout} seconds")
         except requests.exceptions.RequestException as e:
             raise Exception(f"Request failed: {e}")
+        finally:
+            usage.record(
+                "chat_stream", model, ok, (time.monotonic() - started) * 1000,
+                prompt_tokens=tokens.get("prompt_tokens"),
+                completion_tokens=tokens.get("completion_tokens"),
+                request_bytes=request_bytes,
+                response_bytes=response_bytes,
+            )
     
     def _make_request(
         self,
@@ -215,7 +406,10 @@ class GRSAIClient:
         model: str,
         stream: bool = False,
         temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        max_attempts: int = 5,
+        session: Optional[requests.Session] = None,
+        cancel: Optional[threading.Event] = None,
     ) -> str:
         """
         Внутренний метод для выполнения запроса
@@ -226,6 +420,9 @@ class GRSAIClient:
             stream: Потоковый режим
             temperature: Температура генерации
             max_tokens: Максимальное количество токенов
+            max_attempts: Попыток при обрыве соединения
+            session: Отдельная сессия (для параллельных запросов); по умолчанию self.session
+            cancel: Флаг отмены — проверяется перед каждой попыткой (RequestCancelled)
         
         Returns:
             Текст ответа
@@ -244,11 +441,21 @@ class GRSAIClient:
             data["max_tokens"] = max_tokens
         
         last_err = None
-        max_attempts = 5
         delay_sec = 2
+        own_session = session is None
+        session = session or self.session
+        started = time.monotonic()
+        request_bytes = len(json.dumps(data).encode("utf-8"))
+        response = None
         for attempt in range(max_attempts):
+            if cancel is not None and cancel.is_set():
+                if attempt:
+                    self._record_failure("chat", model, started, request_bytes, attempt - 1)
+                if not own_session:
+                    session.close()
+                raise RequestCancelled(f"{model}: cancelled before attempt {attempt + 1}")
             try:
-                response = self.session.post(
+                response = session.post(
                     self.endpoint,
                     json=data,
                     timeout=self.config.timeout
@@ -267,35 +474,59 @@ class GRSAIClient:
                 if not response_text:
                     raise Exception("Empty response from API")
                 
+                tokens = result.get("usage") if isinstance(result.get("usage"), dict) else {}
+                usage.record(
+                    "chat", model, True, (time.monotonic() - started) * 1000,
+                    prompt_tokens=tokens.get("prompt_tokens"),
+                    completion_tokens=tokens.get("completion_tokens"),
+                    request_bytes=request_bytes,
+                    response_bytes=len(response.content or b""),
+                    retries=attempt,
+                )
                 return response_text
             
             except requests.exceptions.Timeout:
+                self._record_failure("chat", model, started, request_bytes, attempt)
                 raise Exception(f"Request timeout after {self.config.timeout} seconds")
             except (requests.exceptions.ConnectionError, ConnectionResetError, OSError) as e:
                 last_err = e
                 logger.warning("Connection error (attempt %d/%d): %s — retrying in %ds", attempt + 1, max_attempts, e, delay_sec)
-                self.session.close()
-                self.session = requests.Session()
-                retry_adapter = requests.adapters.HTTPAdapter(
-                    max_retries=requests.packages.urllib3.util.retry.Retry(
-                        total=3, backoff_factor=0.5,
-                        status_forcelist=[502, 503, 504], allowed_methods=["POST"], raise_on_status=False,
-                    ),
-                )
-                self.session.mount("https://", retry_adapter)
-                self.session.mount("http://", retry_adapter)
-                self.session.headers.update({
-                    "Authorization": f"Bearer {self.config.api_key}",
-                    "Content-Type": "application/json"
-                })
+                session.close()
+                session = self._build_session()
+                if own_session:
+                    self.session = session
                 if attempt < max_attempts - 1:
-                    import time
-                    time.sleep(delay_sec)
+                    if cancel is not None:
+                        cancel.wait(delay_sec)
+                    else:
+                        time.sleep(delay_sec)
                 continue
             except requests.exceptions.RequestException as e:
+                self._record_failure("chat", model, started, request_bytes, attempt)
                 raise Exception(f"Request failed: {e}")
+            except Exception:
+                self._record_failure("chat", model, started, request_bytes, attempt, response)
+                raise
+        self._record_failure("chat", model, started, request_bytes, max_attempts - 1)
         raise Exception(f"Request failed after retries: {last_err}")
     
+    @staticmethod
+    def _record_failure(
+        kind: str,
+        model: str,
+        started: float,
+        request_bytes: int,
+        retries: int,
+        response: Optional[requests.Response] = None,
+    ) -> None:
+        """Учесть неудачный вызов API (время и трафик потрачены, ответа нет)"""
+        usage.record(
+            kind, model, False, (time.monotonic() - started) * 1000,
+            request_bytes=request_bytes,
+            response_bytes=len(response.content or b"") if response is not None else 0,
+            retries=retries,
+        )
+    
     def _parse_response(self, result: Dict[str, Any]) -> str:
         """
         Парсинг ответа от GRS AI API
@@ -395,7 +626,54 @@ class GRSAIClient:
 
         image_urls: список URL референсных изображений (или data URL с base64).
                     Первое изображение можно использовать как лицо/персонажа для переноса в сцену.
+        Одинаковые одновременные запросы (двойной клик, повтор с фронта) выполняются один раз.
         """
+        key = self._draw_fingerprint(prompt, model, size, image_urls)
+        # Копия — у каждого вызывающего свой словарь, даже если ответ общий
+        return dict(single_flight.do(key, lambda: self._generate_image_counted(prompt, model, size, image_urls)))
+
+    async def generate_image_async(
+        self,
+        prompt: str,
+        model: str = "gpt-image-1",
+        size: str = "1024x1024",
+        image_urls: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """generate_image() для asyncio (запрос в пуле потоков, с single-flight)"""
+        key = self._draw_fingerprint(prompt, model, size, image_urls)
+        return dict(await single_flight.do_async(key, lambda: self._generate_image_counted(prompt, model, size, image_urls)))
+
+    def _draw_fingerprint(self, prompt: str, model: str, size: str, image_urls: Optional[List[str]]) -> str:
+        payload = {"prompt": prompt, "model": model, "size": size, "urls": image_urls or []}
+        return fingerprint("draw", self.config.api_key, self.config.base_url, payload)
+
+    def _generate_image_counted(
+        self,
+        prompt: str,
+        model: str,
+        size: str,
+        image_urls: Optional[List[str]],
+    ) -> Dict[str, Any]:
+        """_generate_image с учётом расхода (usage): время, трафик, число картинок"""
+        started = time.monotonic()
+        result = self._generate_image(prompt, model, size, image_urls)
+        ok = bool(result.get("success"))
+        request_bytes = len(prompt.encode("utf-8")) + sum(len(u) for u in image_urls or [])
+        usage.record(
+            "draw", model, ok, (time.monotonic() - started) * 1000,
+            request_bytes=request_bytes,
+            response_bytes=len(result.get("b64_json") or result.get("url") or ""),
+            images=1 if ok else 0,
+        )
+        return result
+
+    def _generate_image(
+        self,
+        prompt: str,
+        model: str,
+        size: str,
+        image_urls: Optional[List[str]],
+    ) -> Dict[str, Any]:
         base = self.config.base_url.rstrip("/")
         urls = image_urls if image_urls else []
         if model.startswith("nano-banana"):
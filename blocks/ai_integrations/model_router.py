@@ -0,0 +1,235 @@
+"""
+Маршрутизация chat-запросов GRS AI по здоровью моделей
+
+Для каждой модели хранится скользящее окно последних вызовов (латентность, успех) —
+отдельно по классам запросов: "short" (заголовки, промпты, короткие ответы) и "long"
+(статьи). Поверх окна — circuit breaker на модель:
+- closed    — модель работает, запросы идут как обычно;
+- open      — GRS_BREAKER_FAILURES ошибок подряд или доля ошибок в окне выше
+              GRS_BREAKER_ERROR_RATE: модель пропускается GRS_BREAKER_COOLDOWN сек;
+- half_open — после паузы пропускается один пробный запрос; успех закрывает breaker,
+              ошибка снова открывает его с удвоенной паузой (до GRS_BREAKER_MAX_COOLDOWN).
+
+Порядок моделей для запроса (ModelRouter.order):
+- запрошенная модель остаётся первой, пока её breaker закрыт и она не медленнее
+  GRS_ROUTER_SLOW_FACTOR раз самой быстрой модели того же уровня (быстрые/мощные) —
+  статья не уходит на «быструю» модель только ради скорости;
+- fallback-модели — по здоровью (доля ошибок, затем p50 для класса запроса), а не по порядку в списке;
+- модели с открытым breaker — в конце (если все открыты, запрос всё равно пробуется).
+
+Хеджирование (GRS_HEDGE=true): если ответ первой модели не пришёл за её p-перцентиль
+(GRS_HEDGE_PERCENTILE) латентности для класса, параллельно отправляется запрос ко второй
+модели; берётся первый успешный ответ.
+
+Состояние общее на процесс (default_router) — клиенты GRSAIClient создаются на каждый вызов.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+ROUTER_ENABLED = os.getenv("GRS_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+WINDOW_SIZE = int(os.getenv("GRS_ROUTER_WINDOW", "50"))
+WINDOW_SEC = float(os.getenv("GRS_ROUTER_WINDOW_SEC", "1800"))
+MIN_SAMPLES = int(os.getenv("GRS_ROUTER_MIN_SAMPLES", "5"))
+SLOW_FACTOR = float(os.getenv("GRS_ROUTER_SLOW_FACTOR", "3"))
+SHORT_MAX_TOKENS = int(os.getenv("GRS_ROUTER_SHORT_MAX_TOKENS", "1024"))
+SHORT_MAX_CHARS = int(os.getenv("GRS_ROUTER_SHORT_MAX_CHARS", "4000"))
+BREAKER_FAILURES = int(os.getenv("GRS_BREAKER_FAILURES", "3"))
+BREAKER_ERROR_RATE = float(os.getenv("GRS_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("GRS_BREAKER_COOLDOWN", "60"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("GRS_BREAKER_MAX_COOLDOWN", "600"))
+HEDGE_ENABLED = os.getenv("GRS_HEDGE", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("GRS_HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = int(os.getenv("GRS_HEDGE_MIN_SAMPLES", "20"))
+# Попыток при обрыве соединения, пока есть запасные модели (последняя модель — полные 5)
+ATTEMPTS_WITH_FALLBACK = int(os.getenv("GRS_ROUTER_ATTEMPTS", "2"))
+
+SHORT = "short"
+LONG = "long"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def classify(messages: List[Dict[str, str]], max_tokens: Optional[int] = None, long_models: Iterable[str] = (), model: Optional[str] = None) -> str:
+    """
+    Класс запроса: "short" или "long".
+    max_tokens решает, если указан; иначе мощная модель — "long", длинный промпт — "long".
+    """
+    if max_tokens is not None:
+        return SHORT if max_tokens <= SHORT_MAX_TOKENS else LONG
+    if model and model in long_models:
+        return LONG
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return SHORT if chars <= SHORT_MAX_CHARS else LONG
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+class _ModelState:
+    """Окна по классам + состояние breaker одной модели."""
+
+    def __init__(self):
+        self.samples: Dict[str, Deque[Tuple[float, float, bool]]] = {}
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probe_in_flight = False
+        self.probe_at = 0.0
+
+    def window(self, cls: Optional[str], now: float) -> List[Tuple[float, float, bool]]:
+        """Свежие записи (ts, latency, ok) класса cls или всех классов."""
+        queues = [self.samples.get(cls, ())] if cls else list(self.samples.values())
+        return [s for q in queues for s in q if now - s[0] <= WINDOW_SEC]
+
+
+class ModelRouter:
+    """Скользящая статистика и circuit breaker по моделям. Потокобезопасен."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelState] = {}
+
+    def _get(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState()
+        return state
+
+    def _refresh(self, state: _ModelState, now: float) -> None:
+        if state.state == OPEN and now - state.opened_at >= state.cooldown:
+            state.state = HALF_OPEN
+            state.probe_in_flight = False
+
+    def _open(self, state: _ModelState, now: float) -> None:
+        if state.state == HALF_OPEN:
+            state.cooldown = min(BREAKER_MAX_COOLDOWN, state.cooldown * 2)
+        state.state = OPEN
+        state.opened_at = now
+        state.probe_in_flight = False
+
+    def record(self, model: str, cls: str, latency: float, ok: bool) -> None:
+        """Учесть результат вызова модели (latency — сек, ok — получен ответ)."""
+        now = time.time()
+        with self._lock:
+            state = self._get(model)
+            queue = state.samples.setdefault(cls, deque(maxlen=WINDOW_SIZE))
+            queue.append((now, latency, ok))
+            if ok:
+                state.consecutive_failures = 0
+                if state.state != CLOSED:
+                    state.state = CLOSED
+                    state.cooldown = BREAKER_COOLDOWN
+                state.probe_in_flight = False
+                return
+            state.consecutive_failures += 1
+            if state.state == HALF_OPEN:
+                self._open(state, now)
+                return
+            window = state.window(None, now)
+            failures = sum(1 for s in window if not s[2])
+            rate_tripped = len(window) >= MIN_SAMPLES and failures / len(window) > BREAKER_ERROR_RATE
+            if state.state == CLOSED and (state.consecutive_failures >= BREAKER_FAILURES or rate_tripped):
+                self._open(state, now)
+
+    def allow(self, model: str) -> bool:
+        """Можно ли сейчас отправить запрос модели (half_open пропускает один пробный запрос)."""
+        now = time.time()
+        with self._lock:
+            state = self._get(model)
+            self._refresh(state, now)
+            if state.state == CLOSED:
+                return True
+            # Пробный запрос, результат которого так и не записали, не блокирует модель навсегда
+            if state.state == HALF_OPEN and (not state.probe_in_flight or now - state.probe_at > state.cooldown):
+                state.probe_in_flight = True
+                state.probe_at = now
+                return True
+            return False
+
+    def _health(self, model: str, cls: str, now: float) -> Tuple[float, Optional[float]]:
+        """(доля ошибок, p50 латентности) по окну класса; p50 None — мало данных."""
+        window = self._get(model).window(cls, now)
+        if not window:
+            return 0.0, None
+        error_rate = sum(1 for s in window if not s[2]) / len(window)
+        latencies = [s[1] for s in window if s[2]]
+        p50 = _percentile(latencies, 50) if len(latencies) >= MIN_SAMPLES else None
+        return error_rate, p50
+
+    def order(self, primary: str, fallbacks: Iterable[str], cls: str, peers: Iterable[str] = ()) -> List[str]:
+        """
+        Порядок моделей для запроса класса cls: primary — запрошенная модель,
+        fallbacks — запасные, peers — модели того же уровня, что и primary
+        (на них primary можно заменить из-за медленности, а не только из-за ошибок).
+        """
+        now = time.time()
+        candidates = list(dict.fromkeys([primary, *fallbacks]))
+        peers = set(peers)
+        with self._lock:
+            for model in candidates:
+                self._refresh(self._get(model), now)
+            health = {m: self._health(m, cls, now) for m in candidates}
+            blocked = {m for m in candidates if self._get(m).state == OPEN}
+
+        def score(model: str) -> Tuple[int, float, float]:
+            error_rate, p50 = health[model]
+            # Модели без статистики — после проверенных здоровых, в исходном порядке
+            return (1 if model in blocked else 0, round(error_rate, 1), p50 if p50 is not None else float("inf"))
+
+        rest = sorted((m for m in candidates if m != primary), key=score)
+        if primary not in blocked:
+            _, primary_p50 = health[primary]
+            faster_peer = next(
+                (m for m in rest if m in peers and m not in blocked and health[m][1] is not None and health[m][0] <= health[primary][0]),
+                None,
+            )
+            if primary_p50 is not None and faster_peer and primary_p50 > SLOW_FACTOR * health[faster_peer][1]:
+                rest.remove(faster_peer)
+                return [faster_peer, primary, *rest]
+            return [primary, *rest]
+        return [*rest, primary]
+
+    def hedge_delay(self, model: str, cls: str) -> Optional[float]:
+        """Через сколько секунд без ответа стоит отправить дублирующий запрос; None — мало данных."""
+        if not HEDGE_ENABLED:
+            return None
+        with self._lock:
+            latencies = [s[1] for s in self._get(model).window(cls, time.time()) if s[2]]
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return _percentile(latencies, HEDGE_PERCENTILE)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Состояние моделей для логов/диагностики: breaker, вызовы, доля ошибок и p50/p90 по классам."""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for model, state in self._models.items():
+                self._refresh(state, now)
+                classes = {}
+                for cls in state.samples:
+                    window = state.window(cls, now)
+                    latencies = [s[1] for s in window if s[2]]
+                    classes[cls] = {
+                        "calls": len(window),
+                        "error_rate": round(sum(1 for s in window if not s[2]) / len(window), 3) if window else 0,
+                        "p50_sec": _percentile(latencies, 50),
+                        "p90_sec": _percentile(latencies, 90),
+                    }
+                result[model] = {"breaker": state.state, "classes": classes}
+        return result
+
+
+default_router = ModelRouter()
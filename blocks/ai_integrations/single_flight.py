@@ -0,0 +1,118 @@
+"""
+Single-flight: одинаковые одновременные запросы к GRS AI выполняются один раз
+
+Ключ — отпечаток запроса (эндпоинт + тело + ключ API). Первый вызов с ключом («ведущий»)
+выполняет запрос, остальные, пришедшие пока он в полёте, ждут его результат и получают
+тот же ответ (или то же исключение). После завершения ключ удаляется — это не кеш:
+следующий такой же запрос снова уйдёт в API.
+
+- Потоки: SingleFlight.do(key, fn) — ожидание на concurrent.futures.Future.
+- asyncio: await SingleFlight.do_async(key, fn) — ведущий выполняет fn в пуле потоков,
+  ведомые ждут через asyncio.wrap_future, не блокируя event loop. Потоки и задачи
+  с одним ключом делят один вызов.
+
+Счётчики (stats()): сколько запросов ушло в API и сколько было схлопнуто — по видам (chat/draw).
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_ENABLED = os.getenv("GRS_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+def fingerprint(kind: str, api_key: str, endpoint: str, payload: Dict[str, Any]) -> str:
+    """Отпечаток запроса: одинаковое тело к тому же эндпоинту с тем же ключом API."""
+    raw = json.dumps([kind, endpoint, payload], sort_keys=True, ensure_ascii=False, default=str)
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"{kind}:{key_hash}:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Группа одновременных вызовов по ключу. Потокобезопасна."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: str, field: str) -> None:
+        kind = key.split(":", 1)[0]
+        counters = self._stats.setdefault(kind, {"upstream": 0, "collapsed": 0})
+        counters[field] += 1
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """(future, ведущий ли вызывающий)."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._count(key, "collapsed")
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self._count(key, "upstream")
+            return future, True
+
+    def _run(self, key: str, future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            result, error = fn(), None
+        except BaseException as e:
+            result, error = None, e
+        # Ключ снимаем до публикации результата: кто пришёл позже — делает новый запрос
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Выполнить fn() или дождаться уже идущего вызова с тем же ключом."""
+        if not SINGLE_FLIGHT_ENABLED:
+            return fn()
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        else:
+            logger.debug("Single-flight: ждём идущий запрос %s", key[:24])
+        return future.result()
+
+    async def do_async(self, key: str, fn: Callable[[], Any]) -> Any:
+        """То же для asyncio: блокирующий fn выполняется в пуле потоков event loop."""
+        loop = asyncio.get_running_loop()
+        if not SINGLE_FLIGHT_ENABLED:
+            return await loop.run_in_executor(None, contextvars.copy_context().run, fn)
+        future, leader = self._join(key)
+        if leader:
+            # С копией контекста: учёт расхода (usage) видит шаг пайплайна вызывающей задачи
+            loop.run_in_executor(None, contextvars.copy_context().run, self._run, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """По видам запросов: upstream (ушло в API), collapsed (получили чужой ответ), in_flight, доля схлопнутых."""
+        with self._lock:
+            in_flight: Dict[str, int] = {}
+            for key in self._inflight:
+                kind = key.split(":", 1)[0]
+                in_flight[kind] = in_flight.get(kind, 0) + 1
+            result = {}
+            for kind, counters in self._stats.items():
+                total = counters["upstream"] + counters["collapsed"]
+                result[kind] = {
+                    **counters,
+                    "in_flight": in_flight.get(kind, 0),
+                    "collapsed_rate": round(counters["collapsed"] / total, 3) if total else 0,
+                }
+            return result
+
+
+default_group = SingleFlight()
@@ -0,0 +1,137 @@
+"""
+Учёт расхода GRS AI: токены, байты, время и повторы на каждый вызов API
+
+GRSAIClient вызывает record() после каждого запроса к API (chat, draw, видео). Запись
+привязывается к текущему шагу пайплайна — project, run_id и имя шага берутся из
+contextvar, который выставляет RunTracker.step (blocks/analytics/tracker.py). Вызовы вне
+шага (grs_image_web, MCP) пишутся в проект ANALYTICS_PROJECT (по умолчанию — основной)
+без run_id и шага.
+
+Записи копятся в памяти и пишутся в таблицу grs_usage БД аналитики пачками:
+при GRS_USAGE_BATCH записей, раз в GRS_USAGE_FLUSH_SEC сек (фоновый поток) и при выходе
+из процесса. Сводка — GET /api/stats/usage дашборда.
+
+Схлопнутые single-flight вызовы в API не уходят и не учитываются.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+USAGE_ENABLED = os.getenv("GRS_USAGE_ENABLED", "true").lower() in ("1", "true", "yes")
+BATCH_SIZE = int(os.getenv("GRS_USAGE_BATCH", "50"))
+FLUSH_SEC = float(os.getenv("GRS_USAGE_FLUSH_SEC", "10"))
+
+_lock = threading.Lock()
+_buffer: List[dict] = []
+_flush_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_sink_broken = False
+
+
+def _current_step() -> Optional[dict]:
+    """{project, run_id, step} текущего шага RunTracker или None."""
+    try:
+        from blocks.analytics.tracker import current_step
+    except ImportError:
+        return None
+    return current_step.get()
+
+
+def record(
+    kind: str,
+    model: str,
+    ok: bool,
+    latency_ms: float,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    request_bytes: int = 0,
+    response_bytes: int = 0,
+    retries: int = 0,
+    images: int = 0,
+) -> None:
+    """Учесть один вызов API. kind: chat | chat_stream | draw | video."""
+    if not USAGE_ENABLED or _sink_broken:
+        return
+    ctx = _current_step() or {}
+    item = {
+        "ts": datetime.now().isoformat(),
+        "project": ctx.get("project") or os.getenv("ANALYTICS_PROJECT") or "",
+        "run_id": ctx.get("run_id"),
+        "step": ctx.get("step"),
+        "kind": kind,
+        "model": model,
+        "ok": 1 if ok else 0,
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+        "request_bytes": request_bytes,
+        "response_bytes": response_bytes,
+        "latency_ms": round(latency_ms),
+        "retries": retries,
+        "images": images,
+    }
+    with _lock:
+        _buffer.append(item)
+        full = len(_buffer) >= BATCH_SIZE
+    _ensure_flusher()
+    if full:
+        flush()
+
+
+def flush() -> int:
+    """Записать накопленные записи в БД аналитики. Возвращает число записанных."""
+    global _sink_broken
+    with _lock:
+        if not _buffer:
+            return 0
+        items = _buffer[:]
+        _buffer.clear()
+    with _flush_lock:
+        try:
+            from blocks.analytics import db
+        except ImportError as e:
+            logger.warning("Учёт GRS: блок аналитики недоступен (%s) — записи не сохраняются", e)
+            _sink_broken = True
+            return 0
+        by_project: Dict[str, List[dict]] = {}
+        for item in items:
+            project = item["project"] if item["project"] in db.PROJECTS else db.DEFAULT_PROJECT
+            by_project.setdefault(project, []).append(item)
+        written = 0
+        for project, rows in by_project.items():
+            try:
+                conn = db.get_connection(project=project)
+                try:
+                    db.insert_usage(conn, rows)
+                finally:
+                    conn.close()
+                written += len(rows)
+            except Exception as e:
+                logger.warning("Учёт GRS: не удалось записать %d записей в %s: %s", len(rows), project, e)
+        return written
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_SEC)
+        try:
+            flush()
+        except Exception as e:
+            logger.warning("Учёт GRS: ошибка фоновой записи: %s", e)
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="grs-usage-flush", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Сводная аналитика по всем проектам (project=all).
+
+У каждого проекта своя SQLite-БД; запросы к ним выполняются параллельно (по соединению
+на поток), результаты сливаются: счётчики суммируются, timeline — по дням с разбивкой по
+проектам, лента запусков — k-way merge по started_at (каждая БД уже отдаёт свои запуски
+от новых к старым).
+"""
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from . import db, latency, usage_stats
+from .models import Run, Step
+
+
+def _per_project(fn: Callable[[Any], Any]) -> Dict[str, Any]:
+    """fn(conn) для каждого проекта параллельно → {project: результат}."""
+    def _run(project: str):
+        conn = db.get_connection(project=project)
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(db.PROJECTS))) as pool:
+        futures = {p: pool.submit(_run, p) for p in db.PROJECTS}
+        return {p: f.result() for p, f in futures.items()}
+
+
+def get_stats_all(channel: Optional[str] = None) -> dict:
+    """Сумма get_stats по проектам + by_project с исходными цифрами."""
+    by_project = _per_project(lambda conn: db.get_stats(conn, channel=channel))
+    total = sum(s["total"] for s in by_project.values())
+    completed = sum(s["completed"] for s in by_project.values())
+    return {
+        "total": total,
+        "completed": completed,
+        "failed": sum(s["failed"] for s in by_project.values()),
+        "today": sum(s["today"] for s in by_project.values()),
+        "success_rate": round(100 * completed / total, 1) if total else 0,
+        "by_project": by_project,
+    }
+
+
+def get_timeline_all(days: int = 30, channel: Optional[str] = None) -> List[dict]:
+    """Публикации по дням: [{day, count, by_project: {project: count}}]."""
+    by_project = _per_project(lambda conn: db.get_timeline(conn, days=days, channel=channel))
+    merged: Dict[str, dict] = {}
+    for project, rows in by_project.items():
+        for row in rows:
+            item = merged.setdefault(row["day"], {"day": row["day"], "count": 0, "by_project": {}})
+            item["count"] += row["count"]
+            item["by_project"][project] = row["count"]
+    return [merged[day] for day in sorted(merged)]
+
+
+def get_runs_all(
+    limit: int = 50,
+    offset: int = 0,
+    status: Optional[str] = None,
+    channel: Optional[str] = None,
+) -> List[dict]:
+    """Общая лента запусков всех проектов (новые первые), в каждом run — поле project."""
+    def _runs(conn) -> List[dict]:
+        result = []
+        # Для слияния нужен порядок по started_at уже в запросе: первые N по id —
+        # не обязательно первые N по времени (продолженные и импортированные запуски)
+        rows = db.get_runs(conn, limit=offset + limit, offset=0, status=status, channel=channel, order_by="started_at")
+        for row in rows:
+            t = tuple(row)
+            steps = [Step.from_row(tuple(s)) for s in db.get_steps_for_run(conn, t[0])]
+            result.append(Run.from_row(t, steps=steps).to_dict())
+        return result
+
+    by_project = _per_project(_runs)
+    for project, runs in by_project.items():
+        for run in runs:
+            run["project"] = project
+    merged = heapq.merge(*by_project.values(), key=lambda r: r.get("started_at") or "", reverse=True)
+    return list(merged)[offset:offset + limit]
+
+
+def get_latency_all(days: int = 30) -> dict:
+    """Перцентили длительностей по всем проектам: счётчики корзин суммируются до расчёта."""
+    by_project = _per_project(lambda conn: db.get_latency_buckets(conn, days=days))
+    return latency.summarize(row for rows in by_project.values() for row in rows)
+
+
+def get_usage_all(days: int = 30) -> dict:
+    """Расход GRS AI по всем проектам + totals каждого проекта в by_project."""
+    by_project = _per_project(lambda conn: (db.get_usage_rows(conn, days=days), db.get_step_labels(conn)))
+    labels = {k: v for _, project_labels in by_project.values() for k, v in project_labels.items()}
+    result = usage_stats.summarize((row for rows, _ in by_project.values() for row in rows), labels)
+    result["by_project"] = {
+        project: usage_stats.summarize(rows)["totals"] for project, (rows, _) in by_project.items()
+    }
+    return result
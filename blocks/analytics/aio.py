@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Неблокирующее выполнение для async-обработчиков дашборда (api.py).
+
+- SQLite — в отдельном пуле потоков (ANALYTICS_DB_WORKERS): чтения БД не конкурируют
+  за общий threadpool Starlette с прокси и обходом папок.
+- Удалённый сервер дашборда (прокси при ANALYTICS_SERVER_SERVICES_URL) — асинхронный
+  httpx.AsyncClient с собственным пулом соединений: ожидание ответа не занимает поток,
+  медленный upstream держит только соединения своего пула (ANALYTICS_UPSTREAM_CONNECTIONS).
+- Файловые операции (обход generated/uploaded) — в пуле IO.
+- systemctl/pkill — asyncio.create_subprocess_exec, без потока на ожидание.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional, Tuple
+
+import httpx
+
+DB_WORKERS = int(os.getenv("ANALYTICS_DB_WORKERS", "4"))
+IO_WORKERS = int(os.getenv("ANALYTICS_IO_WORKERS", "4"))
+# Соединений на upstream. Прокси ждёт ответа до UPSTREAM_TIMEOUT_SEC (20 с), так что пул
+# пропускает ~UPSTREAM_CONNECTIONS / 20 запросов в секунду даже при зависшем сервере:
+# 64 — запас на несколько открытых вкладок дашборда с опросом статуса и лога.
+UPSTREAM_CONNECTIONS = int(os.getenv("ANALYTICS_UPSTREAM_CONNECTIONS", "64"))
+UPSTREAM_KEEPALIVE = int(os.getenv("ANALYTICS_UPSTREAM_KEEPALIVE", "16"))
+UPSTREAM_TIMEOUT_SEC = 20.0
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="analytics-db")
+_io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="analytics-io")
+
+
+async def _in_executor(executor: ThreadPoolExecutor, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+async def run_db(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Выполнить работу с SQLite в пуле БД."""
+    return await _in_executor(_db_executor, fn, *args, **kwargs)
+
+
+async def run_io(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Выполнить файловую операцию в пуле IO."""
+    return await _in_executor(_io_executor, fn, *args, **kwargs)
+
+
+class Upstream:
+    """
+    Внешний HTTP-сервис: один httpx.AsyncClient с пулом до `limit` соединений.
+    Сверх лимита запросы ждут свободное соединение в event loop (не дольше таймаута запроса).
+    Клиент создаётся в первом запросе и привязан к его event loop.
+    """
+
+    def __init__(self, name: str, limit: int = UPSTREAM_CONNECTIONS, keepalive: int = UPSTREAM_KEEPALIVE):
+        self.name = name
+        self.limit = max(1, limit)
+        self._limits = httpx.Limits(max_connections=self.limit, max_keepalive_connections=min(keepalive, self.limit))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Новый event loop (перезапуск приложения, тесты): соединения старого в нём не годятся
+            self._client = httpx.AsyncClient(limits=self._limits, timeout=UPSTREAM_TIMEOUT_SEC)
+            self._loop = loop
+        return self._client
+
+    async def request(self, method: str, url: str, timeout: float = UPSTREAM_TIMEOUT_SEC, **kwargs: Any) -> httpx.Response:
+        """
+        HTTP-запрос через пул сервиса. Ответ с кодом 4xx/5xx возвращается как есть;
+        сетевые ошибки и таймауты — httpx.HTTPError. Ожидание соединения из пула входит в timeout.
+        """
+        return await self._get_client().request(method, url, timeout=httpx.Timeout(timeout), **kwargs)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            client, self._client, self._loop = self._client, None, None
+            await client.aclose()
+
+
+REMOTE = Upstream("remote")
+
+
+async def run_cmd(cmd: List[str], timeout: float) -> Tuple[int, str, str]:
+    """
+    Запустить команду и дождаться её (returncode, stdout, stderr).
+    По таймауту процесс убивается и пробрасывается asyncio.TimeoutError;
+    FileNotFoundError — если бинарника нет.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stdout.decode("utf-8", errors="replace"), stderr.decode("utf-8", errors="replace")
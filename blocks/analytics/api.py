@@ -1,22 +1,25 @@
 # -*- coding: utf-8 -*-
 """FastAPI: REST API для дашборда + раздача static/."""
+import asyncio
 import json
 import logging
 import os
 import re
 import subprocess
 import sys
+import threading
+import time
 from collections import defaultdict
 from datetime import datetime, timezone
 from pathlib import Path
 from urllib.request import Request as UrlRequest, urlopen
-from urllib.error import URLError, HTTPError
 
+import httpx
 from fastapi import Body, FastAPI, HTTPException, Query, Request
 from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from . import db
+from . import aggregate, aio, db, latency, response_cache, retention, services_status, usage_stats
 from .models import Run, Step
 
 logger = logging.getLogger(__name__)
@@ -33,29 +36,61 @@ ALLOWED_IMAGE_EXT = (".png", ".jpg", ".jpeg", ".gif", ".webp")
 USERS_JSON = _GRS_BASE / "users.json"
 
 
+# id, для которых недавно просили grs_image_web найти имя: не повторять просьбу на каждый запрос сводки
+USER_NAMES_REQUEST_COOLDOWN_SEC = 300
+_user_names_requested: dict = {}
+_user_names_lock = threading.Lock()
+_user_names_cache: dict = {"mtime": None, "names": {}}
+
+
+def _post_resolve_names(ids: list) -> None:
+    try:
+        req = UrlRequest(
+            f"{GRS_IMAGE_WEB_INTERNAL_URL}/api/user/resolve_names",
+            data=json.dumps({"ids": ids}).encode("utf-8"),
+            method="POST",
+            headers={"Content-Type": "application/json"},
+        )
+        urlopen(req, timeout=3).close()
+    except Exception as e:
+        logger.debug("resolve_names в grs_image_web: %s", e)
+
+
 def _ensure_generation_user_names(telegram_ids: set) -> None:
-    """Подтянуть имена для telegram_id без имени через API grs_image_web (getChat → users.json)."""
-    for tid in telegram_ids:
-        if tid == "0":
-            continue
-        try:
-            url = f"{GRS_IMAGE_WEB_INTERNAL_URL}/api/user/ensure_name/{tid}"
-            req = UrlRequest(url, method="GET")
-            urlopen(req, timeout=3)
-        except Exception:
-            pass
+    """
+    Попросить grs_image_web найти имена для telegram_id без имени — одним пакетным запросом,
+    в фоне: сводка не ждёт getChat, имена появятся в users.json к следующему обновлению.
+    """
+    now = time.monotonic()
+    with _user_names_lock:
+        ids = sorted(
+            tid for tid in telegram_ids
+            if tid != "0" and now - _user_names_requested.get(tid, -USER_NAMES_REQUEST_COOLDOWN_SEC) >= USER_NAMES_REQUEST_COOLDOWN_SEC
+        )
+        for tid in ids:
+            _user_names_requested[tid] = now
+    if ids:
+        threading.Thread(target=_post_resolve_names, args=(ids,), name="resolve-user-names", daemon=True).start()
 
 
 def _load_generation_user_names() -> dict:
-    """Загрузить { telegram_id: display_name } из grs_image_web."""
-    if not USERS_JSON.is_file():
+    """Загрузить { telegram_id: display_name } из grs_image_web (перечитывается только при изменении файла)."""
+    try:
+        mtime = USERS_JSON.stat().st_mtime
+    except OSError:
         return {}
+    with _user_names_lock:
+        if _user_names_cache["mtime"] == mtime:
+            return _user_names_cache["names"]
     try:
         with open(USERS_JSON, "r", encoding="utf-8") as f:
             data = json.load(f)
-        return {str(k): str(v) for k, v in (data or {}).items()}
+        names = {str(k): str(v) for k, v in (data or {}).items()}
     except Exception:
         return {}
+    with _user_names_lock:
+        _user_names_cache["mtime"], _user_names_cache["names"] = mtime, names
+    return names
 
 
 def _safe_filename(name: str) -> str:
@@ -94,87 +129,189 @@ def _get_conn(project: str | None = None):
 
 @app.get("/api/projects")
 def api_projects():
-    """Список проектов для переключателя дашборда (id и отображаемое имя)."""
+    """Список проектов для переключателя дашборда (id и отображаемое имя) + сводный «all»."""
     return {
-        "projects": [
-            {"id": "flow", "label": "FLOW"},
-            {"id": "fulfilment", "label": "Фулфилмент"},
-        ],
+        "projects": [{"id": pid, "label": label} for pid, label in db.PROJECT_LABELS.items()],
+        "aggregate": {"id": db.ALL_PROJECTS, "label": "Все проекты"},
         "default": db.DEFAULT_PROJECT,
     }
 
 
-def _project_from_request(request: Request, project: str | None = None) -> str:
-    """Проект из query param или заголовка X-Requested-Project."""
-    if project and str(project).strip():
-        return _normalize_project(project)
-    header = request.headers.get("X-Requested-Project") if request else None
-    if header and str(header).strip():
-        return _normalize_project(header)
+def _project_from_request(request: Request, project: str | None = None, allow_all: bool = False) -> str:
+    """
+    Проект из query param или заголовка X-Requested-Project. allow_all — пропускать «all» (сводные эндпоинты);
+    остальные эндпоинты на «all» отвечают 400, а не подставляют проект по умолчанию.
+    """
+    for value in (project, request.headers.get("X-Requested-Project") if request else None):
+        if value and str(value).strip():
+            if str(value).strip().lower() == db.ALL_PROJECTS:
+                if allow_all:
+                    return db.ALL_PROJECTS
+                raise HTTPException(
+                    status_code=400,
+                    detail="Для «Все проекты» этот раздел недоступен — выберите проект: " + ", ".join(db.PROJECTS),
+                )
+            return _normalize_project(value)
     return db.DEFAULT_PROJECT
 
 
+async def _cached_db_response(request: Request, proj: str, endpoint: str, params: tuple, compute):
+    """
+    Ответ read-эндпоинта через response_cache: compute(conn) выполняется (и соединение
+    открывается) только при изменении данных проекта; иначе — готовые байты или 304 по ETag.
+    Работа с SQLite — в пуле БД (aio.run_db), event loop не блокируется.
+    """
+    def _compute():
+        conn = _get_conn(proj)
+        try:
+            return compute(conn)
+        finally:
+            conn.close()
+
+    return await aio.run_db(response_cache.cached_json, request, proj, endpoint, params, _compute)
+
+
+async def _cached_aggregate_response(request: Request, endpoint: str, params: tuple, compute):
+    """То же для project=all: compute() сам опрашивает БД всех проектов (aggregate.py)."""
+    return await aio.run_db(response_cache.cached_json, request, db.ALL_PROJECTS, endpoint, params, compute)
+
+
 @app.get("/api/stats")
-def api_stats(
+async def api_stats(
     request: Request,
     channel: str | None = Query(None),
-    project: str | None = Query(None, description="flow | fulfilment"),
+    project: str | None = Query(None, description="flow | fulfilment | all"),
 ):
     """Сводная статистика: всего запусков, успешных, ошибок, сегодня, success_rate. channel: zen, telegram, site, vk, vc_ru."""
-    proj = _project_from_request(request, project)
-    conn = _get_conn(proj)
+    proj = _project_from_request(request, project, allow_all=True)
     try:
-        return db.get_stats(conn, channel=channel)
+        if proj == db.ALL_PROJECTS:
+            return await _cached_aggregate_response(
+                request, "stats", (channel,),
+                lambda: aggregate.get_stats_all(channel=channel),
+            )
+        return await _cached_db_response(
+            request, proj, "stats", (channel,),
+            lambda conn: db.get_stats(conn, channel=channel),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Ошибка api/stats: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
 @app.get("/api/stats/timeline")
-def api_timeline(
+async def api_timeline(
     request: Request,
     days: int = Query(30, ge=1, le=365),
     channel: str | None = Query(None),
-    project: str | None = Query(None, description="flow | fulfilment"),
+    project: str | None = Query(None, description="flow | fulfilment | all"),
 ):
     """Публикации по дням для графика. channel: фильтр по каналу."""
-    proj = _project_from_request(request, project)
-    conn = _get_conn(proj)
+    proj = _project_from_request(request, project, allow_all=True)
     try:
-        return db.get_timeline(conn, days=days, channel=channel)
+        if proj == db.ALL_PROJECTS:
+            return await _cached_aggregate_response(
+                request, "timeline", (days, channel),
+                lambda: aggregate.get_timeline_all(days=days, channel=channel),
+            )
+        return await _cached_db_response(
+            request, proj, "timeline", (days, channel),
+            lambda conn: db.get_timeline(conn, days=days, channel=channel),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Ошибка api/stats/timeline: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+
+@app.get("/api/stats/latency")
+async def api_latency(
+    request: Request,
+    days: int = Query(30, ge=1, le=365),
+    project: str | None = Query(None, description="flow | fulfilment | all"),
+):
+    """
+    Длительность шагов и запусков: p50/p90/p99 (мс), доля ошибок и тренд по дням.
+    Считается по гистограммам step_latency, которые RunTracker пополняет на каждом шаге.
+    """
+    proj = _project_from_request(request, project, allow_all=True)
+    try:
+        if proj == db.ALL_PROJECTS:
+            return await _cached_aggregate_response(
+                request, "latency", (days,),
+                lambda: aggregate.get_latency_all(days=days),
+            )
+        return await _cached_db_response(
+            request, proj, "latency", (days,),
+            lambda conn: latency.summarize(db.get_latency_buckets(conn, days=days)),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка api/stats/latency: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/stats/usage")
+async def api_usage(
+    request: Request,
+    days: int = Query(30, ge=1, le=365),
+    run_id: int | None = Query(None, description="Только вызовы одного запуска"),
+    project: str | None = Query(None, description="flow | fulfilment | all"),
+):
+    """
+    Расход GRS AI: вызовы, токены, байты, время и повторы — итого, по шагам, моделям и дням.
+    Записи пишет учёт в blocks/ai_integrations/usage.py (шаг — из RunTracker.step).
+    """
+    proj = _project_from_request(request, project, allow_all=run_id is None)
+    try:
+        if proj == db.ALL_PROJECTS:
+            return await _cached_aggregate_response(
+                request, "usage", (days,),
+                lambda: aggregate.get_usage_all(days=days),
+            )
+        return await _cached_db_response(
+            request, proj, "usage", (days, run_id),
+            lambda conn: usage_stats.summarize(db.get_usage_rows(conn, days=days, run_id=run_id), db.get_step_labels(conn)),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка api/stats/usage: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/stats/funnel")
 def api_funnel(
     request: Request,
     channel: str | None = Query(None, description="zen, telegram, site, vk, vc_ru"),
-    project: str | None = Query(None, description="flow | fulfilment"),
+    project: str | None = Query(None, description="flow | fulfilment | all"),
 ):
     """Воронка по каналу (просмотры и т.д.). Пока заглушка — данные зависят от канала."""
-    # TODO: собирать метрики по каналам (просмотры, клики и т.д.)
-    return {"channel": channel or "", "stages": [], "note": "Данные воронки пока не собираются"}
+    proj = _project_from_request(request, project, allow_all=True)
+    # TODO: собирать метрики по каналам (просмотры, клики и т.д.); для all — сумма по проектам
+    return {"channel": channel or "", "project": proj, "stages": [], "note": "Данные воронки пока не собираются"}
 
 
 @app.get("/api/runs")
-def api_runs(
+async def api_runs(
     request: Request,
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
     status: str | None = Query(None),
     channel: str | None = Query(None),
-    project: str | None = Query(None, description="flow | fulfilment"),
+    project: str | None = Query(None, description="flow | fulfilment | all"),
 ):
-    """Список запусков (новые первые), с шагами для отображения цепочки. channel: фильтр по каналу."""
-    proj = _project_from_request(request, project)
-    conn = _get_conn(proj)
-    try:
+    """
+    Список запусков (новые первые), с шагами для отображения цепочки. channel: фильтр по каналу.
+    project=all — общая лента всех проектов, в каждом запуске поле project.
+    """
+    proj = _project_from_request(request, project, allow_all=True)
+
+    def _runs(conn):
         rows = db.get_runs(conn, limit=limit, offset=offset, status=status, channel=channel)
         result = []
         for r in rows:
@@ -185,23 +322,31 @@ def api_runs(
             run = Run.from_row(t, steps=steps)
             result.append(run.to_dict())
         return result
+
+    try:
+        if proj == db.ALL_PROJECTS:
+            return await _cached_aggregate_response(
+                request, "runs", (limit, offset, status, channel),
+                lambda: aggregate.get_runs_all(limit=limit, offset=offset, status=status, channel=channel),
+            )
+        return await _cached_db_response(request, proj, "runs", (limit, offset, status, channel), _runs)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Ошибка api/runs: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
 @app.get("/api/runs/{run_id:int}")
-def api_run_detail(
+async def api_run_detail(
     request: Request,
     run_id: int,
     project: str | None = Query(None, description="flow | fulfilment"),
 ):
     """Детали запуска со всеми шагами."""
     proj = _project_from_request(request, project)
-    conn = _get_conn(proj)
-    try:
+
+    def _run_detail(conn):
         row = db.get_run(conn, run_id)
         if row is None:
             raise HTTPException(status_code=404, detail="Run not found")
@@ -209,30 +354,143 @@ def api_run_detail(
         steps = [Step.from_row(_row_to_tuple(s)) for s in steps_rows]
         run = Run.from_row(_row_to_tuple(row), steps=steps)
         return run.to_dict()
+
+    try:
+        return await _cached_db_response(request, proj, "run", (run_id,), _run_detail)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("Ошибка api/runs/%s: %s", run_id, e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
-
-
-# Список systemd-сервисов для страницы «Сервисы» (только Linux): (unit, label, description).
-# Соответствует проектным юнитам на сервере (analytics, grs, orchestrator, script_board, zakazy_forwarder и др.).
-SERVER_SERVICES = [
-    ("analytics-dashboard", "Дашборд аналитики", "Веб-интерфейс: сводка запусков, графики и статус сервисов"),
-    ("analytics-dashboard-staging", "Дашборд аналитики (staging)", "Стейжинг дашборда для ветки dev"),
-    ("analytics-telegram-bot", "Telegram-бот дашборда", "Уведомления в Telegram о запусках и ошибках пайплайна"),
-    ("github-webhook", "GitHub Webhook", "Автодеплой по push в репозиторий"),
-    ("grs-image-web", "Генерация картинок и ссылок", "Веб-интерфейс генерации изображений и загрузки ссылок (flowimage.ru)"),
-    ("grs-image-web-staging", "Генерация картинок (staging)", "Стейжинг flowimage для ветки dev"),
-    ("orchestrator-kz", "Оркестратор контент завода", "Оркестратор: генерация и публикация (Дзен, Telegram) только по расписанию"),
-    ("script-board", "Script Board", "Доска скриптов диалогов (script.flowcabinet.ru)"),
-    ("contentzavod-watchdog", "Watchdog", "Следит за сервисами и сообщает при сбоях"),
-    ("zakazy-forwarder", "Zakazy Forwarder", "Пересылка заказов из каналов в обработку"),
-    ("quickpack", "Quickpack", "Сайт Quickpack на сервере"),
-]
+
+
+def _step_trace_track(step: Step) -> tuple | None:
+    """Дорожка трассы для шага: спаны из metadata (ZEN_TRACE) или один спан на весь шаг."""
+    meta = None
+    if step.metadata:
+        try:
+            meta = json.loads(step.metadata)
+        except ValueError:
+            meta = None
+    if isinstance(meta, dict) and meta.get("spans"):
+        return step.label or step.name, meta
+    if not step.started_at or not step.finished_at:
+        return None
+    try:
+        started = datetime.fromisoformat(step.started_at).timestamp()
+        finished = datetime.fromisoformat(step.finished_at).timestamp()
+    except ValueError:
+        return None
+    span = {"name": step.label or step.name, "start_ms": 0, "dur_ms": round((finished - started) * 1000, 1)}
+    if step.status == "failed":
+        span["args"] = {"status": "failed"}
+    return step.label or step.name, {"started_at": started, "spans": [span]}
+
+
+@app.get("/api/runs/{run_id:int}/trace")
+async def api_run_trace(
+    request: Request,
+    run_id: int,
+    project: str | None = Query(None, description="flow | fulfilment"),
+):
+    """Трасса запуска в формате Chrome trace-event (chrome://tracing, Perfetto): шаги и спаны ZEN_TRACE."""
+    from blocks.autopost_zen.zen_trace import spans_to_chrome_trace
+
+    proj = _project_from_request(request, project)
+
+    def _trace():
+        conn = _get_conn(proj)
+        try:
+            if db.get_run(conn, run_id) is None:
+                raise HTTPException(status_code=404, detail="Run not found")
+            steps = [Step.from_row(_row_to_tuple(s)) for s in db.get_steps_for_run(conn, run_id)]
+            tracks = [t for t in (_step_trace_track(s) for s in steps) if t is not None]
+            return spans_to_chrome_trace(tracks)
+        finally:
+            conn.close()
+
+    try:
+        return await aio.run_db(_trace)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка api/runs/%s/trace: %s", run_id, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/runs/{run_id:int}/thumbnail")
+async def api_run_thumbnail(
+    request: Request,
+    run_id: int,
+    project: str | None = Query(None, description="flow | fulfilment"),
+):
+    """Превью обложки статьи запуска (вариант thumb из renditions, WebP 480 px)."""
+    from blocks.autopost_zen import publish_registry, renditions
+
+    proj = _project_from_request(request, project)
+
+    def _thumbnail() -> Path | None:
+        conn = _get_conn(proj)
+        try:
+            row = db.get_run(conn, run_id)
+        finally:
+            conn.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Run not found")
+        publish_dir = Run.from_row(_row_to_tuple(row)).publish_dir
+        article_dir = Path(publish_dir) if publish_dir else publish_registry.by_run(run_id)
+        if article_dir and not article_dir.is_absolute():
+            article_dir = publish_registry.BLOCK_DIR / article_dir
+        if not article_dir or not (article_dir / "article.json").is_file():
+            return None
+        article = json.loads((article_dir / "article.json").read_text(encoding="utf-8"))
+        cover = article.get("cover_image")
+        return renditions.lookup(article, article_dir, cover, "thumb") if cover else None
+
+    try:
+        path = await aio.run_db(_thumbnail)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка api/runs/%s/thumbnail: %s", run_id, e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Превью нет")
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": "max-age=86400"})
+
+
+@app.get("/api/archive")
+def api_archive(
+    request: Request,
+    project: str | None = Query(None, description="flow | fulfilment"),
+):
+    """Месяцы, вынесенные из БД в архив (retention.py): [{month, size}]."""
+    proj = _project_from_request(request, project)
+    return {"project": proj, "retention_days": retention.RETENTION_DAYS, "months": retention.list_archive_months(proj)}
+
+
+@app.get("/api/archive/runs")
+def api_archive_runs(
+    request: Request,
+    month: str = Query(..., description="YYYY-MM"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    project: str | None = Query(None, description="flow | fulfilment"),
+):
+    """Запуски из архива за месяц (тот же формат, что /api/runs). Читается с диска по запросу."""
+    proj = _project_from_request(request, project)
+    try:
+        runs = retention.read_archive(proj, month, limit=limit, offset=offset)
+    except (OSError, ValueError) as e:
+        logger.exception("Ошибка api/archive/runs: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if runs is None:
+        raise HTTPException(status_code=404, detail="Архива за этот месяц нет")
+    return runs
+
+
+# Список systemd-сервисов для страницы «Сервисы»: общий с watchdog (см. services_status.py).
+SERVER_SERVICES = services_status.SERVER_SERVICES
 
 
 # Корень проекта (для чтения storage/orchestrator_kz_state.json и порядка сервисов)
@@ -355,21 +613,32 @@ def _remote_base() -> str | None:
     return url.rstrip("/") if url else None
 
 
-def _fetch_remote_server_services() -> dict | None:
+async def _fetch_remote_server_services() -> dict | None:
     """Запросить статус сервисов с удалённого сервера (для локального дашборда)."""
     base = _remote_base()
     if not base:
         return None
     try:
-        req = UrlRequest(base + "/api/server-services", headers={"Accept": "application/json"})
-        with urlopen(req, timeout=10) as r:
-            return json.loads(r.read().decode())
-    except (URLError, HTTPError, ValueError, OSError) as e:
+        r = await aio.REMOTE.request("GET", base + "/api/server-services", timeout=10, headers={"Accept": "application/json"})
+        r.raise_for_status()
+        return r.json()
+    except (httpx.HTTPError, ValueError) as e:
         logger.warning("Не удалось загрузить сервисы с %s: %s", base, e)
         return None
 
 
-def _proxy_post_to_remote(path: str, request: Request) -> dict:
+def _remote_error_detail(r: httpx.Response, json_detail: bool) -> str:
+    """Текст ошибки удалённого сервера: поле detail из JSON (если json_detail) или тело ответа."""
+    try:
+        body = r.text
+        if not body:
+            return r.reason_phrase or str(r.status_code)
+        return r.json().get("detail", body) if json_detail else body
+    except Exception:
+        return r.reason_phrase or str(r.status_code)
+
+
+async def _proxy_post_to_remote(path: str, request: Request) -> dict:
     """
     Отправить POST на удалённый сервер и вернуть JSON. Если сервер вернул ошибку — пробросить HTTPException.
     Используется, когда дашборд запущен не на Linux (например локально), а управление сервисами на удалённом сервере.
@@ -381,44 +650,34 @@ def _proxy_post_to_remote(path: str, request: Request) -> dict:
     project = _project_from_request(request)
     headers = {"Accept": "application/json", "Content-Type": "application/json", "X-Requested-Project": project}
     try:
-        req = UrlRequest(url, data=b"", method="POST", headers=headers)
-        with urlopen(req, timeout=20) as r:
-            return json.loads(r.read().decode())
-    except HTTPError as e:
-        try:
-            body = e.read().decode()
-            detail = json.loads(body).get("detail", body) if body else e.reason
-        except Exception:
-            detail = str(e.reason or e.code)
-        raise HTTPException(status_code=e.code, detail=detail)
-    except (URLError, ValueError, OSError) as e:
+        r = await aio.REMOTE.request("POST", url, timeout=20, content=b"", headers=headers)
+        if r.status_code >= 400:
+            raise HTTPException(status_code=r.status_code, detail=_remote_error_detail(r, json_detail=True))
+        return r.json()
+    except (httpx.HTTPError, ValueError) as e:
         logger.warning("Прокси POST %s: %s", url, e)
         raise HTTPException(status_code=502, detail=f"Не удалось связаться с сервером: {e!s}")
 
 
-def _proxy_get_to_remote(path: str, request: Request, query: str = "") -> bytes:
+async def _proxy_get_to_remote(path: str, request: Request, query: str = "") -> bytes:
     """GET с удалённого сервера (для просмотра лога run-once при локальном дашборде)."""
     base = _remote_base()
     if not base:
         raise HTTPException(status_code=501, detail="Задайте ANALYTICS_SERVER_SERVICES_URL для просмотра лога с сервера.")
     url = base + path + ("?" + query if query else "")
+    headers = {"Accept": "text/plain", "X-Requested-Project": _project_from_request(request) or ""}
     try:
-        req = UrlRequest(url, headers={"Accept": "text/plain", "X-Requested-Project": _project_from_request(request) or ""})
-        with urlopen(req, timeout=10) as r:
-            return r.read()
-    except HTTPError as e:
-        try:
-            detail = e.read().decode() if e.fp else str(e.reason or e.code)
-        except Exception:
-            detail = str(e.reason or e.code)
-        raise HTTPException(status_code=e.code, detail=detail)
-    except (URLError, ValueError, OSError) as e:
+        r = await aio.REMOTE.request("GET", url, timeout=10, headers=headers)
+    except httpx.HTTPError as e:
         logger.warning("Прокси GET %s: %s", url, e)
         raise HTTPException(status_code=502, detail=f"Не удалось связаться с сервером: {e!s}")
+    if r.status_code >= 400:
+        raise HTTPException(status_code=r.status_code, detail=_remote_error_detail(r, json_detail=False))
+    return r.content
 
 
 @app.get("/api/server-services")
-def api_server_services(request: Request):
+async def api_server_services(request: Request):
     """
     Статус systemd-сервисов (active/failed/inactive).
     На Linux — через systemctl; на других ОС — пустой список или данные с удалённого
@@ -434,7 +693,7 @@ def api_server_services(request: Request):
         return d
 
     if sys.platform != "linux":
-        remote = _fetch_remote_server_services()
+        remote = await _fetch_remote_server_services()
         if remote and remote.get("services"):
             return with_order({"services": remote["services"], "note": "Данные с сервера"})
         # Локальный режим: те же карточки сервисов с пометкой, чтобы блок не пустой и можно тестировать вёрстку
@@ -455,99 +714,119 @@ def api_server_services(request: Request):
                 s.update(_get_orchestrator_kz_state())
             result_local.append(s)
         return with_order({"services": result_local, "note": "Статус сервисов отображается только при запуске на Linux-сервере."})
+    return with_order({"services": await aio.run_io(_get_server_services_cached)})
+
+
+def _collect_server_services() -> list[dict]:
+    """
+    Статус всех SERVER_SERVICES за один проход: один `systemctl show` на все юниты,
+    HTTP-проверки (Quickpack) параллельно с ним. Если watchdog недавно опубликовал
+    снимок (storage/services_state.json) — берём его и systemd не опрашиваем. Снимок, снятый
+    до последнего start/stop из дашборда, не годится: в нём состояние до действия.
+    """
+    with _services_cache_lock:
+        invalidated_at = _services_cache["invalidated_at"]
+    snapshot = services_status.read_snapshot(SERVER_SERVICES_SNAPSHOT_MAX_AGE_SEC, not_before=invalidated_at)
+    if snapshot is not None:
+        props_by_unit, probes = snapshot
+    else:
+        props_by_unit, probes = services_status.collect(u[0] for u in SERVER_SERVICES)
     result = []
     for item in SERVER_SERVICES:
         unit, label = item[0], item[1]
         description = item[2] if len(item) > 2 else ""
-        # Quickpack: если задан QUICKPACK_URL — проверяем сайт по HTTP (сайт может быть без systemd-юнита)
-        health_url = os.getenv("QUICKPACK_URL", "").strip() if unit == "quickpack" else None
-        if health_url:
-            try:
-                req = UrlRequest(health_url, headers={"User-Agent": "ContentZavod-HealthCheck/1.0"})
-                with urlopen(req, timeout=8) as r:
-                    code = r.getcode()
-                result.append({
-                    "unit": unit,
-                    "label": label,
-                    "description": description,
-                    "active_state": "active" if code == 200 else "inactive",
-                    "sub_state": f"HTTP {code}" if code != 200 else "работает",
-                    "pid": None,
-                    "url": _service_public_url(unit),
-                })
-            except (URLError, HTTPError, OSError) as e:
-                logger.debug("Quickpack health check %s: %s", health_url, e)
-                result.append({
-                    "unit": unit,
-                    "label": label,
-                    "description": description,
-                    "active_state": "inactive",
-                    "sub_state": str(e)[:80] if e else "нет ответа",
-                    "pid": None,
-                    "url": _service_public_url(unit),
-                })
-            continue
+        if unit in probes:
+            ok, sub_state = probes[unit]
+            active_state, pid = ("active" if ok else "inactive"), None
+        else:
+            active_state, sub_state, pid = services_status.unit_status(props_by_unit.get(unit))
+        s = {
+            "unit": unit,
+            "label": label,
+            "description": description,
+            "active_state": active_state,
+            "sub_state": sub_state,
+            "pid": pid,
+            "url": _service_public_url(unit),
+        }
+        # Для orchestrator-kz добавить last_run_at и next_run_at из state-файла оркестратора
+        if unit == "orchestrator-kz":
+            s.update(_get_orchestrator_kz_state())
+        result.append(s)
+    return result
+
+
+# Кэш статуса сервисов: обновляется фоновым потоком, запрос дашборда читает готовый снимок.
+SERVER_SERVICES_CACHE_TTL_SEC = float(os.getenv("SERVER_SERVICES_CACHE_TTL", "5"))
+SERVER_SERVICES_POLL_INTERVAL_SEC = float(os.getenv("SERVER_SERVICES_POLL_INTERVAL", "5"))
+# Снимок watchdog считается свежим, пока не старше этого возраста (0 — не использовать снимок).
+# По умолчанию — интервал watchdog плюс запас на один проход (systemctl show + HTTP-проверки):
+# у работающего watchdog снимок всегда свежий, у остановленного — отбрасывается через ~20 сек.
+SERVER_SERVICES_SNAPSHOT_PASS_SEC = 5
+SERVER_SERVICES_SNAPSHOT_MAX_AGE_SEC = float(
+    os.getenv("SERVER_SERVICES_SNAPSHOT_MAX_AGE")
+    or int(os.getenv("WATCHDOG_INTERVAL", "15")) + SERVER_SERVICES_SNAPSHOT_PASS_SEC
+)
+# invalidated_at — time.time() последнего start/stop: снимки watchdog старше него не используются;
+# snapshot_mtime — mtime снимка watchdog на момент сборки кэша: более новый снимок (watchdog
+# перепроверил юниты по событию systemd) сбрасывает кэш, не дожидаясь TTL
+_services_cache: dict = {"at": 0.0, "services": None, "invalidated_at": 0.0, "snapshot_mtime": 0.0}
+_services_cache_lock = threading.Lock()
+
+
+def _refresh_server_services_cache() -> list[dict]:
+    snapshot_mtime = services_status.snapshot_mtime()
+    services = _collect_server_services()
+    with _services_cache_lock:
+        _services_cache["services"] = services
+        _services_cache["at"] = time.monotonic()
+        _services_cache["snapshot_mtime"] = snapshot_mtime
+    return services
+
+
+def _invalidate_server_services_cache() -> None:
+    """Сбросить кэш после start/stop, чтобы следующий запрос показал новый статус."""
+    with _services_cache_lock:
+        _services_cache["at"] = 0.0
+        _services_cache["invalidated_at"] = time.time()
+
+
+def _get_server_services_cached() -> list[dict]:
+    """Снимок из кэша, если он свежее TTL и watchdog с тех пор не публиковал новый; иначе — пересобрать синхронно."""
+    with _services_cache_lock:
+        services = _services_cache["services"]
+        age = time.monotonic() - _services_cache["at"]
+        cached_snapshot_mtime = _services_cache["snapshot_mtime"]
+    if (
+        services is not None
+        and age <= SERVER_SERVICES_CACHE_TTL_SEC
+        and services_status.snapshot_mtime() <= cached_snapshot_mtime
+    ):
+        return services
+    return _refresh_server_services_cache()
+
+
+def _server_services_poller() -> None:
+    while True:
         try:
-            # Без --value, чтобы парсить по ключу (порядок вывода systemctl может отличаться)
-            out = subprocess.run(
-                ["systemctl", "show", unit, "-p", "ActiveState", "-p", "SubState", "-p", "MainPID", "--no-pager"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            if out.returncode != 0:
-                # Юнит не найден или ошибка — проверяем, есть ли файл юнита на сервере
-                check = subprocess.run(
-                    ["systemctl", "list-unit-files", unit + ".service", "--no-pager", "--no-legend"],
-                    capture_output=True,
-                    text=True,
-                    timeout=3,
-                )
-                unit_exists = check.returncode == 0
-                sub_state = "не установлен" if not unit_exists else "ошибка"
-                result.append({
-                    "unit": unit,
-                    "label": label,
-                    "description": description,
-                    "active_state": "inactive",
-                    "sub_state": sub_state,
-                    "pid": None,
-                    "url": _service_public_url(unit),
-                })
-                continue
-            # Парсим KEY=VALUE (порядок строк не фиксирован на разных системах)
-            props = {}
-            for line in (out.stdout or "").strip().split("\n"):
-                line = (line or "").strip()
-                if "=" in line:
-                    k, _, v = line.partition("=")
-                    props[k.strip()] = (v or "").strip()
-            raw_active = (props.get("ActiveState") or "unknown").lower()
-            sub_state = props.get("SubState") or ""
-            pid = (props.get("MainPID") or "").strip() or None
-            if pid == "0":
-                pid = None
-            # Зелёная подсветка: active, reloading или sub_state=running
-            is_running = raw_active in ("active", "reloading") or (props.get("SubState") or "").lower() == "running"
-            active_state = "active" if is_running else raw_active
-            result.append({
-                "unit": unit,
-                "label": label,
-                "description": description,
-                "active_state": active_state,
-                "sub_state": sub_state,
-                "pid": pid,
-                "url": _service_public_url(unit),
-            })
+            _refresh_server_services_cache()
         except Exception as e:
-            logger.warning("systemctl show %s: %s", unit, e)
-            result.append({"unit": unit, "label": label, "description": description, "active_state": "error", "sub_state": str(e), "pid": None, "url": _service_public_url(unit)})
-    # Для orchestrator-kz добавить last_run_at и next_run_at из state-файла оркестратора
-    for s in result:
-        if s.get("unit") == "orchestrator-kz":
-            s.update(_get_orchestrator_kz_state())
-            break
-    return with_order({"services": result})
+            logger.warning("Фоновое обновление статуса сервисов: %s", e)
+        time.sleep(SERVER_SERVICES_POLL_INTERVAL_SEC)
+
+
+@app.on_event("startup")
+def _start_server_services_poller() -> None:
+    """Фоновый опрос systemd только на Linux-сервере (локально статус берётся с удалённого сервера)."""
+    if sys.platform != "linux" or SERVER_SERVICES_POLL_INTERVAL_SEC <= 0:
+        return
+    threading.Thread(target=_server_services_poller, name="server-services-poller", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def _close_upstreams() -> None:
+    """Закрыть пул соединений прокси на удалённый сервер."""
+    await aio.REMOTE.aclose()
 
 
 ALLOWED_SERVICE_UNITS = {u[0] for u in SERVER_SERVICES}
@@ -582,66 +861,68 @@ def api_server_services_order(request: Request, body: dict = Body(...)):
 
 
 @app.post("/api/server-services/{unit}/start")
-def api_server_service_start(unit: str, request: Request):
+async def api_server_service_start(unit: str, request: Request):
     """Запустить systemd-сервис (на Linux — локально; иначе — прокси на ANALYTICS_SERVER_SERVICES_URL)."""
     if unit not in ALLOWED_SERVICE_UNITS:
         raise HTTPException(status_code=400, detail="Сервис не в списке")
     if sys.platform != "linux":
-        return _proxy_post_to_remote(f"/api/server-services/{unit}/start", request)
+        return await _proxy_post_to_remote(f"/api/server-services/{unit}/start", request)
     try:
         # Для оркестратора снимаем паузу при ручном старте из дашборда.
         if unit == "orchestrator-kz" and _ORCHESTRATOR_PAUSED_FILE.exists():
             _ORCHESTRATOR_PAUSED_FILE.unlink()
         cmd = _systemctl_cmd() + ["start", unit]
-        out = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-        if out.returncode != 0:
-            raise HTTPException(status_code=502, detail=out.stderr or out.stdout or "Ошибка systemctl start")
+        returncode, stdout, stderr = await aio.run_cmd(cmd, timeout=15)
+        if returncode != 0:
+            raise HTTPException(status_code=502, detail=stderr or stdout or "Ошибка systemctl start")
         _set_manual_stopped(unit, False)
+        _invalidate_server_services_cache()
         return {"ok": True, "unit": unit}
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Таймаут")
     except FileNotFoundError:
         raise HTTPException(status_code=503, detail="systemctl/sudo недоступен")
 
 
-def _kill_all_orchestrator_processes() -> None:
+async def _kill_all_orchestrator_processes() -> None:
     """Убить все процессы оркестратора (python -m blocks.autopost_zen), чтобы ни один не остался работающим."""
     try:
         pkill_cmd = ["pkill", "-9", "-f", "blocks.autopost_zen"] if os.geteuid() == 0 else ["sudo", "-n", "pkill", "-9", "-f", "blocks.autopost_zen"]
-        subprocess.run(pkill_cmd, capture_output=True, text=True, timeout=10)
+        await aio.run_cmd(pkill_cmd, timeout=10)
         # pkill возвращает 1, если не найден ни один процесс — это нормально
-    except (subprocess.TimeoutExpired, FileNotFoundError, AttributeError):
+    except (asyncio.TimeoutError, FileNotFoundError, AttributeError):
         pass
 
 
 @app.post("/api/server-services/{unit}/stop")
-def api_server_service_stop(unit: str, request: Request):
+async def api_server_service_stop(unit: str, request: Request):
     """Остановить systemd-сервис (на Linux — локально; иначе — прокси на ANALYTICS_SERVER_SERVICES_URL).
     Для orchestrator-kz дополнительно убиваются все процессы оркестратора (pkill)."""
     if unit not in ALLOWED_SERVICE_UNITS:
         raise HTTPException(status_code=400, detail="Сервис не в списке")
     if sys.platform != "linux":
-        return _proxy_post_to_remote(f"/api/server-services/{unit}/stop", request)
+        return await _proxy_post_to_remote(f"/api/server-services/{unit}/stop", request)
     try:
         cmd = _systemctl_cmd() + ["stop", unit]
-        out = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-        if out.returncode != 0:
-            raise HTTPException(status_code=502, detail=out.stderr or out.stdout or "Ошибка systemctl stop")
+        returncode, stdout, stderr = await aio.run_cmd(cmd, timeout=15)
+        if returncode != 0:
+            raise HTTPException(status_code=502, detail=stderr or stdout or "Ошибка systemctl stop")
         if unit == "orchestrator-kz":
-            _kill_all_orchestrator_processes()
+            await _kill_all_orchestrator_processes()
         _set_manual_stopped(unit, True)
+        _invalidate_server_services_cache()
         return {"ok": True, "unit": unit}
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Таймаут")
     except FileNotFoundError:
         raise HTTPException(status_code=503, detail="systemctl/sudo недоступен")
 
 
 @app.post("/api/server-services/orchestrator-kz/run-once")
-def api_orchestrator_run_once(request: Request):
+async def api_orchestrator_run_once(request: Request):
     """Разовый прогон цепочки оркестратора (на Linux — локально; иначе — прокси на ANALYTICS_SERVER_SERVICES_URL)."""
     if sys.platform != "linux":
-        return _proxy_post_to_remote("/api/server-services/orchestrator-kz/run-once", request)
+        return await _proxy_post_to_remote("/api/server-services/orchestrator-kz/run-once", request)
     project = _project_from_request(request) or os.environ.get("ANALYTICS_PROJECT", "flow")
     python_bin = (_PROJECT_ROOT / "venv" / "bin" / "python")
     if not python_bin.exists():
@@ -693,15 +974,19 @@ _RUN_ONCE_LOG_MAX_BYTES = 16 * 1024
 
 
 @app.get("/api/server-services/orchestrator-kz/run-once-log", response_class=PlainTextResponse)
-def api_orchestrator_run_once_log(request: Request):
+async def api_orchestrator_run_once_log(request: Request):
     """Последние строки лога stderr разового прогона (для диагностики, если run не появился)."""
     if sys.platform != "linux":
         q = request.scope.get("query_string", b"").decode("utf-8", errors="replace")
         try:
-            body = _proxy_get_to_remote("/api/server-services/orchestrator-kz/run-once-log", request, q)
+            body = await _proxy_get_to_remote("/api/server-services/orchestrator-kz/run-once-log", request, q)
             return PlainTextResponse(body.decode("utf-8", errors="replace"))
         except HTTPException:
             raise
+    return await aio.run_io(_read_run_once_log)
+
+
+def _read_run_once_log() -> PlainTextResponse:
     path = _PROJECT_ROOT / "storage" / "run_once_stderr.log"
     if not path.exists():
         return PlainTextResponse("(файл лога ещё не создан; нажмите «Разовый прогон» и обновите эту страницу)")
@@ -767,7 +1052,6 @@ def _generation_images_summary():
     missing = {tid for tid in user_counts if tid != "0" and (not names.get(tid) or names.get(tid) == tid)}
     if missing:
         _ensure_generation_user_names(missing)
-        names = _load_generation_user_names()
     users_list = [
         {"telegramId": tid, "count": c, "name": names.get(tid) or tid}
         for tid, c in sorted(user_counts.items(), key=lambda x: -x[1])
@@ -800,7 +1084,6 @@ def _generation_links_summary():
     missing = {tid for tid in user_counts if tid != "0" and (not names.get(tid) or names.get(tid) == tid)}
     if missing:
         _ensure_generation_user_names(missing)
-        names = _load_generation_user_names()
     users_list = [
         {"telegramId": tid, "count": c, "name": names.get(tid) or tid}
         for tid, c in sorted(user_counts.items(), key=lambda x: -x[1])
@@ -809,28 +1092,32 @@ def _generation_links_summary():
 
 
 @app.get("/api/generation/images/summary")
-def api_generation_images_summary():
+async def api_generation_images_summary():
     """Статистика по сгенерированным картинкам: всего, по дням, по пользователям."""
     try:
-        return _generation_images_summary()
+        return await aio.run_io(_generation_images_summary)
     except Exception as e:
         logger.exception("generation images summary: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/generation/links/summary")
-def api_generation_links_summary():
+async def api_generation_links_summary():
     """Статистика по загруженным ссылкам: всего, по дням, по пользователям."""
     try:
-        return _generation_links_summary()
+        return await aio.run_io(_generation_links_summary)
     except Exception as e:
         logger.exception("generation links summary: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/generation/images/user/{telegram_id}")
-def api_generation_images_user(telegram_id: str):
+async def api_generation_images_user(telegram_id: str):
     """Список генераций пользователя: id, prompt, date, imageProxyUrl, downloadUrl."""
+    return await aio.run_io(_generation_images_user, telegram_id)
+
+
+def _generation_images_user(telegram_id: str) -> dict:
     tid = _safe_filename(telegram_id).strip("_") or "0"
     items = []
     # Подпапка generated/<tid>/
@@ -873,8 +1160,12 @@ def api_generation_images_user(telegram_id: str):
 
 
 @app.get("/api/generation/links/user/{telegram_id}")
-def api_generation_links_user(telegram_id: str):
+async def api_generation_links_user(telegram_id: str):
     """Список загруженных ссылок пользователя: id, fullUrl, date."""
+    return await aio.run_io(_generation_links_user, telegram_id)
+
+
+def _generation_links_user(telegram_id: str) -> dict:
     tid = _safe_filename(telegram_id).strip("_") or "0"
     user_dir = UPLOADED_DIR / tid
     if not user_dir.is_dir():
@@ -1,20 +1,41 @@
 # -*- coding: utf-8 -*-
-"""SQLite: подключение, миграция, создание таблиц runs и steps."""
+"""SQLite: подключение, миграция, создание таблиц runs, steps, step_latency, errors и run_rollups."""
+import hashlib
 import os
 import sqlite3
+from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 
 from dotenv import load_dotenv
 
+from . import latency
+
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 BLOCK_DIR = Path(__file__).resolve().parent
 load_dotenv(PROJECT_ROOT / ".env")
 
 STORAGE_DIR = PROJECT_ROOT / "storage"
-# Проекты: у каждого своя БД (разные аккаунты/источники аналитики)
-PROJECTS = ["flow", "fulfilment"]  # id для API и путей
-DEFAULT_PROJECT = "flow"
+
+
+def _load_projects() -> Dict[str, str]:
+    """Проекты из ANALYTICS_PROJECTS: «id[:подпись],...» (по умолчанию flow и fulfilment)."""
+    raw = os.getenv("ANALYTICS_PROJECTS", "flow:FLOW,fulfilment:Фулфилмент")
+    projects: Dict[str, str] = {}
+    for item in raw.split(","):
+        pid, _, label = item.strip().partition(":")
+        pid = pid.strip().lower()
+        if pid and pid != ALL_PROJECTS:
+            projects[pid] = label.strip() or pid
+    return projects or {"flow": "FLOW"}
+
+
+# Псевдо-проект для сводных эндпоинтов (все БД сразу)
+ALL_PROJECTS = "all"
+# Проекты: у каждого своя БД (разные аккаунты/источники аналитики). id → подпись в дашборде
+PROJECT_LABELS = _load_projects()
+PROJECTS = list(PROJECT_LABELS)  # id для API и путей
+DEFAULT_PROJECT = "flow" if "flow" in PROJECT_LABELS else PROJECTS[0]
 
 # Одна БД по умолчанию (для обратной совместимости и env)
 _LEGACY_DB_PATH = Path(os.getenv("ANALYTICS_DB_PATH", str(STORAGE_DIR / "analytics.db")))
@@ -83,6 +104,112 @@ def _migrate(conn: sqlite3.Connection) -> None:
         CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status);
     """)
     conn.commit()
+    # Трейсбеки хранятся один раз в errors (ключ — sha256 текста), шаг ссылается через error_hash.
+    # run_rollups — итоги по дням для запусков, вынесенных в архив (retention.py).
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS errors (
+            hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS run_rollups (
+            day TEXT NOT NULL,
+            channel TEXT NOT NULL DEFAULT '',
+            total INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, channel)
+        );
+    """)
+    try:
+        conn.execute("ALTER TABLE steps ADD COLUMN error_hash TEXT")
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass  # колонка уже есть
+    has_latency = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'step_latency'"
+    ).fetchone()
+    if not has_latency:
+        # Гистограммы длительностей (см. latency.py): счётчик на (шаг, день, корзина)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS step_latency (
+                name TEXT NOT NULL,
+                day TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                label TEXT,
+                count INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, day, bucket)
+            );
+            CREATE INDEX IF NOT EXISTS idx_step_latency_day ON step_latency(day);
+        """)
+        _backfill_latency(conn)
+        conn.commit()
+    # Расход GRS AI по вызовам (blocks/ai_integrations/usage.py пишет пачками)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS grs_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            run_id INTEGER,
+            step TEXT,
+            kind TEXT NOT NULL,
+            model TEXT NOT NULL,
+            ok INTEGER NOT NULL DEFAULT 1,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            request_bytes INTEGER NOT NULL DEFAULT 0,
+            response_bytes INTEGER NOT NULL DEFAULT 0,
+            latency_ms INTEGER NOT NULL DEFAULT 0,
+            retries INTEGER NOT NULL DEFAULT 0,
+            images INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_grs_usage_ts ON grs_usage(ts);
+        CREATE INDEX IF NOT EXISTS idx_grs_usage_run_id ON grs_usage(run_id);
+    """)
+    # Чекпоинты слотов оркестратора: последнее пройденное состояние запуска и всё, что нужно,
+    # чтобы продолжить его после перезапуска (тема, строка таблицы, article.json, итоги каналов)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS slot_checkpoints (
+            run_id INTEGER PRIMARY KEY REFERENCES runs(id) ON DELETE CASCADE,
+            state TEXT NOT NULL,
+            topic TEXT,
+            extra TEXT,
+            row_index INTEGER,
+            article_path TEXT,
+            telegram_ok INTEGER,
+            zen_ok INTEGER,
+            resumes INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL
+        );
+    """)
+    conn.commit()
+
+
+def duration_ms_between(started_at: Optional[str], finished_at: Optional[str]) -> Optional[float]:
+    """Длительность между ISO-метками в мс; None — метки нет или формат не распознан."""
+    if not started_at or not finished_at:
+        return None
+    try:
+        delta = datetime.fromisoformat(finished_at) - datetime.fromisoformat(started_at)
+    except ValueError:
+        return None
+    return max(0.0, delta.total_seconds() * 1000)
+
+
+def _backfill_latency(conn: sqlite3.Connection) -> None:
+    """Однократно заполнить step_latency по уже записанным шагам и запускам."""
+    rows = conn.execute(
+        """SELECT name, label, status, started_at, finished_at FROM steps
+           WHERE status IN ('completed', 'failed') AND started_at IS NOT NULL AND finished_at IS NOT NULL"""
+    ).fetchall()
+    rows += conn.execute(
+        """SELECT ?, ?, status, started_at, finished_at FROM runs
+           WHERE status IN ('completed', 'failed') AND finished_at IS NOT NULL""",
+        (latency.RUN_KEY, latency.RUN_LABEL),
+    ).fetchall()
+    for name, label, status, started_at, finished_at in rows:
+        duration = duration_ms_between(started_at, finished_at)
+        if duration is not None:
+            record_latency(conn, name, label, started_at[:10], duration, status == "failed", commit=False)
 
 
 def insert_run(
@@ -128,6 +255,33 @@ def update_run_finished(
     conn.commit()
 
 
+SLOT_CHECKPOINT_FIELDS = ("state", "topic", "extra", "row_index", "article_path", "telegram_ok", "zen_ok", "resumes")
+
+
+def save_slot_checkpoint(conn: sqlite3.Connection, run_id: int, checkpoint: dict) -> None:
+    """Записывает чекпоинт слота (поля SLOT_CHECKPOINT_FIELDS) — одна строка на запуск."""
+    values = [checkpoint.get(f) for f in SLOT_CHECKPOINT_FIELDS]
+    values[-1] = values[-1] or 0
+    conn.execute(
+        f"""INSERT INTO slot_checkpoints (run_id, {", ".join(SLOT_CHECKPOINT_FIELDS)}, updated_at)
+            VALUES (?, {", ".join("?" for _ in SLOT_CHECKPOINT_FIELDS)}, ?)
+            ON CONFLICT(run_id) DO UPDATE SET
+            {", ".join(f"{f} = excluded.{f}" for f in SLOT_CHECKPOINT_FIELDS)}, updated_at = excluded.updated_at""",
+        (run_id, *values, datetime.now().isoformat()),
+    )
+    conn.commit()
+
+
+def get_interrupted_slots(conn: sqlite3.Connection, source: str = "schedule") -> List[dict]:
+    """Чекпоинты запусков source, которые остались в статусе running (процесс завершился посреди слота)."""
+    cur = conn.execute(
+        """SELECT c.* FROM slot_checkpoints c JOIN runs r ON r.id = c.run_id
+           WHERE r.status = 'running' AND r.source = ? ORDER BY c.run_id""",
+        (source,),
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
 def insert_step(
     conn: sqlite3.Connection,
     run_id: int,
@@ -146,6 +300,13 @@ def insert_step(
     return cur.lastrowid
 
 
+def store_error(conn: sqlite3.Connection, text: str) -> str:
+    """Сохранить текст ошибки (один раз на уникальный текст), вернуть его hash."""
+    error_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    conn.execute("INSERT OR IGNORE INTO errors (hash, text) VALUES (?, ?)", (error_hash, text))
+    return error_hash
+
+
 def update_step_started(conn: sqlite3.Connection, step_id: int, started_at: str) -> None:
     conn.execute("UPDATE steps SET status = 'running', started_at = ? WHERE id = ?", (started_at, step_id))
     conn.commit()
@@ -159,13 +320,91 @@ def update_step_finished(
     error_message: Optional[str] = None,
     metadata: Optional[str] = None,
 ) -> None:
+    error_hash = store_error(conn, error_message) if error_message else None
     conn.execute(
-        "UPDATE steps SET finished_at = ?, status = ?, error_message = ?, metadata = ? WHERE id = ?",
-        (finished_at, status, error_message, metadata, step_id),
+        "UPDATE steps SET finished_at = ?, status = ?, error_message = NULL, error_hash = ?, metadata = ? WHERE id = ?",
+        (finished_at, status, error_hash, metadata, step_id),
     )
     conn.commit()
 
 
+def record_latency(
+    conn: sqlite3.Connection,
+    name: str,
+    label: Optional[str],
+    day: str,
+    duration_ms: float,
+    failed: bool = False,
+    commit: bool = True,
+) -> None:
+    """Учесть длительность шага (или запуска — name=latency.RUN_KEY) в гистограмме дня."""
+    conn.execute(
+        """INSERT INTO step_latency (name, day, bucket, label, count, failed) VALUES (?, ?, ?, ?, 1, ?)
+           ON CONFLICT(name, day, bucket) DO UPDATE SET
+               count = count + 1, failed = failed + excluded.failed, label = excluded.label""",
+        (name, day, latency.bucket_for(duration_ms), label, 1 if failed else 0),
+    )
+    if commit:
+        conn.commit()
+
+
+def get_latency_buckets(conn: sqlite3.Connection, days: int = 30) -> List[Tuple]:
+    """Счётчики гистограмм за последние days дней: (name, label, day, bucket, count, failed)."""
+    cur = conn.execute(
+        """SELECT name, label, day, bucket, count, failed FROM step_latency
+           WHERE day >= date('now', 'localtime', ?)""",
+        (f"-{days} days",),
+    )
+    return [tuple(row) for row in cur.fetchall()]
+
+
+USAGE_FIELDS = (
+    "ts", "run_id", "step", "kind", "model", "ok", "prompt_tokens", "completion_tokens",
+    "request_bytes", "response_bytes", "latency_ms", "retries", "images",
+)
+
+
+def insert_usage(conn: sqlite3.Connection, records: List[dict]) -> None:
+    """Записать пачку вызовов GRS AI одной транзакцией."""
+    with conn:
+        conn.executemany(
+            f"INSERT INTO grs_usage ({', '.join(USAGE_FIELDS)}) VALUES ({', '.join('?' * len(USAGE_FIELDS))})",
+            [tuple(r.get(f) for f in USAGE_FIELDS) for r in records],
+        )
+
+
+def get_usage_rows(conn: sqlite3.Connection, days: int = 30, run_id: Optional[int] = None) -> List[Tuple]:
+    """
+    Расход GRS AI, сгруппированный по (день, шаг, модель, вид):
+    (day, step, model, kind, calls, failed, prompt_tokens, completion_tokens,
+     request_bytes, response_bytes, latency_ms, retries, images).
+    """
+    where, params = "ts >= date('now', 'localtime', ?)", [f"-{days} days"]
+    if run_id is not None:
+        where, params = "run_id = ?", [run_id]
+    cur = conn.execute(
+        f"""SELECT substr(ts, 1, 10) AS day, COALESCE(step, ''), model, kind, COUNT(*), SUM(1 - ok),
+                   SUM(prompt_tokens), SUM(completion_tokens), SUM(request_bytes), SUM(response_bytes),
+                   SUM(latency_ms), SUM(retries), SUM(images)
+            FROM grs_usage WHERE {where}
+            GROUP BY day, step, model, kind""",
+        params,
+    )
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def get_step_labels(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Подписи шагов по имени (из гистограмм длительностей)."""
+    return {name: label for name, label in conn.execute("SELECT name, MAX(label) FROM step_latency GROUP BY name")}
+
+
+# Колонки шага в порядке Step.from_row; error_message — из самого шага (старые записи) или из errors
+STEP_COLUMNS = (
+    "s.id, s.run_id, s.name, s.label, s.status, s.started_at, s.finished_at, "
+    "COALESCE(s.error_message, e.text) AS error_message, s.metadata, s.sort_order"
+)
+
+
 def get_run(conn: sqlite3.Connection, run_id: int) -> Optional[Tuple]:
     """Возвращает одну строку runs по id или None."""
     cur = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,))
@@ -173,22 +412,32 @@ def get_run(conn: sqlite3.Connection, run_id: int) -> Optional[Tuple]:
 
 
 def get_steps_for_run(conn: sqlite3.Connection, run_id: int) -> List[Tuple]:
-    """Возвращает список строк steps для run_id, отсортированный по sort_order."""
+    """Возвращает список строк steps для run_id, отсортированный по sort_order (текст ошибки — из errors)."""
     cur = conn.execute(
-        "SELECT * FROM steps WHERE run_id = ? ORDER BY sort_order, id",
+        f"SELECT {STEP_COLUMNS} FROM steps s LEFT JOIN errors e ON e.hash = s.error_hash "
+        "WHERE s.run_id = ? ORDER BY s.sort_order, s.id",
         (run_id,),
     )
     return cur.fetchall()
 
 
+# Допустимые порядки для get_runs (подставляются в SQL, поэтому только из словаря)
+RUNS_ORDER = {"id": "id DESC", "started_at": "started_at DESC, id DESC"}
+
+
 def get_runs(
     conn: sqlite3.Connection,
     limit: int = 50,
     offset: int = 0,
     status: Optional[str] = None,
     channel: Optional[str] = None,
+    order_by: str = "id",
 ) -> List[Tuple]:
-    """Список запусков (новые первые). channel: фильтр по каналу (zen, telegram, …); None — все. channel в БД может быть через запятую (zen,telegram)."""
+    """
+    Список запусков (новые первые). channel: фильтр по каналу (zen, telegram, …); None — все. channel в БД может быть через запятую (zen,telegram).
+    order_by: "id" или "started_at" (для слияния лент нескольких проектов, aggregate.py).
+    """
+    order = RUNS_ORDER[order_by]
     if channel:
         # Совпадение по одному из каналов в списке: ,zen, в ,zen,telegram,
         ch_like = "%," + channel + ",%"
@@ -197,33 +446,33 @@ def get_runs(
         ch_exact = channel
         if status:
             cur = conn.execute(
-                """SELECT * FROM runs WHERE status = ?
+                f"""SELECT * FROM runs WHERE status = ?
                    AND (channel = ? OR channel LIKE ? OR channel LIKE ? OR channel LIKE ?)
-                   ORDER BY id DESC LIMIT ? OFFSET ?""",
+                   ORDER BY {order} LIMIT ? OFFSET ?""",
                 (status, ch_exact, ch_like, ch_start, ch_end, limit, offset),
             )
         else:
             cur = conn.execute(
-                """SELECT * FROM runs WHERE (channel = ? OR channel LIKE ? OR channel LIKE ? OR channel LIKE ?)
-                   ORDER BY id DESC LIMIT ? OFFSET ?""",
+                f"""SELECT * FROM runs WHERE (channel = ? OR channel LIKE ? OR channel LIKE ? OR channel LIKE ?)
+                   ORDER BY {order} LIMIT ? OFFSET ?""",
                 (ch_exact, ch_like, ch_start, ch_end, limit, offset),
             )
     else:
         if status:
             cur = conn.execute(
-                "SELECT * FROM runs WHERE status = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                f"SELECT * FROM runs WHERE status = ? ORDER BY {order} LIMIT ? OFFSET ?",
                 (status, limit, offset),
             )
         else:
             cur = conn.execute(
-                "SELECT * FROM runs ORDER BY id DESC LIMIT ? OFFSET ?",
+                f"SELECT * FROM runs ORDER BY {order} LIMIT ? OFFSET ?",
                 (limit, offset),
             )
     return cur.fetchall()
 
 
 def get_stats(conn: sqlite3.Connection, channel: Optional[str] = None) -> dict:
-    """Сводная статистика: всего запусков, успешных, с ошибками, сегодня. channel=None — все каналы."""
+    """Сводная статистика: всего запусков, успешных, с ошибками, сегодня (с учётом архива). channel=None — все каналы."""
     if channel:
         like = " (channel = ? OR channel LIKE ? OR channel LIKE ? OR channel LIKE ?) "
         args = (channel, "%," + channel + ",%", channel + ",%", "%," + channel)
@@ -239,6 +488,11 @@ def get_stats(conn: sqlite3.Connection, channel: Optional[str] = None) -> dict:
             args,
         )
         today = cur.fetchone()[0]
+        rollup = conn.execute(
+            "SELECT COALESCE(SUM(total), 0), COALESCE(SUM(completed), 0), COALESCE(SUM(failed), 0) "
+            "FROM run_rollups WHERE" + like,
+            args,
+        ).fetchone()
     else:
         cur = conn.execute("SELECT COUNT(*) FROM runs")
         total = cur.fetchone()[0]
@@ -250,6 +504,13 @@ def get_stats(conn: sqlite3.Connection, channel: Optional[str] = None) -> dict:
             "SELECT COUNT(*) FROM runs WHERE date(started_at) = date('now', 'localtime')"
         )
         today = cur.fetchone()[0]
+        rollup = conn.execute(
+            "SELECT COALESCE(SUM(total), 0), COALESCE(SUM(completed), 0), COALESCE(SUM(failed), 0) FROM run_rollups"
+        ).fetchone()
+    # Запуски, вынесенные в архив, учитываются по итогам run_rollups
+    total += rollup[0]
+    completed += rollup[1]
+    failed += rollup[2]
     return {
         "total": total,
         "completed": completed,
@@ -262,22 +523,22 @@ def get_stats(conn: sqlite3.Connection, channel: Optional[str] = None) -> dict:
 def get_timeline(
     conn: sqlite3.Connection, days: int = 30, channel: Optional[str] = None
 ) -> List[dict]:
-    """Публикации по дням для графика. channel=None — все каналы."""
+    """Публикации по дням для графика (дни из архива — по run_rollups). channel=None — все каналы."""
     if channel:
-        cur = conn.execute("""
-            SELECT date(started_at) AS day, COUNT(*) AS count
-            FROM runs
-            WHERE (channel = ? OR channel LIKE ? OR channel LIKE ? OR channel LIKE ?)
-              AND started_at >= date('now', 'localtime', ?)
-            GROUP BY date(started_at)
-            ORDER BY day
-        """, (channel, "%," + channel + ",%", channel + ",%", "%," + channel, f"-{days} days"))
+        like = " (channel = ? OR channel LIKE ? OR channel LIKE ? OR channel LIKE ?) AND "
+        args = (channel, "%," + channel + ",%", channel + ",%", "%," + channel, f"-{days} days")
     else:
-        cur = conn.execute("""
-            SELECT date(started_at) AS day, COUNT(*) AS count
-            FROM runs
-            WHERE started_at >= date('now', 'localtime', ?)
-            GROUP BY date(started_at)
-            ORDER BY day
-        """, (f"-{days} days",))
-    return [{"day": row[0], "count": row[1]} for row in cur.fetchall()]
+        like, args = " ", (f"-{days} days",)
+    cur = conn.execute(
+        "SELECT date(started_at) AS day, COUNT(*) AS count FROM runs WHERE" + like
+        + "started_at >= date('now', 'localtime', ?) GROUP BY date(started_at)",
+        args,
+    )
+    counts: Dict[str, int] = {row[0]: row[1] for row in cur.fetchall()}
+    cur = conn.execute(
+        "SELECT day, SUM(total) FROM run_rollups WHERE" + like + "day >= date('now', 'localtime', ?) GROUP BY day",
+        args,
+    )
+    for day, count in cur.fetchall():
+        counts[day] = counts.get(day, 0) + count
+    return [{"day": day, "count": counts[day]} for day in sorted(counts)]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Длительность шагов и запусков: гистограммы с логарифмическими корзинами.
+
+RunTracker при завершении шага (и запуска целиком — имя RUN_KEY) увеличивает счётчик
+корзины в таблице step_latency (name, day, bucket). Перцентили p50/p90/p99, доля ошибок
+и тренд по дням считаются из этих счётчиков — без разбора ISO-времени по всей таблице steps.
+
+Корзина i покрывает [BUCKET_BASE_MS·F^i, BUCKET_BASE_MS·F^(i+1)), F = BUCKET_FACTOR;
+оценка перцентиля — геометрическая середина корзины (погрешность ≈ ±10%).
+"""
+import math
+from typing import Dict, Iterable, List, Optional
+
+BUCKET_BASE_MS = 50.0
+BUCKET_FACTOR = 1.2
+MAX_BUCKET = 80  # 50 мс · 1.2^80 ≈ 60 ч — всё, что дольше, в последней корзине
+PERCENTILES = (50, 90, 99)
+# Псевдо-шаг: длительность запуска целиком
+RUN_KEY = "__run__"
+RUN_LABEL = "Запуск целиком"
+
+
+def bucket_for(duration_ms: float) -> int:
+    """Номер корзины для длительности в мс."""
+    if duration_ms <= BUCKET_BASE_MS:
+        return 0
+    return min(MAX_BUCKET, int(math.log(duration_ms / BUCKET_BASE_MS) / math.log(BUCKET_FACTOR)))
+
+
+def bucket_value_ms(bucket: int) -> float:
+    """Представитель корзины (геометрическая середина), мс."""
+    return BUCKET_BASE_MS * BUCKET_FACTOR ** (bucket + 0.5)
+
+
+def percentile(counts: Dict[int, int], q: float) -> Optional[float]:
+    """Перцентиль q (0–100) по счётчикам {корзина: count}; None — нет данных."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for bucket in sorted(counts):
+        seen += counts[bucket]
+        if seen >= rank:
+            return round(bucket_value_ms(bucket))
+    return round(bucket_value_ms(max(counts)))
+
+
+def _summary(counts: Dict[int, int], total: int, failed: int) -> dict:
+    item = {
+        "count": total,
+        "failed": failed,
+        "failure_rate": round(100 * failed / total, 1) if total else 0,
+    }
+    for q in PERCENTILES:
+        item[f"p{q}_ms"] = percentile(counts, q)
+    return item
+
+
+def summarize(rows: Iterable) -> dict:
+    """
+    Строки (name, label, day, bucket, count, failed) → {"run": {...} | None, "steps": [...]}.
+    Для каждого шага: count, failed, failure_rate, p50_ms/p90_ms/p99_ms и trend по дням.
+    Одинаковые (name, day, bucket) из разных БД суммируются — годится для project=all.
+    """
+    by_name: Dict[str, dict] = {}
+    for name, label, day, bucket, count, failed in rows:
+        entry = by_name.setdefault(name, {"label": label or name, "buckets": {}, "days": {}, "count": 0, "failed": 0})
+        entry["buckets"][bucket] = entry["buckets"].get(bucket, 0) + count
+        day_entry = entry["days"].setdefault(day, {"buckets": {}, "count": 0, "failed": 0})
+        day_entry["buckets"][bucket] = day_entry["buckets"].get(bucket, 0) + count
+        day_entry["count"] += count
+        day_entry["failed"] += failed
+        entry["count"] += count
+        entry["failed"] += failed
+
+    steps: List[dict] = []
+    run: Optional[dict] = None
+    for name, entry in by_name.items():
+        item = {"name": name, "label": entry["label"]}
+        item.update(_summary(entry["buckets"], entry["count"], entry["failed"]))
+        item["trend"] = [
+            dict(day=day, **_summary(d["buckets"], d["count"], d["failed"]))
+            for day, d in sorted(entry["days"].items())
+        ]
+        if name == RUN_KEY:
+            item["label"] = RUN_LABEL
+            run = item
+        else:
+            steps.append(item)
+    steps.sort(key=lambda s: -s["count"])
+    return {"run": run, "steps": steps}
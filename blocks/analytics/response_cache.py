@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Кеш ответов read-эндпоинтов дашборда (/api/stats, /api/stats/timeline, /api/stats/latency,
+/api/runs, /api/runs/{id}) с ETag и условными запросами.
+
+Ключ — (проект, эндпоинт, параметры). Запись валидна, пока не изменилась версия данных
+проекта (для project=all — версии всех проектов): PRAGMA data_version на отдельном
+«пробном» соединении растёт при каждом commit из другого соединения (RunTracker,
+оркестратор, seed). Плюс текущая дата — «сегодня» и окно timeline сдвигаются в полночь
+без изменения данных.
+
+Попадание в кеш — поиск в словаре без SQL и без сериализации JSON; если клиент прислал
+If-None-Match с тем же ETag — ответ 304 без тела.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from . import db
+
+MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+_entries: "OrderedDict[Tuple, Tuple[Tuple, str, bytes]]" = OrderedDict()
+_probe_conns: Dict[str, sqlite3.Connection] = {}
+_probe_lock = threading.Lock()
+
+
+def data_version(project: str) -> Tuple[int, str]:
+    """
+    Версия данных проекта: (PRAGMA data_version, путь к БД). Пробное соединение держим
+    открытым — data_version имеет смысл только в пределах одного соединения.
+    """
+    path = str(db.get_db_path(project))
+    with _probe_lock:
+        conn = _probe_conns.get(project)
+        if conn is None:
+            conn = db.get_connection(project=project)
+            _probe_conns[project] = conn
+        try:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            # Файл БД пересоздан/недоступен — переоткрываем и считаем данные изменёнными
+            _probe_conns.pop(project, None)
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return -1, path
+    return version, path
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match") if request else None
+    if not header:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in header.split(","))
+
+
+def _respond(request: Request, etag: str, body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_json(
+    request: Request,
+    project: str,
+    endpoint: str,
+    params: Hashable,
+    compute: Callable[[], Any],
+) -> Response:
+    """
+    Ответ из кеша, если версия данных не изменилась; иначе compute() → JSON → кеш.
+    Исключения compute() (в т.ч. HTTPException 404) пробрасываются и не кешируются.
+    """
+    projects = db.PROJECTS if project == db.ALL_PROJECTS else [project]
+    versions = tuple(data_version(p) for p in projects)
+    cacheable = all(v[0] >= 0 for v in versions)
+    stamp = (versions, date.today().isoformat())
+    key = (project, endpoint, params)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == stamp and cacheable:
+            _entries.move_to_end(key)
+            return _respond(request, entry[1], entry[2])
+    body = json.dumps(compute(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = _etag(body)
+    if cacheable:
+        with _lock:
+            _entries[key] = (stamp, etag, body)
+            _entries.move_to_end(key)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return _respond(request, etag, body)
+
+
+def invalidate(project: Optional[str] = None) -> None:
+    """Сбросить кеш (всего или одного проекта) — для записей из самого процесса дашборда."""
+    with _lock:
+        if project is None:
+            _entries.clear()
+            return
+        for key in [k for k in _entries if k[0] in (project, db.ALL_PROJECTS)]:
+            _entries.pop(key, None)
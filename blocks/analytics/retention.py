@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Хранение истории аналитики: архив старых запусков, итоги по дням, компактация БД.
+
+Что делает один проход (по каждому проекту):
+1. Запуски старше ANALYTICS_RETENTION_DAYS дней (кроме running) вместе с шагами
+   дописываются в помесячный архив storage/analytics_archive/<проект>/runs-YYYY-MM.jsonl.gz
+   (одна строка — запуск со всеми шагами), их итоги по дням попадают в run_rollups
+   (сводка и график дашборда продолжают их учитывать), затем строки удаляются из БД.
+2. Старые трейсбеки из steps.error_message переносятся в errors (один текст на hash).
+3. Неиспользуемые записи errors удаляются, записи расхода GRS AI (grs_usage) старше
+   того же срока — тоже.
+4. PRAGMA incremental_vacuum + ANALYZE. Первый проход один раз переводит БД в
+   auto_vacuum=INCREMENTAL (полный VACUUM).
+
+Архив читает дашборд: GET /api/archive и /api/archive/runs?month=YYYY-MM.
+
+Запуск: python -m blocks.analytics.retention [--project flow] [--days 180] [--dry-run]
+На сервере — по таймеру systemd (docs/scripts/deploy_beget/analytics-retention.timer.example).
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from blocks.analytics import db
+from blocks.analytics.models import Run, Step
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "180"))
+_archive_dir = Path(os.getenv("ANALYTICS_ARCHIVE_DIR", str(db.STORAGE_DIR / "analytics_archive")))
+ARCHIVE_DIR = _archive_dir if _archive_dir.is_absolute() else PROJECT_ROOT / _archive_dir
+BATCH_SIZE = 500
+VACUUM_PAGES = 2000  # страниц за один incremental_vacuum
+_MONTH_RE = re.compile(r"^runs-(\d{4}-\d{2})\.jsonl\.gz$")
+
+
+def _archive_path(project: str, month: str) -> Path:
+    return ARCHIVE_DIR / project / f"runs-{month}.jsonl.gz"
+
+
+def _load_runs(conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> List[dict]:
+    result = []
+    for row in rows:
+        steps = [Step.from_row(tuple(s)) for s in db.get_steps_for_run(conn, row["id"])]
+        result.append(Run.from_row(tuple(row), steps=steps).to_dict())
+    return result
+
+
+def _write_archive(project: str, runs: List[dict]) -> None:
+    """Дописать запуски в помесячные файлы. gzip в режиме «ab» добавляет новый member — файл читается целиком."""
+    by_month: Dict[str, List[dict]] = {}
+    for run in runs:
+        by_month.setdefault((run.get("started_at") or "")[:7] or "unknown", []).append(run)
+    for month, items in by_month.items():
+        path = _archive_path(project, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "ab") as f:
+            for run in items:
+                f.write(json.dumps(run, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileobj.fileno())
+
+
+def archive_old_runs(conn: sqlite3.Connection, project: str, days: int = RETENTION_DAYS, dry_run: bool = False) -> int:
+    """Перенести запуски старше days дней в архив + run_rollups. Возвращает число перенесённых."""
+    archived = 0
+    while True:
+        rows = conn.execute(
+            """SELECT * FROM runs WHERE status != 'running' AND started_at < date('now', 'localtime', ?)
+               ORDER BY id LIMIT ?""",
+            (f"-{days} days", BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            return archived
+        if dry_run:
+            return archived + conn.execute(
+                "SELECT COUNT(*) FROM runs WHERE status != 'running' AND started_at < date('now', 'localtime', ?)",
+                (f"-{days} days",),
+            ).fetchone()[0]
+        runs = _load_runs(conn, rows)
+        # Сначала архив на диск, потом удаление: при сбое между ними запуск окажется в архиве дважды, но не пропадёт
+        _write_archive(project, runs)
+        ids = [r["id"] for r in runs]
+        marks = ",".join("?" * len(ids))
+        with conn:
+            for run in runs:
+                conn.execute(
+                    """INSERT INTO run_rollups (day, channel, total, completed, failed) VALUES (?, ?, 1, ?, ?)
+                       ON CONFLICT(day, channel) DO UPDATE SET
+                           total = total + 1,
+                           completed = completed + excluded.completed,
+                           failed = failed + excluded.failed""",
+                    (
+                        (run["started_at"] or "")[:10],
+                        run.get("channel") or "",
+                        1 if run["status"] == "completed" else 0,
+                        1 if run["status"] == "failed" else 0,
+                    ),
+                )
+            conn.execute(f"DELETE FROM steps WHERE run_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM slot_checkpoints WHERE run_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM runs WHERE id IN ({marks})", ids)
+        archived += len(ids)
+
+
+def compact_errors(conn: sqlite3.Connection, dry_run: bool = False) -> int:
+    """Перенести трейсбеки, записанные до таблицы errors, в errors (steps.error_hash)."""
+    moved = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, error_message FROM steps WHERE error_message IS NOT NULL LIMIT ?",
+            (BATCH_SIZE,),
+        ).fetchall()
+        if not rows:
+            return moved
+        if dry_run:
+            return conn.execute("SELECT COUNT(*) FROM steps WHERE error_message IS NOT NULL").fetchone()[0]
+        with conn:
+            for step_id, text in rows:
+                conn.execute(
+                    "UPDATE steps SET error_hash = ?, error_message = NULL WHERE id = ?",
+                    (db.store_error(conn, text), step_id),
+                )
+        moved += len(rows)
+
+
+def prune_errors(conn: sqlite3.Connection) -> int:
+    """Удалить тексты ошибок, на которые больше не ссылается ни один шаг."""
+    with conn:
+        cur = conn.execute(
+            "DELETE FROM errors WHERE hash NOT IN (SELECT error_hash FROM steps WHERE error_hash IS NOT NULL)"
+        )
+    return cur.rowcount
+
+
+def prune_usage(conn: sqlite3.Connection, days: int = RETENTION_DAYS) -> int:
+    """Удалить записи расхода GRS AI старше days дней."""
+    with conn:
+        cur = conn.execute("DELETE FROM grs_usage WHERE ts < date('now', 'localtime', ?)", (f"-{days} days",))
+    return cur.rowcount
+
+
+def compact(conn: sqlite3.Connection) -> str:
+    """incremental_vacuum + ANALYZE; при первом запуске — переход на auto_vacuum=INCREMENTAL."""
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        result = "vacuum (переход на auto_vacuum=INCREMENTAL)"
+    else:
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+        result = "incremental_vacuum"
+    conn.execute("ANALYZE")
+    conn.commit()
+    return result
+
+
+def run_retention(project: str, days: int = RETENTION_DAYS, dry_run: bool = False) -> dict:
+    """Полный проход по одному проекту. Возвращает сводку для лога."""
+    path = db.get_db_path(project)
+    if not path.exists():
+        return {"project": project, "skipped": "нет БД"}
+    size_before = path.stat().st_size
+    conn = db.get_connection(project=project)
+    try:
+        summary = {
+            "project": project,
+            "archived_runs": archive_old_runs(conn, project, days=days, dry_run=dry_run),
+            "compacted_errors": compact_errors(conn, dry_run=dry_run),
+        }
+        if not dry_run:
+            summary["pruned_errors"] = prune_errors(conn)
+            summary["pruned_usage"] = prune_usage(conn, days=days)
+            summary["vacuum"] = compact(conn)
+    finally:
+        conn.close()
+    summary["size_before"] = size_before
+    summary["size_after"] = path.stat().st_size
+    return summary
+
+
+def list_archive_months(project: str) -> List[dict]:
+    """Месяцы в архиве проекта: [{month, size}] от новых к старым."""
+    folder = ARCHIVE_DIR / project
+    if not folder.is_dir():
+        return []
+    months = []
+    for path in folder.iterdir():
+        m = _MONTH_RE.match(path.name)
+        if m:
+            months.append({"month": m.group(1), "size": path.stat().st_size})
+    return sorted(months, key=lambda x: x["month"], reverse=True)
+
+
+def read_archive(project: str, month: str, limit: int = 50, offset: int = 0) -> Optional[List[dict]]:
+    """Запуски из архива за месяц (новые первые). None — архива за этот месяц нет."""
+    if not re.fullmatch(r"\d{4}-\d{2}", month or ""):
+        return None
+    path = _archive_path(project, month)
+    if not path.is_file():
+        return None
+    runs: Dict[int, dict] = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                run = json.loads(line)
+                runs[run["id"]] = run  # повтор после сбоя — берём последнюю копию
+    ordered = sorted(runs.values(), key=lambda r: r.get("started_at") or "", reverse=True)
+    return ordered[offset:offset + limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Архив и компактация БД аналитики")
+    parser.add_argument("--project", choices=db.PROJECTS, help="Один проект (по умолчанию все)")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Хранить в БД запуски за N дней")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не менять")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    for project in [args.project] if args.project else db.PROJECTS:
+        try:
+            logger.info("Retention: %s", run_retention(project, days=args.days, dry_run=args.dry_run))
+        except sqlite3.Error as e:
+            logger.error("Retention %s: ошибка БД: %s", project, e)
+
+
+if __name__ == "__main__":
+    main()
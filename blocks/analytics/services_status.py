@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Сбор статуса systemd-сервисов одним вызовом.
+
+Вместо отдельного `systemctl show` (и `list-unit-files`) на каждый юнит —
+один `systemctl show unit1 unit2 ...`, разбираемый за один проход.
+HTTP-проверки (Quickpack по QUICKPACK_URL и т.п.) выполняются параллельно.
+
+Watchdog публикует снимок в storage/services_state.json; дашборд читает его,
+пока он свежий, и не опрашивает systemd повторно.
+
+События systemd (старт, остановка, падение юнита) — через `journalctl --follow` по
+сообщениям PID 1 о наших юнитах (follow_unit_events): привязки к D-Bus не нужны, watchdog
+перепроверяет статус сразу, а не через WATCHDOG_INTERVAL.
+"""
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import Request as UrlRequest, urlopen
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+SNAPSHOT_FILE = PROJECT_ROOT / "storage" / "services_state.json"
+
+# Список systemd-сервисов для страницы «Сервисы» (только Linux): (unit, label, description).
+# Соответствует проектным юнитам на сервере (analytics, grs, orchestrator, script_board, zakazy_forwarder и др.).
+SERVER_SERVICES = [
+    ("analytics-dashboard", "Дашборд аналитики", "Веб-интерфейс: сводка запусков, графики и статус сервисов"),
+    ("analytics-dashboard-staging", "Дашборд аналитики (staging)", "Стейжинг дашборда для ветки dev"),
+    ("analytics-telegram-bot", "Telegram-бот дашборда", "Уведомления в Telegram о запусках и ошибках пайплайна"),
+    ("github-webhook", "GitHub Webhook", "Автодеплой по push в репозиторий"),
+    ("grs-image-web", "Генерация картинок и ссылок", "Веб-интерфейс генерации изображений и загрузки ссылок (flowimage.ru)"),
+    ("grs-image-web-staging", "Генерация картинок (staging)", "Стейжинг flowimage для ветки dev"),
+    ("orchestrator-kz", "Оркестратор контент завода", "Оркестратор: генерация и публикация (Дзен, Telegram) только по расписанию"),
+    ("script-board", "Script Board", "Доска скриптов диалогов (script.flowcabinet.ru)"),
+    ("contentzavod-watchdog", "Watchdog", "Следит за сервисами и сообщает при сбоях"),
+    ("zakazy-forwarder", "Zakazy Forwarder", "Пересылка заказов из каналов в обработку"),
+    ("quickpack", "Quickpack", "Сайт Quickpack на сервере"),
+]
+SERVER_SERVICE_UNITS = [u[0] for u in SERVER_SERVICES]
+
+# Свойства, которые читаем у каждого юнита
+SHOW_PROPERTIES = ("Id", "LoadState", "ActiveState", "SubState", "MainPID", "UnitFileState")
+SYSTEMCTL_SHOW_TIMEOUT_SEC = 8
+HTTP_PROBE_TIMEOUT_SEC = 8
+# Пауза перед перезапуском journalctl, если он завершился (journald перезапущен, нет прав)
+EVENTS_RESTART_DELAY_SEC = 30
+
+
+def _unit_name(unit: str) -> str:
+    """'grs-image-web' → 'grs-image-web.service' (как systemctl возвращает Id)."""
+    return unit if "." in unit else unit + ".service"
+
+
+def _parse_show_output(stdout: str) -> List[Dict[str, str]]:
+    """Разбирает вывод `systemctl show` для нескольких юнитов: блоки KEY=VALUE, разделённые пустой строкой."""
+    blocks: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+    for line in (stdout or "").split("\n"):
+        line = line.strip()
+        if not line:
+            if current:
+                blocks.append(current)
+                current = {}
+            continue
+        if "=" in line:
+            k, _, v = line.partition("=")
+            current[k.strip()] = v.strip()
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def show_units(units: Iterable[str], timeout: int = SYSTEMCTL_SHOW_TIMEOUT_SEC) -> Dict[str, Dict[str, str]]:
+    """
+    Свойства всех юнитов одним вызовом systemctl. Возвращает { unit: {ActiveState, SubState, ...} }.
+    Юнит без файла получает LoadState=not-found. При ошибке вызова — пустой словарь
+    (вызывающий код показывает статус «ошибка»).
+    """
+    units = list(units)
+    if not units:
+        return {}
+    cmd = ["systemctl", "show", *units]
+    for prop in SHOW_PROPERTIES:
+        cmd += ["-p", prop]
+    cmd.append("--no-pager")
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError) as e:
+        logger.warning("systemctl show (%d юнитов): %s", len(units), e)
+        return {}
+    blocks = _parse_show_output(out.stdout)
+    by_id = {b.get("Id"): b for b in blocks if b.get("Id")}
+    result: Dict[str, Dict[str, str]] = {}
+    for i, unit in enumerate(units):
+        # Сначала по Id, иначе по порядку: systemctl выводит блоки в порядке аргументов
+        props = by_id.get(_unit_name(unit))
+        if props is None and len(blocks) == len(units):
+            props = blocks[i]
+        if props is not None:
+            result[unit] = props
+    return result
+
+
+def unit_status(props: Optional[Dict[str, str]]) -> Tuple[str, str, Optional[str]]:
+    """
+    (active_state, sub_state, pid) для карточки дашборда из свойств юнита.
+    Зелёная подсветка: active, reloading или sub_state=running.
+    """
+    if props is None:
+        return "error", "ошибка", None
+    if (props.get("LoadState") or "").lower() == "not-found":
+        return "inactive", "не установлен", None
+    raw_active = (props.get("ActiveState") or "unknown").lower()
+    sub_state = props.get("SubState") or ""
+    pid = (props.get("MainPID") or "").strip() or None
+    if pid == "0":
+        pid = None
+    is_running = raw_active in ("active", "reloading") or sub_state.lower() == "running"
+    return ("active" if is_running else raw_active), sub_state, pid
+
+
+def is_masked(props: Optional[Dict[str, str]]) -> bool:
+    """Замаскированный юнит намеренно выключен."""
+    if not props:
+        return False
+    return "masked" in ((props.get("LoadState") or "").lower(), (props.get("UnitFileState") or "").lower())
+
+
+def probe_http(url: str, timeout: int = HTTP_PROBE_TIMEOUT_SEC, user_agent: str = "ContentZavod-HealthCheck/1.0") -> Tuple[bool, str]:
+    """HTTP-проверка сайта: (ok, описание). ok — HTTP 200."""
+    try:
+        req = UrlRequest(url, headers={"User-Agent": user_agent})
+        with urlopen(req, timeout=timeout) as r:
+            code = r.getcode()
+        return code == 200, ("работает" if code == 200 else f"HTTP {code}")
+    except (URLError, HTTPError, OSError) as e:
+        logger.debug("HTTP health check %s: %s", url, e)
+        return False, (str(e)[:80] if e else "нет ответа")
+
+
+def http_health_urls(units: Iterable[str]) -> Dict[str, str]:
+    """Юниты, которые проверяются по HTTP, а не через systemd (Quickpack при заданном QUICKPACK_URL)."""
+    urls: Dict[str, str] = {}
+    for unit in units:
+        if unit == "quickpack":
+            url = (os.getenv("QUICKPACK_URL") or "").strip()
+            if url:
+                urls[unit] = url
+    return urls
+
+
+def collect(units: Iterable[str]) -> Tuple[Dict[str, Dict[str, str]], Dict[str, Tuple[bool, str]]]:
+    """
+    Один проход по всем юнитам: batched systemctl show и HTTP-проверки параллельно.
+    Возвращает (props по юнитам systemd, {unit: (ok, описание)} для HTTP-юнитов).
+    """
+    units = list(units)
+    http_urls = http_health_urls(units)
+    systemd_units = [u for u in units if u not in http_urls]
+    with ThreadPoolExecutor(max_workers=1 + max(1, len(http_urls))) as pool:
+        show_future = pool.submit(show_units, systemd_units)
+        probe_futures = {unit: pool.submit(probe_http, url) for unit, url in http_urls.items()}
+        props = show_future.result()
+        probes = {unit: f.result() for unit, f in probe_futures.items()}
+    return props, probes
+
+
+def unit_events_cmd(units: Iterable[str]) -> List[str]:
+    """
+    journalctl, печатающий новые сообщения systemd (PID 1) о юнитах: «Started», «Stopped»,
+    «Main process exited», «Failed with result». Совпадения по одному полю (UNIT=) объединяются
+    через ИЛИ, по разным (_PID и UNIT) — через И, так что логи самих сервисов сюда не попадают.
+    """
+    return [
+        "journalctl", "--follow", "--lines=0", "--output=cat", "--no-pager", "_PID=1",
+        *(f"UNIT={_unit_name(u)}" for u in units),
+    ]
+
+
+def follow_unit_events(
+    units: Iterable[str],
+    on_event: Callable[[str], None],
+    cmd: Optional[List[str]] = None,
+) -> threading.Thread:
+    """
+    Фоновый поток: вызывает on_event(строка) на каждое сообщение systemd о юнитах.
+    Если journalctl не запустился или завершился — пишет предупреждение и пробует снова через
+    EVENTS_RESTART_DELAY_SEC; вызывающий код тем временем продолжает опрос по интервалу.
+    """
+    cmd = cmd or unit_events_cmd(units)
+
+    def _run() -> None:
+        while True:
+            try:
+                proc = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1,
+                )
+            except OSError as e:
+                logger.warning("События systemd недоступны (%s): %s — только опрос по интервалу", cmd[0], e)
+                return
+            with proc:
+                for line in proc.stdout:
+                    try:
+                        on_event(line.rstrip("\n"))
+                    except Exception as e:
+                        logger.warning("Обработка события systemd: %s", e)
+            logger.warning(
+                "%s завершился (код %s), повтор через %d сек", cmd[0], proc.returncode, EVENTS_RESTART_DELAY_SEC,
+            )
+            time.sleep(EVENTS_RESTART_DELAY_SEC)
+
+    thread = threading.Thread(target=_run, name="systemd-unit-events", daemon=True)
+    thread.start()
+    return thread
+
+
+def write_snapshot(props: Dict[str, Dict[str, str]], probes: Dict[str, Tuple[bool, str]]) -> None:
+    """Публикует снимок статуса (атомарно, через временный файл) для дашборда."""
+    payload = {
+        "at": time.time(),
+        "units": props,
+        "probes": {unit: [ok, desc] for unit, (ok, desc) in probes.items()},
+    }
+    try:
+        SNAPSHOT_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SNAPSHOT_FILE.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, SNAPSHOT_FILE)
+    except OSError as e:
+        logger.warning("Не удалось записать %s: %s", SNAPSHOT_FILE.name, e)
+
+
+def snapshot_mtime() -> float:
+    """mtime снимка watchdog (0 — файла нет): дашборд по нему узнаёт, что снимок обновился."""
+    try:
+        return SNAPSHOT_FILE.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def read_snapshot(
+    max_age_sec: float, not_before: float = 0.0
+) -> Optional[Tuple[Dict[str, Dict[str, str]], Dict[str, Tuple[bool, str]]]]:
+    """
+    Снимок watchdog, если он не старше max_age_sec и снят не раньше not_before (time.time(),
+    например момент start/stop из дашборда); иначе None (тогда собираем сами).
+    """
+    if max_age_sec <= 0 or not SNAPSHOT_FILE.is_file():
+        return None
+    try:
+        data = json.loads(SNAPSHOT_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    at = float(data.get("at") or 0)
+    if time.time() - at > max_age_sec or at < not_before:
+        return None
+    props = data.get("units") if isinstance(data.get("units"), dict) else {}
+    probes = {
+        unit: (bool(v[0]), str(v[1]))
+        for unit, v in (data.get("probes") or {}).items()
+        if isinstance(v, list) and len(v) == 2
+    }
+    return props, probes
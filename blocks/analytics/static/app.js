@@ -29,6 +29,7 @@
   let channelTimelineChart = null;
   let genChart = null;
   let genLinksChart = null;
+  let latencyChart = null;
   let currentGenPill = 'images'; // 'images' | 'links'
 
   var PROJECT_IDS = { FLOW: 'flow', FULFILMENT: 'fulfilment' };
@@ -42,14 +43,23 @@
     return path + '?' + q;
   }
 
+  // Условные запросы: ответ с ETag запоминаем, при повторе шлём If-None-Match — на 304 берём из памяти
+  var etagCache = {};
   async function fetchJson(path, options) {
     options = options || {};
     var project = options.project != null ? options.project : currentProject;
     if (project === 'fulfillment') project = 'fulfilment';
     var url = API + appendProjectParam(path, project);
-    var r = await fetch(url, { cache: 'no-store', headers: { 'X-Requested-Project': project } });
+    var headers = { 'X-Requested-Project': project };
+    var cached = etagCache[url];
+    if (cached) headers['If-None-Match'] = cached.etag;
+    var r = await fetch(url, { cache: 'no-store', headers: headers });
+    if (r.status === 304 && cached) return cached.data;
     if (!r.ok) throw new Error(r.statusText);
-    return r.json();
+    var data = await r.json();
+    var etag = r.headers.get('ETag');
+    if (etag) etagCache[url] = { etag: etag, data: data };
+    return data;
   }
 
   function setChannel(channel) {
@@ -63,6 +73,8 @@
         return;
       }
       if (ch === 'generation') a.classList.remove('hidden');
+      // Диспетчер задач привязан к проекту (порядок сервисов, разовый прогон) — в «Все проекты» API отвечает 400
+      if (ch === 'taskmanager') a.classList.toggle('hidden', currentProject === 'all');
       var isActive = ch === currentChannel;
       a.classList.toggle('bg-blue-600', isActive);
       a.classList.toggle('text-white', isActive);
@@ -253,6 +265,11 @@
         var errorBtnHtml = runError
           ? '<button type="button" class="run-show-error mt-2 px-3 py-1.5 rounded bg-red-900/50 text-red-300 text-sm hover:bg-red-800/50" data-error-label="' + escapeAttr(runError.label) + '" data-error-message="' + escapeAttr(runError.message) + '">Показать ошибку</button>'
           : '';
+        // Превью обложки (вариант thumb из renditions); в «Все проекты» — проект самого запуска
+        var thumbHtml = (run.publish_dir || run.status === 'completed')
+          ? '<img class="run-thumb float-right ml-3 mb-2 w-24 h-16 sm:w-32 sm:h-20 object-cover rounded border border-gray-700" loading="lazy" alt="" src="' +
+            escapeAttr(API + appendProjectParam('/runs/' + run.id + '/thumbnail', run.project)) + '">'
+          : '';
         var startedAtHtml = run.started_at
           ? '<div class="text-xs text-gray-500 mb-2">Начало: ' + escapeHtml(formatRunStartedAt(run.started_at)) + '</div>'
           : '';
@@ -260,12 +277,14 @@
           '<div class="run-card bg-gray-800 rounded-lg p-4 border border-gray-700" data-run-id="' +
           run.id +
           '">' +
+          thumbHtml +
           '<div class="flex flex-wrap items-center gap-2 mb-2">' +
           '<span class="font-semibold text-white">Запуск #' + run.id + '</span>' +
           '<span class="text-xs px-2 py-0.5 rounded ' +
           (run.status === 'completed' ? 'bg-green-900/50 text-green-300' : run.status === 'failed' ? 'bg-red-900/50 text-red-300' : 'bg-gray-600 text-gray-300') +
           '">' + (run.status === 'running' ? 'выполняется' : run.status === 'completed' ? 'успех' : 'ошибка') + '</span>' +
           (run.source ? '<span class="text-xs px-2 py-0.5 rounded bg-gray-700 text-gray-400" title="Источник">' + escapeHtml(sourceLabel(run.source)) + '</span>' : '') +
+          (run.project ? '<span class="text-xs px-2 py-0.5 rounded bg-blue-900/50 text-blue-300" title="Проект">' + escapeHtml(PROJECT_LABELS[run.project] || run.project) + '</span>' : '') +
           '</div>' +
           startedAtHtml +
           '<p class="text-gray-400 text-sm mb-3">' + escapeHtml(topic) + '</p>' +
@@ -276,6 +295,10 @@
       })
       .join('');
 
+    // Нет статьи или превью (404) — картинку убираем, карточка остаётся как была
+    container.querySelectorAll('.run-thumb').forEach(function (img) {
+      img.addEventListener('error', function () { img.remove(); });
+    });
     container.querySelectorAll('.run-show-error').forEach(function (btn) {
       btn.addEventListener('click', function () {
         openErrorPanel(btn.getAttribute('data-error-label'), btn.getAttribute('data-error-message'));
@@ -314,6 +337,77 @@
     renderTimeline(data, days, chartElId);
   }
 
+  function formatDurationMs(ms) {
+    if (ms == null) return '—';
+    if (ms < 1000) return ms + ' мс';
+    var sec = ms / 1000;
+    if (sec < 60) return sec.toFixed(sec < 10 ? 1 : 0) + ' с';
+    var min = Math.floor(sec / 60);
+    return min + ' мин ' + Math.round(sec - min * 60) + ' с';
+  }
+
+  // Скорость шагов: таблица p50/p90/p99 + тренд медианы по дням (запуск целиком и топ шагов)
+  function renderLatency(data) {
+    var tableEl = document.getElementById('latency-table');
+    var chartEl = document.getElementById('latency-chart');
+    if (!tableEl) return;
+    var rows = (data && data.run ? [data.run] : []).concat((data && data.steps) || []);
+    if (latencyChart) { latencyChart.destroy(); latencyChart = null; }
+    if (!rows.length) {
+      tableEl.innerHTML = '<p class="text-gray-500 py-4 text-center">Нет данных за период</p>';
+      return;
+    }
+    tableEl.innerHTML =
+      '<table class="w-full text-left"><thead><tr class="text-gray-400 text-xs uppercase tracking-wide">' +
+      '<th class="py-2 pr-3">Шаг</th><th class="py-2 pr-3 text-right">Запусков</th><th class="py-2 pr-3 text-right">p50</th>' +
+      '<th class="py-2 pr-3 text-right">p90</th><th class="py-2 pr-3 text-right">p99</th><th class="py-2 text-right">Ошибки</th></tr></thead><tbody>' +
+      rows.map(function (r) {
+        return '<tr class="border-t border-gray-700 text-gray-200">' +
+          '<td class="py-2 pr-3' + (r === data.run ? ' font-semibold text-white' : '') + '" title="' + escapeAttr(r.name) + '">' + escapeHtml(r.label || r.name) + '</td>' +
+          '<td class="py-2 pr-3 text-right">' + r.count + '</td>' +
+          '<td class="py-2 pr-3 text-right">' + formatDurationMs(r.p50_ms) + '</td>' +
+          '<td class="py-2 pr-3 text-right">' + formatDurationMs(r.p90_ms) + '</td>' +
+          '<td class="py-2 pr-3 text-right">' + formatDurationMs(r.p99_ms) + '</td>' +
+          '<td class="py-2 text-right' + (r.failed ? ' text-red-400' : '') + '">' + r.failure_rate + '%</td></tr>';
+      }).join('') +
+      '</tbody></table>';
+    if (!chartEl) return;
+    var tracked = rows.slice(0, 5);
+    var days = {};
+    tracked.forEach(function (r) { (r.trend || []).forEach(function (t) { days[t.day] = true; }); });
+    var categories = Object.keys(days).sort();
+    var series = tracked.map(function (r) {
+      var byDay = {};
+      (r.trend || []).forEach(function (t) { byDay[t.day] = t.p50_ms; });
+      return {
+        name: r.label || r.name,
+        data: categories.map(function (d) { return byDay[d] != null ? Math.round(byDay[d] / 100) / 10 : null; }),
+      };
+    });
+    latencyChart = new ApexCharts(chartEl, {
+      chart: { type: 'line', height: 220, toolbar: { show: false }, background: 'transparent', fontFamily: 'inherit' },
+      series: series,
+      theme: { mode: 'dark' },
+      dataLabels: { enabled: false },
+      stroke: { curve: 'smooth', width: 2 },
+      xaxis: { categories: categories, labels: { style: { colors: '#9ca3af' } } },
+      yaxis: { title: { text: 'p50, с', style: { color: '#9ca3af' } }, labels: { style: { colors: '#9ca3af' } } },
+      grid: { borderColor: '#374151', strokeDashArray: 4 },
+      legend: { labels: { colors: '#d1d5db' } },
+      tooltip: { theme: 'dark' },
+    });
+    latencyChart.render();
+  }
+
+  async function loadLatency(days) {
+    var tableEl = document.getElementById('latency-table');
+    try {
+      renderLatency(await fetchJson('/stats/latency?days=' + (days || 30)));
+    } catch (e) {
+      if (tableEl) tableEl.textContent = 'Ошибка загрузки: ' + e.message;
+    }
+  }
+
   function renderServerServices(services, preserveOrder) {
     var wrap = document.getElementById('services-items');
     var loading = document.getElementById('services-loading');
@@ -550,6 +644,7 @@
       renderTimeline(timeline, 30);
       allRuns = runs;
       renderRuns(runs, { visibleCount: INITIAL_RUNS_VISIBLE });
+      loadLatency(30);
     }).catch(function (e) {
       var loading = document.getElementById('runs-loading');
       if (loading) {
@@ -788,6 +883,12 @@
     });
   });
 
+  document.querySelectorAll('.latency-btn').forEach(function (btn) {
+    btn.addEventListener('click', function () {
+      loadLatency(parseInt(btn.getAttribute('data-days'), 10));
+    });
+  });
+
   document.querySelectorAll('.channel-timeline-btn').forEach(function (btn) {
     btn.addEventListener('click', function () {
       if (!currentChannel) return;
@@ -830,7 +931,8 @@
     });
   }
 
-  var PROJECT_LABELS = { flow: 'FLOW', fulfilment: 'Фулфилмент' };
+  // Подписи проектов; дополняются из /api/projects (ANALYTICS_PROJECTS на сервере)
+  var PROJECT_LABELS = { flow: 'FLOW', fulfilment: 'Фулфилмент', all: 'Все проекты' };
   function updateProjectTriggerLabel() {
     var el = document.getElementById('project-trigger-label');
     if (el) el.textContent = PROJECT_LABELS[currentProject] || currentProject;
@@ -852,7 +954,7 @@
     localStorage.setItem('analytics_project', currentProject);
     updateProjectTriggerLabel();
     closeProjectDropdown();
-    if (currentChannel === 'generation' && currentProject !== 'flow') {
+    if ((currentChannel === 'generation' && currentProject !== 'flow') || (currentChannel === 'taskmanager' && currentProject === 'all')) {
       setChannel('');
       return;
     }
@@ -860,8 +962,22 @@
   }
   (function initProjectSwitcher() {
     var saved = localStorage.getItem('analytics_project');
-    if (saved === 'flow' || saved === 'fulfilment') currentProject = saved;
+    if (saved && PROJECT_LABELS[saved]) currentProject = saved;
     updateProjectTriggerLabel();
+    fetch(API + '/projects', { cache: 'no-store' })
+      .then(function (r) { return r.ok ? r.json() : null; })
+      .then(function (data) {
+        var dd = document.getElementById('project-dropdown');
+        if (!data || !dd) return;
+        var items = (data.projects || []).concat(data.aggregate ? [data.aggregate] : []);
+        dd.innerHTML = items.map(function (p) {
+          PROJECT_LABELS[p.id] = p.label;
+          return '<button type="button" data-project="' + escapeAttr(p.id) + '" class="project-option w-full text-left px-4 py-2 text-sm text-gray-200 hover:bg-gray-700 hover:text-white rounded-none first:rounded-t-lg last:rounded-b-lg">' + escapeHtml(p.label) + '</button>';
+        }).join('');
+        if (saved && PROJECT_LABELS[saved] && saved !== currentProject) switchProject(saved);
+        else updateProjectTriggerLabel();
+      })
+      .catch(function () {});
   })();
   var triggerEl = document.getElementById('project-trigger');
   if (triggerEl) {
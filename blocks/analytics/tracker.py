@@ -2,18 +2,42 @@
 """
 RunTracker: чекпоинты пайплайна.
 start_run() -> run_id; with tracker.step(run_id, name, label): ...; finish_run(run_id).
+Прерванный запуск продолжается: resume_run(run_id) и дальше те же step()/finish_run();
+save_checkpoint() — состояние слота оркестратора для такого продолжения (таблица slot_checkpoints).
 Какой проект писать в БД: RunTracker(project='flow'|'fulfilment') или env ANALYTICS_PROJECT.
+Внутри step() contextvar current_step = {project, run_id, step} — по нему учёт GRS AI
+(blocks/ai_integrations/usage.py) относит вызовы API к шагу, а record_step_metric()
+добавляет метрики в metadata шага.
 """
 import os
 import traceback
 from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Optional, Generator, Any
 
-from . import db
+from . import db, latency
 from .models import Step
 
 
+# Текущий шаг пайплайна в этом потоке/задаче: {"project", "run_id", "step"} или None
+current_step: ContextVar[Optional[dict]] = ContextVar("analytics_current_step", default=None)
+
+
+def record_step_metric(key: str, value: Any, latency_label: Optional[str] = None) -> None:
+    """
+    Метрика текущего шага (вне шага — ничего не делает): попадёт в metadata шага при его завершении.
+    latency_label — значение в мс, которое ещё и учитывается в гистограмме step_latency под именем key
+    (p50/p90/p99 в блоке «Скорость шагов»).
+    """
+    ctx = current_step.get()
+    if ctx is None:
+        return
+    ctx.setdefault("metrics", {})[key] = value
+    if latency_label and isinstance(value, (int, float)):
+        ctx.setdefault("latency", []).append((key, latency_label, float(value)))
+
+
 def _now() -> str:
     return datetime.now().isoformat()
 
@@ -49,6 +73,23 @@ class RunTracker:
         self._step_counter[run_id] = 0
         return run_id
 
+    def resume_run(self, run_id: int, note: str) -> None:
+        """
+        Продолжает запуск, прерванный вместе с процессом: незавершённые шаги помечаются skipped
+        (с пояснением note, на статус запуска не влияют), новые шаги пишутся после уже записанных.
+        """
+        now = _now()
+        for row in self._conn.execute(
+            "SELECT id FROM steps WHERE run_id = ? AND status IN ('running', 'pending')", (run_id,)
+        ).fetchall():
+            db.update_step_finished(self._conn, int(row[0]), now, "skipped", error_message=note)
+        row = self._conn.execute("SELECT MAX(sort_order) FROM steps WHERE run_id = ?", (run_id,)).fetchone()
+        self._step_counter[run_id] = (row[0] + 1) if row and row[0] is not None else 0
+
+    def save_checkpoint(self, run_id: int, checkpoint: dict) -> None:
+        """Сохраняет чекпоинт слота: state и данные для продолжения (db.SLOT_CHECKPOINT_FIELDS)."""
+        db.save_slot_checkpoint(self._conn, run_id, checkpoint)
+
     def update_run_topic(self, run_id: int, topic: str) -> None:
         """Обновляет тему запуска (после fetch_topic)."""
         db.update_run_topic(self._conn, run_id, topic)
@@ -89,10 +130,13 @@ class RunTracker:
             sort_order=sort_order,
             status="running",
         )
-        db.update_step_started(self._conn, step_id, _now())
+        started_at = _now()
+        db.update_step_started(self._conn, step_id, started_at)
 
         error_message: Optional[str] = None
         status = "completed"
+        ctx = {"project": self._project, "run_id": run_id, "step": name}
+        ctx_token = current_step.set(ctx)
         try:
             yield
         except Exception as e:
@@ -100,16 +144,29 @@ class RunTracker:
             error_message = "".join(traceback.format_exception(type(e), e, e.__traceback__))
             raise
         finally:
+            current_step.reset(ctx_token)
             import json
+            if ctx.get("metrics"):
+                metadata = {**(metadata or {}), **ctx["metrics"]}
             meta_str = json.dumps(metadata, ensure_ascii=False) if metadata else None
+            finished_at = _now()
             db.update_step_finished(
                 self._conn,
                 step_id,
-                finished_at=_now(),
+                finished_at=finished_at,
                 status=status,
                 error_message=error_message,
                 metadata=meta_str,
             )
+            self._record_latency(name, label, started_at, finished_at, status == "failed")
+            for metric_name, metric_label, duration in ctx.get("latency", []):
+                db.record_latency(self._conn, metric_name, metric_label, started_at[:10], duration)
+
+    def _record_latency(self, name: str, label: str, started_at: str, finished_at: str, failed: bool) -> None:
+        """Длительность в гистограмму step_latency (для p50/p90/p99 на дашборде)."""
+        duration = db.duration_ms_between(started_at, finished_at)
+        if duration is not None:
+            db.record_latency(self._conn, name, label, started_at[:10], duration, failed)
 
     def finish_run(self, run_id: int) -> None:
         """Завершает запуск: статус completed, если есть хотя бы один failed шаг — failed."""
@@ -119,5 +176,9 @@ class RunTracker:
         )
         has_failed = cur.fetchone() is not None
         status = "failed" if has_failed else "completed"
-        db.update_run_finished(self._conn, run_id, _now(), status)
+        finished_at = _now()
+        db.update_run_finished(self._conn, run_id, finished_at, status)
+        row = db.get_run(self._conn, run_id)
+        if row is not None and row["started_at"]:
+            self._record_latency(latency.RUN_KEY, latency.RUN_LABEL, row["started_at"], finished_at, status == "failed")
         self._step_counter.pop(run_id, None)
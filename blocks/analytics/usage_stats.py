@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Сводка расхода GRS AI (таблица grs_usage) для дашборда.
+
+Строки db.get_usage_rows (сгруппированы по день/шаг/модель/вид) сворачиваются в итоги
+и разбивки by_step, by_model, by_day. Одинаковые ключи из разных БД суммируются —
+годится для project=all.
+"""
+from typing import Dict, Iterable, List
+
+# Порядок полей в строках db.get_usage_rows после (day, step, model, kind)
+METRICS = (
+    "calls", "failed", "prompt_tokens", "completion_tokens",
+    "request_bytes", "response_bytes", "latency_ms", "retries", "images",
+)
+NO_STEP_LABEL = "Вне пайплайна"
+
+
+def _empty() -> Dict[str, float]:
+    return {m: 0 for m in METRICS}
+
+
+def _finish(item: dict) -> dict:
+    item["total_tokens"] = item["prompt_tokens"] + item["completion_tokens"]
+    item["avg_latency_ms"] = round(item["latency_ms"] / item["calls"]) if item["calls"] else None
+    item["failure_rate"] = round(100 * item["failed"] / item["calls"], 1) if item["calls"] else 0
+    return item
+
+
+def summarize(rows: Iterable, step_labels: Dict[str, str] = None) -> dict:
+    """
+    → {"totals": {...}, "by_step": [...], "by_model": [...], "by_day": [...]}.
+    by_step/by_model отсортированы по суммарному времени вызовов (кто доминирует по латентности),
+    у каждой записи — calls, failed, токены, байты, latency_ms (сумма), avg_latency_ms, retries, images.
+    """
+    step_labels = step_labels or {}
+    totals = _empty()
+    by_step: Dict[str, dict] = {}
+    by_model: Dict[str, dict] = {}
+    by_day: Dict[str, dict] = {}
+    for row in rows:
+        day, step, model, kind = row[:4]
+        values = dict(zip(METRICS, (v or 0 for v in row[4:])))
+        targets = (
+            totals,
+            by_step.setdefault(step, {"step": step, "label": step_labels.get(step) or step or NO_STEP_LABEL, **_empty()}),
+            by_model.setdefault(model, {"model": model, "kind": kind, **_empty()}),
+            by_day.setdefault(day, {"day": day, **_empty()}),
+        )
+        for target in targets:
+            for metric, value in values.items():
+                target[metric] += value
+
+    def _sorted(items: Iterable[dict]) -> List[dict]:
+        return sorted((_finish(i) for i in items), key=lambda i: -i["latency_ms"])
+
+    return {
+        "totals": _finish(totals),
+        "by_step": _sorted(by_step.values()),
+        "by_model": _sorted(by_model.values()),
+        "by_day": [_finish(by_day[d]) for d in sorted(by_day)],
+    }
@@ -1,9 +1,24 @@
 # -*- coding: utf-8 -*-
 """
-Watchdog: проверка systemd-сервисов раз в CHECK_INTERVAL сек.
+Watchdog: проверка systemd-сервисов раз в CHECK_INTERVAL сек и сразу по событию systemd.
 Если сервис не active — отправка уведомления в Telegram и попытка перезапуска.
 Юниты в состоянии masked (намеренно выключены) пропускаются.
 
+События: `journalctl --follow` по сообщениям systemd о юнитах (services_status.follow_unit_events).
+Любое сообщение («Stopped», «Main process exited», «Started») будит цикл; проверка идёт через
+EVENT_DEBOUNCE_SEC, чтобы пачка сообщений одного перехода дала один проход. Если journalctl
+недоступен — остаётся опрос раз в CHECK_INTERVAL (WATCHDOG_EVENTS=0 — только опрос).
+
+Статус всех юнитов собирается одним `systemctl show` (см. services_status.py) и
+публикуется в storage/services_state.json — дашборд читает этот снимок и не опрашивает
+systemd сам.
+
+Перезапуск с backoff: после каждой попытки пауза удваивается (RESTART_BACKOFF_BASE_SEC →
+RESTART_BACKOFF_MAX_SEC). Если за FLAP_WINDOW_SEC было FLAP_MAX_RESTARTS перезапусков —
+юнит «флапает»: автоперезапуск приостанавливается до конца окна, уходит один алерт.
+Одинаковые алерты по юниту не повторяются чаще, чем раз в ALERT_DEDUP_SEC; отправка — в
+отдельном потоке, цикл проверки не ждёт Telegram.
+
 Quickpack: если задан QUICKPACK_URL, проверяется по HTTP (200 = работает).
 Перезапуск через systemd для quickpack не выполняется при проверке по URL.
 
@@ -13,13 +28,17 @@ Quickpack: если задан QUICKPACK_URL, проверяется по HTTP (
 
 Запуск: python -m blocks.analytics.watchdog_services
 """
+import json
 import os
+import queue
 import subprocess
 import sys
+import threading
 import time
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from urllib.request import Request as UrlRequest, urlopen
-from urllib.error import URLError, HTTPError
+from typing import Deque, Dict, Optional
 
 # Корень проекта
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -32,7 +51,16 @@ try:
 except ImportError:
     pass
 
-CHECK_INTERVAL = int(os.getenv("WATCHDOG_INTERVAL", "90"))
+from blocks.analytics import services_status
+
+CHECK_INTERVAL = int(os.getenv("WATCHDOG_INTERVAL", "15"))
+USE_UNIT_EVENTS = os.getenv("WATCHDOG_EVENTS", "1").strip().lower() not in ("0", "false", "no")
+EVENT_DEBOUNCE_SEC = float(os.getenv("WATCHDOG_EVENT_DEBOUNCE", "0.3"))
+RESTART_BACKOFF_BASE_SEC = int(os.getenv("WATCHDOG_RESTART_BACKOFF", "30"))
+RESTART_BACKOFF_MAX_SEC = int(os.getenv("WATCHDOG_RESTART_BACKOFF_MAX", "900"))
+FLAP_WINDOW_SEC = int(os.getenv("WATCHDOG_FLAP_WINDOW", "600"))
+FLAP_MAX_RESTARTS = int(os.getenv("WATCHDOG_FLAP_MAX_RESTARTS", "5"))
+ALERT_DEDUP_SEC = int(os.getenv("WATCHDOG_ALERT_DEDUP", "900"))
 MANUAL_STOPPED_SERVICES_FILE = PROJECT_ROOT / "storage" / "manual_stopped_services.json"
 # Те же сервисы, что на дашборде (кроме самого watchdog).
 SERVICES = [
@@ -46,58 +74,18 @@ BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_ALERT_CHAT_ID")
 
 
-def is_active(unit: str) -> bool:
-    try:
-        out = subprocess.run(
-            ["systemctl", "is-active", unit],
-            capture_output=True,
-            text=True,
-            timeout=5,
-        )
-        return out.stdout.strip() == "active"
-    except Exception:
-        return False
-
-
-def is_masked(unit: str) -> bool:
-    """Замаскированный юнит намеренно выключен — не алертить и не пытаться restart (см. stop_*_on_server.ps1)."""
-    try:
-        out = subprocess.run(
-            ["systemctl", "is-enabled", unit],
-            capture_output=True,
-            text=True,
-            timeout=5,
-        )
-        return out.stdout.strip() == "masked"
-    except Exception:
-        return False
-
-
 def restart_service(unit: str) -> bool:
     try:
-        subprocess.run(
+        out = subprocess.run(
             ["systemctl", "restart", unit],
             capture_output=True,
             timeout=15,
         )
-        return True
+        return out.returncode == 0
     except Exception:
         return False
 
 
-def is_quickpack_ok() -> bool:
-    """Проверка Quickpack по QUICKPACK_URL (HTTP 200 = работает)."""
-    url = (os.getenv("QUICKPACK_URL") or "").strip()
-    if not url:
-        return False
-    try:
-        req = UrlRequest(url, headers={"User-Agent": "ContentZavod-Watchdog/1.0"})
-        with urlopen(req, timeout=8) as r:
-            return r.getcode() == 200
-    except (URLError, HTTPError, OSError):
-        return False
-
-
 def send_telegram(text: str) -> bool:
     if not BOT_TOKEN or not CHAT_ID:
         return False
@@ -113,12 +101,82 @@ def send_telegram(text: str) -> bool:
         return False
 
 
+class AlertSender:
+    """Очередь алертов с отправкой в фоновом потоке и окном дедупликации по ключу (unit, тип)."""
+
+    def __init__(self, dedup_sec: int = ALERT_DEDUP_SEC):
+        self._dedup_sec = dedup_sec
+        self._last_sent: Dict[tuple, float] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        threading.Thread(target=self._worker, name="watchdog-alerts", daemon=True).start()
+
+    def _worker(self) -> None:
+        while True:
+            text = self._queue.get()
+            send_telegram(text)
+
+    def send(self, unit: str, kind: str, text: str) -> None:
+        key = (unit, kind)
+        now = time.monotonic()
+        last = self._last_sent.get(key)
+        if last is not None and now - last < self._dedup_sec:
+            return
+        self._last_sent[key] = now
+        self._queue.put(text)
+
+    def forget(self, unit: str) -> None:
+        """Юнит восстановился — следующий сбой снова даст алерт сразу."""
+        for key in [k for k in self._last_sent if k[0] == unit]:
+            self._last_sent.pop(key, None)
+
+
+@dataclass
+class UnitWatch:
+    """Состояние перезапусков одного юнита: история, backoff, флаг флапа."""
+    restarts: Deque[float] = field(default_factory=deque)
+    backoff_sec: float = 0.0
+    next_restart_at: float = 0.0
+    flapping: bool = False
+    down: bool = False
+
+    def prune(self, now: float) -> None:
+        while self.restarts and now - self.restarts[0] > FLAP_WINDOW_SEC:
+            self.restarts.popleft()
+        if self.flapping and not self.restarts:
+            self.flapping = False
+
+    def reset(self) -> None:
+        self.backoff_sec = 0.0
+        self.next_restart_at = 0.0
+        self.down = False
+
+
+class ManualStoppedServices:
+    """Сервисы, вручную остановленные из дашборда: watchdog их не перезапускает.
+    Файл перечитывается только при изменении mtime."""
+
+    def __init__(self, path: Path = MANUAL_STOPPED_SERVICES_FILE):
+        self._path = path
+        self._mtime: Optional[float] = None
+        self._units: set[str] = set()
+
+    def get(self) -> set[str]:
+        try:
+            mtime = self._path.stat().st_mtime
+        except OSError:
+            self._mtime, self._units = None, set()
+            return self._units
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._units = load_manual_stopped_services()
+        return self._units
+
+
 def load_manual_stopped_services() -> set[str]:
     """Сервисы, вручную остановленные из дашборда: watchdog их не перезапускает."""
     if not MANUAL_STOPPED_SERVICES_FILE.exists():
         return set()
     try:
-        import json
         data = json.loads(MANUAL_STOPPED_SERVICES_FILE.read_text(encoding="utf-8"))
         if not isinstance(data, list):
             return set()
@@ -127,34 +185,99 @@ def load_manual_stopped_services() -> set[str]:
         return set()
 
 
+def _handle_down(unit: str, label: str, watch: UnitWatch, alerts: AlertSender, now: float) -> None:
+    """Юнит не active: алерт и перезапуск с учётом backoff и флапа."""
+    if not watch.down:
+        watch.down = True
+        alerts.send(unit, "down", f"⚠️ Сервис упал: {label} ({unit})")
+    watch.prune(now)
+    if watch.flapping or now < watch.next_restart_at:
+        return
+    ok = restart_service(unit)
+    watch.restarts.append(now)
+    watch.backoff_sec = min(max(RESTART_BACKOFF_BASE_SEC, watch.backoff_sec * 2), RESTART_BACKOFF_MAX_SEC)
+    watch.next_restart_at = now + watch.backoff_sec
+    if ok:
+        alerts.send(unit, "restarted", f"🔄 Перезапущен: {label} ({unit})")
+    else:
+        alerts.send(unit, "restart_failed", f"❌ Не удалось перезапустить: {label} ({unit})")
+    if len(watch.restarts) >= FLAP_MAX_RESTARTS:
+        watch.flapping = True
+        alerts.send(
+            unit,
+            "flapping",
+            f"🔁 Сервис флапает: {label} ({unit}) — {len(watch.restarts)} перезапусков за "
+            f"{FLAP_WINDOW_SEC // 60} мин. Автоперезапуск приостановлен до конца окна.",
+        )
+
+
+def check_once(watches: Dict[str, UnitWatch], alerts: AlertSender, manually_stopped: set[str]) -> None:
+    """Один проход: общий сбор статуса, публикация снимка для дашборда, реакция на упавшие юниты."""
+    props_by_unit, probes = services_status.collect(services_status.SERVER_SERVICE_UNITS)
+    services_status.write_snapshot(props_by_unit, probes)
+    now = time.monotonic()
+    for unit, label in SERVICES:
+        watch = watches.setdefault(unit, UnitWatch())
+        if unit in manually_stopped:
+            watch.reset()
+            continue
+        # Quickpack: при заданном QUICKPACK_URL проверяем по HTTP, перезапуск не делаем
+        if unit in probes:
+            ok, _ = probes[unit]
+            if not ok:
+                quickpack_url = (os.getenv("QUICKPACK_URL") or "").strip()
+                alerts.send(unit, "http_down", f"⚠️ Сервис недоступен: {label} ({unit}) — нет ответа по {quickpack_url}")
+            else:
+                alerts.forget(unit)
+            continue
+        props = props_by_unit.get(unit)
+        if props is None or services_status.is_masked(props):
+            # systemctl не ответил или юнит замаскирован — не алертим и не перезапускаем
+            continue
+        active_state, _, _ = services_status.unit_status(props)
+        if active_state == "active":
+            if watch.down:
+                watch.down = False
+                alerts.forget(unit)
+            # Стабильная работа в течение окна флапа — сбрасываем backoff
+            watch.prune(now)
+            if not watch.restarts:
+                watch.reset()
+            continue
+        _handle_down(unit, label, watch, alerts, now)
+
+
+def wait_next_check(wakeup: threading.Event, interval: float = CHECK_INTERVAL, debounce: float = EVENT_DEBOUNCE_SEC) -> bool:
+    """
+    Ждёт следующей проверки: CHECK_INTERVAL или событие systemd (wakeup).
+    После события выдерживает debounce — переход юнита пишет в журнал несколько строк подряд.
+    True — разбудило событие.
+    """
+    woke = wakeup.wait(interval)
+    if woke:
+        time.sleep(debounce)
+    wakeup.clear()
+    return woke
+
+
 def main():
     if sys.platform != "linux":
         print("Watchdog только для Linux (systemctl). Выход.")
         sys.exit(0)
     if not BOT_TOKEN or not CHAT_ID:
         print("Задайте TELEGRAM_BOT_TOKEN и TELEGRAM_ALERT_CHAT_ID в .env для уведомлений.")
+    alerts = AlertSender()
+    manual_stopped = ManualStoppedServices()
+    watches: Dict[str, UnitWatch] = {}
+    wakeup = threading.Event()
+    if USE_UNIT_EVENTS:
+        services_status.follow_unit_events(services_status.SERVER_SERVICE_UNITS, lambda _line: wakeup.set())
     while True:
-        manually_stopped = load_manual_stopped_services()
-        for unit, label in SERVICES:
-            if unit in manually_stopped:
-                continue
-            if is_masked(unit):
-                continue
-            # Quickpack: при заданном QUICKPACK_URL проверяем по HTTP, перезапуск не делаем
-            if unit == "quickpack":
-                quickpack_url = (os.getenv("QUICKPACK_URL") or "").strip()
-                if quickpack_url:
-                    if not is_quickpack_ok():
-                        send_telegram(f"⚠️ Сервис недоступен: {label} ({unit}) — нет ответа по {quickpack_url}")
-                    continue
-            if not is_active(unit):
-                msg = f"⚠️ Сервис упал: {label} ({unit})"
-                send_telegram(msg)
-                if restart_service(unit):
-                    send_telegram(f"🔄 Перезапущен: {label} ({unit})")
-                else:
-                    send_telegram(f"❌ Не удалось перезапустить: {label} ({unit})")
-        time.sleep(CHECK_INTERVAL)
+        try:
+            check_once(watches, alerts, manual_stopped.get())
+        except Exception as e:
+            print(f"Watchdog: ошибка проверки: {e}")
+        wait_next_check(wakeup)
 
 
 if __name__ == "__main__":
@@ -4,19 +4,25 @@
 Промпты из docs/guides/BLUEPRINT_ARTICLE_GENERATION_PROMPTS.md, адаптированы под flowcabinet.ru.
 """
 import base64
+import contextvars
 import json
 import logging
 import os
 import re
 import shutil
 import sys
+import threading
 import time
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, List, Dict, Any, Tuple
 
 from dotenv import load_dotenv
 
+from . import publish_registry, renditions
+from .html_blocks import BANNER_MARKER, BlockStreamParser, block_info, html_block, parse_blocks
+
 try:
     sys.stdout.reconfigure(encoding="utf-8")
     sys.stderr.reconfigure(encoding="utf-8")
@@ -47,6 +53,30 @@ ZEN_ARTICLE_MODEL = os.getenv("ZEN_ARTICLE_MODEL", "gemini-2.5-pro")
 ZEN_HEADLINE_MODEL = os.getenv("ZEN_HEADLINE_MODEL", "gpt-4o-mini")
 ZEN_IMAGE_MODEL = os.getenv("ZEN_IMAGE_MODEL", "gpt-image-1")
 
+# ──────────────────────────────────────────────
+# Картинки секций: генерируются параллельно (друг с другом и с обложкой)
+# ──────────────────────────────────────────────
+# Сколько подзаголовков иллюстрировать (0 — только обложка и баннер, как раньше)
+ZEN_SECTION_IMAGES = int(os.getenv("ZEN_SECTION_IMAGES", "0"))
+# Одновременных генераций картинок секций
+ZEN_IMAGE_WORKERS = int(os.getenv("ZEN_IMAGE_WORKERS", "3"))
+# Лимиты запросов в минуту по моделям: "gpt-image-1=6,nano-banana=12"; модели без лимита — без ожидания
+ZEN_IMAGE_RPM = os.getenv("ZEN_IMAGE_RPM", "")
+ZEN_MAX_IMAGES = 5  # в Дзене не больше 5 фото в статье, включая обложку и баннер
+IMAGE_DOWNLOAD_CHUNK = 256 * 1024
+
+# ──────────────────────────────────────────────
+# Потоковая генерация статьи: chat_stream + разбор блоков по мере закрытия тегов
+# ──────────────────────────────────────────────
+ZEN_ARTICLE_STREAM = os.getenv("ZEN_ARTICLE_STREAM", "true").lower() in ("1", "true", "yes")
+# Пришло столько символов, а ни один блок не закрылся — модель пишет не HTML, поток обрываем
+ZEN_STREAM_ABORT_CHARS = int(os.getenv("ZEN_STREAM_ABORT_CHARS", "4000"))
+# Столько символов текста вне HTML-блоков — статья разобралась не целиком, не публикуем её
+STREAM_MAX_STRAY_CHARS = 200
+# Сколько текста статьи нужно промптам meta description и саммари для Telegram
+META_FRAGMENT_CHARS = 800
+TELEGRAM_FRAGMENT_CHARS = 3000
+
 # ──────────────────────────────────────────────
 # Обложка: референсные фото из blueprint
 # ──────────────────────────────────────────────
@@ -96,6 +126,77 @@ def _get_grs_client():
     return GRSAIClient()
 
 
+def _record_step_metric(key: str, value: Any, latency_label: Optional[str] = None) -> None:
+    """Метрика в текущий шаг RunTracker (если аналитика доступна)."""
+    try:
+        from blocks.analytics.tracker import record_step_metric
+    except ImportError:
+        return
+    record_step_metric(key, value, latency_label)
+
+
+def _clean_article_html(text: str) -> str:
+    """Убирает обёртку ```html … ``` вокруг ответа модели."""
+    html = text.strip()
+    html = re.sub(r"^```html?\s*\n?", "", html)
+    html = re.sub(r"\n?```\s*$", "", html)
+    return html
+
+
+def _meta_fragment(article_html: str) -> str:
+    """Начало текста статьи без тегов — для мета-описания."""
+    return re.sub(r"<[^>]+>", " ", article_html)[:META_FRAGMENT_CHARS].strip()
+
+
+def _plain_text(article_html: str) -> str:
+    """Текст статьи без тегов и лишних пробелов."""
+    clean = re.sub(r"<[^>]+>", " ", article_html)
+    return re.sub(r"\s{2,}", " ", clean).strip()
+
+
+# Промпты meta/саммари при потоковой генерации стартуют, как только пришло достаточно текста
+_early_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="zen-early")
+
+
+def _parse_rpm(raw: str) -> Dict[str, float]:
+    """"model=rpm,model=rpm" → {model: rpm}."""
+    limits: Dict[str, float] = {}
+    for part in raw.split(","):
+        model, _, rpm = part.partition("=")
+        if not model.strip():
+            continue
+        try:
+            if float(rpm) > 0:
+                limits[model.strip()] = float(rpm)
+        except ValueError:
+            logger.warning("ZEN_IMAGE_RPM: не число в %r — пропуск", part)
+    return limits
+
+
+class _ModelRateLimiter:
+    """Не больше rpm запросов в минуту к модели: старты запросов разносятся равномерно."""
+
+    def __init__(self, limits: Dict[str, float]):
+        self._limits = limits
+        self._next: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, model: str) -> None:
+        rpm = self._limits.get(model)
+        if not rpm:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(model, now))
+            self._next[model] = slot + 60 / rpm
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_image_pool = ThreadPoolExecutor(max_workers=max(1, ZEN_IMAGE_WORKERS), thread_name_prefix="zen-image")
+_image_limiter = _ModelRateLimiter(_parse_rpm(ZEN_IMAGE_RPM))
+
+
 # =====================================================================
 #  ПРОМПТЫ (адаптированы под flowcabinet.ru из BLUEPRINT + новая структура)
 # =====================================================================
@@ -262,6 +363,7 @@ class ArticleGenerator:
 
     def __init__(self):
         self._grs = None
+        self._streamed: Optional[Dict[str, Any]] = None  # результат generate_article_stream
 
     @property
     def grs(self):
@@ -286,11 +388,23 @@ class ArticleGenerator:
         logger.warning("Нет тем в листе '%s'", sheet_name)
         return None, None, None
 
-    def delete_topic(self, row_index: int, sheet_name: Optional[str] = None) -> None:
-        """Удаляет строку с темой после публикации."""
+    def delete_topic(self, row_index: int, sheet_name: Optional[str] = None, expected: Optional[str] = None) -> None:
+        """
+        Удаляет строку с темой после публикации. expected — тема из fetch_topic: если строки
+        таблицы с тех пор сдвинулись (слот продолжен после перезапуска), тема ищется по тексту,
+        а не найденная — не удаляется ничего.
+        """
         sheet_name = sheet_name or ZEN_TOPICS_SHEET_NAME
         client = _get_sheets_client()
         sheet = client.open_by_key(GOOGLE_SHEET_ID).worksheet(sheet_name)
+        if expected:
+            col_a = [(c or "").strip() for c in sheet.col_values(1)]
+            if row_index > len(col_a) or col_a[row_index - 1] != expected:
+                if expected not in col_a:
+                    logger.warning("Тема «%s» не найдена в '%s' — строка не удалена", expected[:60], sheet_name)
+                    return
+                logger.info("Тема сместилась: строка %d → %d", row_index, col_a.index(expected) + 1)
+                row_index = col_a.index(expected) + 1
         sheet.delete_rows(row_index)
         logger.info("Удалена строка %d из '%s'", row_index, sheet_name)
 
@@ -324,9 +438,28 @@ class ArticleGenerator:
         # Fallback: тема как первый сид
         return (topic, "", "")
 
+    def prepare_keywords(self, topics: List[str]) -> Dict[str, str]:
+        """
+        Ключевые слова для нескольких тем: сиды по каждой теме, затем сиды всех тем — одним пакетом
+        в Вордстат (wordstat_client.fetch_top_phrases_many: кеш, повторы сидов, до 128 фраз на вызов).
+        → {тема: ключевые слова через запятую}; без Вордстата — сиды, без сидов — сама тема.
+        """
+        seeds_by_topic = {topic: [s for s in self.generate_seeds(topic) if s] for topic in dict.fromkeys(topics)}
+        try:
+            from blocks.autopost_zen import wordstat_client as wc
+            top = wc.fetch_top_phrases_many(list(seeds_by_topic.values()))
+        except Exception as e:
+            logger.warning("Wordstat не использован: %s", e)
+            top = [[] for _ in seeds_by_topic]
+        return {
+            topic: ", ".join(phrases) if phrases else ", ".join(seeds) if seeds else topic
+            for (topic, seeds), phrases in zip(seeds_by_topic.items(), top)
+        }
+
     # ── 3. Текст статьи ────────────────────────────────
     def generate_article(self, headline: str, topic: str, keywords: str = "") -> str:
-        """Генерирует HTML текст статьи. Возвращает сырой HTML."""
+        """Генерирует HTML текст статьи. Возвращает сырой HTML.
+        При ZEN_ARTICLE_STREAM — потоково (generate_article_stream), при ошибке потока — обычным запросом."""
         prompt = PROMPT_ARTICLE.format(
             headline=headline, topic=topic, keywords=keywords or topic
         )
@@ -334,16 +467,118 @@ class ArticleGenerator:
             {"role": "system", "content": "Ты — SEO-копирайтер для Яндекс.Дзен, тематика: офисные пространства и ремонт (flowcabinet.ru). Ссылки только на flowcabinet.ru и t.me/myflowofficial."},
             {"role": "user", "content": prompt},
         ]
+        self._streamed = None
+        if ZEN_ARTICLE_STREAM:
+            try:
+                return self.generate_article_stream(messages)
+            except Exception as e:
+                logger.warning("Потоковая генерация статьи не удалась (%s) — обычный запрос", e)
+                self._streamed = None
         result = self.grs.chat(messages=messages, model=ZEN_ARTICLE_MODEL, temperature=0.7)
-        html = result.strip()
-        html = re.sub(r"^```html?\s*\n?", "", html)
-        html = re.sub(r"\n?```\s*$", "", html)
+        html = _clean_article_html(result)
         logger.info("Текст статьи: %d символов", len(html))
         return html
 
+    def generate_article_stream(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Потоковая генерация: куски ответа сразу разбираются в content_blocks (BlockStreamParser).
+        Как только текста хватает — параллельно стартуют промпты meta description и саммари для Telegram.
+        Если за ZEN_STREAM_ABORT_CHARS символов не закрылся ни один блок — ответ не HTML, поток обрывается
+        (ValueError) — только тогда generate_article делает обычный запрос. Поток без блоков (разметка,
+        которую потоковый разбор не понял) и поток, где вне блоков осталось больше STREAM_MAX_STRAY_CHARS
+        символов текста (статья разобрана не целиком), разбираются целиком parse_html_to_blocks —
+        уже оплаченный ответ не выбрасывается. При обрыве ранние промпты отменяются.
+        Готовые блоки и ранние промпты используются в build_article для этого же HTML.
+        Время до первого блока — метрика шага time_to_first_block_ms.
+        """
+        started = time.monotonic()
+        parser = BlockStreamParser()
+        blocks: List[Dict[str, Any]] = []
+        chunks: List[str] = []
+        received = 0
+        first_block_ms: Optional[int] = None
+        early: Dict[str, Future] = {}
+        try:
+            stream = self.grs.chat_stream(messages=messages, model=ZEN_ARTICLE_MODEL, temperature=0.7)
+            try:
+                for chunk in stream:
+                    chunks.append(chunk)
+                    received += len(chunk)
+                    closed = parser.feed(chunk)
+                    if closed:
+                        if first_block_ms is None and any(b["type"] == "html" for b in closed):
+                            first_block_ms = int((time.monotonic() - started) * 1000)
+                            logger.info("Первый блок статьи через %d мс", first_block_ms)
+                        blocks.extend(closed)
+                        self._start_early_prompts("".join(chunks), early)
+                    elif first_block_ms is None and received > ZEN_STREAM_ABORT_CHARS:
+                        raise ValueError(f"за {received} символов не закрылся ни один HTML-блок")
+            finally:
+                stream.close()
+            blocks.extend(parser.close())
+            html = _clean_article_html("".join(chunks))
+            if parser.stray_chars > STREAM_MAX_STRAY_CHARS:
+                # Ответ пришёл целиком, но потоковый разбор его не покрыл — тот же случай, что поток без блоков
+                logger.warning(
+                    "%d символов текста вне HTML-блоков — ответ разбирается целиком", parser.stray_chars,
+                )
+                blocks = []
+            if any(b["type"] == "html" for b in blocks):
+                blocks = self._place_banner(blocks)
+            else:
+                blocks = self.parse_html_to_blocks(html)
+                if not blocks:
+                    raise ValueError("в ответе нет HTML-блоков")
+                logger.info("Ответ разобран целиком (%d блоков)", len(blocks))
+        except BaseException:
+            for future in early.values():
+                future.cancel()  # уже идущие доработают, результат не используется
+            raise
+
+        total_ms = int((time.monotonic() - started) * 1000)
+        block_count = sum(1 for b in blocks if b["type"] == "html")
+        self._streamed = {"html": html, "blocks": blocks, "early": early}
+        logger.info("Текст статьи: %d символов, %d блоков, %d мс (поток)", len(html), block_count, total_ms)
+        _record_step_metric("time_to_first_block_ms", first_block_ms, "Первый блок статьи")
+        _record_step_metric("article_stream_ms", total_ms)
+        _record_step_metric("article_blocks", block_count)
+        return html
+
+    def _start_early_prompts(self, received: str, early: Dict[str, Future]) -> None:
+        """Запустить meta/саммари, когда пришедшего текста хватает (фрагмент уже не изменится)."""
+        if len(early) == 2:
+            return
+        # Обрезаем по последнему закрытому тегу — без недописанных тегов
+        html = _clean_article_html(received[:received.rfind(">") + 1])
+        run = contextvars.copy_context().run  # вызовы API — в учёт текущего шага
+        if "meta" not in early and len(re.sub(r"<[^>]+>", " ", html)) > META_FRAGMENT_CHARS:
+            early["meta"] = _early_pool.submit(run, self._meta_from_fragment, _meta_fragment(html))
+        if "telegram_summary" not in early and len(_plain_text(html)) > TELEGRAM_FRAGMENT_CHARS + 1:
+            early["telegram_summary"] = _early_pool.submit(
+                run, self._telegram_summary_from_fragment, _plain_text(html)[:TELEGRAM_FRAGMENT_CHARS]
+            )
+
+    def _streamed_for(self, article_html: str) -> Optional[Dict[str, Any]]:
+        """Результат потоковой генерации, если он относится к этому HTML."""
+        streamed = getattr(self, "_streamed", None)
+        return streamed if streamed and streamed["html"] == article_html else None
+
+    @staticmethod
+    def _early_result(streamed: Optional[Dict[str, Any]], key: str) -> Optional[str]:
+        future = streamed["early"].get(key) if streamed else None
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            logger.warning("Ранний промпт %s не удался: %s — повторяем", key, e)
+            return None
+
     def generate_meta_description(self, article_html: str) -> str:
         """Генерирует короткое мета-описание для Дзен строго по содержанию статьи."""
-        fragment = re.sub(r"<[^>]+>", " ", article_html)[:800].strip()
+        return self._meta_from_fragment(_meta_fragment(article_html))
+
+    def _meta_from_fragment(self, fragment: str) -> str:
         prompt = PROMPT_META_DESCRIPTION.format(text_fragment=fragment)
         result = self.grs.simple_ask(prompt, model=ZEN_HEADLINE_MODEL)
         desc = result.strip().strip('"').strip("'").strip()
@@ -356,9 +591,9 @@ class ArticleGenerator:
         """Генерирует саммари для Telegram (400–700 символов) строго по содержанию статьи.
         Из фрагмента убираются все HTML-теги, чтобы модель не описывала «HTML-структуру»."""
         # Убираем все HTML-теги и лишние пробелы, чтобы модель видела только текст
-        clean = re.sub(r"<[^>]+>", " ", article_html)
-        clean = re.sub(r"\s{2,}", " ", clean).strip()
-        fragment = clean[:3000]
+        return self._telegram_summary_from_fragment(_plain_text(article_html)[:TELEGRAM_FRAGMENT_CHARS])
+
+    def _telegram_summary_from_fragment(self, fragment: str) -> str:
         prompt = PROMPT_TELEGRAM_SUMMARY.format(text_fragment=fragment)
         result = self.grs.simple_ask(prompt, model=ZEN_HEADLINE_MODEL)
         summary = result.strip().strip('"').strip("'").strip()
@@ -385,23 +620,14 @@ class ArticleGenerator:
 
     # ── 4. Парсер HTML → content_blocks ────────────────
     def _parse_html_fragments_to_blocks(self, html: str) -> List[Dict[str, Any]]:
-        """Парсит фрагмент HTML в блоки. Картинок в теле нет — только обложка и баннер по URL."""
-        blocks: List[Dict[str, Any]] = []
-        tag_pattern = re.compile(
-            r'(<(?:h[23]|p|ul|ol|blockquote|div|table|details)[^>]*>.*?</(?:h[23]|p|ul|ol|blockquote|div|table|details)>)',
-            re.DOTALL | re.IGNORECASE,
-        )
-        parts = tag_pattern.findall(html)
-        if not parts:
-            for line in html.strip().split("\n"):
-                line = line.strip()
-                if line and line.startswith("<"):
-                    blocks.append({"type": "html", "content": line})
+        """Парсит фрагмент HTML в блоки (с разобранным видом "parsed"). Картинок в теле нет — только обложка и баннер по URL."""
+        blocks = [b for b in parse_blocks(html) if b["type"] == "html"]
+        if blocks:
             return blocks
-        for part in parts:
-            part = part.strip()
-            if part:
-                blocks.append({"type": "html", "content": part})
+        for line in html.strip().split("\n"):
+            line = line.strip()
+            if line and line.startswith("<"):
+                blocks.append(html_block(line))
         return blocks
 
     # Минимум блоков до маркера <!-- BANNER -->, иначе считаем маркер ошибочно в начале — вставляем баннер в середину
@@ -412,6 +638,24 @@ class ArticleGenerator:
         """Парсит HTML в content_blocks. При наличии <!-- BANNER --> вставляет рекламный баннер после 3–4 шага инструкции.
         Если маркер стоит в начале (мало блоков до него), баннер вставляется в фиксированную позицию в середине статьи."""
         banner_marker = "<!-- BANNER -->"
+        if banner_marker not in html:
+            return self._parse_html_fragments_to_blocks(html)
+        parts = html.split(banner_marker, 1)
+        before = self._parse_html_fragments_to_blocks(parts[0].strip())
+        after = self._parse_html_fragments_to_blocks(parts[1].strip())
+        return self._insert_banner(before, after)
+
+    def _place_banner(self, blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Блоки потокового разбора (с маркерами <!-- BANNER -->) → content_blocks, как parse_html_to_blocks."""
+        html_blocks = [b for b in blocks if b["type"] == "html"]
+        marker_at = next((i for i, b in enumerate(blocks) if b.get("name") == BANNER_MARKER), None)
+        if marker_at is None:
+            return html_blocks
+        before = [b for b in blocks[:marker_at] if b["type"] == "html"]
+        return self._insert_banner(before, html_blocks[len(before):])
+
+    def _insert_banner(self, before: List[Dict[str, Any]], after: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Баннер на месте маркера; если до маркера мало блоков — в фиксированную позицию в середине."""
         banner_blocks: List[Dict[str, Any]] = [
             {
                 "type": "image",
@@ -419,11 +663,6 @@ class ArticleGenerator:
                 "caption": "Планируешь ремонт в офисе? flowcabinet.ru",
             },
         ]
-        if banner_marker not in html:
-            return self._parse_html_fragments_to_blocks(html)
-        parts = html.split(banner_marker, 1)
-        before = self._parse_html_fragments_to_blocks(parts[0].strip())
-        after = self._parse_html_fragments_to_blocks(parts[1].strip())
         if len(before) >= self.MIN_BLOCKS_BEFORE_BANNER:
             return before + banner_blocks + after
         # Маркер в начале или «не на месте» — вставляем баннер в середину контента
@@ -439,7 +678,7 @@ class ArticleGenerator:
         logger.info("Генерация обложки: %s", topic[:50])
         # 1) nano-banana-pro (с повтором при ошибке)
         for attempt in range(2):
-            result = self.grs.generate_image(
+            result = self._generate_image(
                 prompt=prompt,
                 model="nano-banana-pro",
                 size="1792x1024",
@@ -453,7 +692,7 @@ class ArticleGenerator:
                 time.sleep(COVER_RETRY_DELAY_SEC)
         # 2) Запасной вариант: gpt-image-1.5 (без референсов)
         logger.info("Пробуем запасную модель gpt-image-1.5 для обложки")
-        result = self.grs.generate_image(
+        result = self._generate_image(
             prompt=prompt,
             model="gpt-image-1.5",
             size="1792x1024",
@@ -464,18 +703,23 @@ class ArticleGenerator:
         logger.warning("Ошибка генерации обложки gpt-image-1.5: %s", result.get("error"))
         return False
 
+    def _generate_image(self, **kwargs) -> Dict[str, Any]:
+        """generate_image GRS с учётом лимита запросов в минуту модели (ZEN_IMAGE_RPM)."""
+        _image_limiter.wait(kwargs["model"])
+        return self.grs.generate_image(**kwargs)
+
     def generate_article_image(self, section_title: str, headline: str, output_path: Path) -> bool:
         """Генерирует картинку для секции статьи (1024x1024). Пробует ZEN_IMAGE_MODEL, при ошибке — nano-banana."""
         prompt = PROMPT_IMAGE.format(section_title=section_title, headline=headline)
         logger.info("Генерация картинки: %s", section_title[:50])
-        result = self.grs.generate_image(
+        result = self._generate_image(
             prompt=prompt,
             model=ZEN_IMAGE_MODEL,
             size="1024x1024",
         )
         if not result.get("success") and ZEN_IMAGE_MODEL != "nano-banana":
             logger.info("Повтор картинки блока с nano-banana")
-            result = self.grs.generate_image(
+            result = self._generate_image(
                 prompt=prompt,
                 model="nano-banana",
                 size="1024x1024",
@@ -483,29 +727,94 @@ class ArticleGenerator:
         return self._save_image_result(result, output_path)
 
     def _save_image_result(self, result: Dict[str, Any], output_path: Path) -> bool:
-        """Скачивает/декодирует результат GRS image и сохраняет."""
+        """Скачивает (потоком, сразу в файл) или декодирует результат GRS image и сохраняет."""
         if not result.get("success"):
             logger.warning("Ошибка генерации изображения: %s", result.get("error"))
             return False
-        raw: bytes
+        output_path.parent.mkdir(parents=True, exist_ok=True)
         if "url" in result:
+            part_path = output_path.with_name(output_path.name + ".part")
+            size = 0
             try:
-                r = requests.get(result["url"], timeout=120)
-                r.raise_for_status()
-                raw = r.content
+                with requests.get(result["url"], timeout=120, stream=True) as r:
+                    r.raise_for_status()
+                    with open(part_path, "wb") as f:
+                        for chunk in r.iter_content(IMAGE_DOWNLOAD_CHUNK):
+                            f.write(chunk)
+                            size += len(chunk)
+                part_path.replace(output_path)
             except Exception as e:
                 logger.warning("Не удалось скачать изображение: %s", e)
+                part_path.unlink(missing_ok=True)
                 return False
         elif "b64_json" in result:
             raw = base64.b64decode(result["b64_json"])
+            output_path.write_bytes(raw)
+            size = len(raw)
         else:
             logger.warning("Нет url/b64 в ответе: %s", list(result.keys()))
             return False
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_bytes(raw)
-        logger.info("Изображение сохранено: %s (%d KB)", output_path.name, len(raw) // 1024)
+        logger.info("Изображение сохранено: %s (%d KB)", output_path.name, size // 1024)
         return True
 
+    def _pick_image_sections(self, blocks: List[Dict[str, Any]], limit: int) -> List[Tuple[int, str]]:
+        """До limit подзаголовков (индекс блока, текст) для картинок — равномерно по статье; h2, при нехватке и h3."""
+        headings: Dict[str, List[Tuple[int, str]]] = {"h2": [], "h3": []}
+        for i, block in enumerate(blocks):
+            if block.get("type") != "html":
+                continue
+            kind, text, _ = block_info(block)
+            if kind in headings and text.strip():
+                headings[kind].append((i, text.strip()))
+        candidates = headings["h2"]
+        if len(candidates) < limit:
+            candidates = sorted(candidates + headings["h3"])
+        if len(candidates) <= limit:
+            return candidates
+        step = len(candidates) / limit
+        return [candidates[int(k * step)] for k in range(limit)]
+
+    def _start_section_images(
+        self, blocks: List[Dict[str, Any]], headline: str, article_dir: Path
+    ) -> List[Tuple[int, str, str, Future]]:
+        """Запустить генерацию картинок секций в пуле; → [(индекс блока, подзаголовок, файл, future)]."""
+        images_in_body = sum(1 for b in blocks if b.get("type") == "image")
+        limit = min(ZEN_SECTION_IMAGES, ZEN_MAX_IMAGES - 1 - images_in_body)  # 1 — обложка
+        if limit <= 0:
+            return []
+        self.grs  # клиент создаётся здесь, а не наперегонки в потоках пула
+        jobs = []
+        for n, (index, title) in enumerate(self._pick_image_sections(blocks, limit), start=1):
+            name = f"section_{n}.png"
+            run = contextvars.copy_context().run  # вызовы API — в учёт текущего шага
+            future = _image_pool.submit(run, self.generate_article_image, title, headline, article_dir / name)
+            jobs.append((index, title, name, future))
+        logger.info("Картинки секций: %d в работе (потоков %d)", len(jobs), ZEN_IMAGE_WORKERS)
+        return jobs
+
+    def _insert_section_images(
+        self, blocks: List[Dict[str, Any]], jobs: List[Tuple[int, str, str, Future]]
+    ) -> List[Dict[str, Any]]:
+        """Дождаться картинок секций и вставить готовые после своих подзаголовков; неудачные пропускаются."""
+        if not jobs:
+            return blocks
+        result = list(blocks)
+        done = 0
+        for index, title, name, future in sorted(jobs, key=lambda j: j[0], reverse=True):
+            try:
+                ok = future.result()
+            except Exception as e:
+                logger.warning("Картинка секции «%s» не сгенерирована: %s", title[:50], e)
+                ok = False
+            if ok:
+                result.insert(index + 1, {"type": "image", "path": name, "caption": title})
+                done += 1
+        if done < len(jobs):
+            logger.warning("Картинки секций: готово %d из %d, статья без недостающих", done, len(jobs))
+        _record_step_metric("section_images", done)
+        _record_step_metric("section_images_failed", len(jobs) - done)
+        return result
+
     # ── 6. Сборка article.json ─────────────────────────
     def build_article(
         self,
@@ -515,8 +824,11 @@ class ArticleGenerator:
         article_dir: Path,
     ) -> Dict[str, Any]:
         """Полный пайплайн: HTML → blocks, генерация картинок, сборка JSON."""
-        # 1. Парсим HTML в блоки
-        content_blocks = self.parse_html_to_blocks(article_html)
+        # 1. Парсим HTML в блоки (при потоковой генерации блоки уже готовы)
+        streamed = self._streamed_for(article_html)
+        content_blocks = list(streamed["blocks"]) if streamed else self.parse_html_to_blocks(article_html)
+        # Картинки секций генерируются в пуле, пока здесь генерируется обложка
+        section_jobs = self._start_section_images(content_blocks, headline, article_dir)
 
         # 2. Баннер и обложка: файлы в папке статьи, вставка в Дзен как обложка (по пути)
         banner_src = BLOCK_DIR / "articles" / BANNER_IMAGE_FILENAME
@@ -532,6 +844,7 @@ class ArticleGenerator:
                 shutil.copy2(fallback_src, cover_path)
                 cover_ok = True
                 logger.info("Использована fallback-обложка: %s", DEFAULT_COVER_FALLBACK_FILENAME)
+        content_blocks = self._insert_section_images(content_blocks, section_jobs)
         if cover_ok:
             content_blocks.insert(0, {
                 "type": "image",
@@ -540,8 +853,10 @@ class ArticleGenerator:
             })
 
         # 4. Meta для Дзен и отдельное саммари для Telegram (длиннее, строго по содержанию статьи)
-        meta = self.generate_meta_description(article_html)
-        telegram_summary = self.generate_telegram_summary(article_html)
+        meta = self._early_result(streamed, "meta") or self.generate_meta_description(article_html)
+        telegram_summary = (
+            self._early_result(streamed, "telegram_summary") or self.generate_telegram_summary(article_html)
+        )
 
         # 5. Теги
         tags = self.generate_tags(headline, topic)
@@ -556,6 +871,8 @@ class ArticleGenerator:
             "cover_image": cover_name if cover_ok else None,
             "publish": True,
         }
+        # 7. Варианты картинок под каналы (JPEG для Дзена, фото для Telegram, превью дашборда)
+        article_data["renditions"] = renditions.build(article_data, article_dir)
         return article_data
 
     # ── 7. Сохранение ──────────────────────────────────
@@ -578,20 +895,15 @@ class ArticleGenerator:
         if not topic:
             logger.warning("Нет тем для генерации")
             return None
+        return self.generate(topic, extra), row_index
 
+    def generate(self, topic: str, extra: Optional[str] = None) -> Path:
+        """Статья по уже взятой теме (без чтения таблицы). Возвращает путь к article.json."""
         if extra:
             topic = f"{topic}. {extra}"
 
         # 2. Сиды для Wordstat и топ-фразы (SEO)
-        k1, k2, k3 = self.generate_seeds(topic)
-        seeds = [s for s in (k1, k2, k3) if s]
-        try:
-            from blocks.autopost_zen import wordstat_client as wc
-            top_phrases = wc.fetch_top_phrases(seeds) if seeds else []
-        except Exception as e:
-            logger.warning("Wordstat не использован: %s", e)
-            top_phrases = []
-        keywords = ", ".join(top_phrases) if top_phrases else ", ".join(seeds) if seeds else topic
+        keywords = self.prepare_keywords([topic])[topic]
 
         # 3. SEO-заголовок с ключевыми словами
         headline = self.generate_headline(topic, keywords)
@@ -599,27 +911,20 @@ class ArticleGenerator:
         # 4. Текст статьи (новая структура: введение, основной блок, инструкция+баннер, тренды, ссылки, FAQ)
         article_html = self.generate_article(headline, topic, keywords)
 
-        # 5. Папка публикации
-        num = _get_next_publish_number()
-        article_dir = PUBLISH_DIR / f"{num:03d}"
-        article_dir.mkdir(parents=True, exist_ok=True)
-        logger.info("Папка публикации: %s", article_dir)
-
-        # 6. Сборка (парсинг с вставкой баннера + картинки + meta + теги)
-        article_data = self.build_article(headline, topic, article_html, article_dir)
-
-        # Без обложки не публикуем — не сохраняем статью и не идём дальше по циклу
-        if not article_data.get("cover_image"):
-            raise RuntimeError("Обложка не сгенерирована, публикация отменена (без мусора в каналах)")
-
-        # 7. Сохранение
-        article_path = self.save_article(article_data, article_dir)
+        # 5. Папка публикации (номер из реестра — без гонок с параллельными генераторами)
+        article_dir = publish_registry.allocate(title=headline, source="google_sheets")
 
-        return article_path, row_index
+        try:
+            # 6. Сборка (парсинг с вставкой баннера + картинки + meta + теги)
+            article_data = self.build_article(headline, topic, article_html, article_dir)
 
+            # Без обложки не публикуем — не сохраняем статью и не идём дальше по циклу
+            if not article_data.get("cover_image"):
+                raise RuntimeError("Обложка не сгенерирована, публикация отменена (без мусора в каналах)")
 
-def _get_next_publish_number() -> int:
-    """Следующий порядковый номер для папки публикации."""
-    PUBLISH_DIR.mkdir(parents=True, exist_ok=True)
-    existing = [d.name for d in PUBLISH_DIR.iterdir() if d.is_dir() and d.name.isdigit()]
-    return max([0] + [int(n) for n in existing]) + 1
+            # 7. Сохранение
+            return self.save_article(article_data, article_dir)
+        except Exception as e:
+            # Недособранный выпуск закрывается: повтор генерации возьмёт новую папку
+            publish_registry.fail(article_dir, str(e))
+            raise
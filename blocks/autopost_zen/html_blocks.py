@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Разбор HTML статьи на блоки верхнего уровня — один токенизатор для генерации и публикации.
+
+BlockStreamParser получает текст кусками (feed) и отдаёт блоки по мере закрытия тегов
+верхнего уровня (h2, h3, p, ul, ol, blockquote, div, table, details) — не дожидаясь конца
+ответа модели. Вложенность учитывается: <div> с <p> внутри — один блок. Текст вне блоков
+(```html, пустые строки) пропускается и считается в stray_chars. Комментарий <!-- BANNER -->
+верхнего уровня отдаётся маркером {"type": "marker", "name": "BANNER"}.
+
+Незакрытый <p> закрывается неявно, как в браузере: следующим блочным тегом (P_CLOSERS),
+в том числе следующим <p>. Блок, не закрытый к концу входа, отдаётся close() как есть —
+текст после пропущенного </p> не теряется.
+
+Исходная разметка блока сохраняется (открывающие теги — как в ответе, сущности не раскрываются).
+За тот же проход собирается разобранный вид блока — ключ "parsed": {"kind", "text", "items"}
+(тип для редактора Дзена, plain text, пункты списка). Он сохраняется в article.json, и
+ZenClient не разбирает HTML повторно (block_info). Для блоков без "parsed" (старые статьи,
+article.json из других источников) — describe_block.
+
+Разбор линейный по длине входа (html.parser, без регулярок с возвратами).
+Бенчмарк против прежнего регулярного выражения: docs/scripts/benchmark_html_blocks.py.
+"""
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+
+BLOCK_TAGS = frozenset({"h2", "h3", "p", "ul", "ol", "blockquote", "div", "table", "details"})
+VOID_TAGS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+})
+BANNER_MARKER = "BANNER"
+# Открытие этих тегов закрывает незакрытый <p> (правило HTML: <p> не содержит блочных элементов)
+P_CLOSERS = BLOCK_TAGS | frozenset({
+    "h1", "h4", "h5", "h6", "li", "dl", "dt", "dd", "pre", "hr", "section", "article", "aside",
+    "header", "footer", "figure", "form", "fieldset", "nav", "main", "address",
+})
+
+# В теле статьи Дзена только H2 и H3: h1 трактуем как h2, h4 — как h3
+_KIND_BY_TAG = {"h1": "h2", "h2": "h2", "h3": "h3", "h4": "h3", "blockquote": "blockquote", "ul": "ul", "ol": "ol"}
+# Ограда кода вокруг ответа модели (```html … ```) — не «текст вне блоков»
+_FENCE = re.compile(r"```[a-zA-Z]*")
+# После закрытия этих тегов в plain text — перенос строки
+_BREAK_AFTER = frozenset({"p", "li", "h1", "h2", "h3", "h4", "h5", "h6"})
+
+
+class _BlockText:
+    """Тип, plain text и пункты списка одного блока — копятся по ходу разбора."""
+
+    def __init__(self):
+        self.tag: Optional[str] = None
+        self.parts: List[str] = []
+        self.items: List[str] = []
+        self.has_link = False
+        self._item: Optional[List[str]] = None
+
+    def start(self, tag: str, depth: int) -> None:
+        """depth — сколько тегов открыто до этого (0 — тег верхнего уровня)."""
+        if self.tag is None:
+            self.tag = tag
+        if tag == "a":
+            self.has_link = True
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag == "li" and depth == 1 and self.tag in ("ul", "ol"):
+            self._item = []
+
+    def end(self, tag: str, depth: int) -> None:
+        """depth — сколько тегов осталось открыто после закрытия."""
+        if tag in _BREAK_AFTER:
+            self.parts.append("\n")
+        if tag == "li" and depth == 1 and self._item is not None:
+            self.items.append("".join(self._item).strip())
+            self._item = None
+
+    def data(self, text: str) -> None:
+        self.parts.append(text)
+        if self._item is not None:
+            self._item.append(text)
+
+    def result(self) -> Dict[str, Any]:
+        text = re.sub(r"\n{3,}", "\n\n", "".join(self.parts)).strip()
+        kind = _KIND_BY_TAG.get(self.tag or "")
+        if kind is None:
+            kind = "p_with_link" if self.has_link else "p"
+        items = (self.items or None) if kind in ("ul", "ol") else None
+        return {"kind": kind, "text": text, "items": items}
+
+
+class BlockStreamParser(HTMLParser):
+    """feed(chunk) → готовые блоки; close() → то, что закрылось в самом конце."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._stack: List[str] = []
+        self._parts: List[str] = []
+        self._text = _BlockText()
+        self._ready: List[Dict[str, Any]] = []
+        self._stray: List[str] = []  # текст вне блоков
+
+    def feed(self, data: str) -> List[Dict[str, Any]]:
+        super().feed(data)
+        ready, self._ready = self._ready, []
+        return ready
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Дочитать буфер. Блок, не закрытый к концу (нет </p> в конце ответа), закрывается и отдаётся."""
+        super().close()
+        if self._stack:
+            self._close_to(self._stack[0])
+        self._parts.clear()
+        ready, self._ready = self._ready, []
+        return ready
+
+    @property
+    def stray_chars(self) -> int:
+        """Непробельных символов вне блоков (кроме ```-ограды): много — ответ не разобрался в блоки."""
+        return len(re.sub(r"\s", "", _FENCE.sub("", "".join(self._stray))))
+
+    @property
+    def pending_chars(self) -> int:
+        """Сколько символов в незакрытом блоке (для проверки «модель пишет не HTML»)."""
+        return sum(len(p) for p in self._parts)
+
+    def _append(self, text: str) -> None:
+        if self._stack:
+            self._parts.append(text)
+
+    def _close_to(self, tag: str) -> None:
+        """Закрыть открытые теги до tag включительно (дописав закрывающие); блок верхнего уровня — в готовые."""
+        while True:
+            closed = self._stack.pop()
+            self._parts.append(f"</{closed}>")
+            self._text.end(closed, len(self._stack))
+            if closed == tag:
+                break
+        if not self._stack:
+            content = "".join(self._parts).strip()
+            self._parts = []
+            if content:
+                self._ready.append({"type": "html", "content": content, "parsed": self._text.result()})
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        text = self.get_starttag_text() or f"<{tag}>"
+        if self._stack and self._stack[-1] == "p" and tag in P_CLOSERS:
+            # <p> без </p>: блочный тег закрывает абзац (на верхнем уровне — и сам блок)
+            self._close_to("p")
+        if not self._stack:
+            if tag not in BLOCK_TAGS:
+                return
+            self._parts = [text]
+            self._text = _BlockText()
+            self._text.start(tag, 0)
+            self._stack.append(tag)
+            return
+        self._parts.append(text)
+        if tag == "li" and self._stack[-1] == "li":
+            # <li> без </li>: следующий пункт закрывает предыдущий
+            self._text.end(self._stack.pop(), len(self._stack))
+        self._text.start(tag, len(self._stack))
+        if tag not in VOID_TAGS:
+            self._stack.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs) -> None:
+        if self._stack:
+            self._parts.append(self.get_starttag_text() or f"<{tag} />")
+            self._text.start(tag, len(self._stack))
+
+    def handle_endtag(self, tag: str) -> None:
+        if not self._stack:
+            return
+        if tag not in self._stack:
+            self._parts.append(f"</{tag}>")
+            return  # лишний закрывающий тег внутри блока (в том числе </p> уже закрытого абзаца)
+        # Незакрытые вложенные теги (<li> без </li>) закрываются вместе с родителем
+        while self._stack[-1] != tag:
+            self._text.end(self._stack.pop(), len(self._stack))
+        self._close_to(tag)
+
+    def handle_data(self, data: str) -> None:
+        if self._stack:
+            self._parts.append(data)
+            self._text.data(data)
+        else:
+            self._stray.append(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self._append(f"&{name};")
+        if self._stack:
+            self._text.data(f"&{name};")
+
+    def handle_charref(self, name: str) -> None:
+        self._append(f"&#{name};")
+        if self._stack:
+            self._text.data(f"&#{name};")
+
+    def handle_comment(self, data: str) -> None:
+        if self._stack == ["p"] and data.strip() == BANNER_MARKER:
+            self._close_to("p")  # маркер после абзаца без </p>
+        if self._stack:
+            self._parts.append(f"<!--{data}-->")
+        elif data.strip() == BANNER_MARKER:
+            self._ready.append({"type": "marker", "name": BANNER_MARKER})
+
+
+class _FragmentParser(HTMLParser):
+    """Разбор произвольного фрагмента целиком (любой первый тег, текст вне тегов) — для describe_block."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._stack: List[str] = []
+        self.text = _BlockText()
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if self._stack and (
+            (tag == "li" and self._stack[-1] == "li") or (tag in P_CLOSERS and self._stack[-1] == "p")
+        ):
+            self.text.end(self._stack.pop(), len(self._stack))
+        self.text.start(tag, len(self._stack))
+        if tag not in VOID_TAGS:
+            self._stack.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs) -> None:
+        self.text.start(tag, len(self._stack))
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag not in self._stack:
+            self.text.end(tag, len(self._stack))
+            return
+        while True:
+            closed = self._stack.pop()
+            self.text.end(closed, len(self._stack))
+            if closed == tag:
+                break
+
+    def handle_data(self, data: str) -> None:
+        self.text.data(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self.text.data(f"&{name};")
+
+    def handle_charref(self, name: str) -> None:
+        self.text.data(f"&#{name};")
+
+
+def parse_blocks(html: str) -> List[Dict[str, Any]]:
+    """Весь HTML сразу → блоки верхнего уровня (с "parsed") и маркеры BANNER."""
+    parser = BlockStreamParser()
+    blocks = parser.feed(html)
+    blocks.extend(parser.close())
+    return blocks
+
+
+def describe_block(html: str) -> Dict[str, Any]:
+    """Разобранный вид HTML-фрагмента: {"kind", "text", "items"} — как ключ "parsed" у блоков."""
+    if not html or not html.strip():
+        return {"kind": "p", "text": "", "items": None}
+    parser = _FragmentParser()
+    parser.feed(html)
+    parser.close()
+    return parser.text.result()
+
+
+def html_block(content: str) -> Dict[str, Any]:
+    """HTML-блок content_blocks с разобранным видом."""
+    return {"type": "html", "content": content, "parsed": describe_block(content)}
+
+
+def block_info(block: Dict[str, Any]) -> Tuple[str, str, Optional[List[str]]]:
+    """(kind, text, items) HTML-блока: из сохранённого "parsed", иначе разбор content."""
+    parsed = block.get("parsed")
+    if not isinstance(parsed, dict) or "kind" not in parsed:
+        parsed = describe_block(block.get("content") or "")
+    return parsed["kind"], parsed.get("text") or "", parsed.get("items")
@@ -43,7 +43,8 @@ def setup_logging(log_file: Path | None = None) -> None:
 
 def _run_auto(args) -> int:
     """Режим --auto: тема из Google Sheets → генерация → публикация. Каждый шаг — чекпоинт в RunTracker (если доступен)."""
-    from .article_generator import ArticleGenerator, PUBLISH_DIR, _get_next_publish_number
+    from . import publish_registry
+    from .article_generator import ArticleGenerator
 
     try:
         from blocks.analytics.tracker import RunTracker
@@ -62,9 +63,9 @@ def _run_auto(args) -> int:
     generator = ArticleGenerator()
     exit_code = 2
 
-    def step(name, label, fn):
+    def step(name, label, fn, metadata=None):
         if use_tracker:
-            with tracker.step(run_id, name, label):
+            with tracker.step(run_id, name, label, metadata=metadata):
                 return fn()
         return fn()
 
@@ -85,16 +86,22 @@ def _run_auto(args) -> int:
 
         article_html = step("generate_article", "Генерация текста статьи", lambda: generator.generate_article(headline, topic))
 
-        def do_build():
-            num = _get_next_publish_number()
-            article_dir = PUBLISH_DIR / f"{num:03d}"
-            article_dir.mkdir(parents=True, exist_ok=True)
-            return generator.build_article(headline, topic, article_html, article_dir), article_dir
-        article_data, article_dir = step("build_article", "Генерация обложки и картинок, сборка статьи", do_build)
-        if use_tracker:
-            tracker.update_run_publish_dir(run_id, str(article_dir))
+        article_dir = publish_registry.allocate(
+            title=headline, source="google_sheets", run_id=run_id if use_tracker else None,
+        )
+        try:
+            article_data = step(
+                "build_article", "Генерация обложки и картинок, сборка статьи",
+                lambda: generator.build_article(headline, topic, article_html, article_dir),
+            )
+            if use_tracker:
+                tracker.update_run_publish_dir(run_id, str(article_dir))
 
-        article_path = step("save_article", "Сохранение статьи", lambda: generator.save_article(article_data, article_dir))
+            article_path = step("save_article", "Сохранение статьи", lambda: generator.save_article(article_data, article_dir))
+        except Exception as e:
+            # Недособранный выпуск закрывается — в latest()/unpublished() он не попадёт
+            publish_registry.fail(article_dir, str(e))
+            raise
         LOG.info("Статья сгенерирована: %s", article_path)
 
         if args.generate_only:
@@ -114,8 +121,10 @@ def _run_auto(args) -> int:
             telegram_ok = True
         except Exception as e:
             LOG.error("Публикация в Telegram не удалась: %s. Продолжаем в другие каналы.", e)
+        publish_registry.set_channel_status(article_dir, "telegram", publish_registry.DONE if telegram_ok else publish_registry.FAILED)
 
         zen_ok = False
+        zen_trace_meta: dict = {}  # спаны трассировки (ZEN_TRACE) → metadata шага
         try:
             def do_publish():
                 data = json.loads(article_path.read_text(encoding="utf-8"))
@@ -127,14 +136,16 @@ def _run_auto(args) -> int:
                         headless=args.headless or config.HEADLESS,
                         keep_open=args.keep_open or config.KEEP_BROWSER_OPEN,
                         article_path=article_path,
+                        trace_meta=zen_trace_meta,
                     )
                 )
                 if code != 0:
                     raise RuntimeError(msg or "Публикация не удалась")
-            step("publish_zen", "Публикация в Дзен", do_publish)
+            step("publish_zen", "Публикация в Дзен", do_publish, metadata=zen_trace_meta)
             zen_ok = True
         except Exception as e:
             LOG.error("Публикация в Дзен не удалась: %s", e)
+        publish_registry.set_channel_status(article_dir, "zen", publish_registry.DONE if zen_ok else publish_registry.FAILED)
 
         # Каналы для аналитики: по каким каналам реально опубликовали
         if use_tracker:
@@ -221,6 +232,7 @@ def _run_file(args) -> int:
         use_tracker = False
 
     publish = args.publish if args.publish else data.get("publish", True)
+    zen_trace_meta: dict = {}  # спаны трассировки (ZEN_TRACE) → metadata шага
 
     def do_publish():
         return asyncio.run(
@@ -230,11 +242,12 @@ def _run_file(args) -> int:
                 headless=args.headless or config.HEADLESS,
                 keep_open=args.keep_open or config.KEEP_BROWSER_OPEN,
                 article_path=article_path,
+                trace_meta=zen_trace_meta,
             )
         )
 
     if use_tracker:
-        with tracker.step(run_id, "publish_zen", "Публикация в Дзен"):
+        with tracker.step(run_id, "publish_zen", "Публикация в Дзен", metadata=zen_trace_meta):
             exit_code, msg, _ = do_publish()
             if exit_code != 0:
                 raise RuntimeError(msg or "Публикация не удалась")
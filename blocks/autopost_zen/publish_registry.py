@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Реестр папок публикации (publish/001, 002, …): атомарная выдача номеров и индекс выпусков.
+
+Номер выдаётся в транзакции SQLite (BEGIN IMMEDIATE — одна выдача за раз на все процессы),
+папка создаётся mkdir без exist_ok: если номер уже занят папкой, созданной в обход реестра,
+номер помечается занятым и берётся следующий. Параллельные генераторы не попадают в одну папку,
+а выдача не сканирует publish/.
+
+Индекс выпусков (таблица bundles): номер, путь, run_id аналитики, заголовок, источник,
+статусы по каналам (telegram, zen: pending | done | failed), created_at. Запросы
+«последний выпуск», «выпуск запуска», «не опубликованные в Дзен» — по индексам.
+Выпуск, сборка которого не удалась, помечается status=failed (fail()); «последний» и
+«не опубликованные» отдают только активные выпуски с article.json — недособранные папки
+в каналы не попадают.
+
+При первом открытии реестра существующие папки publish/NNN импортируются один раз.
+БД: PUBLISH_REGISTRY_PATH (по умолчанию publish/registry.db).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+BLOCK_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BLOCK_DIR.parent.parent
+PUBLISH_DIR = BLOCK_DIR / "publish"
+REGISTRY_PATH = Path(os.getenv("PUBLISH_REGISTRY_PATH", str(PUBLISH_DIR / "registry.db")))
+if not REGISTRY_PATH.is_absolute():
+    REGISTRY_PATH = PROJECT_ROOT / REGISTRY_PATH
+
+CHANNELS = ("telegram", "zen")
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+# Статус выпуска (bundles.status): active — в работе/готов; failed — сборка не удалась
+ACTIVE = "active"
+# Номер занят папкой, созданной в обход реестра (старый код, ручное копирование)
+EXTERNAL = "external"
+
+# Сколько раз пробовать следующий номер, если папки уже есть на диске
+_MAX_ALLOCATE_ATTEMPTS = 1000
+
+_lock = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _connect() -> sqlite3.Connection:
+    REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(REGISTRY_PATH), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS bundles (
+               number INTEGER PRIMARY KEY,
+               path TEXT NOT NULL,
+               run_id INTEGER,
+               title TEXT,
+               source TEXT,
+               status TEXT NOT NULL DEFAULT 'active',
+               telegram_status TEXT,
+               zen_status TEXT,
+               created_at TEXT NOT NULL,
+               updated_at TEXT
+           );
+           CREATE INDEX IF NOT EXISTS idx_bundles_run ON bundles(run_id);
+           CREATE INDEX IF NOT EXISTS idx_bundles_zen ON bundles(zen_status, number);
+           CREATE INDEX IF NOT EXISTS idx_bundles_telegram ON bundles(telegram_status, number);
+           CREATE TABLE IF NOT EXISTS registry_meta (key TEXT PRIMARY KEY, value TEXT);"""
+    )
+    if conn.execute("SELECT 1 FROM registry_meta WHERE key = 'imported'").fetchone() is None:
+        _import_existing(conn)
+    return conn
+
+
+def _import_existing(conn: sqlite3.Connection) -> None:
+    """Первый запуск: занести в реестр уже существующие папки publish/NNN (единственный скан папки)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM registry_meta WHERE key = 'imported'").fetchone() is None:
+            count = 0
+            if PUBLISH_DIR.is_dir():
+                for d in PUBLISH_DIR.iterdir():
+                    if not (d.is_dir() and d.name.isdigit()):
+                        continue
+                    title = None
+                    try:
+                        title = json.loads((d / "article.json").read_text(encoding="utf-8")).get("title")
+                    except (OSError, ValueError, AttributeError):
+                        pass
+                    created = datetime.fromtimestamp(d.stat().st_mtime).isoformat()
+                    conn.execute(
+                        "INSERT OR IGNORE INTO bundles (number, path, title, source, created_at) VALUES (?, ?, ?, 'import', ?)",
+                        (int(d.name), str(d), title, created),
+                    )
+                    count += 1
+            conn.execute("INSERT INTO registry_meta (key, value) VALUES ('imported', ?)", (_now(),))
+            if count:
+                logger.info("Реестр публикаций: импортировано %d папок из %s", count, PUBLISH_DIR)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _current_run_id() -> Optional[int]:
+    """run_id текущего шага RunTracker (генерация идёт внутри шага), если аналитика доступна."""
+    try:
+        from blocks.analytics.tracker import current_step
+    except ImportError:
+        return None
+    ctx = current_step.get()
+    return ctx.get("run_id") if ctx else None
+
+
+def number_of(path: Path) -> Optional[int]:
+    """Номер выпуска по пути к папке publish/NNN или к article.json в ней; None — папка не из publish/."""
+    path = Path(path)
+    if path.name == "article.json":
+        path = path.parent
+    if not path.name.isdigit() or path.resolve().parent != PUBLISH_DIR.resolve():
+        return None
+    return int(path.name)
+
+
+def allocate(title: Optional[str] = None, source: Optional[str] = None, run_id: Optional[int] = None) -> Path:
+    """
+    Выдать следующий номер и создать папку publish/NNN. Папка новая и пустая — гарантированно
+    не совпадает с папкой другого генератора. run_id по умолчанию — из текущего шага аналитики.
+    """
+    if run_id is None:
+        run_id = _current_run_id()
+    PUBLISH_DIR.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        conn = _connect()
+        try:
+            for _ in range(_MAX_ALLOCATE_ATTEMPTS):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    number = conn.execute("SELECT COALESCE(MAX(number), 0) + 1 FROM bundles").fetchone()[0]
+                    path = PUBLISH_DIR / f"{number:03d}"
+                    try:
+                        path.mkdir()
+                    except FileExistsError:
+                        conn.execute(
+                            "INSERT INTO bundles (number, path, source, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                            (number, str(path), EXTERNAL, EXTERNAL, _now()),
+                        )
+                        conn.execute("COMMIT")
+                        logger.warning("Реестр публикаций: папка %s уже существует (создана в обход реестра), берём следующий номер", path.name)
+                        continue
+                    conn.execute(
+                        """INSERT INTO bundles (number, path, run_id, title, source, telegram_status, zen_status, created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (number, str(path), run_id, title, source, PENDING, PENDING, _now()),
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                logger.info("Папка публикации: %s", path)
+                return path
+        finally:
+            conn.close()
+    raise RuntimeError(f"Не удалось выделить папку публикации в {PUBLISH_DIR}")
+
+
+def update(path: Path, **fields) -> bool:
+    """Обновить поля выпуска (run_id, title, source, status). False — папка не из реестра."""
+    number = number_of(path)
+    allowed = {k: v for k, v in fields.items() if k in ("run_id", "title", "source", "status")}
+    if number is None or not allowed:
+        return False
+    sets = ", ".join(f"{k} = ?" for k in allowed)
+    with _lock:
+        conn = _connect()
+        try:
+            cur = conn.execute(
+                f"UPDATE bundles SET {sets}, updated_at = ? WHERE number = ?",
+                (*allowed.values(), _now(), number),
+            )
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+
+def fail(path: Path, reason: str = "") -> bool:
+    """Закрыть выпуск, сборка которого не удалась: в latest()/unpublished() он больше не попадёт."""
+    ok = update(path, status=FAILED)
+    if ok:
+        logger.warning("Выпуск %s закрыт как failed%s", Path(path).name, f": {reason}" if reason else "")
+    return ok
+
+
+def set_channel_status(path: Path, channel: str, status: str) -> bool:
+    """Статус публикации выпуска в канале (telegram | zen): pending | done | failed."""
+    if channel not in CHANNELS:
+        raise ValueError(f"Неизвестный канал: {channel}")
+    number = number_of(path)
+    if number is None:
+        return False
+    with _lock:
+        conn = _connect()
+        try:
+            cur = conn.execute(
+                f"UPDATE bundles SET {channel}_status = ?, updated_at = ? WHERE number = ?",
+                (status, _now(), number),
+            )
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+
+def _existing_paths(rows) -> List[Path]:
+    """Пути выпусков, папки которых ещё на диске (удалённые вручную пропускаются)."""
+    return [Path(row["path"]) for row in rows if Path(row["path"]).is_dir()]
+
+
+def _built_paths(rows) -> List[Path]:
+    """Пути выпусков, у которых есть article.json (сборка дошла до конца)."""
+    return [p for p in _existing_paths(rows) if (p / "article.json").is_file()]
+
+
+def latest() -> Optional[Path]:
+    """Папка последнего собранного выпуска (с наибольшим номером) или None."""
+    with _lock:
+        conn = _connect()
+        try:
+            # Обычно первая же запись; LIMIT — на случай удалённых вручную и ещё собираемых папок
+            rows = conn.execute(
+                "SELECT path FROM bundles WHERE status = ? ORDER BY number DESC LIMIT 20", (ACTIVE,)
+            ).fetchall()
+        finally:
+            conn.close()
+    paths = _built_paths(rows)
+    return paths[0] if paths else None
+
+
+def by_run(run_id: int) -> Optional[Path]:
+    """Папка выпуска, созданного в запуске run_id аналитики."""
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute("SELECT path FROM bundles WHERE run_id = ? ORDER BY number DESC", (run_id,)).fetchall()
+        finally:
+            conn.close()
+    paths = _existing_paths(rows)
+    return paths[0] if paths else None
+
+
+def unpublished(channel: str = "zen", limit: int = 50) -> List[Path]:
+    """Собранные выпуски, ещё не опубликованные в канале (pending/failed), новые первыми."""
+    if channel not in CHANNELS:
+        raise ValueError(f"Неизвестный канал: {channel}")
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                f"""SELECT path FROM bundles WHERE {channel}_status IN (?, ?) AND status = ?
+                    ORDER BY number DESC LIMIT ?""",
+                (PENDING, FAILED, ACTIVE, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+    return _built_paths(rows)
+
+
+def get(path: Path) -> Optional[dict]:
+    """Запись выпуска по папке (или article.json в ней)."""
+    number = number_of(path)
+    if number is None:
+        return None
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT * FROM bundles WHERE number = ?", (number,)).fetchone()
+        finally:
+            conn.close()
+    return dict(row) if row else None
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Варианты картинок статьи под каналы (renditions) — считаются один раз после генерации.
+
+- zen      — JPEG не больше 1792×1024 и меньше 3 МБ (Дзен проверяет магические байты и размер):
+             для обложки и всех картинок в content_blocks;
+- telegram — JPEG до 1280 px по длинной стороне (больше Telegram всё равно пережимает): обложка;
+- thumb    — WebP 480 px по ширине для дашборда: обложка.
+
+Файлы лежат рядом с article.json в renditions/ и называются по хешу исходника:
+renditions/<имя>.<вариант>.<sha256[:12]>.<ext>. В article.json — ключ "renditions":
+{"cover.png": {"hash": "...", "zen": "renditions/...", "telegram": "...", "thumb": "..."}, ...}.
+Повторные попытки публикации и перезапуски находят готовые файлы по хешу и ничего не пересчитывают;
+если исходник заменили — хеш другой, варианты считаются заново.
+
+Кодирование идёт в пуле процессов (RENDITION_WORKERS): PIL держит GIL на ресайзе и JPEG.
+Без PIL варианты не создаются — ZenClient конвертирует картинку при загрузке, как раньше.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", "2"))
+RENDITIONS_DIRNAME = "renditions"
+
+ZEN_MAX_SIZE = (1792, 1024)
+ZEN_MAX_BYTES = 3_000_000
+# Качество JPEG для Дзена: с первого, пока файл не станет меньше ZEN_MAX_BYTES
+ZEN_QUALITY_STEPS = (88, 80, 72, 64)
+
+# Вариант → (формат, максимальный размер, качество)
+SPECS: Dict[str, Tuple[str, Tuple[int, int], int]] = {
+    "zen": ("JPEG", ZEN_MAX_SIZE, ZEN_QUALITY_STEPS[0]),
+    "telegram": ("JPEG", (1280, 1280), 85),
+    "thumb": ("WEBP", (480, 480), 75),
+}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+COVER_RENDITIONS = ("zen", "telegram", "thumb")
+BODY_RENDITIONS = ("zen",)
+
+
+def source_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _render(src: str, dest: str, kind: str) -> int:
+    """Один вариант одной картинки (выполняется в процессе пула). Возвращает размер файла."""
+    fmt, max_size, quality = SPECS[kind]
+    with Image.open(src) as img:
+        img.load()
+        img = img.convert("RGB")
+        # Только уменьшение, с сохранением пропорций
+        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        tmp = dest + ".part"
+        qualities = ZEN_QUALITY_STEPS if kind == "zen" else (quality,)
+        for q in qualities:
+            img.save(tmp, fmt, quality=q, optimize=True)
+            if kind != "zen" or os.path.getsize(tmp) < ZEN_MAX_BYTES:
+                break
+    os.replace(tmp, dest)
+    return os.path.getsize(dest)
+
+
+def _image_sources(article: Dict[str, Any]) -> List[Tuple[str, Tuple[str, ...]]]:
+    """(имя файла, варианты) всех локальных картинок статьи: обложка и картинки content_blocks."""
+    sources: Dict[str, Tuple[str, ...]] = {}
+    cover = article.get("cover_image")
+    if cover and not str(cover).startswith("http"):
+        sources[Path(cover).name] = COVER_RENDITIONS
+    for block in article.get("content_blocks") or []:
+        path = block.get("path") if block.get("type") == "image" else None
+        if path and not str(path).startswith("http"):
+            sources.setdefault(Path(path).name, BODY_RENDITIONS)
+    return list(sources.items())
+
+
+def build(article: Dict[str, Any], article_dir: Path) -> Dict[str, Dict[str, str]]:
+    """
+    Посчитать недостающие варианты картинок статьи и вернуть значение для article["renditions"].
+    Готовые файлы с тем же хешем исходника переиспользуются. Ошибка одной картинки
+    не мешает остальным — для неё вариантов просто не будет.
+    """
+    article_dir = Path(article_dir)
+    if not PIL_AVAILABLE:
+        logger.warning("PIL не установлен — варианты картинок не создаются")
+        return dict(article.get("renditions") or {})
+    out_dir = article_dir / RENDITIONS_DIRNAME
+    result: Dict[str, Dict[str, str]] = {}
+    jobs: List[Tuple[str, str, str, Path]] = []  # (имя исходника, вариант, src, dest)
+    for name, kinds in _image_sources(article):
+        src = article_dir / name
+        if not src.is_file():
+            continue
+        digest = source_hash(src)
+        entry = {"hash": digest}
+        stem = Path(name).stem
+        for kind in kinds:
+            rel = f"{RENDITIONS_DIRNAME}/{stem}.{kind}.{digest[:12]}.{EXTENSIONS[SPECS[kind][0]]}"
+            entry[kind] = rel
+            if not (article_dir / rel).is_file():
+                jobs.append((name, kind, str(src), article_dir / rel))
+        result[name] = entry
+    if not jobs:
+        return result
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    failed = _run_jobs(jobs)
+    for name, kind in failed:
+        result[name].pop(kind, None)
+    logger.info("Варианты картинок: посчитано %d, ошибок %d (%s)", len(jobs) - len(failed), len(failed), article_dir.name)
+    return result
+
+
+def _run_jobs(jobs: List[Tuple[str, str, str, Path]]) -> List[Tuple[str, str]]:
+    """Выполнить задания в пуле процессов (при недоступном пуле — в текущем). → [(имя, вариант)] с ошибкой."""
+    failed: List[Tuple[str, str]] = []
+    try:
+        # spawn, а не fork: вызывается из процессов с потоками (оркестратор, пулы дашборда),
+        # fork копирует их захваченные блокировки в дочерний процесс
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(RENDITION_WORKERS, len(jobs))),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = [(name, kind, pool.submit(_render, src, str(dest), kind)) for name, kind, src, dest in jobs]
+            for name, kind, future in futures:
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    logger.warning("Вариант %s для %s не создан: %s", kind, name, e)
+                    failed.append((name, kind))
+        return failed
+    except (BrokenProcessPool, OSError) as e:
+        logger.warning("Пул процессов недоступен (%s) — варианты картинок считаются в текущем процессе", e)
+    failed = []
+    for name, kind, src, dest in jobs:
+        if dest.is_file():
+            continue
+        try:
+            _render(src, str(dest), kind)
+        except Exception as e:
+            logger.warning("Вариант %s для %s не создан: %s", kind, name, e)
+            failed.append((name, kind))
+    return failed
+
+
+def lookup(article: Dict[str, Any], article_dir: Optional[Path], image: str, kind: str) -> Optional[Path]:
+    """
+    Путь к готовому варианту kind картинки image (имя или путь) или None, если варианта нет,
+    файл пропал или исходник изменился после расчёта.
+    """
+    if not article_dir:
+        return None
+    entry = (article.get("renditions") or {}).get(Path(image).name)
+    if not entry or not entry.get(kind):
+        return None
+    path = Path(article_dir) / entry[kind]
+    src = Path(article_dir) / Path(image).name
+    if not path.is_file() or (src.is_file() and not path.name.endswith(f".{source_hash(src)[:12]}{path.suffix}")):
+        return None
+    return path
+
+
+def sources_map(article: Dict[str, Any], article_dir: Optional[Path], kind: str) -> Dict[str, str]:
+    """{абсолютный путь исходника: путь варианта kind} — для ZenClient (замена конвертации при загрузке)."""
+    if not article_dir:
+        return {}
+    result = {}
+    for name in (article.get("renditions") or {}):
+        path = lookup(article, article_dir, name, kind)
+        if path:
+            result[str((Path(article_dir) / name).resolve())] = str(path)
+    return result
@@ -15,6 +15,9 @@
 В каждом окне — одна публикация в случайное время. При ошибке генерации или
 публикации — 3 попытки (сразу, через 1 мин, через 3 мин), затем пропуск
 слота с записью ошибки в дашборд аналитики.
+
+Каждый слот — цепочка состояний SLOT_STATES с чекпоинтом в БД аналитики: слот, прерванный
+перезапуском, при старте оркестратора продолжается с последнего состояния (тот же run_id).
 """
 import asyncio
 import json
@@ -23,10 +26,11 @@ import os
 import random
 import signal
 import sys
+import threading
 import time
 from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 from . import config
 from blocks.analytics import db as analytics_db
@@ -36,7 +40,9 @@ ORCHESTRATOR_LOCK_FILE = config.PROJECT_ROOT / "storage" / "orchestrator_kz.lock
 # Если этот файл существует — оркестратор при старте сразу выходит (без генерации и без расписания). Не перезапускается, пока файл не удалить.
 ORCHESTRATOR_PAUSED_FILE = config.PROJECT_ROOT / "storage" / "orchestrator_kz_paused"
 FAILED_PUBLICATIONS_FILE = config.PROJECT_ROOT / "storage" / "failed_publications.jsonl"
+from . import publish_registry
 from .zen_client import run_post_flow, PUBLISH_DIR
+from . import zen_session
 
 LOG = logging.getLogger("autopost_zen.scheduler")
 DEBUG_LOG_FILE = config.PROJECT_ROOT / "debug-441024.log"
@@ -50,11 +56,29 @@ SCHEDULE_WINDOWS = [
     (15, 20, 16, 40),  # 15:20–16:40
 ]
 
+# Ближе к слоту предварительная проверка сессии не запускается (вход через браузер — минуты)
+PREFLIGHT_MIN_LEAD_SEC = 300
 RETRY_DELAYS_SEC = [0, 60, 180]  # сразу, через 1 мин, через 3 мин
 # Жёсткий таймаут на шаг публикации в Дзен, чтобы run не зависал бесконечно в статусе running.
 ZEN_PUBLISH_TIMEOUT_SEC = int(os.getenv("ZEN_PUBLISH_TIMEOUT_SEC", "900"))  # 15 минут
 ORCHESTRATOR_TAKEOVER_WAIT_SEC = 12  # ожидание после SIGTERM старому процессу
 
+# Состояния слота (чекпоинт в БД аналитики, таблица slot_checkpoints) — по порядку прохождения.
+# Прерванный слот продолжается со следующего после последнего сохранённого.
+SLOT_CLAIMED = "topic_claimed"          # тема взята из таблицы (topic, row_index)
+SLOT_GENERATED = "article_generated"    # article.json готов (article_path)
+SLOT_TELEGRAM_STARTED = "telegram_started"  # отправка в Telegram начата — при продолжении не повторяется
+SLOT_TELEGRAM_DONE = "telegram_done"    # Telegram пройден (telegram_ok — успешно ли)
+SLOT_ZEN_STARTED = "zen_started"        # публикация в Дзен начата — при продолжении не повторяется
+SLOT_ZEN_DONE = "zen_done"              # Дзен пройден (zen_ok)
+SLOT_FINISHED = "topic_deleted"         # тема удалена (если опубликовано хоть куда-то), слот завершён
+SLOT_STATES = (
+    SLOT_CLAIMED, SLOT_GENERATED, SLOT_TELEGRAM_STARTED, SLOT_TELEGRAM_DONE,
+    SLOT_ZEN_STARTED, SLOT_ZEN_DONE, SLOT_FINISHED,
+)
+# Сколько раз продолжать один слот: слот, который каждый раз роняет процесс, потом закрывается как failed
+SLOT_MAX_RESUMES = int(os.getenv("ORCHESTRATOR_MAX_RESUMES", "2"))
+
 
 def _debug_log(hypothesis_id: str, run_id: str, message: str, data: dict) -> None:
     """Agent debug log for runtime evidence (NDJSON)."""
@@ -106,6 +130,40 @@ def _sleep_until(target: datetime) -> None:
     time.sleep(delta)
 
 
+def _run_session_preflight() -> None:
+    try:
+        zen_session.preflight_session()
+    except Exception as e:
+        LOG.warning("Предварительная проверка сессии Дзена: %s", e)
+
+
+def _preflight_before_slot(slot: datetime) -> Optional[threading.Thread]:
+    """
+    За ZEN_SESSION_PREFLIGHT сек до слота — проверка сессии Дзена (и повторный вход при
+    необходимости) в фоновом потоке: протухшие куки обнаруживаются до публикации, а не во время.
+    Если до слота меньше PREFLIGHT_MIN_LEAD_SEC — пропуск: повторный вход не успеет, а
+    проверку и вход сделает login() самого слота. Поток нужно дождаться (join) до старта
+    слота: оба браузера пишут zen_storage_state.json.
+    """
+    if zen_session.SESSION_PREFLIGHT_SEC <= 0:
+        return None
+    if (slot - datetime.now()).total_seconds() < PREFLIGHT_MIN_LEAD_SEC:
+        LOG.info("До слота меньше %d сек — предварительная проверка сессии пропущена", PREFLIGHT_MIN_LEAD_SEC)
+        return None
+    _sleep_until(slot - timedelta(seconds=zen_session.SESSION_PREFLIGHT_SEC))
+    thread = threading.Thread(target=_run_session_preflight, name="zen-session-preflight", daemon=True)
+    thread.start()
+    return thread
+
+
+def _join_preflight(thread: Optional[threading.Thread]) -> None:
+    """Дождаться предварительной проверки сессии перед слотом (вход через браузер может ещё идти)."""
+    if thread is None or not thread.is_alive():
+        return
+    LOG.info("Слот ждёт завершения предварительной проверки сессии Дзена")
+    thread.join()
+
+
 def _get_next_slot() -> datetime:
     """Возвращает ближайший будущий слот на сегодня или первый слот завтра."""
     times = _next_run_times()
@@ -185,22 +243,26 @@ def _append_failed_publication(
         LOG.warning("Не удалось записать в failed_publications.jsonl: %s", e)
 
 
-def _close_stale_schedule_runs() -> None:
+def _analytics_project() -> str:
+    project = (os.getenv("ANALYTICS_PROJECT") or analytics_db.DEFAULT_PROJECT).strip()
+    return project if project in analytics_db.PROJECTS else analytics_db.DEFAULT_PROJECT
+
+
+def _close_stale_schedule_runs(keep: Iterable[int] = ()) -> None:
     """
     Закрывает «висящие» schedule-запуски как failed.
     Вызывается только перед стартом нового слота (не при старте процесса), чтобы не помечать
     старый run как прерванный, если новый слот так и не начнётся (рестарт и выход, пауза и т.д.).
+    keep — запуски, которые оркестратор продолжит с чекпоинта (их не трогаем).
     """
-    project = (os.getenv("ANALYTICS_PROJECT") or analytics_db.DEFAULT_PROJECT).strip()
-    if project not in analytics_db.PROJECTS:
-        project = analytics_db.DEFAULT_PROJECT
     conn = None
     try:
-        conn = analytics_db.get_connection(project=project)
+        conn = analytics_db.get_connection(project=_analytics_project())
         stale = conn.execute(
             "SELECT id FROM runs WHERE status = 'running' AND source = 'schedule' ORDER BY id"
         ).fetchall()
-        stale_ids = [int(r[0]) for r in stale]
+        keep = set(keep)
+        stale_ids = [int(r[0]) for r in stale if int(r[0]) not in keep]
         if not stale_ids:
             return
         now = datetime.now().isoformat()
@@ -224,21 +286,78 @@ def _close_stale_schedule_runs() -> None:
             conn.close()
 
 
-def _run_one_slot(run_source: str = "schedule") -> None:
-    """Один слот: генерация (3 попытки) → Telegram → Дзен (3 попытки). Ошибки пишутся в аналитику."""
-    _close_stale_schedule_runs()  # закрыть висящие schedule-запуски только перед стартом нового (планового или ручного)
+def _interrupted_slots() -> list[dict]:
+    """Чекпоинты прерванных schedule-запусков, которые ещё можно продолжить (не больше SLOT_MAX_RESUMES раз)."""
+    conn = None
+    try:
+        conn = analytics_db.get_connection(project=_analytics_project())
+        return [
+            cp for cp in analytics_db.get_interrupted_slots(conn, source="schedule")
+            if (cp["resumes"] or 0) < SLOT_MAX_RESUMES
+        ]
+    except Exception as e:
+        LOG.warning("Не удалось прочитать чекпоинты слотов: %s", e)
+        return []
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _resume_interrupted_slots() -> None:
+    """
+    Продолжить слоты, прерванные перезапуском (деплой, падение процесса), с последнего пройденного
+    состояния. Остальные висящие schedule-запуски (без чекпоинта или исчерпавшие SLOT_MAX_RESUMES)
+    закроет как failed следующий слот. Только в процессе оркестратора — под его блокировкой.
+    """
+    for cp in _interrupted_slots():
+        LOG.info(
+            "Продолжение прерванного слота: запуск %s, состояние %s, тема: %s",
+            cp["run_id"], cp["state"], (cp.get("topic") or "")[:60],
+        )
+        try:
+            _run_one_slot(resume=cp)
+        except Exception as e:
+            LOG.exception("Продолжение слота %s не удалось: %s", cp["run_id"], e)
+
+
+def _run_one_slot(run_source: str = "schedule", resume: Optional[dict] = None) -> None:
+    """
+    Один слот: тема → генерация (3 попытки) → Telegram → Дзен (3 попытки) → удаление темы.
+    Ошибки пишутся в аналитику. После каждого состояния (SLOT_STATES) — чекпоинт в БД аналитики;
+    resume — чекпоинт прерванного запуска: слот продолжается с него, сделанное не повторяется.
+    """
+    if resume is None:
+        # закрыть висящие schedule-запуски только перед стартом нового (планового или ручного);
+        # те, что оркестратор продолжит с чекпоинта, не трогаем
+        _close_stale_schedule_runs(keep=[cp["run_id"] for cp in _interrupted_slots()])
     from .article_generator import ArticleGenerator
 
+    cp: dict = dict(resume) if resume else {"state": None}
     try:
         from blocks.analytics.tracker import RunTracker
         tracker = RunTracker()
-        run_id = tracker.start_run(source=run_source)
+        if resume:
+            run_id = resume["run_id"]
+            tracker.resume_run(run_id, f"Прервано перезапуском оркестратора, слот продолжен с состояния «{resume['state']}»")
+            cp["resumes"] = (resume.get("resumes") or 0) + 1
+        else:
+            run_id = tracker.start_run(source=run_source)
         use_tracker = True
     except Exception as e:
         LOG.warning("Аналитика недоступна: %s", e)
         tracker = run_id = None
         use_tracker = False
 
+    def checkpoint(state: str, **fields) -> None:
+        """Перейти в состояние state и сохранить чекпоинт (ошибка записи не останавливает слот)."""
+        cp.update(fields, state=state)
+        if not use_tracker:
+            return
+        try:
+            tracker.save_checkpoint(run_id, cp)
+        except Exception as e:
+            LOG.warning("Не удалось сохранить чекпоинт слота (%s): %s", state, e)
+
     def _retry_loop(fn):
         """До 3 попыток с задержками 0, 60, 180 сек. Возвращает результат fn() или пробрасывает последнее исключение."""
         last_error = None
@@ -257,100 +376,186 @@ def _run_one_slot(run_source: str = "schedule") -> None:
             raise last_error
         raise RuntimeError("Не удалось выполнить шаг после 3 попыток")
 
-    def step(name: str, label: str, fn, retries: bool = False):
+    def step(name: str, label: str, fn, retries: bool = False, metadata: Optional[dict] = None):
         if not use_tracker:
             if retries:
                 return _retry_loop(fn)
             return fn()
         if not retries:
-            with tracker.step(run_id, name, label):
+            with tracker.step(run_id, name, label, metadata=metadata):
                 return fn()
         # С повторами: один шаг в аналитике, внутри — до 3 попыток
-        with tracker.step(run_id, name, label):
+        with tracker.step(run_id, name, label, metadata=metadata):
             return _retry_loop(fn)
 
-    article_path = None
-    article_dir = None
-    row_index = None
+    if resume:
+        checkpoint(cp["state"])  # учесть попытку продолжения до работы: слот, роняющий процесс, не продолжается бесконечно
+        if cp["state"] in SLOT_STATES[1:-1] and not (
+            cp.get("article_path") and Path(cp["article_path"]).is_file()
+        ):
+            LOG.warning("article.json прерванного слота не найден (%s) — статья генерируется заново", cp.get("article_path"))
+            checkpoint(SLOT_CLAIMED, article_path=None, telegram_ok=None, zen_ok=None)
+
+    article_path = Path(cp["article_path"]) if cp.get("article_path") else None
+    article_dir = article_path.parent if article_path else None
     # #region agent log
     _debug_log(
         "H3",
         "pre-fix",
         "slot_started",
-        {"run_source": run_source, "tracker_enabled": use_tracker},
+        {"run_source": run_source, "tracker_enabled": use_tracker, "resume_state": cp["state"]},
     )
     # #endregion
 
     try:
-        # ─── Генерация (3 попытки) ───
-        def do_generate():
-            gen = ArticleGenerator()
-            res = gen.run()
-            if not res:
-                raise RuntimeError("Нет тем в таблице для генерации")
-            return res
+        # ─── Тема и генерация (3 попытки) ───
+        if cp["state"] in (None, SLOT_CLAIMED):
+            def do_generate():
+                gen = ArticleGenerator()
+                if cp["state"] is None:
+                    topic, extra, row_index = gen.fetch_topic()
+                    if not topic:
+                        raise RuntimeError("Нет тем в таблице для генерации")
+                    checkpoint(SLOT_CLAIMED, topic=topic, extra=extra, row_index=row_index)
+                return gen.generate(cp["topic"], cp.get("extra"))
 
-        try:
-            article_path, row_index = step(
-                "generate_article", "Генерация статьи",
-                lambda: do_generate(),
-                retries=True,
-            )
-        except Exception as e:
-            LOG.error("Генерация не удалась после 3 попыток: %s. Пропуск слота.", e)
-            if use_tracker:
-                tracker.finish_run(run_id)
-            return
+            try:
+                article_path = step(
+                    "generate_article", "Генерация статьи",
+                    lambda: do_generate(),
+                    retries=True,
+                )
+            except Exception as e:
+                LOG.error("Генерация не удалась после 3 попыток: %s. Пропуск слота.", e)
+                if use_tracker:
+                    tracker.finish_run(run_id)
+                return
+            article_dir = article_path.parent
+            checkpoint(SLOT_GENERATED, article_path=str(article_path))
 
-        article_dir = article_path.parent
+        row_index = cp.get("row_index")
         data = json.loads(article_path.read_text(encoding="utf-8"))
         if use_tracker:
             tracker.update_run_topic(run_id, data.get("title", ""))
             tracker.update_run_headline(run_id, data.get("title", ""))
             tracker.update_run_publish_dir(run_id, str(article_dir))
 
+        def interrupted_publish(channel: str, name: str, label: str) -> bool:
+            """
+            Слот прерван во время публикации в канал: вслепую не повторяем (дубль поста/статьи).
+            Успех, отмеченный в реестре выпусков, засчитывается; иначе исход неизвестен —
+            канал failed, статья уходит в failed_publications для ручной проверки.
+            """
+            bundle = publish_registry.get(article_dir) or {}
+            if bundle.get(f"{channel}_status") == publish_registry.DONE:
+                LOG.info("Публикация в %s прерванного слота уже отмечена успешной в реестре", channel)
+                return True
+            publish_registry.set_channel_status(article_dir, channel, publish_registry.FAILED)
+
+            def _unknown():
+                raise RuntimeError(
+                    f"Прервано перезапуском во время публикации в {channel}; результат неизвестен — "
+                    "проверьте канал вручную (повтор не выполнялся, чтобы не было дубля)"
+                )
+
+            try:
+                step(name, label, _unknown)
+            except RuntimeError as e:
+                LOG.warning("%s", e)
+            return False
+
         # ─── Telegram (3 попытки) ───
-        telegram_ok = False
-        try:
-            def do_telegram():
-                import os
-                from blocks.lifehacks_to_spambot.run import post_article_to_telegram_sync
-                ok, err_msg = post_article_to_telegram_sync(article_dir, project_id=os.getenv("PROJECT_ID"))
-                if not ok:
-                    raise RuntimeError("Публикация в Telegram не удалась" + (f": {err_msg}" if err_msg else ""))
-            step("publish_telegram", "Публикация в Telegram", do_telegram, retries=True)
-            telegram_ok = True
-        except Exception as e:
-            LOG.error("Публикация в Telegram не удалась после 3 попыток: %s", e)
+        if cp["state"] == SLOT_TELEGRAM_STARTED:
+            telegram_ok = interrupted_publish("telegram", "publish_telegram", "Публикация в Telegram")
+            checkpoint(SLOT_TELEGRAM_DONE, telegram_ok=int(telegram_ok))
+        if cp["state"] == SLOT_GENERATED:
+            telegram_ok = False
+            checkpoint(SLOT_TELEGRAM_STARTED)
+            try:
+                def do_telegram():
+                    import os
+                    from blocks.lifehacks_to_spambot.run import post_article_to_telegram_sync
+                    ok, err_msg = post_article_to_telegram_sync(article_dir, project_id=os.getenv("PROJECT_ID"))
+                    if not ok:
+                        raise RuntimeError("Публикация в Telegram не удалась" + (f": {err_msg}" if err_msg else ""))
+                    # Сразу в реестр: падение до чекпоинта не приведёт к повторной отправке
+                    publish_registry.set_channel_status(article_dir, "telegram", publish_registry.DONE)
+                step("publish_telegram", "Публикация в Telegram", do_telegram, retries=True)
+                telegram_ok = True
+            except Exception as e:
+                LOG.error("Публикация в Telegram не удалась после 3 попыток: %s", e)
+            publish_registry.set_channel_status(article_dir, "telegram", publish_registry.DONE if telegram_ok else publish_registry.FAILED)
+            checkpoint(SLOT_TELEGRAM_DONE, telegram_ok=int(telegram_ok))
+        telegram_ok = bool(cp.get("telegram_ok"))
 
         # ─── Дзен (3 попытки) ───
-        zen_ok = False
-        try:
-            def do_zen():
-                data = json.loads(article_path.read_text(encoding="utf-8"))
-                async def _run_zen_with_timeout():
-                    return await asyncio.wait_for(
-                        run_post_flow(
-                            data,
-                            publish=data.get("publish", True),
-                            headless=config.HEADLESS,
-                            keep_open=config.KEEP_BROWSER_OPEN,
-                            article_path=article_path,
-                        ),
-                        timeout=ZEN_PUBLISH_TIMEOUT_SEC,
-                    )
+        if cp["state"] == SLOT_ZEN_STARTED:
+            zen_ok = interrupted_publish("zen", "publish_zen", "Публикация в Дзен")
+            checkpoint(SLOT_ZEN_DONE, zen_ok=int(zen_ok))
+        if cp["state"] == SLOT_TELEGRAM_DONE:
+            zen_ok = False
+            checkpoint(SLOT_ZEN_STARTED)
+            zen_trace_meta: dict = {}  # спаны трассировки (ZEN_TRACE) последней попытки → metadata шага
+            try:
+                def do_zen():
+                    zen_trace_meta.clear()
+                    data = json.loads(article_path.read_text(encoding="utf-8"))
+                    async def _run_zen_with_timeout():
+                        return await asyncio.wait_for(
+                            run_post_flow(
+                                data,
+                                publish=data.get("publish", True),
+                                headless=config.HEADLESS,
+                                keep_open=config.KEEP_BROWSER_OPEN,
+                                article_path=article_path,
+                                trace_meta=zen_trace_meta,
+                            ),
+                            timeout=ZEN_PUBLISH_TIMEOUT_SEC,
+                        )
+                    try:
+                        code, msg, _ = asyncio.run(_run_zen_with_timeout())
+                    except asyncio.TimeoutError as e:
+                        raise RuntimeError(
+                            f"Публикация в Дзен превысила таймаут {ZEN_PUBLISH_TIMEOUT_SEC} сек"
+                        ) from e
+                    if code != 0:
+                        raise RuntimeError(msg or "Публикация в Дзен не удалась")
+                    publish_registry.set_channel_status(article_dir, "zen", publish_registry.DONE)
+                step("publish_zen", "Публикация в Дзен", do_zen, retries=True, metadata=zen_trace_meta)
+                zen_ok = True
+            except Exception as e:
+                LOG.error("Публикация в Дзен не удалась после 3 попыток: %s. Пропуск публикации.", e)
+            publish_registry.set_channel_status(article_dir, "zen", publish_registry.DONE if zen_ok else publish_registry.FAILED)
+            checkpoint(SLOT_ZEN_DONE, zen_ok=int(zen_ok))
+        zen_ok = bool(cp.get("zen_ok"))
+
+        # ─── Удаление темы ───
+        # Если хотя бы один канал успешен — удаляем тему из таблицы, чтобы не публиковать её снова.
+        # До finish_run: запуск, прерванный здесь, продолжится и тему всё же удалит.
+        if cp["state"] == SLOT_ZEN_DONE:
+            if zen_ok or telegram_ok:
                 try:
-                    code, msg, _ = asyncio.run(_run_zen_with_timeout())
-                except asyncio.TimeoutError as e:
-                    raise RuntimeError(
-                        f"Публикация в Дзен превысила таймаут {ZEN_PUBLISH_TIMEOUT_SEC} сек"
-                    ) from e
-                if code != 0:
-                    raise RuntimeError(msg or "Публикация в Дзен не удалась")
-            step("publish_zen", "Публикация в Дзен", do_zen, retries=True)
-            zen_ok = True
-        except Exception as e:
-            LOG.error("Публикация в Дзен не удалась после 3 попыток: %s. Пропуск публикации.", e)
+                    gen = ArticleGenerator()
+                    gen.delete_topic(row_index, expected=cp.get("topic"))
+                    LOG.info(
+                        "Тема удалена из таблицы (строка %d). Опубликовано: %s.",
+                        row_index,
+                        ", ".join(c for c in ("zen" if zen_ok else "", "telegram" if telegram_ok else "") if c),
+                    )
+                except Exception as e:
+                    LOG.warning("Не удалось удалить тему из таблицы: %s", e)
+                # Если не во всех каналах — пишем в документ для последующей ручной публикации
+                if not (zen_ok and telegram_ok):
+                    failed = [c for c in ("telegram", "zen") if (c == "telegram" and not telegram_ok) or (c == "zen" and not zen_ok)]
+                    succeeded = [c for c in ("telegram", "zen") if (c == "telegram" and telegram_ok) or (c == "zen" and zen_ok)]
+                    _append_failed_publication(
+                        article_path=article_path,
+                        article_data=data,
+                        failed_channels=failed,
+                        succeeded_channels=succeeded,
+                        run_id=str(run_id) if use_tracker and run_id else None,
+                    )
+            checkpoint(SLOT_FINISHED)
 
         if use_tracker:
             if zen_ok or telegram_ok:
@@ -362,30 +567,6 @@ def _run_one_slot(run_source: str = "schedule") -> None:
                 tracker.update_run_channel(run_id, ",".join(channels))
             tracker.finish_run(run_id)
 
-        # Если хотя бы один канал успешен — удаляем тему из таблицы, чтобы не публиковать её снова
-        if zen_ok or telegram_ok:
-            try:
-                gen = ArticleGenerator()
-                gen.delete_topic(row_index)
-                LOG.info(
-                    "Тема удалена из таблицы (строка %d). Опубликовано: %s.",
-                    row_index,
-                    ", ".join(c for c in ("zen" if zen_ok else "", "telegram" if telegram_ok else "") if c),
-                )
-            except Exception as e:
-                LOG.warning("Не удалось удалить тему из таблицы: %s", e)
-            # Если не во всех каналах — пишем в документ для последующей ручной публикации
-            if not (zen_ok and telegram_ok):
-                failed = [c for c in ("telegram", "zen") if (c == "telegram" and not telegram_ok) or (c == "zen" and not zen_ok)]
-                succeeded = [c for c in ("telegram", "zen") if (c == "telegram" and telegram_ok) or (c == "zen" and zen_ok)]
-                _append_failed_publication(
-                    article_path=article_path,
-                    article_data=data,
-                    failed_channels=failed,
-                    succeeded_channels=succeeded,
-                    run_id=str(run_id) if use_tracker and run_id else None,
-                )
-
     except Exception as e:
         LOG.exception("Ошибка в слоте оркестратора (записана в дашборд по шагу): %s", e)
         if use_tracker:
@@ -529,7 +710,6 @@ def run_scheduler_loop() -> None:
     # #endregion
 
     _lock_file = _acquire_orchestrator_lock()  # держим ссылку, чтобы файл не закрылся и lock не снялся
-    # Не закрываем stale runs при старте: только когда реально начнётся новый слот (см. цикл ниже).
 
     # Проверка Telegram при старте: если не заданы токены — в логах будет видно (на сервере скопировать .env с компа)
     try:
@@ -545,12 +725,20 @@ def run_scheduler_loop() -> None:
         LOG.warning("Проверка Telegram при старте: %s", e)
 
     LOG.info("Оркестратор контент завода: запущен. Режим: только расписание (без автопрогона при старте). Слоты: 10:00–10:30, 11:30–12:00, 13:00–13:30, 14:00–14:30, 15:20–16:40")
+    # Слоты, прерванные перезапуском, продолжаются сразу (с чекпоинта, без новой генерации).
+    # Висящие запуски без чекпоинта закрываются только перед новым слотом (см. цикл ниже).
+    try:
+        _resume_interrupted_slots()
+    except Exception as e:
+        LOG.exception("Продолжение прерванных слотов: %s", e)
     next_slot = _get_next_slot()
     _write_schedule_state(next_run_at=next_slot)
 
     while True:
         try:
+            preflight = _preflight_before_slot(next_slot)
             _sleep_until(next_slot)
+            _join_preflight(preflight)
             LOG.info("Запуск слота в %s", next_slot.strftime("%Y-%m-%d %H:%M"))
             _run_one_slot()
             _write_schedule_state(last_run_at=datetime.now())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Тест разбора HTML на блоки (html_blocks): незакрытые <p>, вложенность, обрыв ответа.
+Запуск из корня проекта: python blocks/autopost_zen/test_html_blocks.py (или pytest).
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from blocks.autopost_zen.html_blocks import BlockStreamParser, describe_block, parse_blocks
+
+
+def _kinds(blocks):
+    return [(b["parsed"]["kind"], b["parsed"]["text"]) for b in blocks if b["type"] == "html"]
+
+
+def test_unclosed_p_is_closed_by_next_block():
+    html = "<h2>A</h2>\n<p>intro\n<h3>Step</h3>\n<p>t1</p><ul><li>x</li></ul><p>t2</p><h2>End</h2>"
+    assert _kinds(parse_blocks(html)) == [
+        ("h2", "A"), ("p", "intro"), ("h3", "Step"), ("p", "t1"), ("ul", "x"), ("p", "t2"), ("h2", "End"),
+    ]
+
+
+def test_unclosed_p_inside_div_stays_in_div():
+    blocks = parse_blocks("<div><p>a<ul><li>x</li></ul><p>b</div><h2>После</h2>")
+    assert _kinds(blocks) == [("p", "a\nx\nb"), ("h2", "После")]
+    assert blocks[0]["content"].startswith("<div><p>a</p><ul>")
+
+
+def test_p_closes_previous_p():
+    assert _kinds(parse_blocks("<p>раз<p>два<p>три")) == [("p", "раз"), ("p", "два"), ("p", "три")]
+
+
+def test_unclosed_block_at_end_is_kept():
+    parser = BlockStreamParser()
+    blocks = parser.feed("<h2>Заголовок</h2><p>обрыв ответа")
+    blocks += parser.close()
+    assert _kinds(blocks) == [("h2", "Заголовок"), ("p", "обрыв ответа")]
+    assert blocks[-1]["content"] == "<p>обрыв ответа</p>"
+
+
+def test_stream_chunks_match_whole_parse():
+    html = "```html\n<h2>A</h2><p>один<p>два <a href='https://flowcabinet.ru'>ссылка</a><!-- BANNER --><ol><li>x<li>y</ol>\n```"
+    parser = BlockStreamParser()
+    streamed = []
+    for i in range(0, len(html), 7):
+        streamed += parser.feed(html[i:i + 7])
+    streamed += parser.close()
+    assert streamed == parse_blocks(html)
+    assert parser.stray_chars == 0
+    assert [b.get("name") for b in streamed if b["type"] == "marker"] == ["BANNER"]
+    assert _kinds(streamed)[2] == ("p_with_link", "два ссылка")
+
+
+def test_stray_text_is_counted():
+    parser = BlockStreamParser()
+    parser.feed("Вот статья:\n<p>текст</p>\nкак просили")
+    parser.close()
+    assert parser.stray_chars == len("Вотстатья:") + len("какпросили")
+
+
+def test_describe_block_unclosed_p():
+    assert describe_block("<p>абзац<ul><li>a<li>b</ul>") == {"kind": "p", "text": "абзац\na\nb", "items": None}
+
+
+if __name__ == "__main__":
+    for name, fn in sorted(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print("OK", name)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Тест реестра папок публикации (publish_registry): выдача номеров без коллизий, папки в обход
+реестра, выдача только собранных выпусков. Реестр — во временной папке.
+Запуск из корня проекта: python blocks/autopost_zen/test_publish_registry.py (или pytest).
+"""
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from blocks.autopost_zen import publish_registry
+
+
+@contextmanager
+def _registry():
+    tmp = tempfile.TemporaryDirectory()
+    publish_dir = Path(tmp.name) / "publish"
+    with ExitStack() as stack:
+        stack.callback(tmp.cleanup)
+        stack.enter_context(mock.patch.object(publish_registry, "PUBLISH_DIR", publish_dir))
+        stack.enter_context(mock.patch.object(publish_registry, "REGISTRY_PATH", publish_dir / "registry.db"))
+        yield publish_dir
+
+
+def _built(title: str) -> Path:
+    path = publish_registry.allocate(title=title, source="test")
+    (path / "article.json").write_text("{}", encoding="utf-8")
+    return path
+
+
+def test_allocate_threads_get_distinct_folders():
+    with _registry():
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            paths = list(pool.map(lambda i: publish_registry.allocate(title=f"t{i}"), range(40)))
+        assert len(set(paths)) == 40
+        assert sorted(int(p.name) for p in paths) == list(range(1, 41))
+        assert all(p.is_dir() for p in paths)
+
+
+def test_folder_created_outside_registry_is_external():
+    with _registry() as publish_dir:
+        first = publish_registry.allocate(title="первый")
+        (publish_dir / "002").mkdir()  # папка в обход реестра (после импорта существующих)
+        nxt = publish_registry.allocate(title="следующий")
+        assert (first.name, nxt.name) == ("001", "003")
+        assert publish_registry.get(publish_dir / "002")["status"] == publish_registry.EXTERNAL
+        assert publish_registry.get(nxt)["status"] == publish_registry.ACTIVE
+
+
+def test_existing_folders_are_imported_once():
+    with _registry() as publish_dir:
+        (publish_dir / "005").mkdir(parents=True)
+        assert publish_registry.allocate().name == "006"
+        assert publish_registry.get(publish_dir / "005")["source"] == "import"
+
+
+def test_latest_and_unpublished_skip_unbuilt_and_failed():
+    with _registry():
+        built = _built("готов")
+        failed = _built("сломан")
+        publish_registry.fail(failed, "обложка не сгенерирована")
+        publish_registry.allocate(title="собирается")  # без article.json
+        assert publish_registry.latest() == built
+        assert publish_registry.unpublished("zen") == [built]
+        publish_registry.set_channel_status(built, "zen", publish_registry.DONE)
+        assert publish_registry.unpublished("zen") == []
+        assert publish_registry.unpublished("telegram") == [built]
+
+
+if __name__ == "__main__":
+    for name, fn in sorted(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print("OK", name)
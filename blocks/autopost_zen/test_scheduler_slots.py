@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Тест машины состояний слота оркестратора (scheduler._run_one_slot): чекпоинты и продолжение
+прерванного слота. Аналитика и реестр выпусков — настоящие, во временной папке; генератор,
+Telegram и Дзен — заглушки.
+Запуск из корня проекта: python blocks/autopost_zen/test_scheduler_slots.py (или pytest).
+"""
+import json
+import sys
+import tempfile
+import types
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from blocks.analytics import db as analytics_db
+from blocks.analytics.tracker import RunTracker
+from blocks.autopost_zen import article_generator, publish_registry, scheduler
+
+
+class _Crash(BaseException):
+    """Процесс «умер» посреди шага (не Exception — повторы и обработчики слота его не ловят)."""
+
+
+@contextmanager
+def _slot_env(telegram_crash: bool = False, zen_crash: bool = False):
+    """Временные БД аналитики и реестр; calls — вызовы заглушек по именам."""
+    calls = {"fetch_topic": 0, "generate": 0, "telegram": 0, "zen": 0, "delete_topic": 0, "failed_publication": []}
+
+    class FakeGenerator:
+        def fetch_topic(self):
+            calls["fetch_topic"] += 1
+            return "Как выбрать шкаф", "доп", 7
+
+        def generate(self, topic, extra=None):
+            calls["generate"] += 1
+            path = publish_registry.allocate(title=topic) / "article.json"
+            path.write_text(json.dumps({"title": topic}, ensure_ascii=False), encoding="utf-8")
+            return path
+
+        def delete_topic(self, row_index, sheet_name=None, expected=None):
+            calls["delete_topic"] += 1
+
+    def post_telegram(article_dir, project_id=None):
+        calls["telegram"] += 1
+        if telegram_crash:
+            raise _Crash()
+        return True, None
+
+    async def run_post_flow(data, **kwargs):
+        calls["zen"] += 1
+        if zen_crash:
+            raise _Crash()
+        return 0, "ok", None
+
+    tmp = tempfile.TemporaryDirectory()
+    tmp_dir = Path(tmp.name)
+    telegram_module = types.ModuleType("blocks.lifehacks_to_spambot.run")
+    telegram_module.post_article_to_telegram_sync = post_telegram
+    with ExitStack() as stack:
+        stack.callback(tmp.cleanup)
+        stack.enter_context(mock.patch.dict("os.environ", {"ANALYTICS_PROJECT": analytics_db.DEFAULT_PROJECT}))
+        stack.enter_context(mock.patch.object(analytics_db, "_LEGACY_DB_PATH", tmp_dir / "analytics.db"))
+        stack.enter_context(mock.patch.object(publish_registry, "PUBLISH_DIR", tmp_dir / "publish"))
+        stack.enter_context(mock.patch.object(publish_registry, "REGISTRY_PATH", tmp_dir / "publish" / "registry.db"))
+        stack.enter_context(mock.patch.object(article_generator, "ArticleGenerator", FakeGenerator))
+        stack.enter_context(mock.patch.dict(sys.modules, {"blocks.lifehacks_to_spambot.run": telegram_module}))
+        stack.enter_context(mock.patch.object(scheduler, "run_post_flow", run_post_flow))
+        stack.enter_context(mock.patch.object(scheduler, "_debug_log", lambda *a, **k: None))
+        stack.enter_context(mock.patch.object(
+            scheduler, "_append_failed_publication",
+            lambda **kw: calls["failed_publication"].append(kw["failed_channels"]),
+        ))
+        yield calls
+
+
+def _conn():
+    return analytics_db.get_connection(project=analytics_db.DEFAULT_PROJECT)
+
+
+def _checkpoint(run_id):
+    conn = _conn()
+    try:
+        row = conn.execute("SELECT * FROM slot_checkpoints WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def _run(run_id):
+    conn = _conn()
+    try:
+        return dict(analytics_db.get_run(conn, run_id))
+    finally:
+        conn.close()
+
+
+def _run_count():
+    conn = _conn()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _interrupted_run(state, article=True, resumes=0, **fields):
+    """Запуск schedule, «прерванный» в состоянии state (без finish_run), с готовой статьёй при article."""
+    tracker = RunTracker()
+    run_id = tracker.start_run(source="schedule")
+    cp = {"state": state, "topic": "Как выбрать шкаф", "extra": "доп", "row_index": 7, "resumes": resumes}
+    if article:
+        path = publish_registry.allocate(title="Как выбрать шкаф") / "article.json"
+        path.write_text(json.dumps({"title": "Как выбрать шкаф"}, ensure_ascii=False), encoding="utf-8")
+        cp["article_path"] = str(path)
+    cp.update(fields)
+    tracker.save_checkpoint(run_id, cp)
+    return run_id
+
+
+# Что выполняется при продолжении из каждого состояния: (generate, telegram, zen, delete_topic)
+EXPECTED_ON_RESUME = {
+    scheduler.SLOT_CLAIMED: (1, 1, 1, 1),
+    scheduler.SLOT_GENERATED: (0, 1, 1, 1),
+    scheduler.SLOT_TELEGRAM_STARTED: (0, 0, 1, 1),
+    scheduler.SLOT_TELEGRAM_DONE: (0, 0, 1, 1),
+    scheduler.SLOT_ZEN_STARTED: (0, 0, 0, 1),
+    scheduler.SLOT_ZEN_DONE: (0, 0, 0, 1),
+    scheduler.SLOT_FINISHED: (0, 0, 0, 0),
+}
+
+
+def test_fresh_slot_walks_all_states():
+    with _slot_env() as calls:
+        scheduler._run_one_slot()
+        assert (calls["fetch_topic"], calls["generate"], calls["telegram"], calls["zen"], calls["delete_topic"]) == (1, 1, 1, 1, 1)
+        run_id = 1
+        assert _checkpoint(run_id)["state"] == scheduler.SLOT_FINISHED
+        assert _run(run_id)["status"] == "completed"
+        bundle = publish_registry.get(Path(_checkpoint(run_id)["article_path"]))
+        assert (bundle["telegram_status"], bundle["zen_status"]) == (publish_registry.DONE, publish_registry.DONE)
+
+
+def test_resume_from_each_state_skips_completed_steps():
+    assert set(EXPECTED_ON_RESUME) == set(scheduler.SLOT_STATES)
+    for state, expected in EXPECTED_ON_RESUME.items():
+        with _slot_env() as calls:
+            run_id = _interrupted_run(state, telegram_ok=1, zen_ok=1 if state == scheduler.SLOT_ZEN_DONE else None)
+            scheduler._resume_interrupted_slots()
+            got = (calls["generate"], calls["telegram"], calls["zen"], calls["delete_topic"])
+            assert got == expected, (state, got)
+            assert calls["fetch_topic"] == 0, state
+            assert _run_count() == 1, state  # тот же run_id, новый запуск не создан
+            assert _run(run_id)["status"] in ("completed", "failed"), state
+            cp = _checkpoint(run_id)
+            assert cp["state"] == scheduler.SLOT_FINISHED, state
+            assert cp["resumes"] == 1, state
+
+
+def test_crash_during_telegram_is_not_resent():
+    with _slot_env(telegram_crash=True) as calls:
+        try:
+            scheduler._run_one_slot()
+        except _Crash:
+            pass
+        assert _checkpoint(1)["state"] == scheduler.SLOT_TELEGRAM_STARTED
+    # Тот же процесс «перезапущен»: отправка не повторяется, канал — на ручную проверку
+    with _slot_env() as calls:
+        run_id = _interrupted_run(scheduler.SLOT_TELEGRAM_STARTED)
+        scheduler._resume_interrupted_slots()
+        assert calls["telegram"] == 0 and calls["zen"] == 1
+        assert calls["failed_publication"] == [["telegram"]]
+        assert publish_registry.get(Path(_checkpoint(run_id)["article_path"]))["telegram_status"] == publish_registry.FAILED
+        assert _run(run_id)["status"] == "failed"
+
+
+def test_crash_during_zen_uses_registry_status():
+    with _slot_env(zen_crash=True) as calls:
+        try:
+            scheduler._run_one_slot()
+        except _Crash:
+            pass
+        assert calls["telegram"] == 1
+        assert _checkpoint(1)["state"] == scheduler.SLOT_ZEN_STARTED
+    # Публикация в Дзен успела отметиться в реестре до падения — засчитывается без повтора
+    with _slot_env() as calls:
+        run_id = _interrupted_run(scheduler.SLOT_ZEN_STARTED, telegram_ok=1)
+        publish_registry.set_channel_status(Path(_checkpoint(run_id)["article_path"]), "zen", publish_registry.DONE)
+        scheduler._resume_interrupted_slots()
+        assert calls["zen"] == 0 and calls["delete_topic"] == 1
+        assert calls["failed_publication"] == []
+        assert _checkpoint(run_id)["zen_ok"] == 1
+
+
+def test_missing_article_falls_back_to_claimed():
+    with _slot_env() as calls:
+        run_id = _interrupted_run(
+            scheduler.SLOT_TELEGRAM_DONE, article=False, article_path="/nonexistent/publish/001/article.json", telegram_ok=1,
+        )
+        scheduler._resume_interrupted_slots()
+        # Тема уже взята — только генерация заново (без fetch_topic), дальше весь путь
+        assert (calls["fetch_topic"], calls["generate"], calls["telegram"], calls["zen"]) == (0, 1, 1, 1)
+        assert _checkpoint(run_id)["state"] == scheduler.SLOT_FINISHED
+        assert _run_count() == 1
+
+
+def test_resume_stops_after_max_resumes():
+    with _slot_env() as calls:
+        exhausted = _interrupted_run(scheduler.SLOT_GENERATED, resumes=scheduler.SLOT_MAX_RESUMES)
+        last_try = _interrupted_run(scheduler.SLOT_GENERATED, resumes=scheduler.SLOT_MAX_RESUMES - 1)
+        assert [cp["run_id"] for cp in scheduler._interrupted_slots()] == [last_try]
+        scheduler._resume_interrupted_slots()
+        assert calls["telegram"] == 1
+        assert _checkpoint(last_try)["resumes"] == scheduler.SLOT_MAX_RESUMES
+        assert _run(exhausted)["status"] == "running"  # закроет как failed следующий слот
+        scheduler._close_stale_schedule_runs(keep=[cp["run_id"] for cp in scheduler._interrupted_slots()])
+        assert _run(exhausted)["status"] == "failed"
+
+
+if __name__ == "__main__":
+    for name, fn in sorted(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print("OK", name)
@@ -11,7 +11,7 @@ os.chdir(ROOT)
 from dotenv import load_dotenv
 load_dotenv(ROOT / ".env")
 
-from blocks.autopost_zen.wordstat_client import fetch_top_phrases, get_wordstat_token
+from blocks.autopost_zen.wordstat_client import fetch_top_phrases, get_wordstat_token, quota_status
 
 def main():
     query = "ремонт офисов"
@@ -29,6 +29,7 @@ def main():
         print(f"  {i}. {p}")
     if len(phrases) > 30:
         print("  ... и ещё", len(phrases) - 30)
+    print("Квота:", quota_status())
     return 0
 
 if __name__ == "__main__":
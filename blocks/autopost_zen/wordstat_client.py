@@ -5,24 +5,77 @@
 
 Метод /v1/topRequests — популярные запросы по фразе. POST, JSON, Bearer-токен.
 Переменная: YANDEX_WORDSTAT_TOKEN (OAuth, см. docs/rules/KEYS_AND_TOKENS.md).
+
+Кеш и пакеты:
+- ответы по каждой фразе хранятся в SQLite (WORDSTAT_CACHE_PATH, по умолчанию
+  storage/wordstat_cache.db) WORDSTAT_CACHE_TTL сек; ошибка по фразе — WORDSTAT_NEGATIVE_TTL сек;
+- fetch_top_phrases_many() берёт сиды нескольких тем сразу: повторяющиеся фразы и фразы из кеша
+  в API не уходят, остальные — пачками до 128 фраз на один вызов /v1/topRequests;
+- квота: после каждого вызова учитываются вызовы и фразы за сутки, заголовки ответа с лимитами
+  и (раз в WORDSTAT_USERINFO_TTL сек) ответ /v1/userInfo — quota_status(). Вызовы
+  не чаще limitPerSecond из userInfo; при исчерпанной суточной квоте запросы не отправляются —
+  SEO-обогащение работает только по кешу и не тормозит генерацию.
 """
 import json
 import logging
 import os
-from typing import List, Optional
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import requests
 
 logger = logging.getLogger(__name__)
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
 # Официальный API Вордстата (POST, JSON, Authorization: Bearer)
 WORDSTAT_BASE_URL = os.getenv(
     "YANDEX_WORDSTAT_API_URL", "https://api.wordstat.yandex.net"
 ).rstrip("/")
 TOP_REQUESTS_URL = f"{WORDSTAT_BASE_URL}/v1/topRequests"
+USER_INFO_URL = f"{WORDSTAT_BASE_URL}/v1/userInfo"
 
 # Сколько фраз возвращать по каждому запросу (макс. 2000)
 NUM_PHRASES_DEFAULT = 100
+# Фраз в одном вызове topRequests (ограничение API)
+MAX_PHRASES_PER_CALL = 128
+# Сколько фраз отдавать на одну тему
+TOP_PHRASES_LIMIT = 50
+
+WORDSTAT_CACHE_PATH = Path(os.getenv("WORDSTAT_CACHE_PATH", str(PROJECT_ROOT / "storage" / "wordstat_cache.db")))
+if not WORDSTAT_CACHE_PATH.is_absolute():
+    WORDSTAT_CACHE_PATH = PROJECT_ROOT / WORDSTAT_CACHE_PATH
+WORDSTAT_CACHE_TTL = int(os.getenv("WORDSTAT_CACHE_TTL", str(7 * 24 * 3600)))
+WORDSTAT_NEGATIVE_TTL = int(os.getenv("WORDSTAT_NEGATIVE_TTL", str(24 * 3600)))
+WORDSTAT_USERINFO_TTL = int(os.getenv("WORDSTAT_USERINFO_TTL", "3600"))
+
+_lock = threading.Lock()
+
+
+class _RateLimiter:
+    """Не чаще rate вызовов в секунду на все потоки (rate берётся из userInfo)."""
+
+    def __init__(self):
+        self.rate = 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + 1.0 / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiter = _RateLimiter()
 
 
 def get_wordstat_token() -> Optional[str]:
@@ -30,17 +83,117 @@ def get_wordstat_token() -> Optional[str]:
     return os.getenv("YANDEX_WORDSTAT_TOKEN", "").strip() or None
 
 
-def _post_top_requests(body: dict) -> Optional[dict]:
-    """
-    POST /v1/topRequests.
-    Тело: {phrase: "..."} или {phrases: ["...", ...], numPhrases?: N, regions?: [], devices?: []}.
-    """
+# ── Кеш и учёт квоты (SQLite) ───────────────────────
+
+def _connect() -> sqlite3.Connection:
+    WORDSTAT_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(WORDSTAT_CACHE_PATH), timeout=10)
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS phrases (
+               phrase TEXT NOT NULL,
+               params TEXT NOT NULL,
+               status TEXT NOT NULL,
+               result TEXT,
+               fetched_at REAL NOT NULL,
+               PRIMARY KEY (phrase, params)
+           );
+           CREATE TABLE IF NOT EXISTS quota (
+               day TEXT PRIMARY KEY,
+               calls INTEGER NOT NULL DEFAULT 0,
+               phrases INTEGER NOT NULL DEFAULT 0,
+               cache_hits INTEGER NOT NULL DEFAULT 0
+           );
+           CREATE TABLE IF NOT EXISTS quota_info (
+               key TEXT PRIMARY KEY,
+               value TEXT,
+               updated_at REAL NOT NULL
+           );"""
+    )
+    return conn
+
+
+def _normalize(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
+def _params_key(num_phrases: int, regions: Optional[List[int]]) -> str:
+    return json.dumps({"n": num_phrases, "r": sorted(regions or [])}, separators=(",", ":"))
+
+
+def _cache_get(conn: sqlite3.Connection, phrases: List[str], params: str) -> Dict[str, List[str]]:
+    """Свежие записи кеша: {фраза: список фраз ответа} (у ошибок — пустой список)."""
+    now = time.time()
+    found: Dict[str, List[str]] = {}
+    for i in range(0, len(phrases), 500):
+        chunk = phrases[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT phrase, status, result, fetched_at FROM phrases WHERE params = ? AND phrase IN ({marks})",
+            [params, *chunk],
+        )
+        for phrase, status, result, fetched_at in rows:
+            ttl = WORDSTAT_CACHE_TTL if status == "ok" else WORDSTAT_NEGATIVE_TTL
+            if now - fetched_at < ttl:
+                found[phrase] = json.loads(result) if result else []
+    return found
+
+
+def _cache_put(conn: sqlite3.Connection, items: Dict[str, Optional[List[str]]], params: str) -> None:
+    """items: {фраза: список фраз ответа или None — ошибка по фразе}."""
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO phrases (phrase, params, status, result, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (phrase, params, "ok" if result is not None else "error",
+                 json.dumps(result, ensure_ascii=False) if result is not None else None, now)
+                for phrase, result in items.items()
+            ],
+        )
+
+
+def _count_usage(conn: sqlite3.Connection, calls: int = 0, phrases: int = 0, cache_hits: int = 0) -> None:
+    with conn:
+        conn.execute(
+            """INSERT INTO quota (day, calls, phrases, cache_hits) VALUES (?, ?, ?, ?)
+               ON CONFLICT(day) DO UPDATE SET calls = calls + excluded.calls,
+                   phrases = phrases + excluded.phrases, cache_hits = cache_hits + excluded.cache_hits""",
+            (date.today().isoformat(), calls, phrases, cache_hits),
+        )
+
+
+def _save_quota_info(conn: sqlite3.Connection, values: Dict[str, object]) -> None:
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO quota_info (key, value, updated_at) VALUES (?, ?, ?)",
+            [(k, json.dumps(v, ensure_ascii=False), now) for k, v in values.items()],
+        )
+
+
+def _load_quota_info(conn: sqlite3.Connection) -> Dict[str, Tuple[object, float]]:
+    return {k: (json.loads(v), ts) for k, v, ts in conn.execute("SELECT key, value, updated_at FROM quota_info")}
+
+
+def _quota_headers(headers) -> Dict[str, str]:
+    """Заголовки ответа с лимитами/остатком квоты (имена у API не задокументированы — берём по смыслу)."""
+    return {
+        f"header:{k.lower()}": v for k, v in (headers or {}).items()
+        if any(word in k.lower() for word in ("limit", "remaining", "quota", "units"))
+    }
+
+
+# ── HTTP ────────────────────────────────────────────
+
+def _post(url: str, body: dict) -> Tuple[Optional[object], Dict[str, str]]:
+    """POST к API. → (JSON ответа или None, заголовки квоты)."""
     token = get_wordstat_token()
     if not token:
-        return None
+        return None, {}
+    _rate_limiter.wait()
     try:
         r = requests.post(
-            TOP_REQUESTS_URL,
+            url,
             json=body,
             headers={
                 "Content-Type": "application/json; charset=utf-8",
@@ -48,15 +201,34 @@ def _post_top_requests(body: dict) -> Optional[dict]:
             },
             timeout=30,
         )
+        quota = _quota_headers(r.headers)
         r.raise_for_status()
-        return r.json()
+        return r.json(), quota
     except requests.HTTPError as e:
         err_body = e.response.text if e.response is not None else ""
-        logger.warning("Wordstat API HTTP %s: %s", e.response.status_code if e.response else "", err_body[:200])
-        return None
+        logger.warning("Wordstat API HTTP %s: %s", e.response.status_code if e.response is not None else "", err_body[:200])
+        return None, _quota_headers(e.response.headers if e.response is not None else None)
     except Exception as e:
         logger.warning("Wordstat request failed: %s", e)
-        return None
+        return None, {}
+
+
+def _post_top_requests(body: dict) -> Optional[dict]:
+    """
+    POST /v1/topRequests.
+    Тело: {phrase: "..."} или {phrases: ["...", ...], numPhrases?: N, regions?: [], devices?: []}.
+    """
+    data, quota = _post(TOP_REQUESTS_URL, body)
+    phrases = 1 if "phrase" in body else len(body.get("phrases") or [])
+    with _lock:
+        conn = _connect()
+        try:
+            _count_usage(conn, calls=1, phrases=phrases)
+            if quota:
+                _save_quota_info(conn, quota)
+        finally:
+            conn.close()
+    return data
 
 
 def _collect_phrases_from_item(item: dict) -> List[str]:
@@ -70,6 +242,130 @@ def _collect_phrases_from_item(item: dict) -> List[str]:
     return result
 
 
+def _response_items(data: object, phrases: List[str]) -> Dict[str, Optional[List[str]]]:
+    """Ответ topRequests → {фраза запроса: фразы ответа или None (ошибка по фразе)}."""
+    # Одна фраза — объект ответа; несколько — массив объектов (или объект с results)
+    if isinstance(data, list):
+        items = data
+    elif isinstance(data, dict) and isinstance(data.get("results"), list):
+        items = data["results"]
+    else:
+        items = [data] if isinstance(data, dict) else []
+    items = [i for i in items if isinstance(i, dict)]
+    by_request = {_normalize(str(i.get("requestPhrase") or "")): i for i in items}
+    result: Dict[str, Optional[List[str]]] = {}
+    for pos, phrase in enumerate(phrases):
+        # По requestPhrase, без него — по порядку
+        item = by_request.get(phrase) or (items[pos] if len(items) == len(phrases) else None)
+        if item is None or item.get("error"):
+            if item is not None:
+                logger.warning("Wordstat error for phrase %s: %s", phrase, item.get("error"))
+            result[phrase] = None
+        else:
+            result[phrase] = _collect_phrases_from_item(item)
+    return result
+
+
+def _calls_left(conn: sqlite3.Connection) -> Optional[int]:
+    """Сколько вызовов осталось в суточной квоте: остаток из userInfo минус вызовы после проверки; None — неизвестно."""
+    info = _load_quota_info(conn)
+    remaining, checked_at = info.get("dailyLimitRemaining", (None, 0))
+    if remaining is None or date.fromtimestamp(checked_at) != date.today():
+        return None
+    calls_today = conn.execute(
+        "SELECT COALESCE(SUM(calls), 0) FROM quota WHERE day = ?", (date.today().isoformat(),)
+    ).fetchone()[0]
+    try:
+        return max(0, int(remaining) - max(0, calls_today - int(info.get("calls_at_check", (0, 0))[0] or 0)))
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_top_phrases_many(
+    seed_groups: List[List[str]],
+    regions: Optional[List[int]] = None,
+    num_phrases: int = NUM_PHRASES_DEFAULT,
+) -> List[List[str]]:
+    """
+    Топ-фразы для нескольких тем сразу: seed_groups — сиды каждой темы, ответ — список фраз
+    на каждую тему (в том же порядке, до TOP_PHRASES_LIMIT, без дубликатов).
+
+    Одинаковые сиды разных тем запрашиваются один раз, свежие — берутся из кеша, остальные
+    уходят в /v1/topRequests пачками до 128 фраз. Ошибка API — тема получает то, что есть в кеше.
+    """
+    groups = [[_normalize(p) for p in (g or []) if p and p.strip()] for g in seed_groups]
+    unique = list(dict.fromkeys(p for g in groups for p in g))
+    if not unique:
+        return [[] for _ in groups]
+    num_phrases = min(num_phrases, 2000)
+    params = _params_key(num_phrases, regions)
+
+    with _lock:
+        conn = _connect()
+        try:
+            cached = _cache_get(conn, unique, params)
+            _count_usage(conn, cache_hits=len(cached))
+            missing = [p for p in unique if p not in cached]
+            info_checked_at = _load_quota_info(conn).get("login", (None, 0))[1]
+        finally:
+            conn.close()
+    if missing and not get_wordstat_token():
+        logger.info("YANDEX_WORDSTAT_TOKEN не задан — ключевые слова только из сидов")
+        missing = []
+    if missing:
+        if time.time() - info_checked_at >= WORDSTAT_USERINFO_TTL:
+            user_info()
+        with _lock:
+            conn = _connect()
+            try:
+                calls_left = _calls_left(conn)
+            finally:
+                conn.close()
+        if calls_left is not None and calls_left * MAX_PHRASES_PER_CALL < len(missing):
+            allowed = missing[:calls_left * MAX_PHRASES_PER_CALL]
+            logger.warning(
+                "Wordstat: суточная квота на исходе (вызовов: %d) — %d фраз без запроса, только кеш",
+                calls_left, len(missing) - len(allowed),
+            )
+            missing = allowed
+
+    fetched: Dict[str, List[str]] = {}
+    for i in range(0, len(missing), MAX_PHRASES_PER_CALL):
+        chunk = missing[i:i + MAX_PHRASES_PER_CALL]
+        # Одна фраза — параметр phrase, несколько — phrases
+        body = {"phrase": chunk[0]} if len(chunk) == 1 else {"phrases": chunk}
+        body["numPhrases"] = num_phrases
+        if regions:
+            body["regions"] = regions
+        data = _post_top_requests(body)
+        if not data:
+            continue  # сеть/HTTP: в кеш не пишем, повторим в следующий раз
+        items = _response_items(data, chunk)
+        with _lock:
+            conn = _connect()
+            try:
+                _cache_put(conn, items, params)
+            finally:
+                conn.close()
+        fetched.update({p: r for p, r in items.items() if r is not None})
+
+    results: List[List[str]] = []
+    for group in groups:
+        seen = set()
+        merged: List[str] = []
+        for seed in group:
+            for phrase in cached.get(seed) or fetched.get(seed) or []:
+                if phrase not in seen:
+                    seen.add(phrase)
+                    merged.append(phrase)
+        results.append(merged[:TOP_PHRASES_LIMIT])
+    logger.info(
+        "Wordstat: %d тем, %d уникальных фраз — из кеша %d, запрошено %d (%d вызовов)",
+        len(groups), len(unique), len(cached), len(missing), -(-len(missing) // MAX_PHRASES_PER_CALL),
+    )
+    return results
+
+
 def fetch_top_phrases(
     phrases: List[str],
     regions: Optional[List[int]] = None,
@@ -80,6 +376,7 @@ def fetch_top_phrases(
 
     Используется метод /v1/topRequests: для одной фразы — один запрос с параметром
     `phrase`; для нескольких — один запрос с параметром `phrases` (макс. 128 фраз).
+    Фразы из кеша в API не уходят (см. fetch_top_phrases_many).
 
     Ответ: topRequests (популярные запросы, содержащие фразу) + associations (похожие).
     Результат объединяется, дубликаты убираются, возвращается до 50 фраз.
@@ -91,61 +388,56 @@ def fetch_top_phrases(
     """
     if not phrases:
         return []
-    token = get_wordstat_token()
-    if not token:
-        logger.info("YANDEX_WORDSTAT_TOKEN не задан — ключевые слова только из сидов")
-        return []
-
-    phrases = [p.strip() for p in phrases if p.strip()]
-    if not phrases:
-        return []
+    return fetch_top_phrases_many([phrases], regions=regions, num_phrases=num_phrases)[0]
 
-    # Один запрос: одна фраза или массив фраз (до 128)
-    if len(phrases) == 1:
-        body = {"phrase": phrases[0], "numPhrases": min(num_phrases, 2000)}
-    else:
-        body = {
-            "phrases": phrases[:128],
-            "numPhrases": min(num_phrases, 2000),
-        }
-    if regions:
-        body["regions"] = regions
-
-    data = _post_top_requests(body)
-    if not data:
-        return []
 
-    result: List[str] = []
-    seen = set()
-
-    # Одна фраза — ответ один объект: requestPhrase, topRequests, associations
-    if len(phrases) == 1:
-        if "error" in data:
-            logger.warning("Wordstat error for phrase %s: %s", phrases[0], data.get("error"))
-            return []
-        for phrase in _collect_phrases_from_item(data):
-            if phrase not in seen:
-                seen.add(phrase)
-                result.append(phrase)
-    else:
-        # Несколько фраз — ответ массив объектов (или с полем error в элементе)
-        items = data if isinstance(data, list) else [data]
-        for item in items:
-            if isinstance(item, dict) and item.get("error"):
-                continue
-            for phrase in _collect_phrases_from_item(item):
-                if phrase not in seen:
-                    seen.add(phrase)
-                    result.append(phrase)
-
-    logger.info("Wordstat: получено %d фраз по %d запросам", len(result), len(phrases))
-    return result[:50]
+def user_info() -> Optional[dict]:
+    """
+    POST /v1/userInfo — лимиты и остаток квоты (login, limitPerSecond, dailyLimit, dailyLimitRemaining).
+    Ответ сохраняется в кеш (quota_status) и задаёт частоту запросов к API. Вызывается
+    fetch_top_phrases_many не чаще раза в WORDSTAT_USERINFO_TTL сек.
+    """
+    data, quota = _post(USER_INFO_URL, {})
+    info = (data.get("userInfo") or data) if isinstance(data, dict) else None
+    values: Dict[str, object] = dict(quota)
+    if info:
+        values.update({k: v for k, v in info.items() if not isinstance(v, (dict, list))})
+    # Время проверки — и при ошибке, чтобы не повторять userInfo на каждый вызов
+    values["login"] = (info or {}).get("login")
+    with _lock:
+        conn = _connect()
+        try:
+            values["calls_at_check"] = conn.execute(
+                "SELECT COALESCE(SUM(calls), 0) FROM quota WHERE day = ?", (date.today().isoformat(),)
+            ).fetchone()[0]
+            _save_quota_info(conn, values)
+        finally:
+            conn.close()
+    if info and info.get("limitPerSecond"):
+        try:
+            _rate_limiter.rate = float(info["limitPerSecond"])
+        except (TypeError, ValueError):
+            pass
+    return info
 
 
-def user_info() -> Optional[dict]:
+def quota_status() -> dict:
     """
-    GET/POST к /v1/userInfo — лимиты и остаток квоты.
-    В документации не указан метод для userInfo; если есть — можно вызвать отдельно.
+    Квота без запросов к API: сегодняшние вызовы/фразы/попадания в кеш по локальному учёту
+    и последние сведения userInfo и заголовков ответа ({ключ: значение}, checked_at — время проверки).
     """
-    # В структуре API указано только описание ответа userInfo, без явного curl. Пока не реализуем.
-    return None
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT calls, phrases, cache_hits FROM quota WHERE day = ?", (date.today().isoformat(),)
+            ).fetchone() or (0, 0, 0)
+            info = _load_quota_info(conn)
+        finally:
+            conn.close()
+    checked_at = max((ts for _, ts in info.values()), default=None)
+    return {
+        "today": {"calls": row[0], "phrases": row[1], "cache_hits": row[2]},
+        "limits": {k: v for k, (v, _) in info.items() if k != "calls_at_check"},
+        "checked_at": checked_at,
+    }
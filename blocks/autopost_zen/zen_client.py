@@ -13,6 +13,7 @@ import os
 import shutil
 import sys
 from datetime import datetime
+from html import escape
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 
@@ -54,6 +55,11 @@ except ImportError:
     async def dismiss_yandex_default_search_modal(page, timeout_ms=5000):
         return False
 
+from . import publish_registry, renditions, zen_session
+from .html_blocks import block_info, describe_block
+from .zen_trace import PLAYWRIGHT_TRACE_ON_FAILURE, TRACES_DIR, PublishTrace
+from .zen_routing import install_routing
+
 logger = logging.getLogger(__name__)
 
 # Селекторы Дзена (официальные data-testid и классы редактора). Правила: не Ctrl+A в теле; ENTER x2 между блоками.
@@ -70,13 +76,6 @@ DZEN = {
 }
 
 
-def get_next_publish_number() -> int:
-    """Следующий порядковый номер для папки публикации (001, 002, ...)."""
-    PUBLISH_DIR.mkdir(parents=True, exist_ok=True)
-    existing = [d.name for d in PUBLISH_DIR.iterdir() if d.is_dir() and d.name.isdigit()]
-    return max([0] + [int(n) for n in existing]) + 1
-
-
 def _resolve_article_image_path(path_str: str, article_parent: Path) -> Optional[Path]:
     """Найти файл картинки: сначала рядом со статьёй, затем articles/, корень проекта."""
     if not path_str or str(path_str).startswith("http"):
@@ -125,23 +124,25 @@ def prepare_publication(article_path: Path) -> Path:
             if (src, name) not in [(s, n) for s, n in images_to_move]:
                 images_to_move.append((src, name))
             block["path"] = name
-    # Создаём папку публикации
-    n = get_next_publish_number()
-    pub_dir = PUBLISH_DIR / f"{n:03d}"
-    pub_dir.mkdir(parents=True, exist_ok=True)
-    # Переносим картинки (без дублей по src)
-    seen_src = set()
-    for src, name in images_to_move:
-        if str(src.resolve()) in seen_src:
-            continue
-        seen_src.add(str(src.resolve()))
-        dest = pub_dir / name
-        if src.resolve() != dest.resolve():
-            shutil.move(str(src), str(dest))
-            logger.info("Перенесено: %s -> %s", src.name, pub_dir)
-    # Записываем обновлённый JSON и удаляем исходный файл статьи
-    out_json = pub_dir / "article.json"
-    out_json.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Создаём папку публикации (новый номер из реестра)
+    pub_dir = publish_registry.allocate(title=data.get("title"), source="file")
+    try:
+        # Переносим картинки (без дублей по src)
+        seen_src = set()
+        for src, name in images_to_move:
+            if str(src.resolve()) in seen_src:
+                continue
+            seen_src.add(str(src.resolve()))
+            dest = pub_dir / name
+            if src.resolve() != dest.resolve():
+                shutil.move(str(src), str(dest))
+                logger.info("Перенесено: %s -> %s", src.name, pub_dir)
+        # Записываем обновлённый JSON и удаляем исходный файл статьи
+        out_json = pub_dir / "article.json"
+        out_json.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    except Exception as e:
+        publish_registry.fail(pub_dir, str(e))
+        raise
     article_path.unlink()
     logger.info("Публикация подготовлена: %s (статья и картинки в %s)", out_json, pub_dir)
     return out_json
@@ -152,6 +153,11 @@ async def _human_wait(lo: float = 0.8, hi: float = 2.5):
     await asyncio.sleep(random.uniform(lo, hi))
 
 
+def _norm_space(text: str) -> str:
+    """Схлопнуть пробелы — для сравнения текста блока с innerText редактора."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
 def _block_label(block: dict) -> str:
     """Краткая подпись блока для чеклиста (h1, h2, ul, image и т.д.)."""
     if block.get("type") == "image":
@@ -176,12 +182,24 @@ def _block_label(block: dict) -> str:
     return "p"
 
 
+class ZenNotLoggedIn(RuntimeError):
+    """Студия Дзена открылась без входа (сессия недействительна)."""
+
+
 class ZenClient:
     """Клиент для работы с Яндекс.Дзен через автоматизацию браузера."""
 
     BASE_URL = "https://dzen.ru"
     LOGIN_URL = "https://passport.yandex.ru/auth?retpath=https%3A%2F%2Fzen.yandex.ru"
     CREATE_POST_URL = os.getenv("ZEN_EDITOR_URL", "https://dzen.ru/profile/editor/flowcabinet")
+    # Признаки залогиненной студии (профиль, «Новая статья»)
+    LOGGED_IN_SELECTORS = (
+        '[data-testid="user-menu"]',
+        ".user-avatar",
+        "a[href*='profile']",
+        "button:has-text('Новая статья')",
+        "a:has-text('Новая статья')",
+    )
 
     def __init__(self):
         self.email = os.getenv("ZEN_EMAIL", "").strip()
@@ -191,11 +209,22 @@ class ZenClient:
         _storage = os.getenv("ZEN_STORAGE_STATE", "zen_storage_state.json")
         self.storage_state_path = str((PROJECT_ROOT / _storage).resolve()) if not os.path.isabs(_storage) else _storage
         self.keep_open = os.getenv("ZEN_KEEP_OPEN", "false").lower() in ("1", "true", "yes")
+        # Трассировка: спаны фаз публикации (zen_trace.py) и логирование консоли/upload-запросов
+        self.trace = os.getenv("ZEN_TRACE", "false").lower() in ("1", "true", "yes")
+        self.tracer = PublishTrace(enabled=self.trace)
+        self.playwright_trace = PLAYWRIGHT_TRACE_ON_FAILURE
+        # Пакетная вставка текста статьи одним paste (вместо поблочного ввода с клавиатуры)
+        self.bulk_paste = os.getenv("ZEN_BULK_PASTE", "false").lower() in ("1", "true", "yes")
+        # Готовые JPEG для Дзена (renditions.py): {абсолютный путь исходника: путь варианта}
+        self.zen_renditions: Dict[str, str] = {}
+        # Вход принят по кешу zen_session без открытия студии — при отказе редактора перелогиниться
+        self.session_from_cache = False
 
         self.playwright = None
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        self.static_cache = None
 
         if not os.path.exists(self.storage_state_path) and (not self.email or not self.password):
             raise ValueError(
@@ -238,20 +267,45 @@ class ZenClient:
             except Exception as e:
                 logger.warning("Stealth не применён: %s", e)
         self.context.set_default_timeout(self.timeout)
+        # Блокировка трекеров, шрифтов, стороннего медиа и кеш статики редактора (zen_routing.py)
+        self.static_cache = await install_routing(self.context)
+        if self.playwright_trace:
+            await self.context.tracing.start(screenshots=True, snapshots=True)
         self.page = await self.context.new_page()
-        self._attach_debug_listeners()
+        self.page.on("pageerror", self._on_page_error)
+        if self.trace:
+            self._attach_debug_listeners()
         logger.info("Браузер запущен")
 
+    async def finish_playwright_trace(self, failed: bool) -> Optional[str]:
+        """Остановить Playwright trace: zip сохраняется только для неудачной публикации."""
+        if not self.playwright_trace or not self.context:
+            return None
+        try:
+            if not failed:
+                await self.context.tracing.stop()
+                return None
+            TRACES_DIR.mkdir(parents=True, exist_ok=True)
+            path = TRACES_DIR / f"playwright_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+            await self.context.tracing.stop(path=str(path))
+            logger.info("Playwright trace: %s (npx playwright show-trace)", path)
+            return str(path)
+        except Exception as e:
+            logger.warning("Playwright trace не сохранён: %s", e)
+            return None
+
+    @staticmethod
+    def _on_page_error(err):
+        logger.error("[ОШИБКА СТРАНИЦЫ] %s", err)
+
     def _attach_debug_listeners(self):
+        """Логирование консоли и upload-запросов. Только при ZEN_TRACE=true: колбэки на каждый запрос дорогие."""
         if not self.page:
             return
 
         def _on_console(msg):
             logger.debug("[БРАУЗЕР] %s: %s", msg.type, msg.text)
 
-        def _on_page_error(err):
-            logger.error("[ОШИБКА СТРАНИЦЫ] %s", err)
-
         # Логируем только запросы загрузки файлов в Дзен (не Метрику, не apptracer)
         def _is_upload_request(url: str, method: str) -> bool:
             u = (url or "").lower()
@@ -298,7 +352,6 @@ class ZenClient:
                 logger.debug("_on_response: %s", e)
 
         self.page.on("console", _on_console)
-        self.page.on("pageerror", _on_page_error)
         self.page.on("request", _on_request)
         self.page.on("response", _on_response)
 
@@ -306,6 +359,8 @@ class ZenClient:
         if self.keep_open:
             logger.info("Браузер оставлен открытым (ZEN_KEEP_OPEN=true)")
             return
+        if self.static_cache is not None:
+            logger.info("Кеш статики: попаданий %d, промахов %d", self.static_cache.hits, self.static_cache.misses)
         if self.browser:
             await self.browser.close()
         if self.playwright:
@@ -345,47 +400,17 @@ class ZenClient:
 
     def _html_to_plain_text(self, html: str) -> str:
         """Конвертация HTML в plain text с сохранением абзацев."""
-        if not html or not html.strip():
-            return ""
-        text = re.sub(r"<br\s*/?>", "\n", html, flags=re.I)
-        text = re.sub(r"</p>", "\n", text, flags=re.I)
-        text = re.sub(r"</h[1-6]>", "\n", text, flags=re.I)
-        text = re.sub(r"</li>", "\n", text, flags=re.I)
-        text = re.sub(r"<[^>]+>", "", text)
-        text = re.sub(r"\n{3,}", "\n\n", text)
-        return text.strip()
-
-    def _parse_html_block(self, html: str) -> tuple[str, str, Optional[List[str]]]:
+        return describe_block(html)["text"]
+
+    def _parse_html_block(self, block: dict) -> tuple[str, str, Optional[List[str]]]:
         """
-        Определить тип блока и извлечь текст (или пункты списка).
+        Тип блока и текст (или пункты списка) — из разобранного при генерации вида ("parsed"
+        в article.json), для старых статей — разбор content (html_blocks.describe_block).
         В теле статьи только H2 и H3; H1 используется только в заголовке статьи — в теле трактуем как H2.
         Возвращает (block_kind, text, list_items).
         block_kind: "h2" | "h3" | "p" | "ul" | "ol" | "blockquote" | "p_with_link"
         """
-        raw = html.strip().lower()
-        plain = self._html_to_plain_text(html)
-        list_items = None
-        if raw.startswith("<h1"):
-            return "h2", plain, None  # H1 только в заголовке статьи; в теле — H2
-        if raw.startswith("<h2"):
-            return "h2", plain, None
-        if raw.startswith("<h3"):
-            return "h3", plain, None
-        if raw.startswith("<h4"):
-            return "h3", plain, None  # в теле только h2/h3; h4 трактуем как h3
-        if raw.startswith("<blockquote"):
-            return "blockquote", plain, None
-        if raw.startswith("<ul"):
-            list_items = re.findall(r"<li[^>]*>(.*?)</li>", html, flags=re.DOTALL | re.I)
-            list_items = [re.sub(r"<[^>]+>", "", x).strip() for x in list_items]
-            return "ul", plain, list_items if list_items else None
-        if raw.startswith("<ol"):
-            list_items = re.findall(r"<li[^>]*>(.*?)</li>", html, flags=re.DOTALL | re.I)
-            list_items = [re.sub(r"<[^>]+>", "", x).strip() for x in list_items]
-            return "ol", plain, list_items if list_items else None
-        if "<a " in raw or "<a>" in raw:
-            return "p_with_link", plain, None
-        return "p", plain, None
+        return block_info(block)
 
     async def _clear_field(self) -> None:
         """Выделить всё в текущем поле (для замены вводом). Используется только для заголовка."""
@@ -908,8 +933,20 @@ class ZenClient:
             await self.page.wait_for_timeout(400)
         return False
 
-    async def _open_new_article_editor(self):
-        """Перейти в редактор новой статьи: data-testid add-publication-button → Написать статью."""
+    async def _page_logged_out(self) -> bool:
+        """Страница студии без входа: редирект на паспорт или «Войти» без признаков профиля."""
+        if "passport" in self.page.url.lower():
+            return True
+        for selector in self.LOGGED_IN_SELECTORS:
+            if await self.page.locator(selector).count() > 0:
+                return False
+        return await self.page.get_by_text("Войти", exact=False).count() > 0
+
+    async def _open_new_article_editor(self, relogin: bool = True):
+        """
+        Перейти в редактор новой статьи: data-testid add-publication-button → Написать статью.
+        Если сессию приняли по кешу, а студия просит войти — сброс кеша zen_session и один повторный вход (relogin).
+        """
         title_check = self.page.locator(DZEN["title_field"]).first
         if await title_check.count() > 0 and await title_check.is_visible():
             logger.info("Редактор уже открыт")
@@ -918,12 +955,28 @@ class ZenClient:
         logger.info("Открываю редактор новой статьи...")
         await self.page.goto("https://dzen.ru/profile/editor/flowcabinet/publications", wait_until="domcontentloaded")
         await _human_wait(2.5, 4)
+        # При входе по кешу сессии капча и модалка Яндекса ещё не обрабатывались
+        await self._wait_captcha_if_present()
+        if await dismiss_yandex_default_search_modal(self.page):
+            logger.info("Модалка «Яндекс станет основным поиском» закрыта.")
         await self._dismiss_donation_modal()
         await _human_wait(0.6, 1.2)
 
         # Приоритет: официальные селекторы Дзена
         add_btn = self.page.locator(DZEN["add_publication"]).first
-        await add_btn.wait_for(state="visible", timeout=10000)
+        try:
+            await add_btn.wait_for(state="visible", timeout=10000)
+        except Exception:
+            if not await self._page_logged_out():
+                raise
+            if not relogin or not self.session_from_cache:
+                raise ZenNotLoggedIn("Студия открылась без входа: " + self.page.url)
+            logger.warning("Сессия из кеша не принята студией — сбрасываю кеш и вхожу заново")
+            zen_session.invalidate()
+            if not await self.login(use_cache=False):
+                raise ZenNotLoggedIn("Повторный вход после отказа кешированной сессии не удался")
+            await self._open_new_article_editor(relogin=False)
+            return
         await add_btn.hover()
         await _human_wait(0.4, 0.9)
         await add_btn.click(timeout=3000)
@@ -943,7 +996,23 @@ class ZenClient:
 
         await self._dismiss_help_popup()
 
-    async def login(self) -> bool:
+    async def login(self, use_cache: bool = True) -> bool:
+        """
+        Авторизация. При use_cache сначала кеш/лёгкая проверка сессии (zen_session) — если
+        сессия валидна, навигация по студии пропускается. Иначе — проверка в браузере и вход по паролю.
+        """
+        if use_cache and os.path.exists(self.storage_state_path):
+            valid = await asyncio.to_thread(zen_session.ensure_session_checked, Path(self.storage_state_path))
+            if valid:
+                logger.info("Сессия валидна (проверка без браузера), авторизация пропущена")
+                self.session_from_cache = True
+                return True
+        self.session_from_cache = False
+        ok = await self._login_in_browser()
+        zen_session.mark_session(ok, "login" if ok else "login failed", Path(self.storage_state_path))
+        return ok
+
+    async def _login_in_browser(self) -> bool:
         try:
             logger.info("=" * 50)
             logger.info("НАЧАЛО АВТОРИЗАЦИИ")
@@ -958,14 +1027,7 @@ class ZenClient:
             await _human_wait(1, 2)
 
             # Проверка: уже залогинены (профиль, «Новая статья», нет «Войти»)
-            logged_in_selectors = [
-                '[data-testid="user-menu"]',
-                ".user-avatar",
-                "a[href*='profile']",
-                "button:has-text('Новая статья')",
-                "a:has-text('Новая статья')",
-            ]
-            for selector in logged_in_selectors:
+            for selector in self.LOGGED_IN_SELECTORS:
                 if await self.page.locator(selector).count() > 0:
                     logger.info("Уже авторизованы (cookies)")
                     return True
@@ -1055,6 +1117,7 @@ class ZenClient:
             logger.info("СОЗДАНИЕ ПОСТА: %s...", title[:50])
             logger.info("=" * 50)
 
+            span = self.tracer.start("open_editor")
             await self.page.goto(self.CREATE_POST_URL, wait_until="domcontentloaded")
             await _human_wait(2.5, 5)
             await self._wait_captcha_if_present()
@@ -1071,6 +1134,11 @@ class ZenClient:
 
             await self._open_new_article_editor()
 
+            content_blocks = kwargs.get("content_blocks")
+            bulk_paste = kwargs.get("bulk_paste")
+            if bulk_paste is None:
+                bulk_paste = self.bulk_paste
+
             await self._dismiss_help_popup()
             await _human_wait(1.2, 2.5)
 
@@ -1081,7 +1149,9 @@ class ZenClient:
                 pass
             count = await editors.count()
             logger.info("Найдено полей редактора: %s", count)
+            self.tracer.end(span)
 
+            span = self.tracer.start("title")
             if count >= 1:
                 title_el = editors.nth(0)
                 await title_el.hover()
@@ -1090,14 +1160,23 @@ class ZenClient:
                 await _human_wait(0.3, 0.7)
                 await self._clear_field()
                 await _human_wait(0.1, 0.25)
-                await self.page.keyboard.type(title, delay=random.randint(35, 85))
+                if bulk_paste:
+                    await self.page.keyboard.insert_text(title)
+                else:
+                    await self.page.keyboard.type(title, delay=random.randint(35, 85))
                 logger.info("Заголовок введён: %s", title[:50])
             else:
                 logger.warning("Поле заголовка не найдено")
             await _human_wait(0.5, 1.2)
+            self.tracer.end(span)
 
-            content_blocks = kwargs.get("content_blocks")
-            if content_blocks:
+            content_span = self.tracer.start("content", blocks=len(content_blocks or []), bulk_paste=bool(bulk_paste))
+            if content_blocks and bulk_paste:
+                content_el = editors.nth(1) if count >= 2 else editors.nth(0)
+                await content_el.click(force=True, timeout=5000)
+                await _human_wait(0.4, 0.9)
+                await self._insert_blocks_bulk(content_blocks, kwargs.get("block_results"), kwargs.get("article_dir"))
+            elif content_blocks:
                 content_el = editors.nth(1) if count >= 2 else editors.nth(0)
                 await content_el.click(force=True, timeout=5000)
                 await _human_wait(0.4, 0.9)
@@ -1111,6 +1190,7 @@ class ZenClient:
                     block_label = _block_label(block)
                     next_is_image = i + 1 < len(content_blocks) and content_blocks[i + 1].get("type") == "image"
                     block_kind = None
+                    block_span = self.tracer.start(f"block #{i + 1} ({block_label})")
                     try:
                         # Между блоками: один Enter (без лишних переносов).
                         if i > 0:
@@ -1118,7 +1198,7 @@ class ZenClient:
                             await _human_wait(0.15, 0.3)
                         if block.get("type") == "html":
                             html = block.get("content", "")
-                            block_kind, text, list_items = self._parse_html_block(html)
+                            block_kind, text, list_items = self._parse_html_block(block)
                             next_is_image = i + 1 < len(content_blocks) and content_blocks[i + 1].get("type") == "image"
                             await self._insert_block_via_editor(
                                 block_kind,
@@ -1133,51 +1213,14 @@ class ZenClient:
                             if block_results is not None:
                                 block_results.append({"i": i + 1, "type": "html", "label": block_label, "success": True, "error": None})
                         if block.get("type") == "image":
-                            img_path = block.get("path", "")
-                            image_url = block.get("url")
-                            ok = False
-                            err = None
-                            article_dir = kwargs.get("article_dir")
-                            # Вставка по URL (рекламный баннер и т.п.) — без локального файла
-                            if image_url and str(image_url).strip().startswith("http"):
-                                ok = await self._add_image_in_article(
-                                    "", block.get("caption"), image_url=image_url.strip()
-                                )
-                                if ok:
-                                    logger.info("Картинка #%s добавлена по URL", i + 1)
-                                else:
-                                    err = "не вставлена по URL"
-                            elif img_path:
-                                if article_dir:
-                                    p = article_dir / Path(img_path).name
-                                else:
-                                    p = Path(img_path)
-                                    if not p.is_absolute():
-                                        p = PROJECT_ROOT / p
-                                    if not p.exists():
-                                        if (BLOCK_DIR / "articles" / p.name).exists():
-                                            p = BLOCK_DIR / "articles" / p.name
-                                    if not p.exists() and not p.is_absolute():
-                                        p_alt = PROJECT_ROOT / block.get("path", "")
-                                        if p_alt.exists():
-                                            p = p_alt
-                                if p.exists():
-                                    ok = await self._add_image_in_article(
-                                        str(p), block.get("caption"), image_url=block.get("url")
-                                    )
-                                    if ok:
-                                        logger.info("Картинка #%s добавлена", i + 1)
-                                    else:
-                                        err = "не вставлена (side button / file chooser)"
-                                else:
-                                    err = f"файл не найден: {img_path}"
-                            else:
-                                err = "нет path и нет url"
+                            ok, err = await self._insert_image_block(block, i + 1, kwargs.get("article_dir"))
                             if block_results is not None:
                                 block_results.append({"i": i + 1, "type": "image", "label": block_label, "success": ok, "error": err})
                         await _human_wait(1, 2.5)
+                        self.tracer.end(block_span)
                     except Exception as e:
                         err_str = str(e)
+                        self.tracer.end(block_span, error=err_str)
                         logger.warning("Блок #%s (%s): %s", i + 1, block_label, err_str)
                         if block_results is not None:
                             block_results.append({"i": i + 1, "type": block.get("type", ""), "label": block_label, "success": False, "error": err_str})
@@ -1207,17 +1250,23 @@ class ZenClient:
                 if article_image:
                     await self._add_image_in_article(article_image, kwargs.get("image_caption"))
 
+            self.tracer.end(content_span)
+
             if self.page.is_closed():
                 raise Exception("Страница закрылась до публикации")
 
             if tags:
-                await self._set_tags(tags)
+                with self.tracer.span("tags", count=len(tags)):
+                    await self._set_tags(tags)
 
             if video and os.path.exists(video):
-                await self._upload_video(video)
+                with self.tracer.span("video_upload"):
+                    await self._upload_video(video)
 
-            await self._click_publish(cover_image=cover_image, cover_image_url=kwargs.get("cover_image_url"))
+            with self.tracer.span("publish"):
+                await self._click_publish(cover_image=cover_image, cover_image_url=kwargs.get("cover_image_url"))
 
+            span = self.tracer.start("verify_screenshots")
             await self.page.wait_for_timeout(3500)
             await self.screenshot("post_created")
             await self.screenshot("post_created_full", full_page=True)
@@ -1247,14 +1296,170 @@ class ZenClient:
                         pass
             except Exception as e:
                 logger.debug("Скриншоты верификации редактора: %s", e)
+            self.tracer.end(span)
             logger.info("ПОСТ УСПЕШНО СОЗДАН")
             return True
 
         except Exception as e:
+            self.tracer.close_all(error=f"{type(e).__name__}: {e}")
             logger.exception("Ошибка создания поста: %s", e)
             await self.screenshot("error_create_post")
             return False
 
+    def _bulk_block_html(self, block: dict) -> str:
+        """HTML одного текстового блока для пакетной вставки: в теле только h2/h3, p, списки, цитаты."""
+        html = block.get("content", "")
+        block_kind, text, list_items = self._parse_html_block(block)
+        if block_kind in ("h2", "h3", "blockquote"):
+            return f"<{block_kind}>{escape(text)}</{block_kind}>"
+        if block_kind in ("ul", "ol"):
+            items = list_items or [text]
+            return f"<{block_kind}>" + "".join(f"<li>{escape(x)}</li>" for x in items) + f"</{block_kind}>"
+        # Абзацы: исходный HTML (жирный и ссылки остаются разметкой)
+        if html.strip().lower().startswith("<p"):
+            return html.strip()
+        return f"<p>{html.strip()}</p>"
+
+    async def _editor_snapshot(self) -> Dict[str, Any]:
+        """Текст тела статьи и заголовки h2/h3 — для проверки вставленных блоков."""
+        return await self.page.evaluate(
+            """(sel) => {
+                const el = document.querySelector(sel) || document.querySelector('[contenteditable="true"]');
+                if (!el) return {text: "", headings: []};
+                const norm = (t) => (t || "").replace(/\\s+/g, " ").trim();
+                return {
+                    text: norm(el.innerText),
+                    headings: Array.from(el.querySelectorAll("h2, h3")).map(h => h.tagName.toLowerCase() + ":" + norm(h.innerText)),
+                };
+            }""",
+            DZEN["body_editor"],
+        )
+
+    def _verify_block(self, block: dict, snapshot: Dict[str, Any]) -> Optional[str]:
+        """None — блок на месте; иначе описание проблемы."""
+        block_kind, text, list_items = self._parse_html_block(block)
+        parts = list_items if block_kind in ("ul", "ol") and list_items else [text]
+        for part in parts:
+            if _norm_space(part) and _norm_space(part) not in snapshot.get("text", ""):
+                return "текст не найден в редакторе после вставки"
+        if block_kind in ("h2", "h3") and f"{block_kind}:{_norm_space(text)}" not in snapshot.get("headings", []):
+            return f"формат {block_kind} не применён"
+        return None
+
+    async def _insert_blocks_bulk(
+        self,
+        content_blocks: List[dict],
+        block_results: Optional[list],
+        article_dir: Optional[Path],
+    ) -> None:
+        """
+        Пакетная вставка (ZEN_BULK_PASTE): подряд идущие текстовые блоки склеиваются в один
+        HTML и вставляются одним paste; картинки вставляются отдельно, по месту.
+        После вставки — проверка каждого текстового блока по DOM редактора (block_results).
+        Если пакет не вставился вовсе — этот пакет вставляется поблочно, как в обычном режиме.
+        """
+        # Сегменты: ("text", [(i, block), ...]) или ("image", [(i, block)])
+        segments: List[tuple] = []
+        for i, block in enumerate(content_blocks):
+            kind = "image" if block.get("type") == "image" else "text"
+            if kind == "text" and block.get("type") != "html":
+                continue
+            if kind == "text" and segments and segments[-1][0] == "text":
+                segments[-1][1].append((i, block))
+            else:
+                segments.append((kind, [(i, block)]))
+
+        results: Dict[int, Dict[str, Any]] = {}
+        text_blocks: List[tuple] = []
+        for seg_idx, (kind, items) in enumerate(segments):
+            if self.page.is_closed():
+                logger.error("Страница закрылась, прерываем вставку блоков")
+                break
+            if seg_idx > 0:
+                await self.page.keyboard.press("Enter")
+                await _human_wait(0.15, 0.3)
+            if kind == "image":
+                i, block = items[0]
+                span = self.tracer.start(f"block #{i + 1} (image)")
+                try:
+                    ok, err = await self._insert_image_block(block, i + 1, article_dir)
+                except Exception as e:
+                    ok, err = False, str(e)
+                self.tracer.end(span, error=err)
+                results[i] = {"i": i + 1, "type": "image", "label": _block_label(block), "success": ok, "error": err}
+                continue
+            span = self.tracer.start(f"paste #{items[0][0] + 1}–#{items[-1][0] + 1}", blocks=len(items))
+            payload = "".join(self._bulk_block_html(block) for _, block in items)
+            before = await self._editor_snapshot()
+            await self._paste_html(payload)
+            after = await self._editor_snapshot()
+            if len(after.get("text", "")) <= len(before.get("text", "")):
+                logger.warning("Пакетная вставка блоков #%s–#%s не сработала, вставляю поблочно", items[0][0] + 1, items[-1][0] + 1)
+                for j, (i, block) in enumerate(items):
+                    if j > 0:
+                        await self.page.keyboard.press("Enter")
+                        await _human_wait(0.15, 0.3)
+                    block_kind, text, list_items = self._parse_html_block(block)
+                    await self._insert_block_via_editor(
+                        block_kind,
+                        text,
+                        list_items=list_items,
+                        html_for_paste=block.get("content", "") if block_kind == "p_with_link" else None,
+                    )
+            else:
+                logger.info("Блоки #%s–#%s вставлены одним пакетом", items[0][0] + 1, items[-1][0] + 1)
+            self.tracer.end(span)
+            text_blocks.extend(items)
+
+        # Проверка по итоговому DOM (после картинок редактор мог перестроить блоки)
+        if text_blocks and not self.page.is_closed():
+            snapshot = await self._editor_snapshot()
+            for i, block in text_blocks:
+                err = self._verify_block(block, snapshot)
+                if err:
+                    logger.warning("Блок #%s (%s): %s", i + 1, _block_label(block), err)
+                results[i] = {"i": i + 1, "type": "html", "label": _block_label(block), "success": err is None, "error": err}
+        if block_results is not None:
+            block_results.extend(results[i] for i in sorted(results))
+
+    async def _insert_image_block(self, block: dict, n: int, article_dir: Optional[Path]) -> tuple[bool, Optional[str]]:
+        """Вставить блок-картинку (по URL или с диска). Возвращает (успех, ошибка)."""
+        img_path = block.get("path", "")
+        image_url = block.get("url")
+        # Вставка по URL (рекламный баннер и т.п.) — без локального файла
+        if image_url and str(image_url).strip().startswith("http"):
+            ok = await self._add_image_in_article(
+                "", block.get("caption"), image_url=image_url.strip()
+            )
+            if ok:
+                logger.info("Картинка #%s добавлена по URL", n)
+                return True, None
+            return False, "не вставлена по URL"
+        if not img_path:
+            return False, "нет path и нет url"
+        if article_dir:
+            p = article_dir / Path(img_path).name
+        else:
+            p = Path(img_path)
+            if not p.is_absolute():
+                p = PROJECT_ROOT / p
+            if not p.exists():
+                if (BLOCK_DIR / "articles" / p.name).exists():
+                    p = BLOCK_DIR / "articles" / p.name
+            if not p.exists() and not p.is_absolute():
+                p_alt = PROJECT_ROOT / block.get("path", "")
+                if p_alt.exists():
+                    p = p_alt
+        if not p.exists():
+            return False, f"файл не найден: {img_path}"
+        ok = await self._add_image_in_article(
+            str(p), block.get("caption"), image_url=block.get("url")
+        )
+        if ok:
+            logger.info("Картинка #%s добавлена", n)
+            return True, None
+        return False, "не вставлена (side button / file chooser)"
+
     async def _fill_caption_and_exit_image_block(self, caption_to_fill: str, wait_img: bool = True) -> None:
         """Заполнить подпись к картинке и выйти из блока. При необходимости дождаться img в DOM."""
         # LAST — берём последний (только что добавленный) input описания, а не первый!
@@ -1474,10 +1679,15 @@ class ZenClient:
 
     def _ensure_jpeg(self, image_path: str, label: str = "image") -> str:
         """ВСЕГДА конвертирует картинку в JPEG (Дзен проверяет магические байты, а не только MIME).
-        Если >3MB — дополнительно ресайзит до 1792x1024. Возвращает путь к .jpg файлу."""
+        Если >3MB — дополнительно ресайзит до 1792x1024. Возвращает путь к .jpg файлу.
+        Если для картинки есть готовый вариант zen (посчитан при генерации) — сразу он."""
         img_path = Path(image_path)
         if not img_path.exists():
             return image_path
+        prepared = self.zen_renditions.get(str(img_path.resolve()))
+        if prepared and Path(prepared).is_file():
+            logger.info("[%s] Готовый вариант для Дзена: %s", label, Path(prepared).name)
+            return prepared
         if not PIL_AVAILABLE:
             logger.warning("PIL не установлен — картинка идёт как есть: %s", image_path)
             return image_path
@@ -1589,6 +1799,7 @@ class ZenClient:
             except Exception as e:
                 logger.warning("Не удалось скачать обложку по URL: %s", e)
 
+        cover_span = self.tracer.start("cover_upload") if cover_path else None
         if cover_path:
             try:
                 await self.page.wait_for_timeout(3000)
@@ -1623,6 +1834,7 @@ class ZenClient:
                         logger.warning("Не удалось подготовить файл обложки (buffer)")
             except Exception as e:
                 logger.warning("Не удалось загрузить обложку: %s", e)
+        self.tracer.end(cover_span)
 
         # Только кнопки внутри модалки — чтобы не нажать главную «Опубликовать» дважды и не создать дубликат
         confirm_selectors = [
@@ -1638,6 +1850,7 @@ class ZenClient:
         for selector in confirm_selectors:
             btn = self.page.locator(selector).first
             if await btn.count() > 0 and await btn.is_visible():
+                confirm_span = self.tracer.start("publish_confirm")
                 await btn.click()
                 await self.page.wait_for_timeout(3000)
                 # Дождаться закрытия модалки, чтобы не было повторного клика и дубликата поста
@@ -1646,10 +1859,30 @@ class ZenClient:
                     await dialog.wait_for(state="detached", timeout=15000)
                 except Exception:
                     pass
+                self.tracer.end(confirm_span)
                 logger.info("Публикация подтверждена")
                 return
         logger.warning("Кнопка подтверждения публикации не найдена")
 
+def _zen_renditions(article: dict, article_path: Path) -> Dict[str, str]:
+    """
+    Готовые варианты картинок для Дзена. Статья без них (старая, из --file) получает их здесь
+    один раз: article.json дописывается, и повторные попытки берут готовые файлы.
+    """
+    article_dir = article_path.parent
+    try:
+        current = article.get("renditions") or {}
+        computed = renditions.build(article, article_dir)
+        if computed != current:
+            article["renditions"] = computed
+            data = json.loads(article_path.read_text(encoding="utf-8"))
+            data["renditions"] = computed
+            article_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    except Exception as e:
+        logger.warning("Варианты картинок не подготовлены (%s) — конвертация при загрузке", e)
+    return renditions.sources_map(article, article_dir, "zen")
+
+
 async def run_post_flow(
     article: dict,
     *,
@@ -1657,11 +1890,13 @@ async def run_post_flow(
     headless: bool = False,
     keep_open: bool = False,
     article_path: Optional[Path] = None,
+    trace_meta: Optional[dict] = None,
 ) -> tuple[int, str]:
     """
     Запуск: ZenClient.start → login → create_post → close.
     article: {"title", "content", "tags", "cover_image", "cover_image_url", "publish", ...}
     article_path: путь к article.json (если задан — картинки ищутся в той же папке).
+    trace_meta: при ZEN_TRACE=true сюда пишутся спаны фаз и пути к трассам (для metadata шага аналитики).
     Возвращает (exit_code, message). 0 — успех, 1 — не авторизован, 2 — ошибка поста, 3 — ошибка конфига.
     """
     title = (article.get("title") or "").strip()
@@ -1697,14 +1932,20 @@ async def run_post_flow(
     client.keep_open = keep_open or client.keep_open
 
     block_results = []  # чеклист по каждому блоку (заполняется в create_post при content_blocks)
+    failed = True
     try:
-        await client.start()
-        if not await client.login():
+        with client.tracer.span("browser_start"):
+            await client.start()
+        with client.tracer.span("login"):
+            logged_in = await client.login()
+        if not logged_in:
             await client.screenshot("error_login_failed")
             return 1, "Не удалось авторизоваться", block_results
 
         publish_flag = publish if publish else article.get("publish", True)
         article_dir = article_path.parent if article_path else None
+        if article_dir:
+            client.zen_renditions = _zen_renditions(article, article_path)
         cover = article.get("cover_image") or article.get("cover_image_url")
         if isinstance(cover, str) and cover.startswith("http"):
             cover_path = None
@@ -1725,6 +1966,7 @@ async def run_post_flow(
                     cover_path = str(p)
             cover_url = article.get("cover_image_url")
 
+        create_span = client.tracer.start("create_post")
         result = await client.create_post(
             title=title,
             content=content,
@@ -1737,13 +1979,34 @@ async def run_post_flow(
             block_results=block_results,
             article_dir=article_dir,
         )
+        client.tracer.end(create_span, error=None if result else "create_post вернул False")
         if result:
+            failed = False
+            # Свежие куки после публикации — сессия продлевается, кеш валидности обновляется
+            try:
+                await client.save_cookies()
+                zen_session.mark_session(True, "publish", Path(client.storage_state_path))
+            except Exception as e:
+                logger.warning("Не удалось сохранить cookies после публикации: %s", e)
             return 0, "Опубликовано", block_results
+        # Сбой мог быть из-за протухшей сессии — следующая попытка проверит её в браузере
+        zen_session.invalidate()
         return 2, "Ошибка создания поста", block_results
     except Exception as e:
         logger.exception("Ошибка при постинге: %s", e)
         return 2, str(e), block_results
     finally:
+        playwright_trace = await client.finish_playwright_trace(failed)
+        if client.tracer.enabled:
+            client.tracer.close_all(error="прервано")
+            trace_file = client.tracer.export("zen")
+            if trace_meta is not None:
+                trace_meta.update(client.tracer.to_metadata())
+                trace_meta["trace_file"] = trace_file
+                if playwright_trace:
+                    trace_meta["playwright_trace"] = playwright_trace
+        elif trace_meta is not None and playwright_trace:
+            trace_meta["playwright_trace"] = playwright_trace
         try:
             await client.close()
         except Exception:
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Профиль маршрутизации запросов для браузерной сессии Дзена (Playwright).
+
+- Блокирует трекеры/аналитику/рекламу (Метрика, apptracer, ads), шрифты и медиа со
+  сторонних хостов — редактору они не нужны, а страница без них грузится заметно быстрее.
+  Медиа с хостов Дзена/Яндекса (ZEN_FIRST_PARTY_MEDIA_HOSTS) не блокируется: через них
+  идёт загрузка и превью видео статьи (create_post(video=...)).
+- Опционально отдаёт статику редактора (js/css/svg с CDN Яндекса) из локального
+  дискового кеша ZEN_STATIC_CACHE_DIR: при повторных запусках браузер не качает её заново.
+
+Маршруты регистрируются по glob-шаблонам URL: сопоставление выполняет сам Playwright,
+в Python попадают только совпавшие запросы (никакого обработчика «на каждый запрос»).
+
+Настройки (.env):
+  ZEN_BLOCK_RESOURCES=true          — включить блокировку (по умолчанию включена)
+  ZEN_BLOCK_EXTRA_PATTERNS=...      — дополнительные glob-шаблоны через запятую
+  ZEN_FIRST_PARTY_MEDIA_HOSTS=...   — домены, медиа с которых не блокируется (через запятую)
+  ZEN_STATIC_CACHE_DIR=...          — папка кеша статики (пусто — кеш выключен)
+  ZEN_STATIC_CACHE_TTL=86400        — срок жизни записи кеша, сек (потом — запрос к CDN заново)
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+from playwright.async_api import BrowserContext, Route
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+BLOCK_RESOURCES = os.getenv("ZEN_BLOCK_RESOURCES", "true").lower() in ("1", "true", "yes")
+
+# Трекеры, аналитика и реклама
+TRACKER_PATTERNS = [
+    "**/mc.yandex.ru/**",
+    "**/mc.yandex.com/**",
+    "**/mc.webvisor.org/**",
+    "**/*apptracer*/**",
+    "**/an.yandex.ru/**",
+    "**/yandex.ru/ads/**",
+    "**/yabs.yandex.ru/**",
+    "**/strm.yandex.ru/**",
+    "**/top-fwz1.mail.ru/**",
+    "**/www.googletagmanager.com/**",
+    "**/www.google-analytics.com/**",
+]
+# Шрифты — для вставки текста и картинок в редактор не нужны
+FONT_PATTERNS = [
+    "**/*.{woff,woff2,ttf,otf,eot}",
+    "**/*.{woff,woff2,ttf,otf,eot}?*",
+]
+# Медиа (видео/аудио): блокируется только со сторонних хостов (см. _abort_third_party)
+MEDIA_PATTERNS = [
+    "**/*.{mp4,webm,m3u8,ts,mp3,ogg}",
+    "**/*.{mp4,webm,m3u8,ts,mp3,ogg}?*",
+]
+# Хосты Дзена/Яндекса (и их поддомены): видео статьи загружается и проигрывается с них
+FIRST_PARTY_MEDIA_HOSTS = tuple(
+    h.strip().lower().lstrip(".")
+    for h in os.getenv(
+        "ZEN_FIRST_PARTY_MEDIA_HOSTS", "dzen.ru,dzeninfra.ru,yandex.ru,yandex.net,yastatic.net",
+    ).split(",")
+    if h.strip()
+)
+# Статика редактора: имена файлов с хешем версии, кешировать безопасно
+STATIC_CACHE_PATTERNS = [
+    "**/yastatic.net/**/*.{js,css,svg}",
+    "**/*.dzeninfra.ru/**/*.{js,css,svg}",
+]
+STATIC_CACHE_TTL_SEC = int(os.getenv("ZEN_STATIC_CACHE_TTL", "86400"))
+# Заголовки, которые не переносятся из сохранённого ответа: тело хранится уже
+# распакованным, а длину и соединение выставляет сам Playwright
+STATIC_SKIP_HEADERS = frozenset({
+    "content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive",
+    "set-cookie", "date", "age", "alt-svc",
+})
+STATIC_CONTENT_TYPES = {
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".svg": "image/svg+xml",
+}
+
+
+def _extra_patterns() -> List[str]:
+    raw = os.getenv("ZEN_BLOCK_EXTRA_PATTERNS", "")
+    return [p.strip() for p in raw.split(",") if p.strip()]
+
+
+def _static_cache_dir() -> Optional[Path]:
+    raw = os.getenv("ZEN_STATIC_CACHE_DIR", "").strip()
+    if not raw:
+        return None
+    path = Path(raw) if os.path.isabs(raw) else PROJECT_ROOT / raw
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+async def _abort(route: Route) -> None:
+    await route.abort()
+
+
+def is_first_party(url: str, hosts=FIRST_PARTY_MEDIA_HOSTS) -> bool:
+    """URL на одном из hosts или его поддомене."""
+    host = (urlsplit(url).hostname or "").lower()
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+
+async def _abort_third_party(route: Route) -> None:
+    """Медиа со стороннего хоста — abort; с хоста Дзена — дальше по маршрутам (трекеры по-прежнему режутся)."""
+    if is_first_party(route.request.url):
+        await route.fallback()
+    else:
+        await route.abort()
+
+
+class StaticAssetCache:
+    """
+    Дисковый кеш статики: ключ — sha256 от URL, рядом .json с заголовками ответа
+    (CORS, timing-allow-origin и т.п. отдаются из кеша как были) и временем записи.
+    Записи старше ZEN_STATIC_CACHE_TTL запрашиваются заново.
+    """
+
+    def __init__(self, cache_dir: Path, ttl_sec: int = STATIC_CACHE_TTL_SEC):
+        self.cache_dir = cache_dir
+        self.ttl_sec = ttl_sec
+        self.hits = 0
+        self.misses = 0
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / key, self.cache_dir / f"{key}.json"
+
+    def _read(self, body_path: Path, meta_path: Path) -> Optional[dict]:
+        """Свежая запись кеша ({headers, body}) или None."""
+        if not (body_path.is_file() and meta_path.is_file()):
+            return None
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            headers = meta.get("headers")
+            # Записи старого формата (только content_type) и протухшие — промах
+            if not isinstance(headers, dict):
+                return None
+            if self.ttl_sec > 0 and time.time() - float(meta.get("stored_at") or 0) > self.ttl_sec:
+                return None
+            return {"headers": headers, "body": body_path.read_bytes()}
+        except (OSError, ValueError) as e:
+            logger.debug("Кеш статики: не прочитан %s: %s", body_path.name, e)
+            return None
+
+    async def handle(self, route: Route) -> None:
+        request = route.request
+        if request.method != "GET":
+            await route.fallback()
+            return
+        body_path, meta_path = self._paths(request.url)
+        cached = self._read(body_path, meta_path)
+        if cached is not None:
+            self.hits += 1
+            await route.fulfill(status=200, headers=cached["headers"], body=cached["body"])
+            return
+        self.misses += 1
+        try:
+            response = await route.fetch()
+        except Exception as e:
+            logger.debug("Кеш статики: fetch %s: %s", request.url[:120], e)
+            await route.fallback()
+            return
+        if response.status == 200:
+            try:
+                body = await response.body()
+                headers = {
+                    k.lower(): v for k, v in response.headers.items() if k.lower() not in STATIC_SKIP_HEADERS
+                }
+                if not headers.get("content-type"):
+                    ext = Path(request.url.split("?", 1)[0]).suffix.lower()
+                    headers["content-type"] = STATIC_CONTENT_TYPES.get(ext, "application/octet-stream")
+                tmp = body_path.with_suffix(".tmp")
+                tmp.write_bytes(body)
+                os.replace(tmp, body_path)
+                meta_tmp = meta_path.with_suffix(".json.tmp")
+                meta_tmp.write_text(
+                    json.dumps({"url": request.url, "headers": headers, "stored_at": time.time()}),
+                    encoding="utf-8",
+                )
+                os.replace(meta_tmp, meta_path)
+            except OSError as e:
+                logger.debug("Кеш статики: не записан %s: %s", request.url[:120], e)
+        await route.fulfill(response=response)
+
+
+async def install_routing(context: BrowserContext) -> Optional[StaticAssetCache]:
+    """
+    Регистрирует маршруты на контексте браузера. Возвращает кеш статики (для статистики
+    попаданий) или None, если кеш выключен.
+    """
+    blocked = 0
+    if BLOCK_RESOURCES:
+        for pattern in TRACKER_PATTERNS + FONT_PATTERNS + _extra_patterns():
+            await context.route(pattern, _abort)
+            blocked += 1
+        for pattern in MEDIA_PATTERNS:
+            await context.route(pattern, _abort_third_party)
+            blocked += 1
+    cache = None
+    cache_dir = _static_cache_dir()
+    if cache_dir is not None:
+        cache = StaticAssetCache(cache_dir)
+        for pattern in STATIC_CACHE_PATTERNS:
+            await context.route(pattern, cache.handle)
+    if blocked or cache:
+        logger.info(
+            "Маршрутизация запросов: блокируется шаблонов %d, кеш статики %s",
+            blocked, cache_dir if cache_dir else "выключен",
+        )
+    return cache
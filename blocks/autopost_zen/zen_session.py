@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Кеш валидности сессии Дзена (zen_storage_state.json).
+
+Проверка без браузера: сначала срок жизни куки Session_id в storage state, затем один
+HTTP-запрос к студии с этими куками (без редиректов) — редирект на passport значит,
+что сессия протухла. SPA студии отвечает 200 и без входа, поэтому 200 считается валидной
+сессией только при признаке входа в теле (ZEN_SESSION_LOGGED_IN_MARKERS); без признака —
+«неизвестно», и решает браузерный login() (перед слотом — сразу, в preflight). Результат кешируется в storage/zen_session_state.json на
+ZEN_SESSION_TTL сек и сбрасывается, если файл сессии изменился.
+
+ZenClient.login() пропускает навигацию по студии при валидной сессии; после успешной
+публикации куки сохраняются и сессия помечается валидной. Оркестратор за
+ZEN_SESSION_PREFLIGHT сек до слота проверяет сессию и при необходимости логинится заново.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_FILE = config.PROJECT_ROOT / "storage" / "zen_session_state.json"
+SESSION_TTL_SEC = int(os.getenv("ZEN_SESSION_TTL", "600"))
+SESSION_PREFLIGHT_SEC = int(os.getenv("ZEN_SESSION_PREFLIGHT", "3600"))
+SESSION_CHECK_URL = os.getenv("ZEN_SESSION_CHECK_URL", config.EDITOR_URL)
+SESSION_CHECK_TIMEOUT_SEC = 15
+# Признаки в HTML студии: залогинен / страница входа (через запятую, регистр не важен)
+LOGGED_IN_MARKERS = tuple(
+    m.strip().lower()
+    for m in os.getenv("ZEN_SESSION_LOGGED_IN_MARKERS", '"isAuthorized":true,"isLoggedIn":true,"is_logged_in":true').split(",")
+    if m.strip()
+)
+LOGGED_OUT_MARKERS = tuple(
+    m.strip().lower()
+    for m in os.getenv("ZEN_SESSION_LOGGED_OUT_MARKERS", '"isAuthorized":false,"isLoggedIn":false,passp-field-login').split(",")
+    if m.strip()
+)
+# Куки авторизации Яндекса: без живой Session_id студия отправит на passport
+AUTH_COOKIE_NAMES = ("Session_id", "sessionid2")
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def _storage_mtime(storage_state_path: Path) -> Optional[float]:
+    try:
+        return storage_state_path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _read_cache() -> Dict:
+    if not SESSION_CACHE_FILE.exists():
+        return {}
+    try:
+        data = json.loads(SESSION_CACHE_FILE.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def mark_session(valid: bool, reason: str = "", storage_state_path: Path = config.STORAGE_STATE_PATH) -> None:
+    """Записать результат проверки сессии (атомарно)."""
+    payload = {
+        "valid": bool(valid),
+        "reason": reason,
+        "checked_at": time.time(),
+        "storage_mtime": _storage_mtime(Path(storage_state_path)),
+    }
+    try:
+        SESSION_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SESSION_CACHE_FILE.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, SESSION_CACHE_FILE)
+    except OSError as e:
+        logger.warning("Не удалось записать %s: %s", SESSION_CACHE_FILE.name, e)
+
+
+def cached_session_valid(storage_state_path: Path = config.STORAGE_STATE_PATH) -> Optional[bool]:
+    """Результат из кеша, если он свежий и файл сессии с тех пор не менялся; иначе None."""
+    data = _read_cache()
+    if not data:
+        return None
+    if time.time() - float(data.get("checked_at") or 0) > SESSION_TTL_SEC:
+        return None
+    if data.get("storage_mtime") != _storage_mtime(Path(storage_state_path)):
+        return None
+    return bool(data.get("valid"))
+
+
+def _load_cookies(storage_state_path: Path) -> list:
+    try:
+        data = json.loads(Path(storage_state_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    cookies = data.get("cookies") if isinstance(data, dict) else None
+    return cookies if isinstance(cookies, list) else []
+
+
+def invalidate() -> None:
+    """Сбросить кеш: следующий login() проверит сессию заново."""
+    try:
+        SESSION_CACHE_FILE.unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.debug("Не удалось удалить %s: %s", SESSION_CACHE_FILE.name, e)
+
+
+def check_session(storage_state_path: Path = config.STORAGE_STATE_PATH) -> Tuple[Optional[bool], str]:
+    """
+    Лёгкая проверка сессии без браузера: (valid, причина).
+    valid=None — проверить не удалось (сеть, нет requests): решает браузерный login().
+    """
+    cookies = _load_cookies(Path(storage_state_path))
+    if not cookies:
+        return False, "нет файла сессии или куки"
+    now = time.time()
+    auth = [c for c in cookies if c.get("name") in AUTH_COOKIE_NAMES]
+    if not auth:
+        return False, "нет куки Session_id"
+    # expires = -1 — сессионная кука; иначе unix-время
+    if all(0 < float(c.get("expires") or -1) < now for c in auth):
+        return False, "кука Session_id истекла"
+    try:
+        import requests
+    except ImportError:
+        return None, "requests не установлен"
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    for c in cookies:
+        if c.get("name") and c.get("value") is not None:
+            session.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path") or "/")
+    try:
+        r = session.get(SESSION_CHECK_URL, allow_redirects=False, timeout=SESSION_CHECK_TIMEOUT_SEC)
+    except requests.RequestException as e:
+        return None, f"сеть: {e}"
+    location = (r.headers.get("Location") or "").lower()
+    if r.is_redirect and ("passport" in location or "auth" in location):
+        return False, "редирект на passport"
+    if r.status_code in (401, 403):
+        return False, f"HTTP {r.status_code}"
+    if r.status_code != 200:
+        return None, f"HTTP {r.status_code}"
+    return session_state_from_body(r.text)
+
+
+def session_state_from_body(body: str) -> Tuple[Optional[bool], str]:
+    """Валидность по HTML студии (ответ 200): признак входа / страницы входа, иначе None."""
+    text = (body or "").lower()
+    for marker in LOGGED_OUT_MARKERS:
+        if marker in text:
+            return False, f"HTTP 200, страница входа ({marker})"
+    for marker in LOGGED_IN_MARKERS:
+        if marker in text:
+            return True, f"HTTP 200, {marker}"
+    return None, "HTTP 200 без признака входа"
+
+
+def ensure_session_checked(storage_state_path: Path = config.STORAGE_STATE_PATH) -> Optional[bool]:
+    """Валидность сессии: из кеша, иначе лёгкая проверка с записью в кеш. None — неизвестно."""
+    cached = cached_session_valid(storage_state_path)
+    if cached is not None:
+        return cached
+    valid, reason = check_session(storage_state_path)
+    logger.info("Проверка сессии Дзена: %s (%s)", {True: "валидна", False: "невалидна"}.get(valid, "неизвестно"), reason)
+    if valid is not None:
+        mark_session(valid, reason, storage_state_path)
+    return valid
+
+
+async def refresh_session() -> bool:
+    """Полный вход через браузер (ZenClient.login сохраняет куки). Для предварительной проверки перед слотом."""
+    from .zen_client import ZenClient
+
+    try:
+        client = ZenClient()
+    except ValueError as e:
+        logger.error("%s", e)
+        return False
+    client.headless = True
+    client.keep_open = False
+    try:
+        await client.start()
+        return await client.login(use_cache=False)
+    finally:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+def preflight_session() -> bool:
+    """
+    Проверка перед слотом: при невалидной или неизвестной сессии — вход через браузер
+    (login(use_cache=False): открывает студию и при необходимости логинится заново).
+    Возвращает итоговую валидность (False — к слоту нужно обновить куки вручную).
+    """
+    valid, reason = check_session()
+    if valid:
+        mark_session(True, "preflight")
+        logger.info("Предварительная проверка сессии Дзена: валидна")
+        return True
+    if valid is None:
+        # Признаки входа в HTML не нашлись (или сеть) — до слота ещё есть время проверить в браузере
+        logger.info("Сессия Дзена без браузера не определена (%s) — проверка в браузере до слота", reason)
+    else:
+        logger.warning("Сессия Дзена невалидна (%s) — повторный вход до слота", reason)
+    ok = asyncio.run(refresh_session())
+    if not ok:
+        logger.error(
+            "Сессия Дзена невалидна и вход не удался. Обновите куки: python docs/scripts/scripts/capture_cookies.py"
+        )
+    return ok
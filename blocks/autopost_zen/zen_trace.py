@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Трассировка публикации в Дзен (опционально, ZEN_TRACE=true).
+
+Фазы run_post_flow/create_post (запуск браузера, логин, открытие редактора, каждый блок
+контента, обложка, теги, публикация) записываются как спаны с длительностью.
+Итог кладётся в metadata шага аналитики (publish_zen) и экспортируется в JSON формата
+Chrome trace-event (storage/zen_traces/*.json) — открывается в chrome://tracing или Perfetto.
+Дашборд отдаёт тот же формат по всем шагам запуска: GET /api/runs/{id}/trace.
+
+ZEN_TRACE_PLAYWRIGHT=true — дополнительно писать Playwright trace (скриншоты + DOM);
+zip сохраняется только для неудачных публикаций.
+Модуль без зависимостей от Playwright — его импортирует и дашборд.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+TRACES_DIR = PROJECT_ROOT / "storage" / "zen_traces"
+TRACE_ENABLED = os.getenv("ZEN_TRACE", "false").lower() in ("1", "true", "yes")
+PLAYWRIGHT_TRACE_ON_FAILURE = os.getenv("ZEN_TRACE_PLAYWRIGHT", "false").lower() in ("1", "true", "yes")
+
+
+class PublishTrace:
+    """Спаны одной публикации. При enabled=False все методы — no-op."""
+
+    def __init__(self, enabled: bool = TRACE_ENABLED):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._depth = 0
+        self.spans: List[Dict[str, Any]] = []
+
+    def start(self, name: str, **args: Any) -> Optional[Dict[str, Any]]:
+        """Открыть спан (для мест, где with-блок неудобен). Закрывать через end()."""
+        if not self.enabled:
+            return None
+        span = {
+            "name": name,
+            "start_ms": round((time.perf_counter() - self._t0) * 1000, 1),
+            "dur_ms": None,
+            "depth": self._depth,
+        }
+        if args:
+            span["args"] = args
+        self.spans.append(span)
+        self._depth += 1
+        return span
+
+    def end(self, span: Optional[Dict[str, Any]], error: Optional[str] = None) -> None:
+        if span is None or span["dur_ms"] is not None:
+            return
+        span["dur_ms"] = round((time.perf_counter() - self._t0) * 1000 - span["start_ms"], 1)
+        if error:
+            span.setdefault("args", {})["error"] = error[:300]
+        self._depth = max(0, self._depth - 1)
+
+    def close_all(self, error: Optional[str] = None) -> None:
+        """Закрыть незакрытые спаны (исключение посреди фазы) — чтобы они попали в трассу."""
+        for span in reversed(self.spans):
+            if span["dur_ms"] is None:
+                self.end(span, error=error)
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        span = self.start(name, **args)
+        try:
+            yield
+        except BaseException as e:
+            self.end(span, error=f"{type(e).__name__}: {e}")
+            raise
+        self.end(span)
+
+    def to_metadata(self) -> Dict[str, Any]:
+        """Компактный вид для metadata шага аналитики."""
+        return {"started_at": self.started_at, "spans": self.spans}
+
+    def export(self, label: str = "zen") -> Optional[str]:
+        """Сохранить Chrome trace-event JSON в storage/zen_traces/. Возвращает путь или None."""
+        if not self.enabled or not self.spans:
+            return None
+        try:
+            TRACES_DIR.mkdir(parents=True, exist_ok=True)
+            path = TRACES_DIR / f"{label}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started_at))}.json"
+            path.write_text(
+                json.dumps(spans_to_chrome_trace([(label, self.to_metadata())]), ensure_ascii=False),
+                encoding="utf-8",
+            )
+            return str(path)
+        except OSError as e:
+            logger.warning("Трасса не сохранена: %s", e)
+            return None
+
+
+def spans_to_chrome_trace(tracks: List[tuple]) -> Dict[str, Any]:
+    """
+    [(имя дорожки, {"started_at", "spans"}), ...] → {"traceEvents": [...]} (Chrome trace-event).
+    Каждая дорожка — отдельный tid; время — микросекунды от начала первой дорожки.
+    """
+    starts = [float(meta.get("started_at") or 0) for _, meta in tracks if meta]
+    base = min(starts) if starts else 0.0
+    events: List[Dict[str, Any]] = []
+    for tid, (track_name, meta) in enumerate(tracks, start=1):
+        if not meta:
+            continue
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track_name}})
+        offset_us = (float(meta.get("started_at") or base) - base) * 1_000_000
+        for span in meta.get("spans") or []:
+            if span.get("dur_ms") is None:
+                continue
+            event = {
+                "name": span.get("name", ""),
+                "ph": "X",
+                "pid": 1,
+                "tid": tid,
+                "ts": round(offset_us + float(span.get("start_ms") or 0) * 1000),
+                "dur": round(float(span["dur_ms"]) * 1000),
+            }
+            if span.get("args"):
+                event["args"] = span["args"]
+            events.append(event)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -9,7 +9,7 @@ import time
 import urllib.request
 from pathlib import Path
 
-from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile
+from fastapi import BackgroundTasks, FastAPI, File, HTTPException, Request, Response, UploadFile
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
@@ -20,7 +20,6 @@ logger = logging.getLogger(__name__)
 BLOCK_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BLOCK_DIR / "static"
 GENERATED_DIR = BLOCK_DIR / "generated"
-USERS_JSON = BLOCK_DIR / "users.json"
 
 # Загрузка .env из корня проекта (если есть)
 try:
@@ -41,6 +40,7 @@ from .auth import (
     get_generated_dir,
     get_uploaded_dir,
 )
+from . import user_names
 
 COOKIE_NAME = "grs_image_web_session"
 COOKIE_MAX_AGE = 30 * 24 * 3600
@@ -60,17 +60,11 @@ def _display_name_from_telegram_user(user: dict) -> str:
 
 
 def _save_user_display_name(telegram_id: int, display_name: str) -> None:
-    """Добавить/обновить имя пользователя в users.json для дашборда аналитики."""
+    """Добавить/обновить имя пользователя (кеш users.db → users.json для дашборда аналитики)."""
     try:
-        data = {}
-        if USERS_JSON.is_file():
-            with open(USERS_JSON, "r", encoding="utf-8") as f:
-                data = json.load(f) or {}
-        data[str(telegram_id)] = display_name
-        with open(USERS_JSON, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=0)
+        user_names.put_name(telegram_id, display_name)
     except Exception as e:
-        logger.warning("Не удалось сохранить users.json: %s", e)
+        logger.warning("Не удалось сохранить имя пользователя %s: %s", telegram_id, e)
 
 
 def _fetch_telegram_display_name(telegram_id: int) -> str | None:
@@ -96,24 +90,21 @@ def _fetch_telegram_display_name(telegram_id: int) -> str | None:
 
 
 def ensure_user_display_name(telegram_id: int) -> str | None:
-    """Если в users.json нет имени или оно пустое/равно ID — подтянуть через getChat и сохранить."""
+    """Имя из кеша; если его нет (и недавно не искали) — подтянуть через getChat и сохранить."""
     try:
-        data = {}
-        if USERS_JSON.is_file():
-            with open(USERS_JSON, "r", encoding="utf-8") as f:
-                data = json.load(f) or {}
-        current = (data.get(str(telegram_id)) or "").strip()
-        if current and current != str(telegram_id):
+        current = user_names.get_names([telegram_id]).get(str(telegram_id))
+        if current:
             return current
-        name = _fetch_telegram_display_name(telegram_id)
-        if name:
-            _save_user_display_name(telegram_id, name)
-            return name
+        return user_names.resolve_many([telegram_id], _fetch_telegram_display_name).get(str(telegram_id))
     except Exception as e:
         logger.warning("ensure_user_display_name %s: %s", telegram_id, e)
     return None
 
 
+class ResolveNamesRequest(BaseModel):
+    ids: list[str] = Field(default_factory=list, max_length=1000)
+
+
 class GenerateRequest(BaseModel):
     prompt: str = Field(..., min_length=1)
     refs: list[str] = Field(default_factory=list, max_length=5)
@@ -220,6 +211,14 @@ def api_config():
     return {"require_auth": REQUIRE_AUTH, "bot_username": BOT_USERNAME}
 
 
+@app.get("/api/grs/stats")
+def api_grs_stats():
+    """Счётчики клиента GRS AI в этом процессе: схлопнутые одинаковые запросы и состояние моделей."""
+    from blocks.ai_integrations.model_router import default_router
+    from blocks.ai_integrations.single_flight import default_group
+    return {"single_flight": default_group.stats(), "models": default_router.snapshot()}
+
+
 @app.post("/api/auth/telegram")
 async def api_auth_telegram(request: Request, response: Response):
     """Обработка данных от Telegram Login Widget: проверка подписи и установка cookie-сессии."""
@@ -278,6 +277,20 @@ def api_user_ensure_name(telegram_id: str):
     return {"telegram_id": telegram_id, "name": name}
 
 
+@app.post("/api/user/resolve_names")
+def api_user_resolve_names(body: ResolveNamesRequest, background_tasks: BackgroundTasks):
+    """
+    Пакетное разрешение имён для дашборда аналитики. Сразу отдаёт известные имена из кеша;
+    неизвестные/устаревшие id резолвятся в фоне (getChat параллельно, с лимитом частоты)
+    и попадают в users.json — дашборд увидит их при следующем обновлении.
+    """
+    ids = [i.strip() for i in body.ids if i and i.strip().isdigit()]
+    pending = user_names.stale_ids(ids)
+    if pending:
+        background_tasks.add_task(user_names.resolve_many, pending, _fetch_telegram_display_name)
+    return {"names": {k: v for k, v in user_names.get_names(ids).items() if v}, "pending": pending}
+
+
 @app.post("/api/improve-prompt")
 def api_improve_prompt(body: ImprovePromptRequest):
     """
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Имена пользователей Telegram для дашборда аналитики (Generation).
+
+Кеш в SQLite (users.db рядом с users.json): telegram_id → имя, статус и время проверки.
+- Имя найдено — запись свежая USER_NAME_TTL сек; не найдено (getChat без ответа) —
+  USER_NAME_NEGATIVE_TTL сек, чтобы не дёргать Bot API на каждый запрос сводки.
+- resolve_many() резолвит пачку id параллельно (USER_NAME_CONCURRENCY потоков) с общим
+  ограничением частоты запросов к Bot API (USER_NAME_RATE_PER_SEC) и записывает все
+  результаты одной транзакцией.
+- users.json — выгрузка для дашборда (он читает файл напрямую): перезаписывается один раз
+  на пачку, а не на каждого пользователя.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BLOCK_DIR = Path(__file__).resolve().parent
+USERS_DB = BLOCK_DIR / "users.db"
+USERS_JSON = BLOCK_DIR / "users.json"
+
+USER_NAME_TTL = int(os.getenv("USER_NAME_TTL", str(7 * 24 * 3600)))
+USER_NAME_NEGATIVE_TTL = int(os.getenv("USER_NAME_NEGATIVE_TTL", str(24 * 3600)))
+USER_NAME_CONCURRENCY = int(os.getenv("USER_NAME_CONCURRENCY", "4"))
+USER_NAME_RATE_PER_SEC = float(os.getenv("USER_NAME_RATE_PER_SEC", "20"))
+
+_lock = threading.Lock()
+_inflight: set = set()
+
+
+class _RateLimiter:
+    """Не чаще rate вызовов в секунду на все потоки."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiter = _RateLimiter(USER_NAME_RATE_PER_SEC)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(USERS_DB), timeout=10)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS user_names (
+               telegram_id TEXT PRIMARY KEY,
+               name TEXT,
+               status TEXT NOT NULL,
+               fetched_at REAL NOT NULL
+           )"""
+    )
+    if conn.execute("SELECT COUNT(*) FROM user_names").fetchone()[0] == 0:
+        _import_users_json(conn)
+    return conn
+
+
+def _import_users_json(conn: sqlite3.Connection) -> None:
+    """Первый запуск: перенести имена из существующего users.json."""
+    if not USERS_JSON.is_file():
+        return
+    try:
+        data = json.loads(USERS_JSON.read_text(encoding="utf-8")) or {}
+    except (OSError, ValueError):
+        return
+    now = time.time()
+    with conn:
+        for tid, name in data.items():
+            name = str(name or "").strip()
+            if name and name != str(tid):
+                conn.execute(
+                    "INSERT OR IGNORE INTO user_names (telegram_id, name, status, fetched_at) VALUES (?, ?, 'ok', ?)",
+                    (str(tid), name, now),
+                )
+
+
+def _export_users_json(conn: sqlite3.Connection) -> None:
+    """Выгрузить все известные имена в users.json (атомарно)."""
+    data = {tid: name for tid, name in conn.execute("SELECT telegram_id, name FROM user_names WHERE status = 'ok'")}
+    try:
+        tmp = USERS_JSON.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=0), encoding="utf-8")
+        os.replace(tmp, USERS_JSON)
+    except OSError as e:
+        logger.warning("Не удалось сохранить users.json: %s", e)
+
+
+def _is_fresh(status: str, fetched_at: float, now: float) -> bool:
+    ttl = USER_NAME_TTL if status == "ok" else USER_NAME_NEGATIVE_TTL
+    return now - fetched_at < ttl
+
+
+def get_names(ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Известные имена из кеша (без сетевых запросов): {id: имя или None}."""
+    ids = [str(i) for i in ids]
+    result: Dict[str, Optional[str]] = {i: None for i in ids}
+    if not ids:
+        return result
+    with _lock:
+        conn = _connect()
+        try:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for tid, name, status in conn.execute(
+                    f"SELECT telegram_id, name, status FROM user_names WHERE telegram_id IN ({marks})", chunk
+                ):
+                    if status == "ok":
+                        result[tid] = name
+        finally:
+            conn.close()
+    return result
+
+
+def stale_ids(ids: Iterable[str]) -> List[str]:
+    """id, для которых в кеше нет свежей записи (ни имени, ни недавней неудачной проверки)."""
+    ids = list(dict.fromkeys(str(i) for i in ids if str(i).isdigit() and str(i) != "0"))
+    if not ids:
+        return []
+    now = time.time()
+    fresh = set()
+    with _lock:
+        conn = _connect()
+        try:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for tid, status, fetched_at in conn.execute(
+                    f"SELECT telegram_id, status, fetched_at FROM user_names WHERE telegram_id IN ({marks})", chunk
+                ):
+                    if _is_fresh(status, fetched_at, now):
+                        fresh.add(tid)
+        finally:
+            conn.close()
+    return [i for i in ids if i not in fresh]
+
+
+def put_name(telegram_id: int, name: str) -> None:
+    """Сохранить имя, известное без запроса (например, из Telegram Login Widget)."""
+    put_names({str(telegram_id): name})
+
+
+def put_names(names: Dict[str, Optional[str]]) -> None:
+    """Записать пачку результатов (None — имя не найдено) одной транзакцией и обновить users.json."""
+    if not names:
+        return
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                for tid, name in names.items():
+                    ok = bool(name) and name != str(tid)
+                    if not ok:
+                        # Неудача не затирает уже известное имя
+                        conn.execute(
+                            """INSERT INTO user_names (telegram_id, name, status, fetched_at) VALUES (?, NULL, 'missing', ?)
+                               ON CONFLICT(telegram_id) DO UPDATE SET fetched_at = excluded.fetched_at
+                               WHERE user_names.status != 'ok'""",
+                            (str(tid), now),
+                        )
+                        continue
+                    conn.execute(
+                        """INSERT INTO user_names (telegram_id, name, status, fetched_at) VALUES (?, ?, 'ok', ?)
+                           ON CONFLICT(telegram_id) DO UPDATE SET
+                               name = excluded.name, status = 'ok', fetched_at = excluded.fetched_at""",
+                        (str(tid), name, now),
+                    )
+            _export_users_json(conn)
+        finally:
+            conn.close()
+
+
+def resolve_many(ids: Iterable[str], fetch: Callable[[int], Optional[str]]) -> Dict[str, Optional[str]]:
+    """
+    Резолвить устаревшие/неизвестные id через fetch(telegram_id) параллельно, с лимитом частоты.
+    id, которые уже резолвятся другим вызовом, пропускаются. Возвращает {id: имя или None}.
+    """
+    todo = stale_ids(ids)
+    with _lock:
+        todo = [i for i in todo if i not in _inflight]
+        _inflight.update(todo)
+    if not todo:
+        return {}
+
+    def _fetch(tid: str) -> Optional[str]:
+        _rate_limiter.wait()
+        try:
+            return fetch(int(tid))
+        except Exception as e:
+            logger.debug("Имя для %s не получено: %s", tid, e)
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, USER_NAME_CONCURRENCY), thread_name_prefix="user-names") as pool:
+            results = dict(zip(todo, pool.map(_fetch, todo)))
+        put_names(results)
+        logger.info(
+            "Имена пользователей: запрошено %d, найдено %d", len(todo), sum(1 for v in results.values() if v)
+        )
+        return results
+    finally:
+        with _lock:
+            _inflight.difference_update(todo)
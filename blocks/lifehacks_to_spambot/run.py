@@ -12,6 +12,7 @@
 """
 import argparse
 import asyncio
+import hashlib
 import html
 import json
 import logging
@@ -38,6 +39,10 @@ logger = logging.getLogger(__name__)
 
 # Лимит подписи Telegram
 MAX_CAPTION_LENGTH = 1024
+# Кэш «sha256 содержимого → Telegram file_id»: повторная отправка той же обложки без загрузки файла
+TELEGRAM_FILE_ID_CACHE_FILE = PROJECT_ROOT / "storage" / "telegram_file_ids.json"
+# Фрагменты текста BadRequest, означающие, что отклонён сам file_id (только тогда — загрузка заново)
+FILE_ID_ERROR_MARKERS = ("file identifier", "file_id", "file reference")
 
 
 def load_article(path: Path) -> Tuple[dict, Path]:
@@ -94,27 +99,108 @@ def get_cover_path(article_data: dict, article_dir: Path) -> Optional[Path]:
     return p if p.is_file() else None
 
 
+def get_telegram_photo(article_data: dict, article_dir: Path, cover_path: Path) -> Path:
+    """Обложка для отправки: готовый вариант telegram (renditions) или исходный файл."""
+    from blocks.autopost_zen import renditions
+    photo = renditions.lookup(article_data, article_dir, cover_path.name, "telegram")
+    if photo:
+        logger.info("Обложка для Telegram: готовый вариант %s", photo.name)
+    return photo or cover_path
+
+
+def _file_sha256(path: Path) -> str:
+    """sha256 содержимого файла (читаем крупными блоками)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _file_id_cache_key(bot_token: str, digest: str) -> str:
+    """file_id действителен только для бота, который его получил, — ключ включает id бота."""
+    bot_id = (bot_token or "").split(":", 1)[0]
+    return f"{bot_id}:{digest}"
+
+
+def load_file_id_cache() -> dict:
+    """Загружает кэш { "<bot_id>:<sha256>": file_id } из storage/telegram_file_ids.json."""
+    if not TELEGRAM_FILE_ID_CACHE_FILE.is_file():
+        return {}
+    try:
+        data = json.loads(TELEGRAM_FILE_ID_CACHE_FILE.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def save_file_id_cache(cache: dict) -> None:
+    """Атомарно сохраняет кэш file_id (через временный файл и replace)."""
+    try:
+        TELEGRAM_FILE_ID_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = TELEGRAM_FILE_ID_CACHE_FILE.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, TELEGRAM_FILE_ID_CACHE_FILE)
+    except Exception as e:
+        logger.warning("Не удалось сохранить кэш file_id: %s", e)
+
+
+def _is_file_id_error(error: Exception) -> bool:
+    """BadRequest относится к самому file_id («Wrong file identifier/http url specified», «Wrong remote file identifier», …)."""
+    text = str(error).lower()
+    return any(marker in text for marker in FILE_ID_ERROR_MARKERS)
+
+
 async def send_lifehack_post(
     bot_token: str,
     channel_id: str,
     photo_path: Path,
     caption: str,
 ) -> bool:
-    """Отправляет пост с фото и подписью в канал (увеличенный таймаут для больших обложек)."""
+    """Отправляет пост с фото и подписью в канал (увеличенный таймаут для больших обложек).
+    Если те же байты уже отправлялись этим ботом — используется сохранённый file_id без повторной загрузки."""
     from telegram import Bot
     from telegram.constants import ParseMode
+    from telegram.error import BadRequest
     from telegram.request import HTTPXRequest
 
     # Таймаут 120 с для загрузки крупных фото (обложка может быть 1–2 MB)
     request = HTTPXRequest(read_timeout=120, write_timeout=120)
     bot = Bot(token=bot_token, request=request)
+
+    cache = load_file_id_cache()
+    key = _file_id_cache_key(bot_token, _file_sha256(photo_path))
+    cached_file_id = cache.get(key)
+    if cached_file_id:
+        try:
+            await bot.send_photo(
+                chat_id=channel_id,
+                photo=cached_file_id,
+                caption=caption,
+                parse_mode=ParseMode.HTML,
+            )
+            logger.info("Обложка отправлена по file_id из кэша (без загрузки): %s", photo_path.name)
+            return True
+        except BadRequest as e:
+            if not _is_file_id_error(e):
+                # Ошибка не в file_id (подпись, разметка, канал) — повторная загрузка её не исправит
+                raise
+            # file_id устарел или недействителен — удаляем из кэша и загружаем файл заново
+            logger.warning("file_id из кэша отклонён Telegram (%s), загружаем файл", e)
+            cache.pop(key, None)
+            save_file_id_cache(cache)
+
     with open(photo_path, "rb") as f:
-        await bot.send_photo(
+        message = await bot.send_photo(
             chat_id=channel_id,
             photo=f,
             caption=caption,
             parse_mode=ParseMode.HTML,
         )
+    if message is not None and message.photo:
+        # Самый крупный размер — последний в списке PhotoSize
+        cache[key] = message.photo[-1].file_id
+        save_file_id_cache(cache)
     return True
 
 
@@ -172,7 +258,8 @@ def post_article_to_telegram_sync(
         logger.error("Обложка не найдена в %s", article_dir)
         return False, f"Обложка не найдена в {article_dir}"
     try:
-        asyncio.run(send_lifehack_post(bot_token, channel_id, cover_path, caption))
+        photo = get_telegram_photo(article_data, article_dir, cover_path)
+        asyncio.run(send_lifehack_post(bot_token, channel_id, photo, caption))
         logger.info("Пост в Telegram отправлен: %s", title[:50])
         return True, None
     except Exception as e:
@@ -198,14 +285,9 @@ def get_telegram_config(project_id: Optional[str]) -> Tuple[str, str]:
 
 
 def find_latest_publish_dir() -> Optional[Path]:
-    """Последняя по номеру папка в blocks/autopost_zen/publish/."""
-    publish = PROJECT_ROOT / "blocks" / "autopost_zen" / "publish"
-    if not publish.is_dir():
-        return None
-    dirs = [d for d in publish.iterdir() if d.is_dir() and d.name.isdigit()]
-    if not dirs:
-        return None
-    return max(dirs, key=lambda d: int(d.name))
+    """Последняя по номеру папка в blocks/autopost_zen/publish/ (из реестра публикаций, без скана папки)."""
+    from blocks.autopost_zen import publish_registry
+    return publish_registry.latest()
 
 
 def main() -> int:
@@ -262,7 +344,8 @@ def main() -> int:
         return 1
 
     try:
-        asyncio.run(send_lifehack_post(bot_token, channel_id, cover_path, caption))
+        photo = get_telegram_photo(article_data, article_dir, cover_path)
+        asyncio.run(send_lifehack_post(bot_token, channel_id, photo, caption))
         logger.info("Пост отправлен в %s", channel_id)
         return 0
     except Exception as e:
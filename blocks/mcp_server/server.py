@@ -121,6 +121,14 @@ def grs_models() -> dict:
     }
 
 
+@mcp.tool()
+def grs_stats() -> dict:
+    """Счётчики клиента GRS AI: схлопнутые одинаковые запросы (single-flight) и состояние моделей."""
+    from blocks.ai_integrations.model_router import default_router
+    from blocks.ai_integrations.single_flight import default_group
+    return {"success": True, "single_flight": default_group.stats(), "models": default_router.snapshot()}
+
+
 @mcp.tool()
 def grs_image(
     prompt: str,
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк конкурентности дашборда аналитики: прежние синхронные обработчики (def в
+общем threadpool Starlette, прокси через urlopen) против async-обработчиков (aio.py).
+
+Сценарий — локальный дашборд с ANALYTICS_SERVER_SERVICES_URL, когда удалённый сервер
+тормозит: пачка запросов лога разового прогона (прокси, ответ через --upstream-ms) и
+одновременно — запросы сводки /api/stats, которые читают только SQLite. Медленный upstream —
+локальный HTTP-сервер в отдельном потоке (ThreadingHTTPServer, keep-alive), БД — временная,
+запросы к дашборду идут через httpx.AsyncClient(transport=ASGITransport(app)) без uvicorn.
+
+- sync  — те же обработчики, объявленные через def (как до перевода на async):
+          прокси (urlopen) занимает поток из общего пула (40), /api/stats ждёт свободный поток;
+- async — приложение blocks/analytics/api.py: прокси через httpx.AsyncClient с пулом
+          соединений (ANALYTICS_UPSTREAM_CONNECTIONS), /api/stats идёт в пул БД.
+
+Запуск из корня проекта:
+  python docs/scripts/benchmark_dashboard_concurrency.py
+  python docs/scripts/benchmark_dashboard_concurrency.py --slow 64 --fast 50 --upstream-ms 1000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.request import Request as UrlRequest, urlopen
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+_TMP = tempfile.TemporaryDirectory(prefix="bench_dashboard_")
+os.environ["ANALYTICS_DB_PATH"] = str(Path(_TMP.name) / "analytics.db")
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+from blocks.analytics import api, db, response_cache
+
+LOG_PATH = "/api/server-services/orchestrator-kz/run-once-log"
+
+
+class _LocalPlatform:
+    """sys для api.py с platform != linux: дашборд проксирует на удалённый сервер."""
+
+    platform = "win32"
+
+    def __getattr__(self, name):
+        return getattr(sys, name)
+
+
+def _start_slow_upstream(delay_sec: float) -> str:
+    """Медленный «удалённый дашборд»: отвечает на любой GET через delay_sec. Возвращает базовый URL."""
+    body = b"log line\n" * 50
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: пул httpx переиспользует соединения
+
+        def do_GET(self):
+            time.sleep(delay_sec)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 256  # backlog listen(): по умолчанию 5, пачка соединений упиралась бы в него
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, name="slow-upstream", daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["ANALYTICS_SERVER_SERVICES_URL"] = base
+    api.sys = _LocalPlatform()
+    return base
+
+
+def _seed_db(runs: int) -> None:
+    conn = db.get_connection(db.DEFAULT_PROJECT)
+    try:
+        conn.executemany(
+            "INSERT INTO runs (started_at, finished_at, status, topic, source, channel) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (f"2026-10-{1 + i % 28:02d}T10:00:00", f"2026-10-{1 + i % 28:02d}T10:05:00",
+                 "completed" if i % 5 else "failed", f"Тема {i}", "schedule", "zen,telegram")
+                for i in range(runs)
+            ],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_sync_app() -> FastAPI:
+    """Базовая линия: те же вызовы, что в api.py до async (обработчики def)."""
+    app = FastAPI()
+
+    @app.get("/api/stats")
+    def stats(request: Request):
+        proj = api._project_from_request(request, None, allow_all=True)
+
+        def _compute():
+            conn = api._get_conn(proj)
+            try:
+                return db.get_stats(conn)
+            finally:
+                conn.close()
+
+        return response_cache.cached_json(request, proj, "bench_stats", (None,), _compute)
+
+    @app.get(LOG_PATH, response_class=PlainTextResponse)
+    def run_once_log(request: Request):
+        # Прокси до перевода на httpx: блокирующий urlopen в потоке обработчика
+        req = UrlRequest(api._remote_base() + LOG_PATH, headers={"Accept": "text/plain"})
+        with urlopen(req, timeout=10) as r:
+            body = r.read()
+        return PlainTextResponse(body.decode("utf-8", errors="replace"))
+
+    return app
+
+
+async def _timed_get(client: httpx.AsyncClient, path: str) -> float:
+    started = time.perf_counter()
+    r = await client.get(path)
+    r.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run_scenario(app, slow: int, fast: int, fast_delay_sec: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://dashboard", timeout=120) as client:
+        await client.get("/api/stats")  # прогрев кеша ответа и соединения с БД
+        started = time.perf_counter()
+        slow_tasks = [asyncio.create_task(_timed_get(client, LOG_PATH)) for _ in range(slow)]
+        await asyncio.sleep(fast_delay_sec)  # медленные уже заняли пул
+        fast_lat = await asyncio.gather(*(_timed_get(client, "/api/stats") for _ in range(fast)))
+        fast_done = time.perf_counter() - started
+        slow_lat = await asyncio.gather(*slow_tasks)
+        total = time.perf_counter() - started
+    await api.aio.REMOTE.aclose()
+    fast_sorted = sorted(fast_lat)
+    return {
+        "stats_p50": statistics.median(fast_sorted),
+        "stats_p95": fast_sorted[max(0, int(len(fast_sorted) * 0.95) - 1)],
+        "stats_done": fast_done,
+        "proxy_max": max(slow_lat),
+        "total": total,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Дашборд: sync-обработчики vs async с пулами aio.py")
+    ap.add_argument("--slow", type=int, default=48, help="одновременных запросов к медленному upstream")
+    ap.add_argument("--fast", type=int, default=40, help="запросов /api/stats во время них")
+    ap.add_argument("--upstream-ms", type=int, default=500, help="задержка заглушки upstream, мс")
+    ap.add_argument("--runs", type=int, default=2000, help="запусков во временной БД")
+    args = ap.parse_args()
+
+    _start_slow_upstream(args.upstream_ms / 1000)
+    _seed_db(args.runs)
+    print(
+        f"upstream {args.upstream_ms} мс, медленных {args.slow}, /api/stats {args.fast}, "
+        f"соединений upstream (async) {api.aio.REMOTE.limit}, пул БД {api.aio.DB_WORKERS}"
+    )
+    print(f"{'режим':<6} {'stats p50, мс':>14} {'stats p95, мс':>14} {'все stats, мс':>14} {'прокси max, мс':>15} {'итого, мс':>10}")
+    for name, app in (("sync", build_sync_app()), ("async", api.app)):
+        res = asyncio.run(run_scenario(app, args.slow, args.fast, fast_delay_sec=0.05))
+        print(
+            f"{name:<6} {res['stats_p50'] * 1000:>14.1f} {res['stats_p95'] * 1000:>14.1f} "
+            f"{res['stats_done'] * 1000:>14.1f} {res['proxy_max'] * 1000:>15.1f} {res['total'] * 1000:>10.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк разбора HTML статьи на блоки: прежнее регулярное выражение
+(ArticleGenerator._parse_html_fragments_to_blocks до html_blocks) против токенизатора
+blocks/autopost_zen/html_blocks.py на входах от 100 КБ, в том числе «враждебных» для регулярки:
+- article         — обычная статья (h2/p/ul), повторённая до нужного размера;
+- unclosed        — тысячи открытых <p> без закрывающих (обрыв/мусор в ответе модели):
+                    ленивый .*? на каждый <p> просматривает весь хвост — квадратичное время;
+- nested_div      — глубоко вложенные <div> с <p> (регулярка ещё и режет блоки неверно);
+- attr_soup       — теги с длинными атрибутами и «>» в значениях.
+
+Запуск из корня проекта:
+  python docs/scripts/benchmark_html_blocks.py            # 100 КБ
+  python docs/scripts/benchmark_html_blocks.py --kb 400   # размер входа
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from blocks.autopost_zen.html_blocks import parse_blocks
+
+OLD_PATTERN = re.compile(
+    r'(<(?:h[23]|p|ul|ol|blockquote|div|table|details)[^>]*>.*?</(?:h[23]|p|ul|ol|blockquote|div|table|details)>)',
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def _repeat(unit: str, size: int) -> str:
+    return unit * (size // len(unit) + 1)
+
+
+def make_inputs(size: int) -> dict:
+    article = _repeat(
+        "<h2>Как выбрать мебель</h2>\n<p>Текст абзаца с <b>жирным</b> и <a href=\"https://flowcabinet.ru\">ссылкой</a>.</p>\n"
+        "<ul><li>Пункт один</li><li>Пункт два</li></ul>\n",
+        size,
+    )
+    depth = 200
+    nested = _repeat("<div>" * depth + "<p>глубоко</p>" + "</div>" * depth + "\n", size)
+    return {
+        "article": article,
+        "unclosed": _repeat("<p>абзац без закрывающего тега ", size),
+        "nested_div": nested,
+        "attr_soup": _repeat('<p data-x="' + "a>b " * 50 + '">текст</p><span>' + "x" * 200 + "</span>", size),
+    }
+
+
+def _time(fn, text: str, repeat: int) -> tuple[float, int]:
+    best, count = float("inf"), 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = len(fn(text))
+        best = min(best, time.perf_counter() - started)
+    return best, count
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Регулярка vs html_blocks на больших входах")
+    ap.add_argument("--kb", type=int, default=100, help="размер каждого входа, КБ (по умолчанию 100)")
+    ap.add_argument("--repeat", type=int, default=3, help="повторов, берётся лучшее время")
+    args = ap.parse_args()
+    size = args.kb * 1024
+
+    print(f"{'вход':<12} {'КБ':>6} {'regex, мс':>11} {'блоков':>7} {'parser, мс':>11} {'блоков':>7}")
+    for name, text in make_inputs(size).items():
+        kb = len(text.encode("utf-8")) // 1024
+        old_sec, old_blocks = _time(OLD_PATTERN.findall, text, args.repeat)
+        new_sec, new_blocks = _time(parse_blocks, text, args.repeat)
+        print(f"{name:<12} {kb:>6} {old_sec * 1000:>11.1f} {old_blocks:>7} {new_sec * 1000:>11.1f} {new_blocks:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,6 +22,11 @@ Backup Manager - система управления бекапами блоко
     
     # Сравнить текущую версию с бекапом
     python scripts/backup_manager.py diff <backup_id>
+
+Хранилище: содержимое файлов лежит один раз в objects/<2 символа>/<sha256>
+(content-addressed). Одинаковые файлы и неизменённые файлы при повторном бекапе блока
+не копируются заново — новый снапшот блока ссылается на уже сохранённые объекты.
+Старые бекапы (backup_NNNN/ с MD5) читаются и восстанавливаются как раньше.
 """
 
 import os
@@ -29,9 +34,14 @@ import sys
 import json
 import shutil
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+HASH_ALGO = "sha256"
+READ_BUFFER_SIZE = 1024 * 1024  # 1 MB
+MAX_WORKERS = min(8, (os.cpu_count() or 2) * 2)
 
 
 class BackupManager:
@@ -51,6 +61,7 @@ class BackupManager:
         
         self.project_root = Path(project_root)
         self.backups_dir = self.project_root / "docs" / "backups" / "backups"
+        self.objects_dir = self.backups_dir / "objects"
         self.metadata_file = self.backups_dir / "metadata.json"
         
         # Создаем директорию для бекапов если её нет
@@ -58,26 +69,102 @@ class BackupManager:
         
         # Загружаем метаданные
         self.metadata = self._load_metadata()
+        self._rebuild_index()
     
     def _load_metadata(self) -> Dict:
         """Загрузка метаданных бекапов"""
         if self.metadata_file.exists():
             with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"backups": [], "next_id": 1}
+                metadata = json.load(f)
+        else:
+            metadata = {"backups": [], "next_id": 1}
+        metadata.setdefault("snapshots", [])
+        return metadata
     
     def _save_metadata(self):
-        """Сохранение метаданных"""
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
+        """Сохранение метаданных (через временный файл, чтобы не оставить битый JSON)"""
+        tmp_file = self.metadata_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             json.dump(self.metadata, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.metadata_file)
+    
+    def _rebuild_index(self):
+        """Индексы: backup_id → бекап и (путь, хеш) → бекап, вместо линейного поиска по списку"""
+        self._by_id: Dict[str, Dict] = {}
+        self._by_path_hash: Dict[Tuple[str, str], Dict] = {}
+        for backup in self.metadata["backups"]:
+            self._index(backup)
     
-    def _get_file_hash(self, filepath: Path) -> str:
-        """Получение MD5 хеша файла"""
-        md5 = hashlib.md5()
+    def _index(self, backup: Dict):
+        self._by_id[backup["backup_id"]] = backup
+        self._by_path_hash.setdefault((backup["file_path"], backup["file_hash"]), backup)
+    
+    def _get_file_hash(self, filepath: Path, algo: str = HASH_ALGO) -> str:
+        """Получение хеша файла (sha256 по умолчанию; md5 — для старых бекапов)"""
+        h = hashlib.new(algo)
         with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                md5.update(chunk)
-        return md5.hexdigest()
+            for chunk in iter(lambda: f.read(READ_BUFFER_SIZE), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    
+    def _object_path(self, file_hash: str) -> Path:
+        return self.objects_dir / file_hash[:2] / file_hash
+    
+    def _store_file(self, source_file: Path) -> Tuple[str, int, Path]:
+        """
+        Хеширует файл и кладёт его в хранилище объектов, если такого содержимого там ещё нет.
+        Безопасно вызывать из нескольких потоков: запись через временный файл и os.replace.
+        
+        Returns:
+            (хеш, размер, путь к объекту)
+        """
+        file_hash = self._get_file_hash(source_file)
+        obj = self._object_path(file_hash)
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp = obj.with_name(f"{obj.name}.{os.getpid()}.{id(source_file)}.tmp")
+            shutil.copy2(source_file, tmp)
+            os.replace(tmp, obj)
+        return file_hash, source_file.stat().st_size, obj
+    
+    def _register_backup(
+        self,
+        rel_path: str,
+        source_file: Path,
+        file_hash: str,
+        file_size: int,
+        obj: Path,
+        description: str,
+        tags: Optional[List[str]],
+    ) -> Tuple[Dict, bool]:
+        """
+        Добавляет запись бекапа в метаданные (без сохранения на диск).
+        Если для этого пути уже есть бекап с таким же содержимым — возвращает его.
+        
+        Returns:
+            (бекап, создан_ли_новый)
+        """
+        existing = self._by_path_hash.get((rel_path, file_hash))
+        if existing is not None:
+            return existing, False
+        
+        backup_id = f"backup_{self.metadata['next_id']:04d}"
+        self.metadata['next_id'] += 1
+        backup_info = {
+            "backup_id": backup_id,
+            "file_path": rel_path,
+            "file_name": source_file.name,
+            "file_hash": file_hash,
+            "hash_algo": HASH_ALGO,
+            "file_size": file_size,
+            "description": description,
+            "tags": tags or [],
+            "created_at": datetime.now().isoformat(),
+            "backup_file": str(obj.relative_to(self.project_root)).replace('\\', '/')
+        }
+        self.metadata["backups"].append(backup_info)
+        self._index(backup_info)
+        return backup_info, True
     
     def _normalize_path(self, filepath: str) -> str:
         """Нормализация пути относительно корня проекта"""
@@ -111,53 +198,13 @@ class BackupManager:
         if not source_file.exists():
             raise FileNotFoundError(f"Файл не найден: {source_file}")
         
-        # Получаем хеш файла
-        file_hash = self._get_file_hash(source_file)
-        
-        # Проверяем, не создан ли уже бекап с таким же хешем
-        for backup in self.metadata["backups"]:
-            if backup["file_path"] == rel_path and backup["file_hash"] == file_hash:
-                print(f"[!] Бекап с таким же содержимым уже существует: {backup['backup_id']}")
-                return backup
-        
-        # Генерируем ID бекапа
-        backup_id = f"backup_{self.metadata['next_id']:04d}"
-        self.metadata['next_id'] += 1
-        
-        # Создаем директорию для бекапа
-        backup_dir = self.backups_dir / backup_id
-        backup_dir.mkdir(exist_ok=True)
-        
-        # Копируем файл
-        backup_file = backup_dir / source_file.name
-        shutil.copy2(source_file, backup_file)
-        
-        # Получаем размер файла
-        file_size = source_file.stat().st_size
-        
-        # Создаем метаданные бекапа
-        backup_info = {
-            "backup_id": backup_id,
-            "file_path": rel_path,
-            "file_name": source_file.name,
-            "file_hash": file_hash,
-            "file_size": file_size,
-            "description": description,
-            "tags": tags or [],
-            "created_at": datetime.now().isoformat(),
-            "backup_file": str(backup_file.relative_to(self.project_root)).replace('\\', '/')
-        }
-        
-        # Сохраняем метаданные бекапа в отдельный файл
-        backup_meta_file = backup_dir / "metadata.json"
-        with open(backup_meta_file, 'w', encoding='utf-8') as f:
-            json.dump(backup_info, f, indent=2, ensure_ascii=False)
-        
-        # Добавляем в общие метаданные
-        self.metadata["backups"].append(backup_info)
+        file_hash, file_size, obj = self._store_file(source_file)
+        backup, created = self._register_backup(rel_path, source_file, file_hash, file_size, obj, description, tags)
+        if not created:
+            print(f"[!] Бекап с таким же содержимым уже существует: {backup['backup_id']}")
+            return backup
         self._save_metadata()
-        
-        return backup_info
+        return backup
     
     def create_block_backup(self, block_path: str, description: str = "", tags: List[str] = None) -> List[Dict]:
         """
@@ -180,16 +227,49 @@ class BackupManager:
             tags.append(rel_path.split("/")[-1])
         if "block" not in tags:
             tags.append("block")
+        files = [f for f in sorted(block_dir.iterdir()) if f.is_file() and not f.name.startswith(".")]
+        
+        # Хеширование и копирование в хранилище объектов — параллельно
+        def _prepare(f: Path):
+            try:
+                return f, self._store_file(f), None
+            except Exception as e:
+                return f, None, e
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            prepared = list(pool.map(_prepare, files))
+        
+        # Регистрация — в одном потоке, метаданные пишутся один раз на весь снапшот
         created = []
-        for f in sorted(block_dir.iterdir()):
-            if f.is_file() and not f.name.startswith("."):
-                file_rel = (block_dir / f.name).relative_to(self.project_root)
-                file_rel_str = str(file_rel).replace("\\", "/")
-                try:
-                    backup = self.create_backup(file_rel_str, description or f"Block backup: {rel_path}", tags)
-                    created.append(backup)
-                except Exception as e:
-                    print(f"[!] Пропуск {f.name}: {e}")
+        snapshot_files = {}
+        reused = 0
+        for f, stored, error in prepared:
+            if error is not None:
+                print(f"[!] Пропуск {f.name}: {error}")
+                continue
+            file_rel_str = str(f.relative_to(self.project_root)).replace("\\", "/")
+            file_hash, file_size, obj = stored
+            backup, is_new = self._register_backup(
+                file_rel_str, f, file_hash, file_size, obj,
+                description or f"Block backup: {rel_path}", tags,
+            )
+            snapshot_files[file_rel_str] = backup["backup_id"]
+            if is_new:
+                created.append(backup)
+            else:
+                reused += 1
+        
+        # Снапшот блока ссылается и на новые, и на неизменённые бекапы
+        self.metadata["snapshots"].append({
+            "snapshot_id": f"snapshot_{len(self.metadata['snapshots']) + 1:04d}",
+            "block_path": rel_path,
+            "description": description,
+            "created_at": datetime.now().isoformat(),
+            "files": snapshot_files,
+        })
+        self._save_metadata()
+        if reused:
+            print(f"[i] Без изменений (ссылки на существующие бекапы): {reused} файлов")
         return created
     
     def list_backups(self, filepath: Optional[str] = None, tags: Optional[List[str]] = None) -> List[Dict]:
@@ -229,10 +309,7 @@ class BackupManager:
         Returns:
             Информация о бекапе или None
         """
-        for backup in self.metadata["backups"]:
-            if backup["backup_id"] == backup_id:
-                return backup
-        return None
+        return self._by_id.get(backup_id)
     
     def restore_backup(self, backup_id: str, create_backup_before: bool = True) -> bool:
         """
@@ -286,13 +363,23 @@ class BackupManager:
         if not backup:
             raise ValueError(f"Бекап не найден: {backup_id}")
         
-        # Удаляем директорию бекапа
+        # Удаляем директорию бекапа (старый формат backup_NNNN/)
         backup_dir = self.backups_dir / backup_id
         if backup_dir.exists():
             shutil.rmtree(backup_dir)
         
-        # Удаляем из метаданных
+        # Удаляем из метаданных и снапшотов
         self.metadata["backups"] = [b for b in self.metadata["backups"] if b["backup_id"] != backup_id]
+        for snapshot in self.metadata["snapshots"]:
+            snapshot["files"] = {p: bid for p, bid in snapshot["files"].items() if bid != backup_id}
+        self._rebuild_index()
+        
+        # Объект удаляем, только если на него больше не ссылается ни один бекап
+        if backup.get("hash_algo") == HASH_ALGO:
+            still_used = any(b["backup_file"] == backup["backup_file"] for b in self.metadata["backups"])
+            obj = self.project_root / backup["backup_file"]
+            if not still_used and obj.exists():
+                obj.unlink()
         self._save_metadata()
         
         return True
@@ -321,7 +408,7 @@ class BackupManager:
             }
         
         # Сравниваем хеши
-        current_hash = self._get_file_hash(current_file)
+        current_hash = self._get_file_hash(current_file, backup.get("hash_algo", "md5"))
         backup_hash = backup["file_hash"]
         
         if current_hash == backup_hash:
@@ -3,15 +3,28 @@
 """
 Webhook сервер для GitHub деплоя.
 Поддержка main (production) и dev (staging): push в main → prod, push в dev → staging.
-Порт: WEBHOOK_PORT (по умолчанию 3000). Endpoints: GET /health, POST /webhook.
+Порт: WEBHOOK_PORT (по умолчанию 3000). Endpoints: GET /health, POST /webhook,
+GET /deploys (очередь и история деплоев с таймингами фаз и логом), GET /deploys/<id>.
+
+POST /webhook отвечает сразу (202), деплой выполняет отдельный поток: серия push'ей в одну
+ветку за DEPLOY_COALESCE_SEC схлопывается в один деплой, сервисы перезапускаются параллельно.
+Сам вебхук после деплоя main перезапускается, только когда очередь пуста и ни один деплой не идёт.
+Очередь и история деплоев сохраняются в storage/webhook_deploys.json: /deploys/<id> переживает
+перезапуск, ожидавшие деплои после него выполняются.
 """
 import json
 import logging
 import os
 import subprocess
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 import hmac
 import hashlib
 
@@ -21,11 +34,15 @@ SECRET_TOKEN = os.getenv('GITHUB_WEBHOOK_SECRET', '')  # Секрет из GitHu
 PROJECT_DIR = Path(__file__).resolve().parent
 PROJECT_DIR_STAGING = os.getenv('PROJECT_DIR_STAGING', '')  # Путь к staging (dev), пусто = отключено
 LOG_FILE = PROJECT_DIR / 'storage' / 'webhook.log'
+DEPLOY_STATE_FILE = PROJECT_DIR / 'storage' / 'webhook_deploys.json'
 
 # Ветки и окружения: ref -> (project_dir, services)
 DEPLOY_MAIN_DIR = PROJECT_DIR
 DEPLOY_MAIN_SERVICES = ['analytics-dashboard', 'grs-image-web', 'zen-schedule']
 DEPLOY_STAGING_SERVICES = ['analytics-dashboard-staging', 'grs-image-web-staging']
+# Пауза перед стартом деплоя: push'и в ту же ветку за это время объединяются в один деплой
+DEPLOY_COALESCE_SEC = float(os.getenv('DEPLOY_COALESCE_SEC', '5'))
+DEPLOY_HISTORY_SIZE = 20
 
 # Директория для логов должна существовать до настройки FileHandler
 LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
@@ -41,10 +58,376 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class DeployJob:
+    """Один деплой ветки: статус, сколько push'ей в него схлопнуто, тайминги фаз и лог."""
+
+    _ids = 0
+    _ids_lock = threading.Lock()
+
+    def __init__(self, project_dir: Path, branch: str, services: list, env_name: str, ref: str, job_id: int | None = None):
+        with DeployJob._ids_lock:
+            DeployJob._ids = max(DeployJob._ids + 1, job_id or 0)
+            self.id = job_id or DeployJob._ids
+        self.project_dir = project_dir
+        self.branch = branch
+        self.services = list(services)
+        self.env_name = env_name
+        self.ref = ref
+        self.status = 'queued'  # queued | running | success | failed
+        self.pushes = 1
+        self.commits: list[str] = []
+        self.queued_at = time.time()
+        self.not_before = self.queued_at + DEPLOY_COALESCE_SEC
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.phases: list[dict] = []
+        self.log_lines: list[str] = []
+        self.error: str | None = None
+        self.restart_webhook = False  # деплой обновил код самого вебхука — перезапустить, когда очередь опустеет
+
+    def log(self, message: str, level: int = logging.INFO) -> None:
+        logger.log(level, "[deploy #%s %s] %s", self.id, self.env_name, message)
+        self.log_lines.append(f"{datetime.now().strftime('%H:%M:%S')} {message}")
+
+    @contextmanager
+    def phase(self, name: str):
+        """Фаза деплоя с замером длительности (git_pull, pip_install, restart_services, ...)."""
+        started = time.monotonic()
+        entry = {'name': name, 'ok': True}
+        try:
+            yield
+        except Exception:
+            entry['ok'] = False
+            raise
+        finally:
+            entry['seconds'] = round(time.monotonic() - started, 2)
+            self.phases.append(entry)
+
+    def to_dict(self, with_log: bool = True) -> dict:
+        def _iso(ts):
+            return datetime.fromtimestamp(ts).isoformat(timespec='seconds') if ts else None
+        d = {
+            'id': self.id,
+            'env': self.env_name,
+            'branch': self.branch,
+            'status': self.status,
+            'pushes': self.pushes,
+            'commits': self.commits,
+            'queued_at': _iso(self.queued_at),
+            'started_at': _iso(self.started_at),
+            'finished_at': _iso(self.finished_at),
+            'duration_sec': round(self.finished_at - self.started_at, 2) if self.started_at and self.finished_at else None,
+            'phases': self.phases,
+            'error': self.error,
+        }
+        if with_log:
+            d['log'] = self.log_lines
+        return d
+
+    def to_state(self) -> dict:
+        """Всё для восстановления после перезапуска вебхука (формат storage/webhook_deploys.json)."""
+        return {
+            **self.to_dict(),
+            'project_dir': str(self.project_dir),
+            'services': self.services,
+            'ref': self.ref,
+            'not_before': self.not_before,
+            'times': [self.queued_at, self.started_at, self.finished_at],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'DeployJob':
+        job = cls(Path(state['project_dir']), state['branch'], state['services'], state['env'], state['ref'], job_id=state['id'])
+        job.status = state['status']
+        job.pushes = state.get('pushes', 1)
+        job.commits = state.get('commits') or []
+        job.queued_at, job.started_at, job.finished_at = state['times']
+        job.not_before = state.get('not_before') or job.queued_at
+        job.phases = state.get('phases') or []
+        job.log_lines = state.get('log') or []
+        job.error = state.get('error')
+        return job
+
+
+class DeployQueue:
+    """
+    Очередь деплоев с одним рабочим потоком. Push в ветку, для которой деплой ещё ждёт
+    старта, не создаёт новый деплой — увеличивает счётчик pushes у ожидающего.
+    Push во время идущего деплоя ставит новый (идущий мог уже сделать git pull).
+
+    Состояние (ожидающие, идущий, история) пишется в DEPLOY_STATE_FILE при каждом изменении
+    и читается при старте: ожидавшие деплои выполняются, прерванный перезапуском — failed.
+    Перезапуск самого вебхука (после деплоя main) откладывается, пока очередь не опустеет.
+    """
+
+    def __init__(self, state_file: Path = DEPLOY_STATE_FILE):
+        self._cond = threading.Condition()
+        self._pending: dict[str, DeployJob] = {}
+        self._current: DeployJob | None = None
+        self._history: deque[DeployJob] = deque(maxlen=DEPLOY_HISTORY_SIZE)
+        self._state_file = state_file
+        self._restart_requested = False
+        self._load()
+        self._worker = threading.Thread(target=self._run, name='deploy-worker', daemon=True)
+        self._worker.start()
+
+    def _load(self) -> None:
+        """Восстановить очередь и историю после перезапуска вебхука."""
+        try:
+            state = json.loads(self._state_file.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Состояние деплоев не прочитано (%s): %s", self._state_file.name, e)
+            return
+        try:
+            self._history.extend(DeployJob.from_state(s) for s in state.get('history') or [])
+            current = state.get('current')
+            if current:
+                job = DeployJob.from_state(current)
+                job.status = 'failed'
+                job.error = 'Прерван перезапуском вебхука'
+                job.finished_at = time.time()
+                self._history.appendleft(job)
+            for s in state.get('pending') or []:
+                job = DeployJob.from_state(s)
+                self._pending[job.branch] = job
+                job.log("Деплой восстановлен из очереди после перезапуска вебхука")
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Состояние деплоев повреждено, начинаем с пустой очереди: %s", e)
+            self._pending.clear()
+            self._history.clear()
+
+    def _save(self) -> None:
+        """Записать состояние очереди (вызывается под self._cond)."""
+        state = {
+            'current': self._current.to_state() if self._current else None,
+            'pending': [j.to_state() for j in self._pending.values()],
+            'history': [j.to_state() for j in self._history],
+        }
+        tmp = self._state_file.with_suffix('.tmp')
+        try:
+            tmp.write_text(json.dumps(state, ensure_ascii=False), encoding='utf-8')
+            tmp.replace(self._state_file)
+        except OSError as e:
+            logger.warning("Состояние деплоев не сохранено: %s", e)
+
+    def submit(self, project_dir: Path, branch: str, services: list, env_name: str, ref: str, commit: str = '') -> DeployJob:
+        with self._cond:
+            job = self._pending.get(branch)
+            if job is not None:
+                job.pushes += 1
+                job.not_before = time.time() + DEPLOY_COALESCE_SEC
+                job.log(f"Push объединён с ожидающим деплоем (всего {job.pushes})")
+            else:
+                job = DeployJob(project_dir, branch, services, env_name, ref)
+                self._pending[branch] = job
+                job.log(f"Деплой поставлен в очередь (ветка {branch})")
+            if commit:
+                job.commits.append(commit[:12])
+            self._save()
+            self._cond.notify()
+            return job
+
+    def _next_job(self) -> DeployJob:
+        with self._cond:
+            while True:
+                now = time.time()
+                ready = [j for j in self._pending.values() if j.not_before <= now]
+                if ready:
+                    job = min(ready, key=lambda j: j.queued_at)
+                    del self._pending[job.branch]
+                    self._current = job
+                    job.status = 'running'
+                    job.started_at = time.time()
+                    self._save()
+                    return job
+                wait = min((j.not_before - now for j in self._pending.values()), default=None)
+                self._cond.wait(timeout=wait)
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            try:
+                run_deploy(job)
+                job.status = 'success'
+                # После успешного main: автобутстрап staging (если не настроен)
+                if job.ref == 'refs/heads/main':
+                    bootstrap_staging_if_needed()
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                job.log(f"Deployment error: {e}", logging.ERROR)
+            finally:
+                job.finished_at = time.time()
+                with self._cond:
+                    self._current = None
+                    self._history.appendleft(job)
+                    self._restart_requested = self._restart_requested or job.restart_webhook
+                    self._save()
+                    if self._restart_requested and not self._pending:
+                        # Очередь пуста, деплоев нет — новый код вебхука можно подхватить.
+                        # Push, пришедший за секунду до перезапуска, сохранён в очереди и выполнится после.
+                        self._restart_requested = False
+                        _restart_webhook(job)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                'current': self._current.to_dict() if self._current else None,
+                'pending': [j.to_dict(with_log=False) for j in self._pending.values()],
+                'history': [j.to_dict(with_log=False) for j in self._history],
+            }
+
+    def get(self, job_id: int) -> DeployJob | None:
+        with self._cond:
+            candidates = list(self._pending.values()) + list(self._history)
+            if self._current:
+                candidates.append(self._current)
+        return next((j for j in candidates if j.id == job_id), None)
+
+
+def _restart_webhook(job: DeployJob) -> None:
+    """Перезапуск github-webhook (чтобы подхватить обновлённый код) в отдельной сессии."""
+    try:
+        subprocess.Popen(
+            ['sh', '-c', 'sleep 1 && sudo -n systemctl restart github-webhook'],
+            cwd=str(PROJECT_DIR), start_new_session=True
+        )
+        job.log("Очередь деплоев пуста — перезапуск github-webhook")
+    except Exception as e:
+        job.log(f"Перезапуск github-webhook не запланирован: {e}", logging.WARNING)
+
+
+def _restart_unit(unit: str, project_dir: Path) -> tuple[str, bool, float]:
+    started = time.monotonic()
+    try:
+        result = subprocess.run(
+            ['sudo', '-n', 'systemctl', 'restart', unit],
+            cwd=str(project_dir), timeout=10, capture_output=True
+        )
+        ok = result.returncode == 0
+    except Exception:
+        ok = False  # сервис может быть не установлен
+    return unit, ok, round(time.monotonic() - started, 2)
+
+
+def run_deploy(job: DeployJob) -> None:
+    """Выполнить деплой: git pull, зависимости и параллельный перезапуск сервисов."""
+    project_dir = job.project_dir
+    job.log(f"Начинаем деплой в {project_dir} (ветка {job.branch}, push'ей: {job.pushes})")
+
+    if not project_dir.exists():
+        raise Exception(f"Директория не существует: {project_dir}")
+
+    # Выполняем git pull
+    with job.phase('git_pull'):
+        try:
+            result = subprocess.run(
+                ['git', 'pull', 'origin', job.branch],
+                capture_output=True,
+                text=True,
+                timeout=60,
+                cwd=str(project_dir)
+            )
+        except subprocess.TimeoutExpired:
+            raise Exception("git pull timeout")
+        except FileNotFoundError:
+            raise Exception("git not found")
+        if result.returncode != 0:
+            raise Exception(f"git pull failed: {result.stderr}")
+        job.log(f"git pull успешен: {result.stdout.strip()}")
+
+    # Обновляем зависимости в venv (последовательно: pip в одном venv параллельно не запускаем)
+    venv_python = project_dir / 'venv' / 'bin' / 'python'
+    if not venv_python.exists():
+        venv_python = project_dir / 'venv' / 'Scripts' / 'python.exe'
+    if venv_python.exists():
+        with job.phase('pip_install'):
+            try:
+                subprocess.run(
+                    [str(venv_python), '-m', 'pip', 'install', '-q', '-r', 'docs/config/requirements.txt'],
+                    cwd=str(project_dir), timeout=120, check=False, capture_output=True
+                )
+                for req_name in ('blocks/analytics/requirements.txt', 'blocks/grs_image_web/requirements.txt', 'blocks/autopost_zen/requirements.txt'):
+                    req_path = project_dir / req_name
+                    if req_path.exists():
+                        subprocess.run(
+                            [str(venv_python), '-m', 'pip', 'install', '-q', '-r', str(req_path)],
+                            cwd=str(project_dir), timeout=60, check=False, capture_output=True
+                        )
+                job.log("Зависимости обновлены")
+            except Exception as e:
+                job.log(f"pip install: {e}", logging.WARNING)
+
+    # Перезапуск systemd-сервисов параллельно: юниты друг от друга не зависят
+    # (требуется passwordless sudo для user, см. docs)
+    if job.services:
+        with job.phase('restart_services'):
+            with ThreadPoolExecutor(max_workers=len(job.services)) as pool:
+                for unit, ok, seconds in pool.map(lambda u: _restart_unit(u, project_dir), job.services):
+                    if ok:
+                        job.log(f"Сервис {unit} перезапущен ({seconds} с)")
+                    else:
+                        job.log(f"Сервис {unit} не перезапущен (не установлен?)", logging.WARNING)
+
+    # Перезапуск webhook (чтобы подхватить обновлённый код) — когда очередь опустеет (DeployQueue._run)
+    if job.env_name == 'production':
+        job.restart_webhook = True
+
+    job.log("Деплой завершен успешно")
+
+
+def bootstrap_staging_if_needed():
+    """Если staging не настроен — запустить setup (один раз)."""
+    staging_dir = Path(PROJECT_DIR_STAGING or '/root/contentzavod-staging')
+    if staging_dir.exists():
+        return
+    run_bootstrap()
+
+
+def run_bootstrap():
+    """Запустить setup_staging_all.sh."""
+    staging_dir = Path(PROJECT_DIR_STAGING or '/root/contentzavod-staging')
+    setup_script = PROJECT_DIR / 'docs' / 'scripts' / 'deploy_beget' / 'setup_staging_all.sh'
+    if not setup_script.exists():
+        logger.info("Staging setup script не найден")
+        return
+    logger.info("Запуск bootstrap: %s", setup_script)
+    try:
+        result = subprocess.run(
+            ['sudo', 'bash', str(setup_script), str(PROJECT_DIR), str(staging_dir)],
+            cwd=str(PROJECT_DIR),
+            capture_output=True,
+            text=True,
+            timeout=300
+        )
+        if result.returncode == 0:
+            logger.info("Staging bootstrap успешен")
+        else:
+            logger.warning("Staging bootstrap: %s", result.stderr or result.stdout)
+    except Exception as e:
+        logger.warning("Staging bootstrap error: %s", e)
+
+
+DEPLOY_QUEUE: DeployQueue | None = None
+
+
+def get_deploy_queue() -> DeployQueue:
+    """Очередь создаётся при первом обращении (рабочий поток стартует вместе с сервером)."""
+    global DEPLOY_QUEUE
+    if DEPLOY_QUEUE is None:
+        DEPLOY_QUEUE = DeployQueue()
+    return DEPLOY_QUEUE
+
+
 class WebhookHandler(BaseHTTPRequestHandler):
-    def _send_response(self, status: int, message: str):
+    def _send_response(self, status: int, message: str, **extra):
         """Отправить JSON ответ."""
-        response = json.dumps({"message": message}, ensure_ascii=False).encode('utf-8')
+        self._send_json(status, {"message": message, **extra})
+
+    def _send_json(self, status: int, payload: dict):
+        response = json.dumps(payload, ensure_ascii=False).encode('utf-8')
         self.send_response(status)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
         self.send_header('Content-Length', str(len(response)))
@@ -71,17 +454,34 @@ class WebhookHandler(BaseHTTPRequestHandler):
         if parsed.path == '/health':
             self._send_response(200, "Webhook server is running")
         elif parsed.path == '/bootstrap':
-            from urllib.parse import parse_qs
-            qs = parse_qs(parsed.query)
-            secret = (qs.get('secret') or [''])[0]
-            if SECRET_TOKEN and not hmac.compare_digest(secret, SECRET_TOKEN):
+            if not self._check_query_secret(parsed.query):
                 self._send_response(403, "Invalid secret")
                 return
             self._send_response(200, "Bootstrap started")
-            self._run_bootstrap()
+            run_bootstrap()
+        elif parsed.path == '/deploys' or parsed.path.startswith('/deploys/'):
+            # Статус деплоев: лог содержит вывод git — закрыт тем же секретом, что и /bootstrap
+            if not self._check_query_secret(parsed.query):
+                self._send_response(403, "Invalid secret")
+                return
+            tail = parsed.path[len('/deploys'):].strip('/')
+            if not tail:
+                self._send_json(200, get_deploy_queue().snapshot())
+                return
+            job = get_deploy_queue().get(int(tail)) if tail.isdigit() else None
+            if job is None:
+                self._send_response(404, "Deploy not found")
+                return
+            self._send_json(200, job.to_dict())
         else:
             self._send_response(404, "Not found")
 
+    def _check_query_secret(self, query: str) -> bool:
+        if not SECRET_TOKEN:
+            return True
+        secret = (parse_qs(query).get('secret') or [''])[0]
+        return hmac.compare_digest(secret, SECRET_TOKEN)
+
     def do_POST(self):
         """Обработка webhook от GitHub."""
         parsed = urlparse(self.path)
@@ -152,121 +552,9 @@ class WebhookHandler(BaseHTTPRequestHandler):
             self._send_response(200, f"Branch {ref} ignored")
             return
 
-        # Выполняем деплой
-        try:
-            self._deploy(project_dir, branch, services, env_name)
-            self._send_response(200, f"Deployment {env_name} successful")
-            # После успешного main: автобутстрап staging (если не настроен)
-            if ref == 'refs/heads/main':
-                self._bootstrap_staging_if_needed()
-        except Exception as e:
-            logger.error(f"Deployment error: {e}")
-            self._send_response(500, f"Deployment failed: {str(e)}")
-
-    def _deploy(self, project_dir: Path, branch: str, services: list, env_name: str):
-        """Выполнить деплой: git pull и перезапуск сервисов."""
-        logger.info("Начинаем деплой [%s] в %s (ветка %s)...", env_name, project_dir, branch)
-        
-        if not project_dir.exists():
-            raise Exception(f"Директория не существует: {project_dir}")
-        
-        # Выполняем git pull
-        try:
-            result = subprocess.run(
-                ['git', 'pull', 'origin', branch],
-                capture_output=True,
-                text=True,
-                timeout=60,
-                cwd=str(project_dir)
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"git pull failed: {result.stderr}")
-                raise Exception(f"git pull failed: {result.stderr}")
-            
-            logger.info(f"git pull успешен: {result.stdout}")
-            
-        except subprocess.TimeoutExpired:
-            logger.error("git pull timeout")
-            raise Exception("git pull timeout")
-        except FileNotFoundError:
-            logger.error("git не найден")
-            raise Exception("git not found")
-
-        # Обновляем зависимости в venv
-        venv_python = project_dir / 'venv' / 'bin' / 'python'
-        if not venv_python.exists():
-            venv_python = project_dir / 'venv' / 'Scripts' / 'python.exe'
-        if venv_python.exists():
-            try:
-                subprocess.run(
-                    [str(venv_python), '-m', 'pip', 'install', '-q', '-r', 'docs/config/requirements.txt'],
-                    cwd=str(project_dir), timeout=120, check=False, capture_output=True
-                )
-                for req_name in ('blocks/analytics/requirements.txt', 'blocks/grs_image_web/requirements.txt', 'blocks/autopost_zen/requirements.txt'):
-                    req_path = project_dir / req_name
-                    if req_path.exists():
-                        subprocess.run(
-                            [str(venv_python), '-m', 'pip', 'install', '-q', '-r', str(req_path)],
-                            cwd=str(project_dir), timeout=60, check=False, capture_output=True
-                        )
-                logger.info("Зависимости обновлены")
-            except Exception as e:
-                logger.warning(f"pip install: {e}")
-
-        # Перезапуск systemd-сервисов (требуется passwordless sudo для user, см. docs)
-        for unit in services:
-            try:
-                subprocess.run(
-                    ['sudo', '-n', 'systemctl', 'restart', unit],
-                    cwd=str(project_dir), timeout=10, capture_output=True
-                )
-                logger.info(f"Сервис {unit} перезапущен")
-            except Exception:
-                pass  # сервис может быть не установлен
-
-        # Перезапуск webhook (чтобы подхватить обновлённый код)
-        if env_name == 'production':
-            try:
-                subprocess.Popen(
-                    ['sh', '-c', 'sleep 3 && sudo -n systemctl restart github-webhook'],
-                    cwd=str(project_dir), start_new_session=True
-                )
-                logger.info("Запланирован перезапуск github-webhook через 3 сек")
-            except Exception:
-                pass
-
-        logger.info("Деплой [%s] завершен успешно", env_name)
-
-    def _bootstrap_staging_if_needed(self):
-        """Если staging не настроен — запустить setup (один раз)."""
-        staging_dir = Path(PROJECT_DIR_STAGING or '/root/contentzavod-staging')
-        if staging_dir.exists():
-            return
-        self._run_bootstrap()
-
-    def _run_bootstrap(self):
-        """Запустить setup_staging_all.sh."""
-        staging_dir = Path(PROJECT_DIR_STAGING or '/root/contentzavod-staging')
-        setup_script = PROJECT_DIR / 'docs' / 'scripts' / 'deploy_beget' / 'setup_staging_all.sh'
-        if not setup_script.exists():
-            logger.info("Staging setup script не найден")
-            return
-        logger.info("Запуск bootstrap: %s", setup_script)
-        try:
-            result = subprocess.run(
-                ['sudo', 'bash', str(setup_script), str(PROJECT_DIR), str(staging_dir)],
-                cwd=str(PROJECT_DIR),
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-            if result.returncode == 0:
-                logger.info("Staging bootstrap успешен")
-            else:
-                logger.warning("Staging bootstrap: %s", result.stderr or result.stdout)
-        except Exception as e:
-            logger.warning("Staging bootstrap error: %s", e)
+        # Ставим деплой в очередь и отвечаем сразу (GitHub ждёт ответ не дольше 10 сек)
+        job = get_deploy_queue().submit(project_dir, branch, services, env_name, ref, commit=data.get('after') or '')
+        self._send_response(202, f"Deployment {env_name} queued", deploy_id=job.id, pushes=job.pushes)
 
     def log_message(self, format, *args):
         """Переопределяем логирование для использования нашего logger."""
@@ -275,10 +563,13 @@ class WebhookHandler(BaseHTTPRequestHandler):
 
 def run_server():
     """Запустить webhook сервер."""
-    server = HTTPServer(('0.0.0.0', PORT), WebhookHandler)
+    get_deploy_queue()
+    # ThreadingHTTPServer: /health и /deploys отвечают, пока идёт деплой или медленный запрос
+    server = ThreadingHTTPServer(('0.0.0.0', PORT), WebhookHandler)
     logger.info(f"Webhook сервер запущен на http://0.0.0.0:{PORT}")
     logger.info(f"Endpoint: http://0.0.0.0:{PORT}/webhook")
     logger.info(f"Health check: http://0.0.0.0:{PORT}/health")
+    logger.info(f"Deploy status: http://0.0.0.0:{PORT}/deploys")
     
     try:
         server.serve_forever()